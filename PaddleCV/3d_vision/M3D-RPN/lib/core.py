@@ -545,6 +545,7 @@ def init_training_paths(conf_name, use_tmp_folder=None):
     weights =  ./output/<conf_name>/weights
     results =  ./output/<conf_name>/results
     logs    =  ./output/<conf_name>/log
+    cache   =  ./output/cache (anchors and bbox stats shared by experiments)
 
     Args:
         conf_name (str): configuration experiment name (used for storage into ./output/<conf_name>)
@@ -557,6 +558,7 @@ def init_training_paths(conf_name, use_tmp_folder=None):
     paths.output = os.path.join(os.getcwd(), 'output', conf_name)
     paths.weights = os.path.join(paths.output, 'weights')
     paths.logs = os.path.join(paths.output, 'log')
+    paths.cache = os.path.join(os.getcwd(), 'output', 'cache')
 
     if use_tmp_folder:
         paths.results = os.path.join(paths.base, '.tmp_results', conf_name,
@@ -569,5 +571,6 @@ def init_training_paths(conf_name, use_tmp_folder=None):
     mkdir_if_missing(paths.logs)
     mkdir_if_missing(paths.weights)
     mkdir_if_missing(paths.results)
+    mkdir_if_missing(paths.cache)
 
     return paths
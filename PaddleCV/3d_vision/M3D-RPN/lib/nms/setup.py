@@ -65,7 +65,12 @@ def locate_cuda():
     return cudaconfig
 
 
-CUDA = locate_cuda()
+try:
+    CUDA = locate_cuda()
+except EnvironmentError:
+    # only cpu_nms is built without CUDA, lib/rpn_util.py then runs the NMS
+    # on CPU
+    CUDA = None
 
 # Obtain the numpy include directory.  This logic works across numpy versions.
 try:
@@ -126,30 +131,33 @@ ext_modules = [
         include_dirs=[numpy_include],
         library_dirs=["/home/vis/yexiaoqing/06_pp3d/python3.7_paddle1.8/lib"],
         libraries=['python3.7m']),
-    Extension(
-        'gpu_nms',
-        ['nms_kernel.cu', 'gpu_nms.pyx'],
-        #library_dirs=[CUDA['lib64']],
-        library_dirs=[
-            CUDA['lib64'],
-            "/home/vis/yexiaoqing/06_pp3d/python3.7_paddle1.8/lib"
-        ],
-        libraries=['cudart', 'python3.7m'],
-        language='c++',
-        runtime_library_dirs=[CUDA['lib64']],
-        # this syntax is specific to this build system
-        # we're only going to use certain compiler args with nvcc and not with
-        # gcc the implementation of this trick is in customize_compiler() below
-        extra_compile_args={
-            'gcc': ["-Wno-unused-function"],
-            'nvcc': [
-                '-arch=sm_35', '--ptxas-options=-v', '-c', '--compiler-options',
-                "'-fPIC'"
-            ]
-        },
-        include_dirs=[numpy_include, CUDA['include']]),
 ]
 
+if CUDA is not None:
+    ext_modules.append(
+        Extension(
+            'gpu_nms',
+            ['nms_kernel.cu', 'gpu_nms.pyx'],
+            #library_dirs=[CUDA['lib64']],
+            library_dirs=[
+                CUDA['lib64'],
+                "/home/vis/yexiaoqing/06_pp3d/python3.7_paddle1.8/lib"
+            ],
+            libraries=['cudart', 'python3.7m'],
+            language='c++',
+            runtime_library_dirs=[CUDA['lib64']],
+            # this syntax is specific to this build system
+            # we're only going to use certain compiler args with nvcc and not with
+            # gcc the implementation of this trick is in customize_compiler() below
+            extra_compile_args={
+                'gcc': ["-Wno-unused-function"],
+                'nvcc': [
+                    '-arch=sm_35', '--ptxas-options=-v', '-c', '--compiler-options',
+                    "'-fPIC'"
+                ]
+            },
+            include_dirs=[numpy_include, CUDA['include']]))
+
 setup(
     name='fast_rcnn',
     ext_modules=ext_modules,
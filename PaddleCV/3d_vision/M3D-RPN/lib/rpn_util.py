@@ -11,10 +11,18 @@ import math
 import os
 import re
 import gc
+import hashlib
+import multiprocessing
+from functools import partial
 from lib.util import *
 from lib.core import *
 from data.augmentations import *
-from lib.nms.gpu_nms import gpu_nms
+from lib.nms.py_cpu_nms import py_cpu_nms
+try:
+    from lib.nms.gpu_nms import gpu_nms
+except ImportError:
+    # gpu_nms is only built when CUDA is found, see lib/nms/setup.py
+    gpu_nms = None
 
 from copy import deepcopy
 import numpy as np
@@ -27,17 +35,30 @@ import paddle.fluid as fluid
 from paddle.fluid.dygraph import to_variable
 
 
-def generate_anchors(conf, imdb, cache_folder):
+def generate_anchors(conf, imdb, cache_folder, num_workers=None):
     """
     Generates the anchors according to the configuration and
     (optionally) based on the imdb properties.
+
+    The anchors are cached in cache_folder under a key of the anchor settings
+    of conf and the ground truths of imdb, so experiments which only differ
+    in other settings reuse them.
     """
     #
     # use cache?
-    if (cache_folder is not None
-        ) and os.path.exists(os.path.join(cache_folder, 'anchors.pkl')):
-
-        anchors = pickle_read(os.path.join(cache_folder, 'anchors.pkl'))
+    cache_file = None
+    if cache_folder is not None:
+        key = cache_key(conf.anchor_scales, conf.anchor_ratios,
+                        conf.feat_stride, conf.test_scale, conf.lbls,
+                        conf.ilbls, conf.min_gt_vis, conf.min_gt_h,
+                        conf.max_gt_h, conf.cluster_anchors,
+                        conf.even_anchors, conf.expand_anchors, conf.has_3d,
+                        [imobj_digest(imobj) for imobj in imdb])
+        cache_file = os.path.join(cache_folder, 'anchors_{}.pkl'.format(key))
+
+    if (cache_file is not None) and os.path.exists(cache_file):
+
+        anchors = pickle_read(cache_file)
 #
 # generate anchors
     else:
@@ -63,9 +84,19 @@ def generate_anchors(conf, imdb, cache_folder):
 # optionally cluster anchors
         if conf.cluster_anchors:
             anchors = cluster_anchors(
-                conf.feat_stride, anchors, conf.test_scale, imdb, conf.lbls,
-                conf.ilbls, conf.anchor_ratios, conf.min_gt_vis, conf.min_gt_h,
-                conf.max_gt_h, conf.even_anchors, conf.expand_anchors)
+                conf.feat_stride,
+                anchors,
+                conf.test_scale,
+                imdb,
+                conf.lbls,
+                conf.ilbls,
+                conf.anchor_ratios,
+                conf.min_gt_vis,
+                conf.min_gt_h,
+                conf.max_gt_h,
+                conf.even_anchors,
+                conf.expand_anchors,
+                num_workers=num_workers)
 #
 #
 # has 3d? then need to compute stats for each new dimension
@@ -73,110 +104,37 @@ def generate_anchors(conf, imdb, cache_folder):
         elif conf.has_3d:
             #
             # compute the default stats for each anchor
-            normalized_gts = []
-            #
-            # check all images
-            for imind, imobj in enumerate(imdb):
-                #
-                # has ground truths?
-                if len(imobj.gts) > 0:
-                    #
-                    scale = imobj.scale * conf.test_scale / imobj.imH
-                    #
-                    # determine ignores
-                    igns, rmvs = determine_ignores(imobj.gts, conf.lbls,
-                                                   conf.ilbls, conf.min_gt_vis,
-                                                   conf.min_gt_h, np.inf, scale)
-                    #
-                    # accumulate boxes
-                    gts_all = bbXYWH2Coords(
-                        np.array([gt.bbox_full * scale for gt in imobj.gts]))
-                    gts_val = gts_all[(rmvs == False) & (igns == False), :]
-                    #
-                    gts_3d = np.array([gt.bbox_3d for gt in imobj.gts])
-                    gts_3d = gts_3d[(rmvs == False) & (igns == False), :]
-                    #
-                    if gts_val.shape[0] > 0:
-                        #
-                        # center all 2D ground truths
-                        for gtind in range(0, gts_val.shape[0]):
-                            w = gts_val[gtind, 2] - gts_val[gtind, 0] + 1
-                            h = gts_val[gtind, 3] - gts_val[gtind, 1] + 1
-                            #
-                            gts_val[gtind, 0:4] = anchor_center(
-                                w, h, conf.feat_stride)
-#
-                    if gts_val.shape[0] > 0:
-                        normalized_gts += np.concatenate(
-                            (gts_val, gts_3d), axis=1).tolist()
-#
-# convert to np
-            normalized_gts = np.array(normalized_gts)
+            normalized_gts, _ = collect_normalized_gts(
+                imdb, conf.feat_stride, conf.test_scale, conf.lbls,
+                conf.ilbls, conf.min_gt_vis, conf.min_gt_h, num_workers)
             #
             # expand dimensions
             anchors = np.concatenate(
                 (anchors, np.zeros([anchors.shape[0], 5])), axis=1)
             #
-            # bbox_3d order --> [cx3d, cy3d, cz3d, w3d, h3d, l3d, rotY]
-            anchors_z3d = [[] for x in range(anchors.shape[0])]
-            anchors_w3d = [[] for x in range(anchors.shape[0])]
-            anchors_h3d = [[] for x in range(anchors.shape[0])]
-            anchors_l3d = [[] for x in range(anchors.shape[0])]
-            anchors_rotY = [[] for x in range(anchors.shape[0])]
-            #
             # find best matches for each ground truth
             ols = iou(anchors[:, 0:4], normalized_gts[:, 0:4])
             gt_target_ols = np.amax(ols, axis=0)
             gt_target_anchor = np.argmax(ols, axis=0)
             #
-            # assign each box to an anchor
-            for gtind, gt in enumerate(normalized_gts):
-                #
-                anum = gt_target_anchor[gtind]
-                #
-                if gt_target_ols[gtind] > 0.2:
-                    anchors_z3d[anum].append(gt[6])
-                    anchors_w3d[anum].append(gt[7])
-                    anchors_h3d[anum].append(gt[8])
-                    anchors_l3d[anum].append(gt[9])
-                    anchors_rotY[anum].append(gt[10])
-#
-# compute global means
-            anchors_z3d_gl = np.empty(0)
-            anchors_w3d_gl = np.empty(0)
-            anchors_h3d_gl = np.empty(0)
-            anchors_l3d_gl = np.empty(0)
-            anchors_rotY_gl = np.empty(0)
-            #
-            # update anchors
+            # update anchors with the mean of the assigned boxes
+            # bbox_3d order --> [cx3d, cy3d, cz3d, w3d, h3d, l3d, rotY]
             for aind in range(0, anchors.shape[0]):
                 #
-                if len(np.array(anchors_z3d[aind])) > 0:
+                assigned = np.flatnonzero((gt_target_anchor == aind) & (
+                    gt_target_ols > 0.2))
+                #
+                if len(assigned) > 0:
                     #
-                    if conf.has_3d:
-                        #
-                        anchors_z3d_gl = np.hstack(
-                            (anchors_z3d_gl, np.array(anchors_z3d[aind])))
-                        anchors_w3d_gl = np.hstack(
-                            (anchors_w3d_gl, np.array(anchors_w3d[aind])))
-                        anchors_h3d_gl = np.hstack(
-                            (anchors_h3d_gl, np.array(anchors_h3d[aind])))
-                        anchors_l3d_gl = np.hstack(
-                            (anchors_l3d_gl, np.array(anchors_l3d[aind])))
-                        anchors_rotY_gl = np.hstack(
-                            (anchors_rotY_gl, np.array(anchors_rotY[aind])))
-                        #
-                        anchors[aind, 4] = np.mean(np.array(anchors_z3d[aind]))
-                        anchors[aind, 5] = np.mean(np.array(anchors_w3d[aind]))
-                        anchors[aind, 6] = np.mean(np.array(anchors_h3d[aind]))
-                        anchors[aind, 7] = np.mean(np.array(anchors_l3d[aind]))
-                        anchors[aind, 8] = np.mean(np.array(anchors_rotY[aind]))
+                    for k in range(5):
+                        anchors[aind, 4 + k] = np.mean(normalized_gts[
+                            assigned, 6 + k])
 #
                 else:
                     raise ValueError('Non-used anchor #{} found'.format(aind))
 #
-        if (cache_folder is not None):
-            pickle_write(os.path.join(cache_folder, 'anchors.pkl'), anchors)
+        if (cache_file is not None):
+            write_cache(cache_file, anchors)
 
 #
     conf.anchors = anchors
@@ -189,18 +147,143 @@ def anchor_center(w, h, stride):
     center ground truths with steps of half stride
     hence box 0 is centered at (7.5, 7.5) rather than (0, 0)
     for a feature stride of 16 px.
+
+    w and h may be arrays of N shapes, then N x 4 anchors are returned.
     """
 
-    anchor = np.zeros([4], dtype=np.float32)
+    anchor = np.zeros(np.shape(w) + (4, ), dtype=np.float32)
     #
-    anchor[0] = -w / 2 + (stride - 1) / 2
-    anchor[1] = -h / 2 + (stride - 1) / 2
-    anchor[2] = w / 2 + (stride - 1) / 2
-    anchor[3] = h / 2 + (stride - 1) / 2
+    anchor[..., 0] = -w / 2 + (stride - 1) / 2
+    anchor[..., 1] = -h / 2 + (stride - 1) / 2
+    anchor[..., 2] = w / 2 + (stride - 1) / 2
+    anchor[..., 3] = h / 2 + (stride - 1) / 2
     #
     return anchor
 
 
+def cache_key(*items):
+    """
+    Key of the anchor and bbox stats caches, md5 of the items, numpy
+    arrays are compared by value.
+    """
+
+    items = [x.tolist() if isinstance(x, np.ndarray) else x for x in items]
+    return hashlib.md5(repr(items).encode('utf-8')).hexdigest()
+
+
+def write_cache(cache_file, obj):
+    """
+    pickle_write through a temporary file, so trainers sharing the cache
+    never read a partial file
+    """
+
+    tmp_file = '{}.{}.tmp'.format(cache_file, os.getpid())
+    pickle_write(tmp_file, obj)
+    os.rename(tmp_file, cache_file)
+
+
+def imobj_digest(imobj):
+    """
+    Digest of what generate_anchors and compute_bbox_stats read from an
+    image, its size, scale and ground truths.
+    """
+
+    gts = [(gt.cls, bool(gt.ign), float(gt.visibility),
+            np.asarray(gt.bbox_full).tolist(),
+            np.asarray(gt.bbox_3d).tolist() if 'bbox_3d' in gt else None)
+           for gt in imobj.gts]
+    return cache_key(imobj.imW, imobj.imH, imobj.scale, gts)
+
+
+def map_imdb(fn, imdb, num_workers=None):
+    """
+    [fn(imobj) for imobj in imdb] over a pool of num_workers processes,
+    all cpus by default.
+    """
+
+    if num_workers is None:
+        num_workers = multiprocessing.cpu_count()
+    if num_workers <= 1 or len(imdb) <= 1:
+        return [fn(imobj) for imobj in imdb]
+
+    pool = multiprocessing.Pool(num_workers)
+    try:
+        return pool.map(
+            fn, imdb, chunksize=max(1, len(imdb) // (num_workers * 4)))
+    finally:
+        pool.close()
+        pool.join()
+
+
+def normalized_gts_of(imobj, feat_stride, test_scale, lbls, ilbls,
+                      min_gt_vis, min_gt_h):
+    """
+    Valid ground truths of one image scaled to test_scale and centered like
+    the anchors, N x 4 [x1, y1, x2, y2], followed by the bbox_3d if the
+    ground truths have 3d boxes.
+    """
+
+    if len(imobj.gts) == 0:
+        return None
+
+    scale = imobj.scale * test_scale / imobj.imH
+
+    # determine ignores
+    igns, rmvs = determine_ignores(imobj.gts, lbls, ilbls, min_gt_vis, min_gt_h,
+                                   np.inf, scale)
+
+    # accumulate boxes
+    gts_all = bbXYWH2Coords(np.array([gt.bbox_full * scale for gt in imobj.gts]))
+    gts_val = gts_all[(rmvs == False) & (igns == False), :]
+
+    if gts_val.shape[0] == 0:
+        return None
+
+    # center all 2D ground truths
+    w = gts_val[:, 2] - gts_val[:, 0] + 1
+    h = gts_val[:, 3] - gts_val[:, 1] + 1
+    gts_val[:, 0:4] = anchor_center(w, h, feat_stride)
+
+    if 'bbox_3d' in imobj.gts[0]:
+        gts_3d = np.array([gt.bbox_3d for gt in imobj.gts])
+        gts_3d = gts_3d[(rmvs == False) & (igns == False), :]
+        return np.concatenate((gts_val, gts_3d), axis=1)
+
+    return gts_val
+
+
+def collect_normalized_gts(imdb,
+                           feat_stride,
+                           test_scale,
+                           lbls,
+                           ilbls,
+                           min_gt_vis,
+                           min_gt_h,
+                           num_workers=None):
+    """
+    normalized_gts_of all images of imdb, computed over a process pool.
+    Returns the concatenated ground truths and whether they have 3d boxes.
+    """
+
+    normalized_gts = map_imdb(
+        partial(
+            normalized_gts_of,
+            feat_stride=feat_stride,
+            test_scale=test_scale,
+            lbls=lbls,
+            ilbls=ilbls,
+            min_gt_vis=min_gt_vis,
+            min_gt_h=min_gt_h),
+        imdb,
+        num_workers)
+    normalized_gts = [gts for gts in normalized_gts if gts is not None]
+
+    # keep track if using 3d
+    has_3d = len(normalized_gts) > 0 and normalized_gts[0].shape[1] > 4
+
+    return np.concatenate(normalized_gts, axis=0), has_3d
+
+
 def cluster_anchors(feat_stride,
                     anchors,
                     test_scale,
@@ -213,7 +296,8 @@ def cluster_anchors(feat_stride,
                     max_gt_h=10e10,
                     even_anchor_distribution=False,
                     expand_anchors=False,
-                    expand_stop_dt=0.0025):
+                    expand_stop_dt=0.0025,
+                    num_workers=None):
     """
     Clusters the anchors based on the imdb boxes (in 2D and/or 3D).
 #
@@ -221,56 +305,10 @@ def cluster_anchors(feat_stride,
     as a distance metric.
     """
 
-    normalized_gts = []
-
-    # keep track if using 3d
-    has_3d = False
-
-    # check all images
-    for imind, imobj in enumerate(imdb):
-
-        # has ground truths?
-        if len(imobj.gts) > 0:
-
-            scale = imobj.scale * test_scale / imobj.imH
-
-            # determine ignores
-            igns, rmvs = determine_ignores(imobj.gts, lbls, ilbls, min_gt_vis,
-                                           min_gt_h, np.inf, scale)
-
-            # check for 3d box
-            has_3d = 'bbox_3d' in imobj.gts[0]
-
-            # accumulate boxes
-            gts_all = bbXYWH2Coords(
-                np.array([gt.bbox_full * scale for gt in imobj.gts]))
-            gts_val = gts_all[(rmvs == False) & (igns == False), :]
-
-            if has_3d:
-                gts_3d = np.array([gt.bbox_3d for gt in imobj.gts])
-                gts_3d = gts_3d[(rmvs == False) & (igns == False), :]
-
-            if gts_val.shape[0] > 0:
-
-                # center all 2D ground truths
-                for gtind in range(0, gts_val.shape[0]):
-
-                    w = gts_val[gtind, 2] - gts_val[gtind, 0] + 1
-                    h = gts_val[gtind, 3] - gts_val[gtind, 1] + 1
-
-                    gts_val[gtind, 0:4] = anchor_center(w, h, feat_stride)
-
-            if gts_val.shape[0] > 0:
-
-                # add normalized gts given 3d or 2d boxes
-                if has_3d:
-                    normalized_gts += np.concatenate(
-                        (gts_val, gts_3d), axis=1).tolist()
-                else:
-                    normalized_gts += gts_val.tolist()
-
-    # convert to np
-    normalized_gts = np.array(normalized_gts)
+    # collect the normalized gts of all images, in 2d and/or 3d
+    normalized_gts, has_3d = collect_normalized_gts(
+        imdb, feat_stride, test_scale, lbls, ilbls, min_gt_vis, min_gt_h,
+        num_workers)
 
     # sort by height
     sorted_inds = np.argsort((normalized_gts[:, 3] - normalized_gts[:, 1] + 1))
@@ -279,6 +317,9 @@ def cluster_anchors(feat_stride,
     min_h = normalized_gts[0, 3] - normalized_gts[0, 1] + 1
     max_h = normalized_gts[-1, 3] - normalized_gts[-1, 1] + 1
 
+    gts_w = normalized_gts[:, 2] - normalized_gts[:, 0] + 1
+    gts_h = normalized_gts[:, 3] - normalized_gts[:, 1] + 1
+
     # for 3d, expand dimensions
     if has_3d:
         anchors = np.concatenate(
@@ -343,67 +384,33 @@ def cluster_anchors(feat_stride,
 
         while round < max_rounds and dif > -0.0:
 
-            # make empty arrays for each anchor
-            anchors_h = [[] for x in range(anchors.shape[0])]
-            anchors_w = [[] for x in range(anchors.shape[0])]
-
-            if has_3d:
-
-                # bbox_3d order --> [cx3d, cy3d, cz3d, w3d, h3d, l3d, rotY]
-                anchors_z3d = [[] for x in range(anchors.shape[0])]
-                anchors_w3d = [[] for x in range(anchors.shape[0])]
-                anchors_h3d = [[] for x in range(anchors.shape[0])]
-                anchors_l3d = [[] for x in range(anchors.shape[0])]
-                anchors_rotY = [[] for x in range(anchors.shape[0])]
-
-            round_ious = []
-
             # find best matches for each ground truth
             ols = iou(anchors[:, 0:4], normalized_gts[:, 0:4])
             gt_target_ols = np.amax(ols, axis=0)
             gt_target_anchor = np.argmax(ols, axis=0)
 
-            # assign each box to an anchor
-            for gtind, gt in enumerate(normalized_gts):
-
-                anum = gt_target_anchor[gtind]
-
-                w = gt[2] - gt[0] + 1
-                h = gt[3] - gt[1] + 1
-
-                anchors_h[anum].append(h)
-                anchors_w[anum].append(w)
-
-                if has_3d:
-                    anchors_z3d[anum].append(gt[6])
-                    anchors_w3d[anum].append(gt[7])
-                    anchors_h3d[anum].append(gt[8])
-                    anchors_l3d[anum].append(gt[9])
-                    anchors_rotY[anum].append(gt[10])
-
-                round_ious.append(gt_target_ols[gtind])
-
             # compute current iou
-            cur_iou = np.mean(np.array(round_ious))
+            cur_iou = np.mean(gt_target_ols)
 
-            # update anchors
+            # update anchors with the mean of the assigned boxes
             for aind in range(0, anchors.shape[0]):
 
+                assigned = np.flatnonzero(gt_target_anchor == aind)
+
                 # compute mean h/w
-                if len(np.array(anchors_h[aind])) > 0:
+                if len(assigned) > 0:
 
-                    mean_h = np.mean(np.array(anchors_h[aind]))
-                    mean_w = np.mean(np.array(anchors_w[aind]))
+                    mean_h = np.mean(gts_h[assigned])
+                    mean_w = np.mean(gts_w[assigned])
 
                     anchors[aind, 0:4] = anchor_center(mean_w, mean_h,
                                                        feat_stride)
 
+                    # bbox_3d order --> [cx3d, cy3d, cz3d, w3d, h3d, l3d, rotY]
                     if has_3d:
-                        anchors[aind, 4] = np.mean(np.array(anchors_z3d[aind]))
-                        anchors[aind, 5] = np.mean(np.array(anchors_w3d[aind]))
-                        anchors[aind, 6] = np.mean(np.array(anchors_h3d[aind]))
-                        anchors[aind, 7] = np.mean(np.array(anchors_l3d[aind]))
-                        anchors[aind, 8] = np.mean(np.array(anchors_rotY[aind]))
+                        for k in range(5):
+                            anchors[aind, 4 + k] = np.mean(normalized_gts[
+                                assigned, 6 + k])
 
                 else:
 
@@ -417,7 +424,8 @@ def cluster_anchors(feat_stride,
             valid_anchors_inds = np.flatnonzero(valid_anchors)
 
             # determine most heavy anchors (to be split up)
-            valid_multi = np.array([len(x) for x in anchors_h])
+            valid_multi = np.bincount(
+                gt_target_anchor, minlength=anchors.shape[0])
             valid_multi = valid_multi[valid_anchors_inds]
             valid_multi = valid_multi / np.sum(valid_multi)
 
@@ -425,7 +433,7 @@ def cluster_anchors(feat_stride,
             if cur_iou > best_iou:
                 best_iou = cur_iou
                 best_anchors = anchors[valid_anchors, :]
-                best_cov = np.mean(np.array(round_ious) > 0.5)
+                best_cov = np.mean(gt_target_ols > 0.5)
 
             # add random new anchors for any not used
             for aind in range(0, anchors.shape[0]):
@@ -677,6 +685,88 @@ def hill_climb(p2,
     return z2d, ry3d, verts_best
 
 
+def hill_climb_batch(p2,
+                     p2_inv,
+                     box_2d,
+                     x2d,
+                     y2d,
+                     z2d,
+                     w3d,
+                     h3d,
+                     l3d,
+                     ry3d,
+                     step_z_init=0,
+                     step_r_init=0,
+                     z_lim=0,
+                     r_lim=0,
+                     min_ol_dif=0.0):
+    """
+    hill_climb of N boxes at once, box_2d is (N, 4) and the others are (N,)
+    arrays. Every box takes the same steps as in hill_climb, the boxes are
+    refined together until the steps of all boxes are below the limits.
+
+    Returns the (N,) z2d, ry3d and the (N, 16, 2) verts_best.
+    """
+
+    z2d = np.array(z2d, dtype=np.float64)
+    ry3d = np.array(ry3d, dtype=np.float64)
+    step_z = np.full(z2d.shape, step_z_init, dtype=np.float64)
+    step_r = np.full(z2d.shape, step_r_init, dtype=np.float64)
+
+    ol_best, verts_best, _, invalid = test_projection_batch(
+        p2, p2_inv, box_2d, x2d, y2d, z2d, w3d, h3d, l3d, ry3d)
+
+    # boxes behind the camera are not refined
+    step_z[invalid] = z_lim
+    step_r[invalid] = r_lim
+
+    def climb(values, steps, lim, project):
+        """one step of the boxes whose step is above lim"""
+        inds = np.where(steps > lim)[0]
+        if len(inds) == 0:
+            return
+        ol_neg, verts_neg, _, invalid_neg = project(inds, -steps[inds])
+        ol_pos, verts_pos, _, invalid_pos = project(inds, steps[inds])
+
+        no_gain = ((ol_pos - ol_best[inds]) <= min_ol_dif) & (
+            (ol_neg - ol_best[inds]) <= min_ol_dif)
+        pos = ~no_gain & ((ol_pos - ol_best[inds]) > min_ol_dif) & (
+            ol_pos > ol_neg) & ~invalid_pos
+        neg = ~no_gain & ~pos & (
+            (ol_neg - ol_best[inds]) > min_ol_dif) & ~invalid_neg
+        halve = ~(pos | neg)
+
+        values[inds[pos]] += steps[inds[pos]]
+        ol_best[inds[pos]] = ol_pos[pos]
+        verts_best[inds[pos]] = verts_pos[pos]
+        values[inds[neg]] -= steps[inds[neg]]
+        ol_best[inds[neg]] = ol_neg[neg]
+        verts_best[inds[neg]] = verts_neg[neg]
+        steps[inds[halve]] = steps[inds[halve]] * 0.5
+
+    def project_z(inds, step):
+        return test_projection_batch(
+            p2, p2_inv, box_2d[inds], x2d[inds], y2d[inds], z2d[inds] + step,
+            w3d[inds], h3d[inds], l3d[inds], ry3d[inds])
+
+    def project_r(inds, step):
+        return test_projection_batch(
+            p2, p2_inv, box_2d[inds], x2d[inds], y2d[inds], z2d[inds],
+            w3d[inds], h3d[inds], l3d[inds], ry3d[inds] + step)
+
+    # attempt to fit z/rot more properly
+    while np.any(step_z > z_lim) or np.any(step_r > r_lim):
+        climb(z2d, step_z, z_lim, project_z)
+        climb(ry3d, step_r, r_lim, project_r)
+
+    while np.any(ry3d > math.pi):
+        ry3d[ry3d > math.pi] -= math.pi * 2
+    while np.any(ry3d < (-math.pi)):
+        ry3d[ry3d < (-math.pi)] += math.pi * 2
+
+    return z2d, ry3d, verts_best
+
+
 # def clsInd2Name(lbls, ind):
 #     """
 #     Converts a cls ind to string name
@@ -698,7 +788,70 @@ def clsName2Ind(lbls, cls):
         raise ValueError('unknown class')
 
 
-def compute_bbox_stats(conf, imdb, cache_folder=''):
+def bbox_targets_of(imobj, conf):
+    """
+    Regression targets of the foreground anchors of one image for
+    compute_bbox_stats, or None if the image has no ground truths.
+
+    Returns the N x 4 [dx, dy, dw, dh] targets, and if conf.has_3d the N x 5
+    foreground rois (with the anchor index) and their N x 7 3d ground
+    truths, else None and None. Only the 2d anchors are used here, the 3d
+    targets are computed from the rois with bbox_transform_3d.
+    """
+
+    if len(imobj.gts) == 0:
+        return None
+
+    scale_factor = imobj.scale * conf.test_scale / imobj.imH
+    feat_size = calc_output_size(
+        np.array([imobj.imH, imobj.imW]) * scale_factor, conf.feat_stride)
+    rois = locate_anchors(conf.anchors, feat_size, conf.feat_stride)
+
+    # determine ignores
+    igns, rmvs = determine_ignores(imobj.gts, conf.lbls, conf.ilbls,
+                                   conf.min_gt_vis, conf.min_gt_h, np.inf,
+                                   scale_factor)
+
+    # accumulate boxes
+    gts_all = bbXYWH2Coords(
+        np.array([gt.bbox_full * scale_factor for gt in imobj.gts]))
+
+    # filter out irrelevant cls, and ignore cls
+    gts_val = gts_all[(rmvs == False) & (igns == False), :]
+    gts_ign = gts_all[(rmvs == False) & (igns == True), :]
+
+    # accumulate labels
+    box_lbls = np.array([gt.cls for gt in imobj.gts])
+    box_lbls = box_lbls[(rmvs == False) & (igns == False)]
+    box_lbls = np.array([clsName2Ind(conf.lbls, cls) for cls in box_lbls])
+
+    # compute transforms for 2d
+    transforms, ols, _ = compute_targets(
+        gts_val, gts_ign, box_lbls, rois, conf.fg_thresh, conf.ign_thresh,
+        conf.bg_thresh_lo, conf.bg_thresh_hi, conf.best_thresh)
+
+    gt_inds = np.flatnonzero(transforms[:, 4] > 0)
+
+    if not conf.has_3d:
+        return transforms[gt_inds, 0:4], None, None
+
+    # accumulate 3d boxes
+    gts_3d = np.array([gt.bbox_3d for gt in imobj.gts])
+    gts_3d = gts_3d[(rmvs == False) & (igns == False), :]
+
+    # rescale centers (in 2d)
+    for gtind, gt in enumerate(gts_3d):
+        gts_3d[gtind, 0:2] *= scale_factor
+
+    if len(gt_inds) > 0:
+        target_3d = gts_3d[np.argmax(ols[gt_inds, :], axis=1)]
+    else:
+        target_3d = np.zeros([0, gts_3d.shape[1]])
+
+    return transforms[gt_inds, 0:4], rois[gt_inds, :], target_3d
+
+
+def compute_bbox_stats(conf, imdb, cache_folder='', num_workers=None):
     """
     Computes the mean and standard deviation for each regression
     parameter (usually pertaining to [dx, dy, sw, sh] but sometimes
@@ -706,194 +859,106 @@ def compute_bbox_stats(conf, imdb, cache_folder=''):
 
     Once these stats are known we normalize the regression targets
     to have 0 mean and 1 variance, to hypothetically ease training.
+
+    The targets of each image are computed over a process pool and cached
+    in cache_folder by image, under a key of the 2d anchors and the target
+    settings of conf, so only new or changed images are computed again.
     """
 
-    if (cache_folder is not None) and os.path.exists(os.path.join(cache_folder, 'bbox_means.pkl')) \
-            and os.path.exists(os.path.join(cache_folder, 'bbox_stds.pkl')):
+    cache_file = None
+    if cache_folder is not None:
+        key = cache_key(conf.anchors[:, 0:4], conf.feat_stride, conf.test_scale,
+                        conf.lbls, conf.ilbls, conf.min_gt_vis, conf.min_gt_h,
+                        conf.fg_thresh, conf.ign_thresh, conf.bg_thresh_lo,
+                        conf.bg_thresh_hi, conf.best_thresh, conf.has_3d)
+        cache_file = os.path.join(cache_folder,
+                                  'bbox_targets_{}.pkl'.format(key))
+
+    # targets of the images by imobj_digest
+    if (cache_file is not None) and os.path.exists(cache_file):
+        image_targets = pickle_read(cache_file)
+    else:
+        image_targets = {}
 
-        means = pickle_read(os.path.join(cache_folder, 'bbox_means.pkl'))
-        stds = pickle_read(os.path.join(cache_folder, 'bbox_stds.pkl'))
+    digests = [imobj_digest(imobj) for imobj in imdb]
+    missing = [
+        imind for imind, digest in enumerate(digests)
+        if digest not in image_targets
+    ]
 
-    else:
+    if len(missing) > 0:
+
+        logging.info('Computing bbox regression targets of {} images..'.format(
+            len(missing)))
+
+        targets = map_imdb(
+            partial(
+                bbox_targets_of, conf=conf), [imdb[imind] for imind in missing],
+            num_workers)
+        for imind, target in zip(missing, targets):
+            image_targets[digests[imind]] = target
+
+        if (cache_file is not None):
+            write_cache(cache_file, image_targets)
+
+    # targets of the foreground anchors, 2d and 3d
+    targets = []
+    for digest in digests:
+
+        if image_targets[digest] is None:
+            continue
+
+        targets_2d, rois, target_3d = image_targets[digest]
+
+        if len(targets_2d) == 0:
+            continue
 
         if conf.has_3d:
-            squared_sums = np.zeros([1, 11], dtype=np.float128)
-            sums = np.zeros([1, 11], dtype=np.float128)
+            src_3d = conf.anchors[rois[:, 4].astype(np.int64), 4:]
+            targets_3d = bbox_transform_3d(rois, src_3d, target_3d)
+            targets.append((targets_2d, targets_3d.astype(np.float32)))
         else:
-            squared_sums = np.zeros([1, 4], dtype=np.float128)
-            sums = np.zeros([1, 4], dtype=np.float128)
-
-        class_counts = np.zeros([1], dtype=np.float128) + 1e-10
-
-        # compute the mean first
-        logging.info('Computing bbox regression mean..')
-
-        for imind, imobj in enumerate(imdb):
-
-            if len(imobj.gts) > 0:
-
-                scale_factor = imobj.scale * conf.test_scale / imobj.imH
-                feat_size = calc_output_size(
-                    np.array([imobj.imH, imobj.imW]) * scale_factor,
-                    conf.feat_stride)
-                rois = locate_anchors(conf.anchors, feat_size, conf.feat_stride)
-
-                # determine ignores
-                igns, rmvs = determine_ignores(imobj.gts, conf.lbls, conf.ilbls,
-                                               conf.min_gt_vis, conf.min_gt_h,
-                                               np.inf, scale_factor)
-
-                # accumulate boxes
-                gts_all = bbXYWH2Coords(
-                    np.array([gt.bbox_full * scale_factor for gt in imobj.gts]))
-
-                # filter out irrelevant cls, and ignore cls
-                gts_val = gts_all[(rmvs == False) & (igns == False), :]
-                gts_ign = gts_all[(rmvs == False) & (igns == True), :]
-
-                # accumulate labels
-                box_lbls = np.array([gt.cls for gt in imobj.gts])
-                box_lbls = box_lbls[(rmvs == False) & (igns == False)]
-                box_lbls = np.array(
-                    [clsName2Ind(conf.lbls, cls) for cls in box_lbls])
-
-                if conf.has_3d:
-
-                    # accumulate 3d boxes
-                    gts_3d = np.array([gt.bbox_3d for gt in imobj.gts])
-                    gts_3d = gts_3d[(rmvs == False) & (igns == False), :]
-
-                    # rescale centers (in 2d)
-                    for gtind, gt in enumerate(gts_3d):
-                        gts_3d[gtind, 0:2] *= scale_factor
-
-                    # compute transforms for all 3d
-                    transforms, _, _ = compute_targets(
-                        gts_val,
-                        gts_ign,
-                        box_lbls,
-                        rois,
-                        conf.fg_thresh,
-                        conf.ign_thresh,
-                        conf.bg_thresh_lo,
-                        conf.bg_thresh_hi,
-                        conf.best_thresh,
-                        gts_3d=gts_3d,
-                        anchors=conf.anchors,
-                        tracker=rois[:, 4])
-                else:
+            targets.append((targets_2d, None))
 
-                    # compute transforms for 2d
-                    transforms, _, _ = compute_targets(
-                        gts_val, gts_ign, box_lbls, rois, conf.fg_thresh,
-                        conf.ign_thresh, conf.bg_thresh_lo, conf.bg_thresh_hi,
-                        conf.best_thresh)
-
-                gt_inds = np.flatnonzero(transforms[:, 4] > 0)
-
-                if len(gt_inds) > 0:
-
-                    if conf.has_3d:
-                        sums[:, 0:4] += np.sum(transforms[gt_inds, 0:4], axis=0)
-                        sums[:, 4:] += np.sum(transforms[gt_inds, 5:12], axis=0)
-                    else:
-                        sums += np.sum(transforms[gt_inds, 0:4], axis=0)
-
-                    class_counts += len(gt_inds)
-
-        means = sums / class_counts
-
-        logging.info('Computing bbox regression stds..')
-
-        for imobj in imdb:
-
-            if len(imobj.gts) > 0:
-
-                scale_factor = imobj.scale * conf.test_scale / imobj.imH
-                feat_size = calc_output_size(
-                    np.array([imobj.imH, imobj.imW]) * scale_factor,
-                    conf.feat_stride)
-                rois = locate_anchors(conf.anchors, feat_size, conf.feat_stride)
-
-                # determine ignores
-                igns, rmvs = determine_ignores(imobj.gts, conf.lbls, conf.ilbls,
-                                               conf.min_gt_vis, conf.min_gt_h,
-                                               np.inf, scale_factor)
-
-                # accumulate boxes
-                gts_all = bbXYWH2Coords(
-                    np.array([gt.bbox_full * scale_factor for gt in imobj.gts]))
-
-                # filter out irrelevant cls, and ignore cls
-                gts_val = gts_all[(rmvs == False) & (igns == False), :]
-                gts_ign = gts_all[(rmvs == False) & (igns == True), :]
-
-                # accumulate labels
-                box_lbls = np.array([gt.cls for gt in imobj.gts])
-                box_lbls = box_lbls[(rmvs == False) & (igns == False)]
-                box_lbls = np.array(
-                    [clsName2Ind(conf.lbls, cls) for cls in box_lbls])
-
-                if conf.has_3d:
-
-                    # accumulate 3d boxes
-                    gts_3d = np.array([gt.bbox_3d for gt in imobj.gts])
-                    gts_3d = gts_3d[(rmvs == False) & (igns == False), :]
-
-                    # rescale centers (in 2d)
-                    for gtind, gt in enumerate(gts_3d):
-                        gts_3d[gtind, 0:2] *= scale_factor
-
-                    # compute transforms for all 3d
-                    transforms, _, _ = compute_targets(
-                        gts_val,
-                        gts_ign,
-                        box_lbls,
-                        rois,
-                        conf.fg_thresh,
-                        conf.ign_thresh,
-                        conf.bg_thresh_lo,
-                        conf.bg_thresh_hi,
-                        conf.best_thresh,
-                        gts_3d=gts_3d,
-                        anchors=conf.anchors,
-                        tracker=rois[:, 4])
-                else:
+    if conf.has_3d:
+        squared_sums = np.zeros([1, 11], dtype=np.float128)
+        sums = np.zeros([1, 11], dtype=np.float128)
+    else:
+        squared_sums = np.zeros([1, 4], dtype=np.float128)
+        sums = np.zeros([1, 4], dtype=np.float128)
+
+    class_counts = np.zeros([1], dtype=np.float128) + 1e-10
+
+    # compute the mean first
+    logging.info('Computing bbox regression mean..')
 
-                    # compute transforms for 2d
-                    transforms, _, _ = compute_targets(
-                        gts_val, gts_ign, box_lbls, rois, conf.fg_thresh,
-                        conf.ign_thresh, conf.bg_thresh_lo, conf.bg_thresh_hi,
-                        conf.best_thresh)
+    for targets_2d, targets_3d in targets:
+
+        sums[:, 0:4] += np.sum(targets_2d, axis=0)
+        if conf.has_3d:
+            sums[:, 4:] += np.sum(targets_3d, axis=0)
 
-                gt_inds = np.flatnonzero(transforms[:, 4] > 0)
+        class_counts += len(targets_2d)
 
-                if len(gt_inds) > 0:
+    means = sums / class_counts
 
-                    if conf.has_3d:
-                        squared_sums[:, 0:4] += np.sum(np.power(
-                            transforms[gt_inds, 0:4] - means[:, 0:4], 2),
-                                                       axis=0)
-                        squared_sums[:, 4:] += np.sum(np.power(
-                            transforms[gt_inds, 5:12] - means[:, 4:], 2),
-                                                      axis=0)
+    logging.info('Computing bbox regression stds..')
 
-                    else:
-                        squared_sums += np.sum(np.power(
-                            transforms[gt_inds, 0:4] - means, 2),
-                                               axis=0)
+    for targets_2d, targets_3d in targets:
 
-        stds = np.sqrt((squared_sums / class_counts))
+        squared_sums[:, 0:4] += np.sum(np.power(
+            targets_2d - means[:, 0:4], 2), axis=0)
+        if conf.has_3d:
+            squared_sums[:, 4:] += np.sum(np.power(
+                targets_3d - means[:, 4:], 2), axis=0)
 
-        means = means.astype(float)
-        stds = stds.astype(float)
+    stds = np.sqrt((squared_sums / class_counts))
 
-        logging.info('used {:d} boxes with avg std {:.4f}'.format(
-            int(class_counts[0]), np.mean(stds)))
+    means = means.astype(float)
+    stds = stds.astype(float)
 
-        if (cache_folder is not None):
-            pickle_write(os.path.join(cache_folder, 'bbox_means.pkl'), means)
-            pickle_write(os.path.join(cache_folder, 'bbox_stds.pkl'), stds)
+    logging.info('used {:d} boxes with avg std {:.4f}'.format(
+        int(class_counts[0]), np.mean(stds)))
 
     conf.bbox_means = means
     conf.bbox_stds = stds
@@ -980,6 +1045,43 @@ def project_3d(p2, x3d, y3d, z3d, w3d, h3d, l3d, ry3d, return_3d=False):
         return verts3d
 
 
+def project_3d_batch(p2, x3d, y3d, z3d, w3d, h3d, l3d, ry3d):
+    """
+    project_3d of N boxes, the arguments are (N,) arrays.
+
+    Returns the (N, 16, 2) verts3d and the (N, 3, 8) corners_3d.
+    """
+
+    x3d, y3d, z3d, w3d, h3d, l3d, ry3d = [
+        np.asarray(
+            v, dtype=np.float64)[:, np.newaxis]
+        for v in (x3d, y3d, z3d, w3d, h3d, l3d, ry3d)
+    ]
+    cos_ry = np.cos(ry3d)
+    sin_ry = np.sin(ry3d)
+
+    # 3D bounding box corners, in the order of project_3d
+    x_corners = np.array([0, 1, 1, 1, 1, 0, 0, 0]) * l3d + (-l3d / 2)
+    y_corners = np.array([0, 0, 1, 1, 0, 0, 1, 1]) * h3d + (-h3d / 2)
+    z_corners = np.array([0, 0, 0, 1, 1, 1, 1, 0]) * w3d + (-w3d / 2)
+
+    # rotate and translate
+    corners_3d = np.stack(
+        (cos_ry * x_corners + sin_ry * z_corners + x3d, y_corners + y3d,
+         -sin_ry * x_corners + cos_ry * z_corners + z3d),
+        axis=1)
+
+    corners_2d = np.einsum('ij,njk->nik', p2[:3, :3], corners_3d) + \
+        p2[:3, 3][np.newaxis, :, np.newaxis]
+    corners_2d = corners_2d / corners_2d[:, 2:3]
+
+    bb3d_lines_verts_idx = [0, 1, 2, 3, 4, 5, 6, 7, 0, 5, 4, 1, 2, 7, 6, 3]
+
+    verts3d = corners_2d[:, :2, bb3d_lines_verts_idx].transpose(0, 2, 1)
+
+    return verts3d, corners_3d
+
+
 def project_3d_corners(p2, x3d, y3d, z3d, w3d, h3d, l3d, ry3d):
     """
 	Projects a 3D box into 2D vertices
@@ -1296,9 +1398,21 @@ def calc_output_size(res, stride):
     return np.ceil(np.array(res) / stride).astype(int)
 
 
+def nms(dets, thresh, gpu=0):
+    """
+    NMS of dets [x1, y1, x2, y2, score], returns the kept indices.
+
+    gpu_nms runs on device gpu, when gpu < 0 or gpu_nms is not available
+    py_cpu_nms is used, which keeps the same boxes.
+    """
+    if gpu >= 0 and gpu_nms is not None and fluid.is_compiled_with_cuda():
+        return gpu_nms(dets, thresh, device_id=gpu)
+    return py_cpu_nms(dets, thresh)
+
+
 def im_detect_3d(im, net, rpn_conf, preprocess, p2, gpu=0, synced=False):
     """
-    Object detection in 3D
+    Object detection in 3D, the NMS runs on CPU when gpu < 0
     """
 
     imH_orig = im.shape[0]
@@ -1425,10 +1539,8 @@ def im_detect_3d(im, net, rpn_conf, preprocess, p2, gpu=0, synced=False):
     if synced:
 
         # nms
-        keep_inds = gpu_nms(
-            aboxes[:, 0:5].astype(np.float32),
-            rpn_conf.nms_thres,
-            device_id=gpu)
+        keep_inds = nms(aboxes[:, 0:5].astype(np.float32),
+                        rpn_conf.nms_thres, gpu)
 
         # convert to bool
         keep = np.zeros([aboxes.shape[0], 1], dtype=bool)
@@ -1448,10 +1560,8 @@ def im_detect_3d(im, net, rpn_conf, preprocess, p2, gpu=0, synced=False):
         coords_3d = coords_3d[0:min(rpn_conf.nms_topN_pre, coords_3d.shape[0])]
 
         # nms
-        keep_inds = gpu_nms(
-            aboxes[:, 0:5].astype(np.float32),
-            rpn_conf.nms_thres,
-            device_id=gpu)
+        keep_inds = nms(aboxes[:, 0:5].astype(np.float32),
+                        rpn_conf.nms_thres, gpu)
 
         # stack cls prediction
         aboxes = np.hstack((aboxes, cls_pred[:, np.newaxis], coords_3d,
@@ -1487,14 +1597,94 @@ def get_2D_from_3D(p2, cx3d, cy3d, cz3d, w3d, h3d, l3d, rotY):
     return np.array([x, y, x2, y2])
 
 
+def kitti_3d_results(aboxes, p2, p2_inv, rpn_conf):
+    """
+    KITTI label lines of the boxes from im_detect_3d, z and ry of the top
+    nms_topN_post boxes with score >= 0.5 are refined together by
+    hill_climb_batch
+    """
+
+    aboxes = aboxes[0:min(rpn_conf.nms_topN_post, aboxes.shape[0]), :]
+    aboxes = aboxes[aboxes[:, 4] >= 0.5]
+    if aboxes.shape[0] == 0:
+        return ''
+
+    x1 = aboxes[:, 0]
+    y1 = aboxes[:, 1]
+    x2 = aboxes[:, 2]
+    y2 = aboxes[:, 3]
+    width = (x2 - x1 + 1)
+    height = (y2 - y1 + 1)
+
+    x3d = aboxes[:, 6]
+    y3d = aboxes[:, 7]
+    z3d = aboxes[:, 8]
+    w3d = aboxes[:, 9]
+    h3d = aboxes[:, 10]
+    l3d = aboxes[:, 11]
+    ry3d = aboxes[:, 12]
+    ones = np.ones_like(z3d)
+
+    # convert alpha into ry3d
+    coord3d = p2_inv.dot(np.stack((x3d * z3d, y3d * z3d, 1 * z3d, ones)))
+    ry3d = ry3d + np.arctan2(-coord3d[2], coord3d[0]) + 0.5 * math.pi
+    while np.any(ry3d > math.pi):
+        ry3d[ry3d > math.pi] -= math.pi * 2
+    while np.any(ry3d < (-math.pi)):
+        ry3d[ry3d < (-math.pi)] += math.pi * 2
+
+    box_2d = np.stack((x1, y1, width, height), axis=1)
+
+    z3d, ry3d, _ = hill_climb_batch(
+        p2,
+        p2_inv,
+        box_2d,
+        x3d,
+        y3d,
+        z3d,
+        w3d,
+        h3d,
+        l3d,
+        ry3d,
+        step_r_init=0.3 * math.pi,
+        r_lim=0.01)
+
+    # predict a more accurate projection
+    coord3d = p2_inv.dot(np.stack((x3d * z3d, y3d * z3d, 1 * z3d, ones)))
+    alpha = ry3d - np.arctan2(-coord3d[2], coord3d[0]) - 0.5 * math.pi
+    while np.any(alpha > math.pi):
+        alpha[alpha > math.pi] -= math.pi * 2
+    while np.any(alpha < (-math.pi)):
+        alpha[alpha < (-math.pi)] += math.pi * 2
+
+    x3d = coord3d[0]
+    y3d = coord3d[1] + h3d / 2
+    z3d = coord3d[2]
+
+    text_to_write = ''
+    for boxind in range(aboxes.shape[0]):
+        cls = rpn_conf.lbls[int(aboxes[boxind, 5] - 1)]
+        text_to_write += (
+            '{} -1 -1 {:.6f} {:.6f} {:.6f} {:.6f} {:.6f} {:.6f} {:.6f} {:.6f} {:.6f} {:.6f} {:.6f} '
+            + '{:.6f} {:.6f}\n').format(
+                cls, alpha[boxind], x1[boxind], y1[boxind], x2[boxind],
+                y2[boxind], h3d[boxind], w3d[boxind], l3d[boxind],
+                x3d[boxind], y3d[boxind], z3d[boxind], ry3d[boxind],
+                aboxes[boxind, 4])
+
+    return text_to_write
+
+
 def test_kitti_3d(dataset_test,
                   net,
                   rpn_conf,
                   results_path,
                   test_path,
-                  use_log=True):
+                  use_log=True,
+                  gpu=0):
     """
-    Test the KITTI framework for object detection in 3D
+    Test the KITTI framework for object detection in 3D, the NMS runs on CPU
+    when gpu < 0
     """
 
     # import read_kitti_cal
@@ -1527,77 +1717,12 @@ def test_kitti_3d(dataset_test,
         p2_inv = np.linalg.inv(p2)
 
         # forward test batch
-        aboxes = im_detect_3d(im, net, rpn_conf, preprocess, p2)
+        aboxes = im_detect_3d(im, net, rpn_conf, preprocess, p2, gpu=gpu)
 
         base_path, name, ext = file_parts(impath)
 
         file = open(os.path.join(results_path, name + '.txt'), 'w')
-        text_to_write = ''
-
-        for boxind in range(0, min(rpn_conf.nms_topN_post, aboxes.shape[0])):
-
-            box = aboxes[boxind, :]
-            score = box[4]
-            cls = rpn_conf.lbls[int(box[5] - 1)]
-
-            #if score >= 0.75:
-            if score >= 0.5:  #TODO yexiaoqing
-
-                x1 = box[0]
-                y1 = box[1]
-                x2 = box[2]
-                y2 = box[3]
-                width = (x2 - x1 + 1)
-                height = (y2 - y1 + 1)
-
-                # plot 3D box
-                x3d = box[6]
-                y3d = box[7]
-                z3d = box[8]
-                w3d = box[9]
-                h3d = box[10]
-                l3d = box[11]
-                ry3d = box[12]
-
-                # convert alpha into ry3d
-                coord3d = np.linalg.inv(p2).dot(
-                    np.array([x3d * z3d, y3d * z3d, 1 * z3d, 1]))
-                ry3d = convertAlpha2Rot(ry3d, coord3d[2], coord3d[0])
-
-                step_r = 0.3 * math.pi
-                r_lim = 0.01
-                box_2d = np.array([x1, y1, width, height])
-
-                z3d, ry3d, verts_best = hill_climb(
-                    p2,
-                    p2_inv,
-                    box_2d,
-                    x3d,
-                    y3d,
-                    z3d,
-                    w3d,
-                    h3d,
-                    l3d,
-                    ry3d,
-                    step_r_init=step_r,
-                    r_lim=r_lim)
-
-                # predict a more accurate projection
-                coord3d = np.linalg.inv(p2).dot(
-                    np.array([x3d * z3d, y3d * z3d, 1 * z3d, 1]))
-                alpha = convertRot2Alpha(ry3d, coord3d[2], coord3d[0])
-
-                x3d = coord3d[0]
-                y3d = coord3d[1]
-                z3d = coord3d[2]
-
-                y3d += h3d / 2
-
-                text_to_write += (
-                    '{} -1 -1 {:.6f} {:.6f} {:.6f} {:.6f} {:.6f} {:.6f} {:.6f} {:.6f} {:.6f} {:.6f} {:.6f} '
-                    + '{:.6f} {:.6f}\n').format(cls, alpha, x1, y1, x2, y2, h3d,
-                                                w3d, l3d, x3d, y3d, z3d, ry3d,
-                                                score)
+        text_to_write = kitti_3d_results(aboxes, p2, p2_inv, rpn_conf)
 
         file.write(text_to_write)
         file.close()
@@ -1751,3 +1876,31 @@ def test_projection(p2, p2_inv, box_2d, cx, cy, z, w3d, h3d, l3d, rotY):
            np.abs(y2 - y2_new))
 
     return ol, verts3d, b2, invalid
+
+
+def test_projection_batch(p2, p2_inv, box_2d, cx, cy, z, w3d, h3d, l3d, rotY):
+    """
+    test_projection of N boxes, box_2d is (N, 4) and the others are (N,)
+    arrays. Returns the (N,) ol, (N, 16, 2) verts3d, (N, 4) b2 and (N,)
+    invalid.
+    """
+
+    x = box_2d[:, 0]
+    y = box_2d[:, 1]
+    x2 = x + box_2d[:, 2] - 1
+    y2 = y + box_2d[:, 3] - 1
+
+    coord3d = p2_inv.dot(np.stack((cx * z, cy * z, z, np.ones_like(z))))
+
+    verts3d, corners_3d = project_3d_batch(p2, coord3d[0], coord3d[1],
+                                           coord3d[2], w3d, h3d, l3d, rotY)
+
+    invalid = np.any(corners_3d[:, 2, :] <= 0, axis=1)
+
+    b2 = np.concatenate(
+        (verts3d.min(axis=1), verts3d.max(axis=1)), axis=1)
+
+    ol = -(np.abs(x - b2[:, 0]) + np.abs(y - b2[:, 1]) +
+           np.abs(x2 - b2[:, 2]) + np.abs(y2 - b2[:, 3]))
+
+    return ol, verts3d, b2, invalid
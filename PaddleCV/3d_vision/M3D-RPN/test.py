@@ -54,6 +54,11 @@ def parse_args():
 
     parser.add_argument(
         '--data_dir', type=str, default='dataset', help='dataset directory')
+    parser.add_argument(
+        '--use_gpu',
+        type=ast.literal_eval,
+        default=True,
+        help='default use gpu, the NMS runs on CPU if False.')
 
     args = parser.parse_args()
     return args
@@ -70,7 +75,8 @@ def test():
     # make directory
     mkdir_if_missing(results_path, delete_if_exist=True)
 
-    with fluid.dygraph.guard(fluid.CUDAPlace(0)):
+    place = fluid.CUDAPlace(0) if args.use_gpu else fluid.CPUPlace()
+    with fluid.dygraph.guard(place):
         # training network
         src_path = os.path.join('.', 'models', conf.model + '.py')
         train_model = absolute_import(src_path)
@@ -81,8 +87,13 @@ def test():
         print("loaded model from ", args.weights_path)
         train_model.set_dict(Already_trained)  #, use_structured_name=True)
         print("start evaluation...")
-        test_kitti_3d(conf.dataset_test, train_model, conf, results_path,
-                      args.data_dir)
+        test_kitti_3d(
+            conf.dataset_test,
+            train_model,
+            conf,
+            results_path,
+            args.data_dir,
+            gpu=0 if args.use_gpu else -1)
     print("Evaluation Finished!")
 
 
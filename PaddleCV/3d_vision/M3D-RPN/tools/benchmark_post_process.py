@@ -0,0 +1,204 @@
+#  Copyright (c) 2020 PaddlePaddle Authors. All Rights Reserve.
+#
+#Licensed under the Apache License, Version 2.0 (the "License");
+#you may not use this file except in compliance with the License.
+#You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#Unless required by applicable law or agreed to in writing, software
+#distributed under the License is distributed on an "AS IS" BASIS,
+#WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#See the License for the specific language governing permissions and
+#limitations under the License.
+"""
+Per image post-processing latency of test_kitti_3d on KITTI val.
+
+The network runs on the val images like in test.py, then for every image
+the NMS is timed on CPU and on GPU (if gpu_nms is built), and the 3D box
+refinement is timed with hill_climb per box, like test_kitti_3d did before,
+and with kitti_3d_results. The kept boxes and the label lines are compared.
+Run from the M3D-RPN directory.
+"""
+
+import os
+import sys
+import math
+import argparse
+import ast
+
+sys.path.insert(0, os.getcwd())
+
+import numpy as np
+import cv2
+import paddle.fluid as fluid
+from easydict import EasyDict as edict
+
+import lib.rpn_util as rpn_util
+from lib.rpn_util import *
+from lib.util import *
+from data.m3drpn_reader import read_kitti_cal
+from time import time
+
+
+def parse_args():
+    """parse"""
+    parser = argparse.ArgumentParser("M3D-RPN post-processing benchmark")
+    parser.add_argument("--conf_path", type=str, default='', help="config.pkl")
+    parser.add_argument(
+        '--weights_path', type=str, default='', help='weights save path')
+    parser.add_argument(
+        '--backbone',
+        type=str,
+        default='DenseNet121',
+        help='backbone model to train, default DenseNet121')
+    parser.add_argument(
+        '--data_dir', type=str, default='dataset', help='dataset directory')
+    parser.add_argument(
+        '--num_images',
+        type=int,
+        default=500,
+        help='val images to test, default 500')
+    parser.add_argument(
+        '--use_gpu',
+        type=ast.literal_eval,
+        default=True,
+        help='default use gpu.')
+    args = parser.parse_args()
+    return args
+
+
+def per_box_results(aboxes, p2, p2_inv, rpn_conf):
+    """label lines of test_kitti_3d with hill_climb per box"""
+    text_to_write = ''
+    for boxind in range(0, min(rpn_conf.nms_topN_post, aboxes.shape[0])):
+        box = aboxes[boxind, :]
+        score = box[4]
+        cls = rpn_conf.lbls[int(box[5] - 1)]
+        if score < 0.5:
+            continue
+
+        x1, y1, x2, y2 = box[0:4]
+        width = (x2 - x1 + 1)
+        height = (y2 - y1 + 1)
+        x3d, y3d, z3d, w3d, h3d, l3d, ry3d = box[6:13]
+
+        coord3d = p2_inv.dot(np.array([x3d * z3d, y3d * z3d, 1 * z3d, 1]))
+        ry3d = convertAlpha2Rot(ry3d, coord3d[2], coord3d[0])
+
+        box_2d = np.array([x1, y1, width, height])
+        z3d, ry3d, _ = hill_climb(
+            p2,
+            p2_inv,
+            box_2d,
+            x3d,
+            y3d,
+            z3d,
+            w3d,
+            h3d,
+            l3d,
+            ry3d,
+            step_r_init=0.3 * math.pi,
+            r_lim=0.01)
+
+        coord3d = p2_inv.dot(np.array([x3d * z3d, y3d * z3d, 1 * z3d, 1]))
+        alpha = convertRot2Alpha(ry3d, coord3d[2], coord3d[0])
+
+        text_to_write += (
+            '{} -1 -1 {:.6f} {:.6f} {:.6f} {:.6f} {:.6f} {:.6f} {:.6f} {:.6f} {:.6f} {:.6f} {:.6f} '
+            + '{:.6f} {:.6f}\n').format(cls, alpha, x1, y1, x2, y2, h3d, w3d,
+                                        l3d, coord3d[0], coord3d[1] + h3d / 2,
+                                        coord3d[2], ry3d, score)
+    return text_to_write
+
+
+def time_it(fn, *args):
+    start = time()
+    out = fn(*args)
+    return time() - start, out
+
+
+def benchmark():
+    """run the network on val and time the post-processing"""
+    args = parse_args()
+    conf = edict(pickle_read(args.conf_path))
+    conf.pretrained = None
+
+    # record the NMS inputs of im_detect_3d
+    nms_inputs = []
+
+    def recording_nms(dets, thresh, gpu=0):
+        nms_inputs.append(dets)
+        return nms(dets, thresh, gpu)
+
+    rpn_util.nms = recording_nms
+
+    imlist = list_files(
+        os.path.join(args.data_dir, conf.dataset_test, 'validation', 'image_2',
+                     ''), '*.png')[:args.num_images]
+    preprocess = Preprocess([conf.test_scale], conf.image_means,
+                            conf.image_stds)
+    use_gpu_nms = args.use_gpu and gpu_nms is not None
+
+    costs = {'nms_cpu': 0., 'nms_gpu': 0., 'per_box': 0., 'batched': 0.}
+    nms_diff = 0
+    lines = 0
+    lines_diff = 0
+
+    place = fluid.CUDAPlace(0) if args.use_gpu else fluid.CPUPlace()
+    with fluid.dygraph.guard(place):
+        src_path = os.path.join('.', 'models', conf.model + '.py')
+        train_model = absolute_import(src_path)
+        train_model = train_model.build(conf, args.backbone, 'train')
+        train_model.eval()
+        train_model.phase = "eval"
+        Already_trained, _ = fluid.load_dygraph(args.weights_path)
+        train_model.set_dict(Already_trained)
+
+        for impath in imlist:
+            im = cv2.imread(impath)
+            _, name, _ = file_parts(impath)
+            p2 = read_kitti_cal(
+                os.path.join(args.data_dir, conf.dataset_test, 'validation',
+                             'calib', name + '.txt'))
+            p2_inv = np.linalg.inv(p2)
+
+            aboxes = im_detect_3d(
+                im, train_model, conf, preprocess, p2,
+                gpu=0 if args.use_gpu else -1)
+            dets = nms_inputs.pop()
+
+            cost, keep_cpu = time_it(nms, dets, conf.nms_thres, -1)
+            costs['nms_cpu'] += cost
+            if use_gpu_nms:
+                cost, keep_gpu = time_it(nms, dets, conf.nms_thres, 0)
+                costs['nms_gpu'] += cost
+                nms_diff += list(keep_cpu) != list(keep_gpu)
+
+            cost, text_ref = time_it(per_box_results, aboxes, p2, p2_inv,
+                                     conf)
+            costs['per_box'] += cost
+            cost, text = time_it(kitti_3d_results, aboxes, p2, p2_inv, conf)
+            costs['batched'] += cost
+
+            text_ref = text_ref.splitlines()
+            text = text.splitlines()
+            lines += len(text_ref)
+            lines_diff += sum(a != b for a, b in zip(text_ref, text)) + abs(
+                len(text_ref) - len(text))
+
+    num = max(len(imlist), 1)
+    print("{} images, per image:".format(len(imlist)))
+    print("nms cpu: {:.2f} ms".format(costs['nms_cpu'] / num * 1000))
+    if use_gpu_nms:
+        print("nms gpu: {:.2f} ms, {} images keep other boxes than cpu".
+              format(costs['nms_gpu'] / num * 1000, nms_diff))
+    print("hill climb per box: {:.2f} ms".format(costs['per_box'] / num *
+                                                  1000))
+    print("hill climb batched: {:.2f} ms, {} of {} lines differ".format(
+        costs['batched'] / num * 1000, lines_diff, lines))
+
+
+if __name__ == '__main__':
+
+    benchmark()
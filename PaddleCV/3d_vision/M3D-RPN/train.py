@@ -69,6 +69,12 @@ def parse_args():
         help='default use gpu.')
     parser.add_argument(
         '--data_dir', type=str, default='dataset', help='dataset directory')
+    parser.add_argument(
+        '--num_workers',
+        type=int,
+        default=None,
+        help='processes computing the anchors and bbox stats, default all cpus.'
+    )
     parser.add_argument(
         '--save_dir',
         type=str,
@@ -114,8 +120,10 @@ def train():
     m3drpn_reader = M3drpnReader(conf, args.data_dir)
     epoch = (conf.max_iter / (m3drpn_reader.len / conf.batch_size)) + 1
     train_reader = m3drpn_reader.get_reader(conf.batch_size, mode='train')
-    generate_anchors(conf, m3drpn_reader.data['train'], paths.output)
-    compute_bbox_stats(conf, m3drpn_reader.data['train'], paths.output)
+    generate_anchors(conf, m3drpn_reader.data['train'], paths.cache,
+                     args.num_workers)
+    compute_bbox_stats(conf, m3drpn_reader.data['train'], paths.cache,
+                       args.num_workers)
     pickle_write(os.path.join(paths.output, 'conf.pkl'), conf)
 
     # train
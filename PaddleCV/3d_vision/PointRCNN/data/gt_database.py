@@ -0,0 +1,187 @@
+#  Copyright (c) 2020 PaddlePaddle Authors. All Rights Reserve.
+#
+#Licensed under the Apache License, Version 2.0 (the "License");
+#you may not use this file except in compliance with the License.
+#You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#Unless required by applicable law or agreed to in writing, software
+#distributed under the License is distributed on an "AS IS" BASIS,
+#WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#See the License for the specific language governing permissions and
+#limitations under the License.
+"""
+Packed GT database for GT augmentation, and half-space tests on 3D boxes.
+
+A packed database is a directory holding
+
+    points.npy   (P, 4) float32, [x, y, z, intensity] of all objects
+    index.npz    offsets (N + 1) of each object in points.npy, gt_box3d
+                 (N, 7), corners (N, 8, 3) and planes (N, 6, 4) of the
+                 gt boxes enlarged like in GT augmentation, sample_ids,
+                 cls_types and labels (label lines of the objects)
+
+points.npy is read with mmap, so only the points of the sampled objects are
+touched and the pages are shared by the reader processes.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import numpy as np
+
+import utils.cyops.kitti_utils as kitti_utils
+from utils.object3d import Object3d
+
+__all__ = [
+    "boxes3d_to_planes", "pts_in_hulls", "hulls_overlap", "enlarge_gt_boxes3d",
+    "GTDatabase", "pack_gt_database"
+]
+
+# enlargement of w and l of the gt boxes to avoid too nearby boxes
+GT_AUG_ENLARGE = 0.5
+
+# corner ids of the faces of the corners from boxes3d_to_corners3d, bottom,
+# top and the 4 sides
+BOX_FACES = np.array(
+    [[0, 1, 2], [4, 5, 6], [0, 1, 5], [1, 2, 6], [2, 3, 7], [3, 0, 4]])
+
+
+def boxes3d_to_planes(corners3d):
+    """
+    :param corners3d: (N, 8, 3) corners of boxes
+    :return planes: (N, 6, 4) [nx, ny, nz, d] of the faces, the normals are
+        unit and point outwards, so n * p + d <= 0 inside the box
+    """
+    corners3d = np.asarray(corners3d, dtype=np.float64)
+    a = corners3d[:, BOX_FACES[:, 0]]
+    b = corners3d[:, BOX_FACES[:, 1]]
+    c = corners3d[:, BOX_FACES[:, 2]]
+    normals = np.cross(b - a, c - a)
+    normals /= np.linalg.norm(normals, axis=2, keepdims=True)
+    d = -(normals * a).sum(axis=2)
+    center = corners3d.mean(axis=1, keepdims=True)
+    outwards = np.where((normals * center).sum(axis=2) + d > 0, -1., 1.)
+    planes = np.concatenate((normals, d[:, :, np.newaxis]), axis=2)
+    return (planes * outwards[:, :, np.newaxis]).astype(np.float32)
+
+
+def pts_in_hulls(pts, planes, eps=1e-5):
+    """
+    :param pts: (M, 3) points
+    :param planes: (N, 6, 4) planes of boxes from boxes3d_to_planes
+    :return: (N, M) bool, whether the points are inside the boxes
+    """
+    # (N * 6, M) distances of the points to the planes
+    dist = np.dot(planes[:, :, :3].reshape(-1, 3), pts.T)
+    dist += planes[:, :, 3].reshape(-1, 1)
+    return dist.reshape(planes.shape[0], 6, -1).max(axis=1) <= eps
+
+
+def hulls_overlap(corners3d, planes, query_corners3d, query_planes,
+                  eps=1e-5):
+    """
+    Whether the boxes overlap with a positive volume. The boxes are rotated
+    along y only, so the face normals of the two boxes include all the
+    separating axes, and two boxes are apart iff all the corners of one box
+    are outside a face plane of the other.
+
+    :param corners3d: (N, 8, 3), planes: (N, 6, 4) of the boxes
+    :param query_corners3d: (M, 8, 3), query_planes: (M, 6, 4)
+    :return: (N, M) bool
+    """
+    # (N, M, 6, 8) distances of the query corners to the planes
+    dist = np.einsum('nfk,mck->nmfc', planes[:, :, :3], query_corners3d) + \
+        planes[:, np.newaxis, :, 3:]
+    apart = (dist >= -eps).all(axis=3).any(axis=2)
+    dist = np.einsum('mfk,nck->nmfc', query_planes[:, :, :3], corners3d) + \
+        query_planes[np.newaxis, :, :, 3:]
+    apart |= (dist >= -eps).all(axis=3).any(axis=2)
+    return ~apart
+
+
+def enlarge_gt_boxes3d(boxes3d):
+    """enlarge w and l of the boxes like GT augmentation"""
+    boxes3d = boxes3d.copy()
+    boxes3d[:, 4] += GT_AUG_ENLARGE
+    boxes3d[:, 5] += GT_AUG_ENLARGE
+    return boxes3d
+
+
+def pack_gt_database(gt_database, path):
+    """
+    write the gt database, a list of dicts of generate_gt_database.py, to
+    the packed database directory path
+    """
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    num = len(gt_database)
+    counts = np.array([len(obj['points']) for obj in gt_database],
+                      dtype=np.int64)
+    offsets = np.zeros(num + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(counts)
+
+    points = np.lib.format.open_memmap(
+        os.path.join(path, 'points.npy'),
+        mode='w+',
+        dtype=np.float32,
+        shape=(int(offsets[-1]), 4))
+    for k, obj in enumerate(gt_database):
+        points[offsets[k]:offsets[k + 1], 0:3] = obj['points']
+        points[offsets[k]:offsets[k + 1], 3] = obj['intensity']
+    points.flush()
+    del points
+
+    gt_box3d = np.array(
+        [obj['gt_box3d'] for obj in gt_database],
+        dtype=np.float32).reshape(-1, 7)
+    corners = kitti_utils.boxes3d_to_corners3d(enlarge_gt_boxes3d(gt_box3d))
+    np.savez(
+        os.path.join(path, 'index.npz'),
+        offsets=offsets,
+        gt_box3d=gt_box3d,
+        corners=corners.reshape(-1, 8, 3),
+        planes=boxes3d_to_planes(corners.reshape(-1, 8, 3)),
+        sample_ids=np.array(
+            [obj['sample_id'] for obj in gt_database], dtype=np.int32),
+        cls_types=np.array([obj['cls_type'] for obj in gt_database]),
+        labels=np.array([obj['obj'].src.strip() for obj in gt_database]))
+
+
+class GTDatabase(object):
+    """
+    Read only packed gt database, items are the dicts of the pickled
+    database, with the corners and planes of the enlarged box added.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.points = np.load(os.path.join(path, 'points.npy'), mmap_mode='r')
+        index = np.load(os.path.join(path, 'index.npz'))
+        self.offsets = index['offsets']
+        self.gt_box3d = index['gt_box3d']
+        self.corners = index['corners']
+        self.planes = index['planes']
+        self.sample_ids = index['sample_ids']
+        self.cls_types = index['cls_types']
+        self.labels = index['labels']
+        self.num_points = np.diff(self.offsets)
+
+    def __len__(self):
+        return len(self.gt_box3d)
+
+    def __getitem__(self, idx):
+        pts = np.array(self.points[self.offsets[idx]:self.offsets[idx + 1]])
+        return {
+            'sample_id': int(self.sample_ids[idx]),
+            'cls_type': str(self.cls_types[idx]),
+            'gt_box3d': self.gt_box3d[idx].copy(),
+            'points': pts[:, 0:3],
+            'intensity': pts[:, 3],
+            'obj': Object3d(str(self.labels[idx])),
+            'corners': self.corners[idx].copy(),
+            'planes': self.planes[idx].copy()
+        }
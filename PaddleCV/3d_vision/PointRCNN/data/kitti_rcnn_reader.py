@@ -20,12 +20,14 @@ from __future__ import division
 from __future__ import print_function
 
 import os
+import copy
+import mmap
 import signal
 import logging
+import six
+import traceback
 import multiprocessing
 import numpy as np
-import scipy
-from scipy.spatial import Delaunay
 try:
     import cPickle as pickle
 except:
@@ -35,6 +37,8 @@ import pts_utils
 import utils.cyops.kitti_utils as kitti_utils
 import utils.cyops.roipool3d_utils as roipool3d_utils
 from data.kitti_dataset import KittiDataset
+from data.gt_database import GTDatabase, boxes3d_to_planes, pts_in_hulls, \
+    hulls_overlap, enlarge_gt_boxes3d
 from utils.config import cfg
 from collections import OrderedDict
 
@@ -42,6 +46,9 @@ __all__ = ["KittiRCNNReader"]
 
 logger = logging.getLogger(__name__)
 
+# seconds to wait for a batch before checking the reader processes are alive
+READER_POLL_TIMEOUT = 5
+
 
 def has_empty(data):
     for d in data:
@@ -50,21 +57,59 @@ def has_empty(data):
     return False
 
 
-def in_hull(p, hull):
+def batch_layout(batch_data):
+    """
+    Layout of batch_data, a list of samples of fields, as written by
+    pack_batch, fields of different lengths are padded with zeros to the
+    longest one.
+    :return: layout of the fields [(offset, dtype, shape, lengths)], lengths
+        is None for fields of the same shape, and the bytes it takes
+    """
+    layout = []
+    offset = 0
+    for k in range(len(batch_data[0])):
+        items = [np.asarray(sample[k]) for sample in batch_data]
+        shapes = [item.shape for item in items]
+        if all(shape == shapes[0] for shape in shapes):
+            shape = (len(items), ) + shapes[0]
+            lengths = None
+        else:
+            lengths = [shape[0] for shape in shapes]
+            shape = (len(items), max(lengths)) + shapes[0][1:]
+        dtype = items[0].dtype
+        layout.append((offset, dtype.str, shape, lengths))
+        # keep the arrays 64 bytes aligned
+        offset += (int(np.prod(shape)) * dtype.itemsize + 63) // 64 * 64
+    return layout, offset
+
+
+def pack_batch(batch_data, buf, layout):
     """
-    :param p: (N, K) test points
-    :param hull: (M, K) M corners of a box
-    :return (N) bool
+    Write batch_data to the buffer buf with the layout of batch_layout
     """
-    try:
-        if not isinstance(hull, Delaunay):
-            hull = Delaunay(hull)
-        flag = hull.find_simplex(p) >= 0
-    except scipy.spatial.qhull.QhullError:
-        logger.debug('Warning: not a hull.')
-        flag = np.zeros(p.shape[0], dtype=np.bool)
+    for k, (offset, dtype, shape, lengths) in enumerate(layout):
+        arr = np.frombuffer(buf, np.dtype(dtype), count=int(np.prod(shape)), offset=offset).reshape(shape)
+        for i, sample in enumerate(batch_data):
+            if lengths is None:
+                arr[i] = sample[k]
+            else:
+                arr[i, :lengths[i]] = sample[k]
+                arr[i, lengths[i]:] = 0
+
 
-    return flag
+def unpack_batch(buf, layout, pad=True):
+    """
+    Views of the batch written by pack_batch, as a list of samples of fields,
+    fields of different lengths are unpadded if not pad
+    """
+    fields = []
+    for offset, dtype, shape, lengths in layout:
+        arr = np.frombuffer(buf, np.dtype(dtype), count=int(np.prod(shape)), offset=offset).reshape(shape)
+        if lengths is None or pad:
+            fields.append(list(arr))
+        else:
+            fields.append([arr[i, :lengths[i]] for i in range(shape[0])])
+    return [list(sample) for sample in zip(*fields)]
 
 
 class KittiRCNNReader(KittiDataset):
@@ -111,6 +156,7 @@ class KittiRCNNReader(KittiDataset):
         self.rcnn_training_feature_dir = rcnn_training_feature_dir
 
         self.gt_database = None
+        self.gt_database_groups = None
 
         if not self.random_select:
             logger.warning('random select is False')
@@ -120,21 +166,7 @@ class KittiRCNNReader(KittiDataset):
 
         if cfg.RPN.ENABLED:
             if gt_database_dir is not None:
-                self.gt_database = pickle.load(open(gt_database_dir, 'rb'))
-
-                if cfg.GT_AUG_HARD_RATIO > 0:
-                    easy_list, hard_list = [], []
-                    for k in range(self.gt_database.__len__()):
-                        obj = self.gt_database[k]
-                        if obj['points'].shape[0] > 100:
-                            easy_list.append(obj)
-                        else:
-                            hard_list.append(obj)
-                    self.gt_database = [easy_list, hard_list]
-                    logger.info('Loading gt_database(easy(pt_num>100): %d, hard(pt_num<=100): %d) from %s'
-                                % (len(easy_list), len(hard_list), gt_database_dir))
-                else:
-                    logger.info('Loading gt_database(%d) from %s' % (len(self.gt_database), gt_database_dir))
+                self.gt_database, self.gt_database_groups = self.load_gt_database(gt_database_dir)
 
             if mode == 'TRAIN':
                 self.preprocess_rpn_training_data()
@@ -154,6 +186,35 @@ class KittiRCNNReader(KittiDataset):
             logger.info('Done: filter %s results for rcnn training: %d / %d\n' %
                   (self.mode, len(self.sample_id_list), len(self.image_idx_list)))
 
+    @staticmethod
+    def load_gt_database(gt_database_dir):
+        """
+        Load the packed gt database directory, or the pickled gt database
+        :return: gt_database, [easy ids, hard ids] or None if cfg.GT_AUG_HARD_RATIO <= 0
+        """
+        if os.path.isdir(gt_database_dir):
+            gt_database = GTDatabase(gt_database_dir)
+            num_points = gt_database.num_points
+        else:
+            gt_database = pickle.load(open(gt_database_dir, 'rb'))
+            # add the enlarged corners and planes the packed database stores
+            gt_boxes3d = np.array([obj['gt_box3d'] for obj in gt_database], dtype=np.float32).reshape(-1, 7)
+            corners = kitti_utils.boxes3d_to_corners3d(enlarge_gt_boxes3d(gt_boxes3d)).reshape(-1, 8, 3)
+            planes = boxes3d_to_planes(corners)
+            for k, obj in enumerate(gt_database):
+                obj['corners'], obj['planes'] = corners[k], planes[k]
+            num_points = np.array([obj['points'].shape[0] for obj in gt_database])
+
+        if cfg.GT_AUG_HARD_RATIO > 0:
+            easy_ids = np.where(num_points > 100)[0]
+            hard_ids = np.where(num_points <= 100)[0]
+            logger.info('Loading gt_database(easy(pt_num>100): %d, hard(pt_num<=100): %d) from %s'
+                        % (len(easy_ids), len(hard_ids), gt_database_dir))
+            return gt_database, [easy_ids, hard_ids]
+
+        logger.info('Loading gt_database(%d) from %s' % (len(gt_database), gt_database_dir))
+        return gt_database, None
+
     def preprocess_rpn_training_data(self):
         """
         Discard samples which don't have current classes, which will not be used for training.
@@ -414,15 +475,13 @@ class KittiRCNNReader(KittiDataset):
             extra_gt_num = cfg.GT_EXTRA_NUM
         try_times = 100
         cnt = 0
-        cur_gt_boxes3d = all_gt_boxes3d.copy()
-        cur_gt_boxes3d[:, 4] += 0.5  # TODO: consider different objects
-        cur_gt_boxes3d[:, 5] += 0.5  # enlarge new added box to avoid too nearby boxes
-        cur_gt_corners = kitti_utils.boxes3d_to_corners3d(cur_gt_boxes3d)
+        # enlarge new added box to avoid too nearby boxes
+        cur_gt_corners = kitti_utils.boxes3d_to_corners3d(enlarge_gt_boxes3d(all_gt_boxes3d)).reshape(-1, 8, 3)
+        cur_gt_planes = boxes3d_to_planes(cur_gt_corners)
 
         extra_gt_obj_list = []
         extra_gt_boxes3d_list = []
         new_pts_list, new_pts_intensity_list = [], []
-        src_pts_flag = np.ones(pts_rect.shape[0], dtype=np.int32)
 
         road_plane = self.get_road_plane(sample_id)
         a, b, c, d = road_plane
@@ -432,61 +491,54 @@ class KittiRCNNReader(KittiDataset):
                 break
 
             try_times -= 1
-            if cfg.GT_AUG_HARD_RATIO > 0:
+            if self.gt_database_groups is not None:
                 p = np.random.rand()
                 if p > cfg.GT_AUG_HARD_RATIO:
                     # use easy sample
-                    rand_idx = np.random.randint(0, len(self.gt_database[0]))
-                    new_gt_dict = self.gt_database[0][rand_idx]
+                    gt_ids = self.gt_database_groups[0]
                 else:
                     # use hard sample
-                    rand_idx = np.random.randint(0, len(self.gt_database[1]))
-                    new_gt_dict = self.gt_database[1][rand_idx]
+                    gt_ids = self.gt_database_groups[1]
+                rand_idx = np.random.randint(0, len(gt_ids))
+                new_gt_dict = self.gt_database[gt_ids[rand_idx]]
             else:
                 rand_idx = np.random.randint(0, self.gt_database.__len__())
                 new_gt_dict = self.gt_database[rand_idx]
 
             new_gt_box3d = new_gt_dict['gt_box3d'].copy()
-            new_gt_points = new_gt_dict['points'].copy()
-            new_gt_intensity = new_gt_dict['intensity'].copy()
-            new_gt_obj = new_gt_dict['obj']
             center = new_gt_box3d[0:3]
             if cfg.PC_REDUCE_BY_RANGE and (self.check_pc_range(center) is False):
                 continue
 
-            if new_gt_points.__len__() < 5:  # too few points
+            if new_gt_dict['points'].__len__() < 5:  # too few points
                 continue
 
             # put it on the road plane
             cur_height = (-d - a * center[0] - c * center[2]) / b
             move_height = new_gt_box3d[1] - cur_height
             new_gt_box3d[1] -= move_height
-            new_gt_points[:, 1] -= move_height
-            new_gt_obj.pos[1] -= move_height
 
-            new_enlarged_box3d = new_gt_box3d.copy()
-            new_enlarged_box3d[4] += 0.5
-            new_enlarged_box3d[5] += 0.5  # enlarge new added box to avoid too nearby boxes
+            # move the precomputed corners and planes of the enlarged box along
+            new_corners = new_gt_dict['corners'].copy()
+            new_corners[:, 1] -= move_height
+            new_planes = new_gt_dict['planes'].copy()
+            new_planes[:, 3] += new_planes[:, 1] * move_height
 
             cnt += 1
-            new_corners = kitti_utils.boxes3d_to_corners3d(new_enlarged_box3d.reshape(1, 7))
-            iou3d = kitti_utils.get_iou3d(new_corners, cur_gt_corners)
-            valid_flag = iou3d.max() < 1e-8
-            if not valid_flag:
+            overlap = hulls_overlap(new_corners[np.newaxis], new_planes[np.newaxis], cur_gt_corners, cur_gt_planes)
+            if overlap.any():
                 continue
 
-            enlarged_box3d = new_gt_box3d.copy()
-            enlarged_box3d[3] += 2  # remove the points above and below the object
-
-            boxes_pts_mask_list = pts_utils.pts_in_boxes3d(pts_rect,
-                    enlarged_box3d.reshape(1, 7))
-            pt_mask_flag = (boxes_pts_mask_list[0] == 1)
-            src_pts_flag[pt_mask_flag] = 0  # remove the original points which are inside the new box
+            new_gt_points = new_gt_dict['points'].copy()
+            new_gt_points[:, 1] -= move_height
+            new_gt_obj = copy.copy(new_gt_dict['obj'])
+            new_gt_obj.pos = new_gt_obj.pos.copy()
+            new_gt_obj.pos[1] -= move_height
 
             new_pts_list.append(new_gt_points)
-            new_pts_intensity_list.append(new_gt_intensity)
-            cur_gt_boxes3d = np.concatenate((cur_gt_boxes3d, new_enlarged_box3d.reshape(1, 7)), axis=0)
-            cur_gt_corners = np.concatenate((cur_gt_corners, new_corners), axis=0)
+            new_pts_intensity_list.append(new_gt_dict['intensity'])
+            cur_gt_corners = np.concatenate((cur_gt_corners, new_corners[np.newaxis]), axis=0)
+            cur_gt_planes = np.concatenate((cur_gt_planes, new_planes[np.newaxis]), axis=0)
             extra_gt_boxes3d_list.append(new_gt_box3d.reshape(1, 7))
             extra_gt_obj_list.append(new_gt_obj)
 
@@ -494,9 +546,15 @@ class KittiRCNNReader(KittiDataset):
             return False, pts_rect, pts_intensity, None, None
 
         extra_gt_boxes3d = np.concatenate(extra_gt_boxes3d_list, axis=0)
+        # remove the original points which are inside the new boxes, and the points above and below them
+        enlarged_boxes3d = extra_gt_boxes3d.copy()
+        enlarged_boxes3d[:, 3] += 2
+        boxes_pts_mask_list = pts_utils.pts_in_boxes3d(pts_rect, enlarged_boxes3d)
+        src_pts_flag = ~(boxes_pts_mask_list == 1).any(axis=0)
+
         # remove original points and add new points
-        pts_rect = pts_rect[src_pts_flag == 1]
-        pts_intensity = pts_intensity[src_pts_flag == 1]
+        pts_rect = pts_rect[src_pts_flag]
+        pts_intensity = pts_intensity[src_pts_flag]
         new_pts_rect = np.concatenate(new_pts_list, axis=0)
         new_pts_intensity = np.concatenate(new_pts_intensity_list, axis=0)
         pts_rect = np.concatenate((pts_rect, new_pts_rect), axis=0)
@@ -580,15 +638,16 @@ class KittiRCNNReader(KittiDataset):
         gt_corners = kitti_utils.boxes3d_to_corners3d(gt_boxes3d, rotate=True)
         extend_gt_boxes3d = kitti_utils.enlarge_box3d(gt_boxes3d, extra_width=0.2)
         extend_gt_corners = kitti_utils.boxes3d_to_corners3d(extend_gt_boxes3d, rotate=True)
+        # (M, N) flags of the points inside the boxes, by the half-spaces of the box faces
+        fg_pt_flags = pts_in_hulls(pts_rect, boxes3d_to_planes(gt_corners.reshape(-1, 8, 3)))
+        fg_enlarge_flags = pts_in_hulls(pts_rect, boxes3d_to_planes(extend_gt_corners.reshape(-1, 8, 3)))
         for k in range(gt_boxes3d.shape[0]):
-            box_corners = gt_corners[k]
-            fg_pt_flag = in_hull(pts_rect, box_corners)
+            fg_pt_flag = fg_pt_flags[k]
             fg_pts_rect = pts_rect[fg_pt_flag]
             cls_label[fg_pt_flag] = 1
 
             # enlarge the bbox3d, ignore nearby points
-            extend_box_corners = extend_gt_corners[k]
-            fg_enlarge_flag = in_hull(pts_rect, extend_box_corners)
+            fg_enlarge_flag = fg_enlarge_flags[k]
             ignore_flag = np.logical_xor(fg_pt_flag, fg_enlarge_flag)
             cls_label[ignore_flag] = -1
 
@@ -1135,59 +1194,121 @@ class KittiRCNNReader(KittiDataset):
                     yield batch_out
         return reader
 
-    def get_multiprocess_reader(self, batch_size, fields, proc_num=8, max_queue_len=128, drop_last=False):
-        def read_to_queue(idxs, queue):
-            for idx in idxs:
-                sample_all = self.__getitem__(idx)
-                sample = [sample_all[f] for f in fields]
-                queue.put(sample)
-            queue.put(None)
+    def sample_bytes_estimate(self):
+        """
+        Upper estimate of the bytes of a sample, to size the shared memory
+        buffers of get_multiprocess_reader without loading a sample
+        """
+        if cfg.RPN.ENABLED:
+            # float32 pts_input with intensity, rpn_cls_label, rpn_reg_label
+            return self.npoints * 4 * (4 + 1 + 7)
+        # rpn_xyz, rpn_features, rpn_intensity, seg_mask and pts_depth of the
+        # scene points or of the points pooled for the rois
+        num_points = max(self.npoints, cfg.RCNN.ROI_PER_IMAGE * cfg.RCNN.NUM_POINTS)
+        return num_points * 4 * (3 + cfg.RPN.FP_MLPS[0][-1] + 3)
+
+    def get_multiprocess_reader(self, batch_size, fields, proc_num=8, num_buffers=8, drop_last=False):
+        """
+        Read batches in proc_num processes. The processes assemble and pad
+        whole batches into shared memory buffers and pass only the buffer id
+        and the array layout to the trainer, the returned sample list
+        generator yields numpy views of the buffer, which are copied by the
+        loader before the buffer is reused.
+
+        :param num_buffers: number of shared memory batch buffers
+        """
+        # fields of different lengths are kept as LoD in rpn feeds, and padded
+        # in rcnn feeds like padding_batch
+        pad = not cfg.RPN.ENABLED
+        # the buffers are sized by an estimate at first, and grown to the
+        # largest batch that did not fit for the next epochs
+        buffer_bytes = [int(self.sample_bytes_estimate() * batch_size) + (1 << 20)]
+
+        def read_to_buffers(batch_idxs, seed, buffers, free_queue, ready_queue):
+            # the reader processes are stopped by the trainer process
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            np.random.seed(seed)
+            try:
+                for idxs in batch_idxs:
+                    batch_data = []
+                    for idx in idxs:
+                        sample_all = self.__getitem__(idx)
+                        batch_data.append([sample_all[f] for f in fields])
+                    layout, nbytes = batch_layout(batch_data)
+                    if nbytes > len(buffers[0]):
+                        # larger than the buffers, send the packed batch itself
+                        buf = bytearray(nbytes)
+                        pack_batch(batch_data, buf, layout)
+                        ready_queue.put((-1, (buf, layout)))
+                    else:
+                        buf_id = free_queue.get()
+                        pack_batch(batch_data, buffers[buf_id], layout)
+                        ready_queue.put((buf_id, layout))
+            except Exception:
+                ready_queue.put((-2, traceback.format_exc()))
+                return
+            ready_queue.put(None)
 
         def reader():
-            sample_num = self.__len__()
             idxs = np.arange(self.__len__())
             if self.mode == 'TRAIN':
                 np.random.shuffle(idxs)
-
-            proc_idxs = []
-            proc_sample_num = int(sample_num / proc_num)
-            start_idx = 0
-            for i in range(proc_num - 1):
-                proc_idxs.append(idxs[start_idx:start_idx + proc_sample_num])
-                start_idx += proc_sample_num
-            proc_idxs.append(idxs[start_idx:])
-
-            queue = multiprocessing.Queue(max_queue_len)
+            batch_idxs = [idxs[i:i + batch_size] for i in range(0, len(idxs), batch_size)]
+            if drop_last and len(batch_idxs) > 0 and len(batch_idxs[-1]) < batch_size:
+                batch_idxs.pop()
+            if len(batch_idxs) == 0:
+                return
+
+            # anonymous shared mappings, inherited by the forked reader processes
+            buffers = [mmap.mmap(-1, buffer_bytes[0]) for _ in range(num_buffers)]
+            free_queue = multiprocessing.Queue()
+            for buf_id in range(num_buffers):
+                free_queue.put(buf_id)
+            ready_queue = multiprocessing.Queue()
+
+            proc_num_ = min(proc_num, len(batch_idxs))
+            seeds = np.random.randint(0, 2**31 - 1, proc_num_)
             p_list = []
-            for i in range(proc_num):
-                p_list.append(multiprocessing.Process(
-                    target=read_to_queue, args=(proc_idxs[i], queue,)))
-                p_list[-1].start()
-
-            finish_num = 0
-            batch_out = []
-            while finish_num < len(p_list):
-                sample = queue.get()
-                if sample is None:
-                    finish_num += 1
-                else:
-                    batch_out.append(sample)
-                    if len(batch_out) == batch_size:
-                        yield batch_out
-                        batch_out = []
-
-            # join process
-            for p in p_list:
-                if p.is_alive():
+            try:
+                for i in range(proc_num_):
+                    p_list.append(multiprocessing.Process(
+                        target=read_to_buffers,
+                        args=(batch_idxs[i::proc_num_], seeds[i], buffers, free_queue, ready_queue)))
+                    p_list[-1].daemon = True
+                    p_list[-1].start()
+
+                finish_num = 0
+                while finish_num < len(p_list):
+                    try:
+                        item = ready_queue.get(timeout=READER_POLL_TIMEOUT)
+                    except six.moves.queue.Empty:
+                        # a process killed by a signal or the OOM killer
+                        # never reports its failure
+                        for p in p_list:
+                            if not p.is_alive() and p.exitcode != 0:
+                                raise RuntimeError(
+                                    "reader process {} exited with code {}".format(
+                                        p.pid, p.exitcode))
+                        continue
+                    if item is None:
+                        finish_num += 1
+                        continue
+                    buf_id, data = item
+                    if buf_id == -2:
+                        raise RuntimeError("reader process failed:\n{}".format(data))
+                    if buf_id == -1:
+                        buf, layout = data
+                        buffer_bytes[0] = max(buffer_bytes[0], int(len(buf) * 1.25))
+                        yield unpack_batch(buf, layout, pad)
+                    else:
+                        yield unpack_batch(buffers[buf_id], data, pad)
+                        # the loader converts the batch before asking for the next one
+                        free_queue.put(buf_id)
+            finally:
+                # also reached when the loader is reset before the end
+                for p in p_list:
+                    if p.is_alive():
+                        p.terminate()
                     p.join()
 
         return reader
-
-
-def _term_reader(signum, frame):
-    logger.info('pid {} terminated, terminate reader process '
-                'group {}...'.format(os.getpid(), os.getpgrp()))
-    os.killpg(os.getpgid(os.getpid()), signal.SIGKILL)
-
-signal.signal(signal.SIGINT, _term_reader)
-
@@ -0,0 +1,189 @@
+#  Copyright (c) 2020 PaddlePaddle Authors. All Rights Reserve.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Latency of the proposal NMS and 3D IoU in utils/box_utils.py.
+
+The rotated overlap is first checked on touching, nested and edge sharing
+boxes in both argument orders, and on random boxes against polygon
+clipping. Random proposals are drawn around a number of objects, like the RPN
+outputs, and box_nms is timed at the RPN pre/post NMS sizes (9000 -> 512 by
+default) for both NMS types, then boxes_iou3d of the kept proposals with
+the objects and box_nms_eval of the RCNN outputs.
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from utils.box_utils import boxes3d_to_bev, box_nms, box_nms_eval, boxes_iou3d, \
+        box_overlap_rotate_matrix, rotated_corners
+
+
+def parse_args():
+    parser = argparse.ArgumentParser("proposal NMS benchmark")
+    parser.add_argument(
+        '--pre_nms_top_n',
+        type=int,
+        default=9000,
+        help='proposals before NMS, default 9000')
+    parser.add_argument(
+        '--post_nms_top_n',
+        type=int,
+        default=512,
+        help='proposals kept by NMS, default 512')
+    parser.add_argument(
+        '--nms_thresh', type=float, default=0.85, help='default 0.85')
+    parser.add_argument(
+        '--num_objects',
+        type=int,
+        default=20,
+        help='objects the proposals are drawn around, default 20')
+    parser.add_argument(
+        '--repeat', type=int, default=10, help='timed runs, default 10')
+    return parser.parse_args()
+
+
+def random_proposals(num, num_objects, rng):
+    """camera boxes [x, y, z, h, w, l, ry] around num_objects cars"""
+    centers = np.stack(
+        [
+            rng.uniform(-30, 30, num_objects), rng.uniform(1, 2, num_objects),
+            rng.uniform(5, 60, num_objects)
+        ],
+        axis=1)
+    headings = rng.uniform(-np.pi, np.pi, num_objects)
+    obj = rng.randint(0, num_objects, num)
+    boxes = np.zeros((num, 7), dtype='float32')
+    boxes[:, :3] = centers[obj] + rng.normal(0, 0.4, (num, 3))
+    boxes[:, 3] = rng.normal(1.5, 0.1, num)
+    boxes[:, 4] = rng.normal(1.6, 0.1, num)
+    boxes[:, 5] = rng.normal(3.9, 0.3, num)
+    boxes[:, 6] = headings[obj] + rng.normal(0, 0.2, num)
+    gt = np.concatenate(
+        [centers, np.tile([[1.5, 1.6, 3.9]], (num_objects, 1)),
+         headings[:, np.newaxis]], axis=1).astype('float32')
+    return boxes, gt
+
+
+def clip_polygon(poly, clip):
+    """Sutherland-Hodgman clipping of poly by the convex counter clockwise
+    polygon clip, both lists of (x, y)"""
+    for k in range(len(clip)):
+        (ex, ey), (fx, fy) = clip[k], clip[(k + 1) % len(clip)]
+        side = lambda p: (fx - ex) * (p[1] - ey) - (fy - ey) * (p[0] - ex)
+        out = []
+        for i in range(len(poly)):
+            p, q = poly[i], poly[(i + 1) % len(poly)]
+            sp, sq = side(p), side(q)
+            if sp >= 0:
+                out.append(p)
+            if sp * sq < 0:
+                t = sp / (sp - sq)
+                out.append((p[0] + t * (q[0] - p[0]), p[1] + t * (q[1] - p[1])))
+        poly = out
+        if not poly:
+            break
+    return poly
+
+
+def polygon_area(poly):
+    return abs(sum(poly[i - 1][0] * p[1] - p[0] * poly[i - 1][1]
+                   for i, p in enumerate(poly))) / 2.
+
+
+def check_overlap_rotate(rng, num_random=2000):
+    # (box a, box b, overlap), box: [x1, y1, x2, y2, angle]
+    cases = [
+        # touching along an edge or a corner
+        ([0, 0, 2, 2, 0], [2, 0, 4, 2, 0], 0.),
+        ([0, 0, 1, 1, 0], [1, 0, 2, 1, 0], 0.),
+        ([0, 0, 1, 1, 0], [1, 0, 3, 2, 0], 0.),
+        ([0, 0, 1, 1, 0], [0, 1, 1, 2, 0], 0.),
+        ([0, 0, 1, 1, 0], [1, 1, 2, 2, 0], 0.),
+        ([0, 0, 2, 2, np.pi / 2], [2, 0, 4, 2, np.pi / 2], 0.),
+        # nested, with and without shared edges
+        ([0, 0, 2, 2, 0], [0, 0, 1, 1, 0], 1.),
+        ([0, 0, 2, 2, 0], [0.5, 0.5, 1.5, 1.5, 0], 1.),
+        ([0, 0, 2, 2, 0.4], [0.5, 0.5, 1.5, 1.5, 0.4], 1.),
+        ([0, 0, 2, 2, 0], [1, 0, 3, 1, 0], 1.),
+        ([0, 0, 2, 2, 0], [0, 0, 2, 2, 0], 4.),
+        ([0, 0, 2, 2, 0.7], [0, 0, 2, 2, 0.7], 4.),
+    ]
+    for box_a, box_b, expected in cases:
+        box_a = np.array([box_a], dtype='float32')
+        box_b = np.array([box_b], dtype='float32')
+        for a, b in [(box_a, box_b), (box_b, box_a)]:
+            overlap = box_overlap_rotate_matrix(a, b)[0, 0]
+            assert abs(overlap - expected) < 1e-5, \
+                "overlap of {} and {} is {}, expected {}".format(
+                    a[0].tolist(), b[0].tolist(), overlap, expected)
+
+    boxes = np.zeros((num_random, 5), dtype='float32')
+    boxes[:, :2] = rng.uniform(-2, 2, (num_random, 2))
+    boxes[:, 2:4] = boxes[:, :2] + rng.uniform(0.5, 4, (num_random, 2))
+    boxes[:, 4] = rng.uniform(-np.pi, np.pi, num_random)
+    pairs = rng.randint(0, num_random, (num_random, 2))
+    corners = rotated_corners(boxes.astype('float64'))
+    max_diff = 0.
+    for i, j in pairs:
+        expected = polygon_area(
+            clip_polygon([tuple(p) for p in corners[i]],
+                         [tuple(p) for p in corners[j]]))
+        overlap = box_overlap_rotate_matrix(boxes[i:i + 1], boxes[j:j + 1])
+        swapped = box_overlap_rotate_matrix(boxes[j:j + 1], boxes[i:i + 1])
+        max_diff = max(max_diff, abs(overlap[0, 0] - expected),
+                       abs(swapped[0, 0] - expected))
+    assert max_diff < 1e-4, "rotated overlap differs by {}".format(max_diff)
+    print("rotated overlap: {} cases and {} random pairs checked, max diff {:.1e}".
+          format(len(cases), len(pairs), max_diff))
+
+
+def time_it(fn, repeat):
+    fn()
+    start = time.time()
+    for _ in range(repeat):
+        out = fn()
+    return (time.time() - start) / repeat * 1000, out
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    rng = np.random.RandomState(0)
+    check_overlap_rotate(rng)
+    proposals, gt = random_proposals(args.pre_nms_top_n, args.num_objects, rng)
+    scores = rng.rand(args.pre_nms_top_n).astype('float32')
+    boxes_bev = boxes3d_to_bev(proposals)
+
+    for nms_type in ['normal', 'rotate']:
+        cost, (s_scores, s_proposals) = time_it(
+            lambda: box_nms(boxes_bev, scores, proposals, args.nms_thresh, args.post_nms_top_n, nms_type),
+            args.repeat)
+        print("box_nms {:6s} {} -> {} proposals: {:.1f} ms".format(
+            nms_type, args.pre_nms_top_n, len(s_scores), cost))
+
+    kept = np.array(s_proposals)
+    cost, _ = time_it(lambda: boxes_iou3d(kept, gt), args.repeat)
+    print("boxes_iou3d {} x {}: {:.1f} ms".format(len(kept), len(gt), cost))
+
+    kept_scores = np.array(s_scores)
+    cost, (e_scores, _) = time_it(
+        lambda: box_nms_eval(boxes3d_to_bev(kept), kept_scores, kept, 0.1),
+        args.repeat)
+    print("box_nms_eval {} -> {} boxes: {:.1f} ms".format(
+        len(kept), len(e_scores), cost))
@@ -0,0 +1,98 @@
+#  Copyright (c) 2020 PaddlePaddle Authors. All Rights Reserve.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Samples/sec of KittiRCNNReader.get_rpn_sample with GT augmentation on.
+
+The RPN training samples are read in one process with GT_AUG_APPLY_PROB 1,
+for each --gt_database given, e.g. the pickled database and the packed
+database generated by tools/generate_gt_database.py.
+"""
+
+import os
+import sys
+import time
+import argparse
+import logging
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from data.kitti_rcnn_reader import KittiRCNNReader
+from utils.config import cfg, load_config, set_config_from_list
+
+logging.basicConfig(level=logging.INFO, stream=sys.stdout)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser("GT augmentation benchmark")
+    parser.add_argument(
+        '--cfg',
+        type=str,
+        default='cfgs/default.yml',
+        help='specify the config for training')
+    parser.add_argument(
+        '--data_dir',
+        type=str,
+        default='./data',
+        help='KITTI dataset root directory')
+    parser.add_argument(
+        '--gt_database',
+        type=str,
+        nargs='+',
+        default=[
+            'data/gt_database/train_gt_database_3level_Car.pkl',
+            'data/gt_database/train_gt_database_3level_Car'
+        ],
+        help='gt databases to compare, pkl files or packed directories')
+    parser.add_argument(
+        '--num_samples',
+        type=int,
+        default=200,
+        help='samples read per gt database, default 200')
+    parser.add_argument(
+        '--set',
+        dest='set_cfgs',
+        default=None,
+        nargs=argparse.REMAINDER,
+        help='set extra config keys if needed.')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    load_config(args.cfg)
+    if args.set_cfgs is not None:
+        set_config_from_list(args.set_cfgs)
+    cfg.GT_AUG_ENABLED = True
+    cfg.GT_AUG_APPLY_PROB = 1.0
+
+    for gt_database in args.gt_database:
+        reader = KittiRCNNReader(
+            data_dir=args.data_dir,
+            npoints=cfg.RPN.NUM_POINTS,
+            split=cfg.TRAIN.SPLIT,
+            mode='TRAIN',
+            classes=cfg.CLASSES,
+            gt_database_dir=gt_database)
+        num_samples = min(args.num_samples, len(reader.sample_id_list))
+        np.random.seed(0)
+        reader.get_rpn_sample(0)
+
+        start = time.time()
+        for idx in range(num_samples):
+            reader.get_rpn_sample(idx)
+        cost = time.time() - start
+        print("{}: {} samples in {:.2f} s, {:.1f} samples/sec".format(
+            gt_database, num_samples, cost, num_samples / cost))
@@ -0,0 +1,118 @@
+#  Copyright (c) 2020 PaddlePaddle Authors. All Rights Reserve.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Parity and speed of the CPU rotated IoU used by KITTI evaluation.
+
+The CPU kernel is checked against rotate_iou_gpu_eval, which needs a CUDA
+device, or the numba CUDA simulator when NUMBA_ENABLE_CUDASIM=1 is set (use
+a small --parity_boxes then). The benchmark times bev_box_overlap and
+d3_box_overlap on random car boxes in the partition sizes calculate_iou_partly
+uses on the KITTI val set (3769 frames in 50 parts).
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from tools.kitti_object_eval_python import eval as kitti_eval
+from tools.kitti_object_eval_python.rotate_iou_cpu import rotate_iou_cpu_eval
+
+
+def parse_args():
+    parser = argparse.ArgumentParser("rotated IoU parity and benchmark")
+    parser.add_argument(
+        '--parity_boxes',
+        type=int,
+        default=300,
+        help='number of boxes compared against the CUDA kernel, default 300')
+    parser.add_argument(
+        '--num_gt',
+        type=int,
+        default=600,
+        help='gt boxes per evaluation part, default 600')
+    parser.add_argument(
+        '--num_dt',
+        type=int,
+        default=4000,
+        help='detected boxes per evaluation part, default 4000')
+    parser.add_argument(
+        '--num_parts',
+        type=int,
+        default=50,
+        help='evaluation parts, default 50')
+    return parser.parse_args()
+
+
+def random_boxes(num, rng):
+    """camera boxes [x, y, z, h, w, l, ry] spread like KITTI cars"""
+    boxes = np.zeros((num, 7), dtype=np.float32)
+    boxes[:, 0] = rng.uniform(-30, 30, num)
+    boxes[:, 1] = rng.uniform(1.0, 2.0, num)
+    boxes[:, 2] = rng.uniform(0, 60, num)
+    boxes[:, 3] = rng.normal(1.5, 0.1, num)
+    boxes[:, 4] = rng.normal(1.6, 0.1, num)
+    boxes[:, 5] = rng.normal(3.9, 0.3, num)
+    boxes[:, 6] = rng.uniform(-np.pi, np.pi, num)
+    return boxes
+
+
+def check_parity(args, rng):
+    try:
+        from tools.kitti_object_eval_python.rotate_iou import rotate_iou_gpu_eval
+    except Exception as e:
+        print("skip parity check, CUDA kernel unavailable: {}".format(e))
+        return
+    # dense boxes, so most pairs overlap
+    boxes = random_boxes(args.parity_boxes, rng)[:, [0, 2, 3, 5, 6]]
+    boxes[:, :2] /= 10.
+    qboxes = random_boxes(args.parity_boxes, rng)[:, [0, 2, 3, 5, 6]]
+    qboxes[:, :2] /= 10.
+    for criterion in [-1, 0, 1, 2]:
+        ref = rotate_iou_gpu_eval(boxes, qboxes, criterion)
+        out = rotate_iou_cpu_eval(boxes, qboxes, criterion)
+        print("criterion {:2d}: {} overlapping pairs, max abs diff {:.2e}".
+              format(criterion, int((ref > 0).sum()), np.abs(ref - out).max()))
+
+
+def benchmark(args, rng):
+    gt = random_boxes(args.num_gt, rng)
+    dt = random_boxes(args.num_dt, rng)
+    bev_index = [0, 2, 3, 5, 6]
+    # compile
+    kitti_eval.bev_box_overlap(gt[:2, bev_index], dt[:2, bev_index])
+    kitti_eval.d3_box_overlap(gt[:2], dt[:2])
+
+    start = time.time()
+    kitti_eval.bev_box_overlap(gt[:, bev_index], dt[:, bev_index])
+    bev_cost = time.time() - start
+    start = time.time()
+    kitti_eval.d3_box_overlap(gt, dt)
+    d3_cost = time.time() - start
+    print("{} backend, {} x {} boxes per part".format(
+        kitti_eval.rotate_iou_eval.__name__, args.num_gt, args.num_dt))
+    print("bev_box_overlap {:.1f} ms, d3_box_overlap {:.1f} ms per part, "
+          "{:.1f} s for {} parts".format(bev_cost * 1000, d3_cost * 1000, (
+              bev_cost + d3_cost) * args.num_parts, args.num_parts))
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    rng = np.random.RandomState(0)
+    check_parity(args, rng)
+    benchmark(args, rng)
@@ -8,6 +8,7 @@ import numpy as np
 import pickle
 
 from data.kitti_dataset import KittiDataset
+from data.gt_database import pack_gt_database
 import pts_utils 
 import argparse
 
@@ -94,6 +95,11 @@ class GTDatabaseGenerator(KittiDataset):
         self.gt_database = gt_database
         print('Save refine training sample info file to %s' % save_file_name)
 
+        # packed database read with mmap by KittiRCNNReader
+        packed_dir = os.path.splitext(save_file_name)[0]
+        pack_gt_database(gt_database, packed_dir)
+        print('Save packed gt database to %s' % packed_dir)
+
 
 if __name__ == '__main__':
     dataset = GTDatabaseGenerator(root_dir=args.data_dir, split=args.split)
@@ -1,7 +1,23 @@
 import numpy as np
 import numba
 import io as sysio
-from tools.kitti_object_eval_python.rotate_iou import rotate_iou_gpu_eval
+
+
+def _get_rotate_iou_eval():
+    # rotate_iou.py compiles CUDA kernels when imported, use the CPU
+    # implementation on machines without a CUDA device
+    try:
+        from numba import cuda
+        if cuda.is_available():
+            from tools.kitti_object_eval_python.rotate_iou import rotate_iou_gpu_eval
+            return rotate_iou_gpu_eval
+    except Exception:
+        pass
+    from tools.kitti_object_eval_python.rotate_iou_cpu import rotate_iou_cpu_eval
+    return rotate_iou_cpu_eval
+
+
+rotate_iou_eval = _get_rotate_iou_eval()
 
 
 @numba.jit
@@ -112,7 +128,7 @@ def image_box_overlap(boxes, query_boxes, criterion=-1):
 
 
 def bev_box_overlap(boxes, qboxes, criterion=-1):
-    riou = rotate_iou_gpu_eval(boxes, qboxes, criterion)
+    riou = rotate_iou_eval(boxes, qboxes, criterion)
     return riou
 
 
@@ -146,8 +162,8 @@ def d3_box_overlap_kernel(boxes, qboxes, rinc, criterion=-1):
 
 
 def d3_box_overlap(boxes, qboxes, criterion=-1):
-    rinc = rotate_iou_gpu_eval(boxes[:, [0, 2, 3, 5, 6]],
-                               qboxes[:, [0, 2, 3, 5, 6]], 2)
+    rinc = rotate_iou_eval(boxes[:, [0, 2, 3, 5, 6]],
+                           qboxes[:, [0, 2, 3, 5, 6]], 2)
     d3_box_overlap_kernel(boxes, qboxes, rinc, criterion)
     return rinc
 
@@ -0,0 +1,235 @@
+#####################
+# CPU version of rotate_iou.py, for machines without a CUDA device.
+# The device functions are ported one to one to numba nopython functions
+# and the box pairs are computed in parallel over the rows. Float errors
+# follow IEEE (error_model numpy) like on the GPU.
+#####################
+import math
+
+import numba
+import numpy as np
+
+
+@numba.njit(inline='always', error_model='numpy')
+def trangle_area(ax, ay, bx, by, cx, cy):
+    return ((ax - cx) * (by - cy) - (ay - cy) * (bx - cx)) / 2.0
+
+
+@numba.njit(error_model='numpy')
+def area(int_pts, num_of_inter):
+    area_val = 0.0
+    for i in range(num_of_inter - 2):
+        area_val += abs(
+            trangle_area(int_pts[0], int_pts[1], int_pts[2 * i + 2],
+                         int_pts[2 * i + 3], int_pts[2 * i + 4],
+                         int_pts[2 * i + 5]))
+    return area_val
+
+
+@numba.njit(error_model='numpy')
+def sort_vertex_in_convex_polygon(int_pts, num_of_inter, vs):
+    if num_of_inter > 0:
+        center_x = np.float32(0.0)
+        center_y = np.float32(0.0)
+        for i in range(num_of_inter):
+            center_x += int_pts[2 * i]
+            center_y += int_pts[2 * i + 1]
+        center_x /= num_of_inter
+        center_y /= num_of_inter
+        for i in range(num_of_inter):
+            v0 = int_pts[2 * i] - center_x
+            v1 = int_pts[2 * i + 1] - center_y
+            d = math.sqrt(v0 * v0 + v1 * v1)
+            v0 = v0 / d
+            v1 = v1 / d
+            if v1 < 0:
+                v0 = -2 - v0
+            vs[i] = v0
+        for i in range(1, num_of_inter):
+            if vs[i - 1] > vs[i]:
+                temp = vs[i]
+                tx = int_pts[2 * i]
+                ty = int_pts[2 * i + 1]
+                j = i
+                while j > 0 and vs[j - 1] > temp:
+                    vs[j] = vs[j - 1]
+                    int_pts[j * 2] = int_pts[j * 2 - 2]
+                    int_pts[j * 2 + 1] = int_pts[j * 2 - 1]
+                    j -= 1
+
+                vs[j] = temp
+                int_pts[j * 2] = tx
+                int_pts[j * 2 + 1] = ty
+
+
+@numba.njit(error_model='numpy')
+def line_segment_intersection(pts1, pts2, i, j, temp_pts):
+    A0 = pts1[2 * i]
+    A1 = pts1[2 * i + 1]
+
+    B0 = pts1[2 * ((i + 1) % 4)]
+    B1 = pts1[2 * ((i + 1) % 4) + 1]
+
+    C0 = pts2[2 * j]
+    C1 = pts2[2 * j + 1]
+
+    D0 = pts2[2 * ((j + 1) % 4)]
+    D1 = pts2[2 * ((j + 1) % 4) + 1]
+    BA0 = B0 - A0
+    BA1 = B1 - A1
+    DA0 = D0 - A0
+    CA0 = C0 - A0
+    DA1 = D1 - A1
+    CA1 = C1 - A1
+    acd = DA1 * CA0 > CA1 * DA0
+    bcd = (D1 - B1) * (C0 - B0) > (C1 - B1) * (D0 - B0)
+    if acd != bcd:
+        abc = CA1 * BA0 > BA1 * CA0
+        abd = DA1 * BA0 > BA1 * DA0
+        if abc != abd:
+            DC0 = D0 - C0
+            DC1 = D1 - C1
+            ABBA = A0 * B1 - B0 * A1
+            CDDC = C0 * D1 - D0 * C1
+            DH = BA1 * DC0 - BA0 * DC1
+            Dx = ABBA * DC0 - BA0 * CDDC
+            Dy = ABBA * DC1 - BA1 * CDDC
+            temp_pts[0] = Dx / DH
+            temp_pts[1] = Dy / DH
+            return True
+    return False
+
+
+@numba.njit(error_model='numpy')
+def point_in_quadrilateral(pt_x, pt_y, corners):
+    ab0 = corners[2] - corners[0]
+    ab1 = corners[3] - corners[1]
+
+    ad0 = corners[6] - corners[0]
+    ad1 = corners[7] - corners[1]
+
+    ap0 = pt_x - corners[0]
+    ap1 = pt_y - corners[1]
+
+    abab = ab0 * ab0 + ab1 * ab1
+    abap = ab0 * ap0 + ab1 * ap1
+    adad = ad0 * ad0 + ad1 * ad1
+    adap = ad0 * ap0 + ad1 * ap1
+
+    return abab >= abap and abap >= 0 and adad >= adap and adap >= 0
+
+
+@numba.njit(error_model='numpy')
+def quadrilateral_intersection(pts1, pts2, int_pts, temp_pts):
+    num_of_inter = 0
+    for i in range(4):
+        if point_in_quadrilateral(pts1[2 * i], pts1[2 * i + 1], pts2):
+            int_pts[num_of_inter * 2] = pts1[2 * i]
+            int_pts[num_of_inter * 2 + 1] = pts1[2 * i + 1]
+            num_of_inter += 1
+        if point_in_quadrilateral(pts2[2 * i], pts2[2 * i + 1], pts1):
+            int_pts[num_of_inter * 2] = pts2[2 * i]
+            int_pts[num_of_inter * 2 + 1] = pts2[2 * i + 1]
+            num_of_inter += 1
+    for i in range(4):
+        for j in range(4):
+            has_pts = line_segment_intersection(pts1, pts2, i, j, temp_pts)
+            if has_pts:
+                int_pts[num_of_inter * 2] = temp_pts[0]
+                int_pts[num_of_inter * 2 + 1] = temp_pts[1]
+                num_of_inter += 1
+
+    return num_of_inter
+
+
+@numba.njit(error_model='numpy')
+def rbbox_to_corners(rbboxes):
+    # generate clockwise corners and rotate it clockwise, shape (N, 8)
+    corners = np.empty((rbboxes.shape[0], 8), dtype=np.float32)
+    corners_x = np.empty(4, dtype=np.float32)
+    corners_y = np.empty(4, dtype=np.float32)
+    for n in range(rbboxes.shape[0]):
+        angle = rbboxes[n, 4]
+        a_cos = np.float32(math.cos(angle))
+        a_sin = np.float32(math.sin(angle))
+        center_x = rbboxes[n, 0]
+        center_y = rbboxes[n, 1]
+        x_d = rbboxes[n, 2]
+        y_d = rbboxes[n, 3]
+        corners_x[0] = -x_d / 2
+        corners_x[1] = -x_d / 2
+        corners_x[2] = x_d / 2
+        corners_x[3] = x_d / 2
+        corners_y[0] = -y_d / 2
+        corners_y[1] = y_d / 2
+        corners_y[2] = y_d / 2
+        corners_y[3] = -y_d / 2
+        for i in range(4):
+            corners[n, 2 * i] = (a_cos * corners_x[i] + a_sin * corners_y[i]
+                                 + center_x)
+            corners[n, 2 * i + 1] = (-a_sin * corners_x[i] +
+                                     a_cos * corners_y[i] + center_y)
+    return corners
+
+
+@numba.njit(parallel=True, error_model='numpy')
+def rotate_iou_kernel_eval(boxes, query_boxes, iou, criterion=-1):
+    N = boxes.shape[0]
+    K = query_boxes.shape[0]
+    corners = rbbox_to_corners(boxes)
+    qcorners = rbbox_to_corners(query_boxes)
+    # half diagonals, boxes whose circumscribed circles are apart can not
+    # overlap and are skipped before the polygon clipping
+    radius = np.sqrt(boxes[:, 2]**2 + boxes[:, 3]**2) / 2
+    qradius = np.sqrt(query_boxes[:, 2]**2 + query_boxes[:, 3]**2) / 2
+    for n in numba.prange(N):
+        int_pts = np.empty(16, dtype=np.float32)
+        temp_pts = np.empty(2, dtype=np.float32)
+        vs = np.empty(16, dtype=np.float32)
+        for k in range(K):
+            dx = boxes[n, 0] - query_boxes[k, 0]
+            dy = boxes[n, 1] - query_boxes[k, 1]
+            if dx * dx + dy * dy >= (radius[n] + qradius[k])**2 * 1.01:
+                area_inter = np.float32(0.0)
+            else:
+                num_intersection = quadrilateral_intersection(
+                    qcorners[k], corners[n], int_pts, temp_pts)
+                sort_vertex_in_convex_polygon(int_pts, num_intersection, vs)
+                area_inter = np.float32(area(int_pts, num_intersection))
+            # same argument order as rotate_iou_kernel_eval of
+            # rotate_iou.py, the query box is rbox1
+            area1 = query_boxes[k, 2] * query_boxes[k, 3]
+            area2 = boxes[n, 2] * boxes[n, 3]
+            if criterion == -1:
+                iou[n, k] = area_inter / (area1 + area2 - area_inter)
+            elif criterion == 0:
+                iou[n, k] = area_inter / area1
+            elif criterion == 1:
+                iou[n, k] = area_inter / area2
+            else:
+                iou[n, k] = area_inter
+
+
+def rotate_iou_cpu_eval(boxes, query_boxes, criterion=-1):
+    """rotated box iou running in cpu, same interface and results as
+    rotate_iou_gpu_eval in rotate_iou.py.
+
+    Args:
+        boxes (float tensor: [N, 5]): rbboxes. format: centers, dims,
+            angles(clockwise when positive)
+        query_boxes (float tensor: [K, 5]): [description]
+        criterion (int, optional): -1 for iou, 0 / 1 for the intersection
+            over the area of the query box / box, else the intersection.
+
+    Returns:
+        float32 tensor [N, K], the overlaps.
+    """
+    boxes = np.ascontiguousarray(boxes, dtype=np.float32)
+    query_boxes = np.ascontiguousarray(query_boxes, dtype=np.float32)
+    N = boxes.shape[0]
+    K = query_boxes.shape[0]
+    iou = np.zeros((N, K), dtype=np.float32)
+    if N == 0 or K == 0:
+        return iou
+    rotate_iou_kernel_eval(boxes, query_boxes, iou, criterion)
+    return iou
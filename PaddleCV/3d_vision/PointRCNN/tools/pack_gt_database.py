@@ -0,0 +1,41 @@
+#  Copyright (c) 2020 PaddlePaddle Authors. All Rights Reserve.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Convert a pickled gt database of generate_gt_database.py to the packed
+database directory, e.g.
+
+    python tools/pack_gt_database.py \\
+        data/gt_database/train_gt_database_3level_Car.pkl \\
+        data/gt_database/train_gt_database_3level_Car
+"""
+
+import os
+import sys
+import pickle
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from data.gt_database import pack_gt_database
+
+parser = argparse.ArgumentParser()
+parser.add_argument('src_pkl', type=str, help='pickled gt database')
+parser.add_argument('dst_dir', type=str, help='output packed gt database')
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    with open(args.src_pkl, 'rb') as f:
+        gt_database = pickle.load(f)
+    pack_gt_database(gt_database, args.dst_dir)
+    print('Save packed gt database(%d) to %s' % (len(gt_database), args.dst_dir))
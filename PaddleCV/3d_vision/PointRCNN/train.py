@@ -86,7 +86,7 @@ def parse_args():
         '--gt_database',
         type=str,
         default='data/gt_database/train_gt_database_3level_Car.pkl',
-        help='generated gt database for augmentation')
+        help='generated gt database for augmentation, pkl file or packed directory')
     parser.add_argument(
         '--rcnn_training_roi_dir',
         type=str,
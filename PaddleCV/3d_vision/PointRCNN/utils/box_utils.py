@@ -24,7 +24,7 @@ import paddle.fluid as fluid
 
 from utils.config import cfg
 
-__all__ = ["boxes3d_to_bev", "box_overlap_rotate", "boxes3d_to_bev", "box_iou", "box_nms"]
+__all__ = ["boxes3d_to_bev", "box_overlap_rotate", "box_overlap_rotate_matrix", "box_iou", "box_nms"]
 
 
 def boxes3d_to_bev(boxes3d):
@@ -44,140 +44,145 @@ def boxes3d_to_bev(boxes3d):
     return boxes_bev
 
 
-def rotate_around_center(center, angle_cos, angle_sin, corners):
-    new_x = (corners[:, 0] - center[0]) * angle_cos + \
-            (corners[:, 1] - center[1]) * angle_sin + center[0]
-    new_y = -(corners[:, 0] - center[0]) * angle_sin + \
-            (corners[:, 1] - center[1]) * angle_cos + center[1]
-    return np.concatenate([new_x[:, np.newaxis], new_y[:, np.newaxis]], axis=-1)
+# pairs of boxes processed at once by the vectorized rotated overlap
+PAIR_CHUNK = 65536
+# distance below which an edge lies on the edge line of the other box
+COLLINEAR_EPS = 1e-6
 
 
-def check_rect_cross(p1, p2, q1, q2):
-    return min(p1[0], p2[0]) <= max(q1[0], q2[0]) and \
-           min(q1[0], q2[0]) <= max(p1[0], p2[0]) and \
-           min(p1[1], p2[1]) <= max(q1[1], q2[1]) and \
-           min(q1[1], q2[1]) <= max(p1[1], p2[1])
-
-
-def cross(p1, p2, p0):
-    return (p1[0] - p0[0]) * (p2[1] - p0[1]) - (p2[0] - p0[0]) * (p1[1] - p0[1]);
-
-
-def cross_area(a, b):
-    return a[0] * b[1] - a[1] * b[0]
+def rotated_corners(boxes):
+    """
+    Args:
+        boxes: [N, 5], (x1, y1, x2, y2, angle)
+    Return:
+        corners: [N, 4, 2], (x1, y1), (x2, y1), (x2, y2), (x1, y2) rotated
+            around the box center
+    """
+    center_x = (boxes[:, 0] + boxes[:, 2]) / 2.
+    center_y = (boxes[:, 1] + boxes[:, 3]) / 2.
+    x = boxes[:, [0, 2, 2, 0]] - center_x[:, np.newaxis]
+    y = boxes[:, [1, 1, 3, 3]] - center_y[:, np.newaxis]
+    angle_cos = np.cos(boxes[:, 4:5])
+    angle_sin = np.sin(boxes[:, 4:5])
+    new_x = x * angle_cos + y * angle_sin + center_x[:, np.newaxis]
+    new_y = -x * angle_sin + y * angle_cos + center_y[:, np.newaxis]
+    return np.stack([new_x, new_y], axis=-1)
 
 
-def intersection(p1, p0, q1, q0):
-    if not check_rect_cross(p1, p0, q1, q0):
-        return None
+def cross(a, b):
+    return a[..., 0] * b[..., 1] - a[..., 1] * b[..., 0]
 
-    s1 = cross(q0, p1, p0)
-    s2 = cross(p1, q1, p0)
-    s3 = cross(p0, q1, q0)
-    s4 = cross(q1, p1, q0)
-    if not (s1 * s2 > 0 and s3 * s4 > 0):
-        return None
 
-    s5 = cross(q1, p1, p0)
-    if np.abs(s5 - s1) > 1e-8:
-        return np.array([(s5 * q0[0] - s1 * q1[0]) / (s5 - s1),
-                (s5 * q0[1] - s1 * q1[1]) / (s5 - s1)], dtype='float32')
+def edge_area_inside(poly, clip, keep_shared):
+    """
+    Sum of cross(p, q) / 2 over the parts p -> q of the edges of the
+    counter clockwise quadrilaterals poly [P, 4, 2] lying inside clip
+    [P, 4, 2]. An edge of poly on an edge line of clip is kept only if
+    keep_shared and both edges run the same direction, an edge in the
+    opposite direction only touches clip from outside.
+    """
+    d = np.roll(poly, -1, axis=1) - poly
+    e = np.roll(clip, -1, axis=1) - clip
+    e_len = np.maximum(np.sqrt((e**2).sum(axis=-1)), 1e-8)[:, np.newaxis, :]
+    # signed distance of poly[i] + t * d[i] to edge line k: n0 + t * nd
+    n0 = cross(e[:, np.newaxis], poly[:, :, np.newaxis] -
+               clip[:, np.newaxis]) / e_len
+    nd = cross(e[:, np.newaxis], d[:, :, np.newaxis]) / e_len
+    collinear = (np.abs(n0) <= COLLINEAR_EPS) & \
+                (np.abs(n0 + nd) <= COLLINEAR_EPS)
+    if keep_shared:
+        same_dir = (d[:, :, np.newaxis] * e[:, np.newaxis]).sum(axis=-1) > 0
+        dropped = (collinear & ~same_dir).any(axis=-1)
+        # the line of a shared edge does not clip it
+        shared = collinear & same_dir
+        n0 = np.where(shared, 1., n0)
+        nd = np.where(shared, 0., nd)
     else:
-        a0 = p0[1] - p1[1]
-        b0 = p1[0] - p0[0]
-        c0 = p0[0] * p1[1] - p1[0] * p0[1]
-        a0 = q0[1] - q1[1]
-        b0 = q1[0] - q0[0]
-        c0 = q0[0] * q1[1] - q1[0] * q0[1]
-        D = a0 * b1 - a1 * b0
-        return np.array([(b0 * c1 - b1 * c0) / D, (a1 * c0 - a0 * c1) / D], dtype='float32')
+        dropped = collinear.any(axis=-1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = -n0 / nd
+    t_lo = np.maximum(np.where(nd > 0, t, -np.inf).max(axis=-1), 0.)
+    t_hi = np.minimum(np.where(nd < 0, t, np.inf).min(axis=-1), 1.)
+    valid = (t_lo < t_hi) & ~((nd == 0) & (n0 < 0)).any(axis=-1) & ~dropped
+    start = poly + t_lo[..., np.newaxis] * d
+    end = poly + t_hi[..., np.newaxis] * d
+    return np.where(valid, cross(start, end), 0.).sum(axis=-1) / 2.
+
+
+def _pair_overlap_rotate(boxes_a, boxes_b):
+    # the intersection polygon is bounded by the parts of the edges of each
+    # box inside the other one, its area follows from Green's theorem. Edges
+    # shared by both boxes in the same direction are counted from box a only,
+    # edges shared in opposite directions bound no area and are dropped.
+    origin = ((boxes_a[:, 0:2] + boxes_a[:, 2:4]) / 2.)[:, np.newaxis]
+    corners_a = rotated_corners(boxes_a) - origin
+    corners_b = rotated_corners(boxes_b) - origin
+    area = edge_area_inside(corners_a, corners_b, True) + \
+           edge_area_inside(corners_b, corners_a, False)
+    return np.maximum(area, 0.)
+
+
+def box_overlap_rotate_pairs(boxes_a, boxes_b):
+    """
+    Calculate the rotated overlap of boxes_a[i] and boxes_b[i],
+    box: [x1, y1, x2, y2, angle]
+    """
+    boxes_a = np.asarray(boxes_a, dtype='float64')
+    boxes_b = np.asarray(boxes_b, dtype='float64')
+    areas = np.zeros((len(boxes_a), ), dtype='float32')
+    for start in range(0, len(boxes_a), PAIR_CHUNK):
+        end = start + PAIR_CHUNK
+        areas[start:end] = _pair_overlap_rotate(boxes_a[start:end],
+                                                boxes_b[start:end])
+    return areas
 
 
-def check_in_box2d(box, p):
-    center_x = (box[0] + box[2]) / 2.
-    center_y = (box[1] + box[3]) / 2.
-    angle_cos = np.cos(-box[4])
-    angle_sin = np.sin(-box[4])
-    rot_x = (p[0] - center_x) * angle_cos + (p[1] - center_y) * angle_sin + center_x
-    rot_y = -(p[0] - center_x) * angle_sin + (p[1] - center_y) * angle_cos + center_y
-    return rot_x > box[0] - 1e-5 and rot_x < box[2] + 1e-5 and \
-            rot_y > box[1] - 1e-5 and rot_y < box[3] + 1e-5
+def box_overlap_rotate(cur_box, boxes):
+    """
+    Calculate box overlap with rotate, box: [x1, y1, x2, y2, angle]
+    """
+    return box_overlap_rotate_pairs(
+        np.broadcast_to(cur_box, (len(boxes), 5)), boxes)
 
 
-def point_cmp(a, b, center):
-    return np.arctan2(a[1] - center[1], a[0] - center[0]) > \
-            np.arctan2(b[1] - center[1], b[0] - center[0])
+def bounding_rects(boxes, box_type='normal'):
+    """axis aligned [x1, y1, x2, y2] covering the (rotated) boxes"""
+    if box_type == 'normal':
+        return boxes[:, :4]
+    corners = rotated_corners(boxes)
+    return np.concatenate(
+        [corners.min(axis=1), corners.max(axis=1)], axis=1)
 
 
-def box_overlap_rotate(cur_box, boxes):
+def overlap_candidates(rects_a, rects_b, chunk=1024):
     """
-    Calculate box overlap with rotate, box: [x1, y1, x2, y2, angle]
+    Index pairs (i, j) whose rects_a[i] and rects_b[j] overlap, the only
+    pairs that can have a non zero overlap.
     """
-    areas = np.zeros((len(boxes), ), dtype='float32')
-    cur_center = [(cur_box[0] + cur_box[2]) / 2., (cur_box[1] + cur_box[3]) / 2.]
-    cur_corners = np.array([
-            [cur_box[0], cur_box[1]], # (x1, y1)
-            [cur_box[2], cur_box[1]], # (x2, y1)
-            [cur_box[2], cur_box[3]], # (x2, y2)
-            [cur_box[0], cur_box[3]], # (x1, y2)
-            [cur_box[0], cur_box[1]], # (x1, y1)
-            ], dtype='float32')
-    cur_angle_cos = np.cos(cur_box[4])
-    cur_angle_sin = np.sin(cur_box[4])
-    cur_corners = rotate_around_center(cur_center, cur_angle_cos, cur_angle_sin, cur_corners)
-
-    for i, box in enumerate(boxes):
-        box_center = [(box[0] + box[2]) / 2., (box[1] + box[3]) / 2.]
-        box_corners = np.array([
-                [box[0], box[1]],
-                [box[2], box[1]],
-                [box[2], box[3]],
-                [box[0], box[3]],
-                [box[0], box[1]],
-                ], dtype='float32')
-        box_angle_cos = np.cos(box[4])
-        box_angle_sin = np.sin(box[4])
-        box_corners = rotate_around_center(box_center, box_angle_cos, box_angle_sin, box_corners)
-
-        cross_points = np.zeros((16, 2), dtype='float32')
-        cnt = 0
-        # get intersection of lines
-        for j in range(4):
-            for k in range(4):
-                inters = intersection(cur_corners[j + 1], cur_corners[j],
-                                      box_corners[k + 1], box_corners[k])
-                if inters is not None:
-                    cross_points[cnt, :] = inters
-                    cnt += 1
-        # check corners
-        for l in range(4):
-            if check_in_box2d(cur_box, box_corners[l]):
-                cross_points[cnt, :] = box_corners[l]
-                cnt += 1
-            if check_in_box2d(box, cur_corners[l]):
-                cross_points[cnt, :] = cur_corners[l]
-                cnt += 1
-
-        if cnt > 0:
-            poly_center = np.sum(cross_points[:cnt, :], axis=0) / cnt
-        else:
-            poly_center = np.zeros((2,))
-
-        # sort the points of polygon
-        for j in range(cnt - 1):
-            for k in range(cnt - j - 1):
-                if point_cmp(cross_points[k], cross_points[k + 1], poly_center):
-                    cross_points[k], cross_points[k + 1] = \
-                            cross_points[k + 1].copy(), cross_points[k].copy()
-
-        # get the overlap areas
-        area = 0.
-        for j in range(cnt - 1):
-            area += cross_area(cross_points[j] - cross_points[0],
-                               cross_points[j + 1] - cross_points[0])
-        areas[i] = np.abs(area) / 2.
-    
-    return areas
+    rows, cols = [], []
+    for start in range(0, len(rects_a), chunk):
+        a = rects_a[start:start + chunk, np.newaxis]
+        mask = (a[..., 0] <= rects_b[:, 2]) & (rects_b[:, 0] <= a[..., 2]) & \
+               (a[..., 1] <= rects_b[:, 3]) & (rects_b[:, 1] <= a[..., 3])
+        r, c = np.nonzero(mask)
+        rows.append(r + start)
+        cols.append(c)
+    if len(rows) == 0:
+        return np.zeros((0, ), 'int64'), np.zeros((0, ), 'int64')
+    return np.concatenate(rows), np.concatenate(cols)
+
+
+def box_overlap_rotate_matrix(boxes_a, boxes_b):
+    """
+    Calculate the rotated overlap of all pairs of boxes_a [N, 5] and
+    boxes_b [M, 5], box: [x1, y1, x2, y2, angle]. Return [N, M]
+    """
+    overlaps = np.zeros((len(boxes_a), len(boxes_b)), dtype='float32')
+    rows, cols = overlap_candidates(
+        bounding_rects(boxes_a, 'rotate'), bounding_rects(boxes_b, 'rotate'))
+    overlaps[rows, cols] = box_overlap_rotate_pairs(boxes_a[rows],
+                                                    boxes_b[cols])
+    return overlaps
 
 
 def box_iou(cur_box, boxes, box_type='normal'):
@@ -200,60 +205,87 @@ def box_iou(cur_box, boxes, box_type='normal'):
     return inter_area / np.maximum(cur_S + boxes_S - inter_area, 1e-8)
 
 
+def box_iou_pairs(boxes_a, boxes_b, box_type='normal'):
+    """iou of boxes_a[i] and boxes_b[i]"""
+    S_a = (boxes_a[:, 2] - boxes_a[:, 0]) * (boxes_a[:, 3] - boxes_a[:, 1])
+    S_b = (boxes_b[:, 2] - boxes_b[:, 0]) * (boxes_b[:, 3] - boxes_b[:, 1])
+
+    if box_type == 'normal':
+        inter_w = np.maximum(
+            np.minimum(boxes_a[:, 2], boxes_b[:, 2]) -
+            np.maximum(boxes_a[:, 0], boxes_b[:, 0]), 0.)
+        inter_h = np.maximum(
+            np.minimum(boxes_a[:, 3], boxes_b[:, 3]) -
+            np.maximum(boxes_a[:, 1], boxes_b[:, 1]), 0.)
+        inter_area = inter_w * inter_h
+    elif box_type == 'rotate':
+        inter_area = box_overlap_rotate_pairs(boxes_a, boxes_b)
+    else:
+        raise NotImplementedError
+
+    return inter_area / np.maximum(S_a + S_b - inter_area, 1e-8)
+
+
+def nms_keep(boxes, thresh, topk=None, nms_type='normal'):
+    """
+    Greedy NMS of boxes sorted by score, return the indices kept.
+
+    Suppressed boxes are marked in a mask instead of slicing the arrays
+    after every kept box, and the iou of a kept box is only computed with
+    the remaining boxes its bounding rect overlaps.
+    """
+    num = boxes.shape[0]
+    topk = num if topk is None else topk
+    if num == 0 or topk <= 0:
+        return np.zeros((0, ), dtype='int64')
+
+    rects = bounding_rects(boxes, nms_type)
+    removed = np.zeros((num, ), dtype=bool)
+    keep = []
+    for i in range(num):
+        if removed[i]:
+            continue
+        keep.append(i)
+        if len(keep) >= topk:
+            break
+        rest = rects[i + 1:]
+        if thresh > 0:
+            # boxes apart from box i have iou 0 and are never suppressed
+            cand = ~removed[i + 1:] & \
+                   (rects[i, 0] <= rest[:, 2]) & (rest[:, 0] <= rects[i, 2]) & \
+                   (rects[i, 1] <= rest[:, 3]) & (rest[:, 1] <= rects[i, 3])
+        else:
+            cand = ~removed[i + 1:]
+        cand = np.flatnonzero(cand) + i + 1
+        iou = box_iou_pairs(
+            np.broadcast_to(boxes[i], (len(cand), boxes.shape[1])),
+            boxes[cand], nms_type)
+        removed[cand[iou >= thresh]] = True
+    return np.array(keep, dtype='int64')
+
+
 def box_nms(boxes, scores, proposals, thresh, topk, nms_type='normal'):
     assert nms_type in ['normal', 'rotate'], \
             "unknown nms type {}".format(nms_type)
     order = np.argsort(-scores)
-    boxes = boxes[order]
-    scores = scores[order]
-    proposals = proposals[order]
-
-    nmsed_scores = []
-    nmsed_proposals = []
-    cnt = 0
-    while boxes.shape[0]:
-        nmsed_scores.append(scores[0])
-        nmsed_proposals.append(proposals[0])
-        cnt +=1
-        if cnt >= topk or boxes.shape[0] == 1:
-            break
-        iou = box_iou(boxes[0], boxes[1:], nms_type)
-        boxes = boxes[1:][iou < thresh]
-        scores = scores[1:][iou < thresh]
-        proposals = proposals[1:][iou < thresh]
-    return nmsed_scores, nmsed_proposals
+    keep = order[nms_keep(boxes[order], thresh, topk, nms_type)]
+    return list(scores[keep]), list(proposals[keep])
 
 
 def box_nms_eval(boxes, scores, proposals, thresh, nms_type='rotate'):
     assert nms_type in ['normal', 'rotate'], \
             "unknown nms type {}".format(nms_type)
     order = np.argsort(-scores)
-    boxes = boxes[order]
-    scores = scores[order]
-    proposals = proposals[order]
-
-    nmsed_scores = []
-    nmsed_proposals = []
-    while boxes.shape[0]:
-        nmsed_scores.append(scores[0])
-        nmsed_proposals.append(proposals[0])
-        iou = box_iou(boxes[0], boxes[1:], nms_type)
-        inds = iou < thresh
-        boxes = boxes[1:][inds]
-        scores = scores[1:][inds]
-        proposals = proposals[1:][inds]
-    nmsed_scores = np.asarray(nmsed_scores)
-    nmsed_proposals = np.asarray(nmsed_proposals)
-    return nmsed_scores, nmsed_proposals 
+    keep = order[nms_keep(boxes[order], thresh, nms_type=nms_type)]
+    return scores[keep], proposals[keep]
+
 
 def boxes_iou3d(boxes1, boxes2):
     boxes1_bev = boxes3d_to_bev(boxes1)
     boxes2_bev = boxes3d_to_bev(boxes2)
 
     # bev overlap
-    overlaps_bev = np.zeros((boxes1_bev.shape[0], boxes2_bev.shape[0]))
-    for i in range(boxes1_bev.shape[0]):
-        overlaps_bev[i, :] = box_overlap_rotate(boxes1_bev[i], boxes2_bev)
+    overlaps_bev = box_overlap_rotate_matrix(boxes1_bev, boxes2_bev)
 
     # height overlap
     boxes1_height_min = (boxes1[:, 1] - boxes1[:, 3]).reshape(-1, 1)
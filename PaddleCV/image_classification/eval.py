@@ -43,10 +43,14 @@ add_arg('model',            str,  "ResNet50", "Set the network to use.")
 add_arg('resize_short_size', int, 256,                  "Set resize short size")
 add_arg('reader_thread',    int,  8,                    "The number of multi thread reader")
 add_arg('reader_buf_size',  int,  2048,                 "The buf size of multi thread reader")
+add_arg('reader_backend',   str,  "thread",             "The backend to decode and augment images, thread or process")
+add_arg('use_record',       bool, False,                "Whether to read packed record files instead of val_list.txt")
 parser.add_argument('--image_mean', nargs='+', type=float, default=[0.485, 0.456, 0.406], help="The mean of input image data")
 parser.add_argument('--image_std', nargs='+', type=float, default=[0.229, 0.224, 0.225], help="The std of input image data")
 parser.add_argument('--image_shape', nargs="+",  type=int, default=[3,224,224], help=" The shape of image")
 add_arg('interpolation',    int,  None,                 "The interpolation mode")
+add_arg('reduced_decode',   bool, False,                "Whether to decode JPEG at 1/2, 1/4 or 1/8 size chosen by resize_short_size")
+add_arg('rect_val',         bool, False,                "Whether to batch images by aspect ratio and center crop each batch to a rectangle")
 add_arg('padding_type',     str,  "SAME",               "Padding type of convolution")
 add_arg('use_se',           bool, True,                 "Whether to use Squeeze-and-Excitation module for EfficientNet.")
 add_arg('save_json_path',   str,  None,                 "Whether to save output in json file.")
@@ -58,6 +62,11 @@ add_arg('deploy',                bool,    False,                      "deploy mo
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# these models end in a fixed size pooling, flatten or slice before the
+# classifier, so they can't take the per batch rectangles of rect_val
+RECT_VAL_UNSUPPORTED = ('AlexNet', 'VGG', 'GoogLeNet', 'DPN', 'ShuffleNetV2',
+                        'DARTS')
+
 
 def eval(args):
     model_list = [m for m in dir(models) if "__" not in m]
@@ -76,8 +85,18 @@ def eval(args):
         assert args.batch_size % fluid.core.get_cuda_device_count(
         ) == 0, "please support correct batch_size({}), which can be divided by available cards({}), you can change the number of cards by indicating: export CUDA_VISIBLE_DEVICES= ".format(
             args.batch_size, fluid.core.get_cuda_device_count())
-    image = fluid.data(
-        name='image', shape=[None] + args.image_shape, dtype='float32')
+    if args.rect_val:
+        assert not args.model.startswith(RECT_VAL_UNSUPPORTED), \
+            "rect_val is not supported by {}, its classifier needs a fixed input size".format(
+                args.model)
+        assert not (args.model.startswith('EfficientNet') and
+                    args.padding_type == "SAME"), \
+            "rect_val needs padding_type DYNAMIC or VALID for EfficientNet, SAME padding is computed for a fixed input size"
+        # every batch has its own rectangle, see reader.rect_crop_shape
+        image_shape = [None, args.image_shape[0], None, None]
+    else:
+        image_shape = [None] + args.image_shape
+    image = fluid.data(name='image', shape=image_shape, dtype='float32')
     label = fluid.data(name='label', shape=[None, 1], dtype='int64')
 
     # model definition
@@ -133,6 +152,8 @@ def eval(args):
 
     # set places to run on the multi-card
     feeder = fluid.DataFeeder(place=places, feed_list=[image, label])
+    # the batches left over when fewer than the places run on a single place
+    single_feeder = fluid.DataFeeder(place=place, feed_list=[image, label])
 
     test_info = [[], [], []]
     cnt = 0
@@ -143,6 +164,7 @@ def eval(args):
     real_iter = 0
     info_dict = {}
 
+    start_time = time.time()
     for batch_id, data in enumerate(val_reader()):
         #image data and label
         image_data = [items[0:2] for items in data]
@@ -160,10 +182,12 @@ def eval(args):
             loss = np.mean(loss_set)
             acc1 = np.mean(acc1_set)
             acc5 = np.mean(acc5_set)
-            test_info[0].append(loss * len(data))
-            test_info[1].append(acc1 * len(data))
-            test_info[2].append(acc5 * len(data))
-            cnt += len(data)
+            # weight every place by its own batch, the last one may be partial
+            sizes = np.array([len(d) for d in parallel_data], dtype='float64')
+            test_info[0].append(np.sum(np.array(loss_set).reshape(-1) * sizes))
+            test_info[1].append(np.sum(np.array(acc1_set).reshape(-1) * sizes))
+            test_info[2].append(np.sum(np.array(acc5_set).reshape(-1) * sizes))
+            cnt += int(np.sum(sizes))
             if batch_id % args.print_step == 0:
                 info = "Testbatch {0},loss {1}, acc1 {2},acc5 {3},time {4}".format(real_iter, \
                   "%.5f"%loss,"%.5f"%acc1, "%.5f"%acc5, \
@@ -175,12 +199,25 @@ def eval(args):
             parallel_data = []
             real_iter += 1
 
+    for image_data in parallel_data:
+        loss_set, acc1_set, acc5_set = exe.run(
+            test_program,
+            fetch_list=fetch_list,
+            feed=single_feeder.feed(image_data))
+        test_info[0].append(np.mean(loss_set) * len(image_data))
+        test_info[1].append(np.mean(acc1_set) * len(image_data))
+        test_info[2].append(np.mean(acc5_set) * len(image_data))
+        cnt += len(image_data)
+
+    total_time = time.time() - start_time
+
     test_loss = np.sum(test_info[0]) / cnt
     test_acc1 = np.sum(test_info[1]) / cnt
     test_acc5 = np.sum(test_info[2]) / cnt
 
-    info = "Test_loss {0}, test_acc1 {1}, test_acc5 {2}".format(
-        "%.5f" % test_loss, "%.5f" % test_acc1, "%.5f" % test_acc5)
+    info = "Test_loss {0}, test_acc1 {1}, test_acc5 {2}, {3} images/sec".format(
+        "%.5f" % test_loss, "%.5f" % test_acc1, "%.5f" % test_acc5,
+        "%.1f" % (cnt / total_time))
     if args.save_json_path:
         info_dict = {
             "Test_loss": test_loss,
@@ -14,10 +14,13 @@
 
 from PIL import Image
 
+import io
 import os
 import os.path
 import sys
 
+from utils import record_file
+
 IMG_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff')
 
 
@@ -210,3 +213,56 @@ class ImageFolder(DatasetFolder):
             transform=transform,
             target_transform=target_transform)
         self.imgs = self.samples
+
+
+class RecordFolder(object):
+    """A data loader reading images packed by tools/pack_records.py: ::
+
+        prefix-00000.rec
+        prefix-00001.rec
+        prefix.idx.npz
+
+    Args:
+        prefix (string): Path prefix of the packed records.
+        transform (callable, optional): A function/transform that  takes in an PIL image
+            and returns a transformed version. E.g, ``transforms.RandomCrop``
+        target_transform (callable, optional): A function/transform that takes in the
+            target and transforms it.
+
+     Attributes:
+        records (RecordDataset): mmapped shards and their index.
+        targets (list): The class_index value for each image in the dataset
+    """
+
+    def __init__(self, prefix, transform=None, target_transform=None):
+        if not record_file.exists(prefix):
+            raise (RuntimeError("Found no record index: " +
+                                record_file.index_path(prefix)))
+        self.transform = transform
+        self.target_transform = target_transform
+        self.records = record_file.RecordDataset(prefix)
+        self.targets = self.records.labels.tolist()
+
+    def loader(self, index):
+        img = Image.open(io.BytesIO(self.records.read(index)))
+        return img.convert('RGB')
+
+    def __getitem__(self, index):
+        """
+        Args:
+            index (int): Index
+
+        Returns:
+            tuple: (sample, target) where target is class_index of the target class.
+        """
+        sample = self.loader(index)
+        target = self.targets[index]
+        if self.transform is not None:
+            sample = self.transform(sample)
+        if self.target_transform is not None:
+            target = self.target_transform(target)
+
+        return sample, target
+
+    def __len__(self):
+        return len(self.targets)
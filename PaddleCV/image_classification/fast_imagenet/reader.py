@@ -98,17 +98,24 @@ class PaddleDataLoader(object):
         return _reader_creator
 
 
-def train(traindir, sz, min_scale=0.08, shuffle_seed=0):
+def train(traindir, sz, min_scale=0.08, shuffle_seed=0, use_record=False):
     train_tfms = [
         transforms.RandomResizedCrop(
             sz, scale=(min_scale, 1.0)), transforms.RandomHorizontalFlip()
     ]
-    train_dataset = datasets.ImageFolder(traindir,
-                                         transforms.Compose(train_tfms))
+    if use_record:
+        train_dataset = datasets.RecordFolder(traindir,
+                                              transforms.Compose(train_tfms))
+    else:
+        train_dataset = datasets.ImageFolder(traindir,
+                                             transforms.Compose(train_tfms))
     return PaddleDataLoader(train_dataset, shuffle_seed=shuffle_seed).reader()
 
 
-def test(valdir, bs, sz, rect_val=False):
+def test(valdir, bs, sz, rect_val=False, use_record=False):
+    if rect_val and use_record:
+        print("rect_val is not supported by packed records, use center crop.")
+        rect_val = False
     if rect_val:
         idx_ar_sorted = sort_ar(valdir)
         idx_sorted, _ = zip(*idx_ar_sorted)
@@ -121,7 +128,12 @@ def test(valdir, bs, sz, rect_val=False):
             shuffle=False).reader()
 
     val_tfms = [transforms.Resize(int(sz * 1.14)), transforms.CenterCrop(sz)]
-    val_dataset = datasets.ImageFolder(valdir, transforms.Compose(val_tfms))
+    if use_record:
+        val_dataset = datasets.RecordFolder(valdir,
+                                            transforms.Compose(val_tfms))
+    else:
+        val_dataset = datasets.ImageFolder(valdir,
+                                           transforms.Compose(val_tfms))
 
     return PaddleDataLoader(val_dataset).reader()
 
@@ -20,14 +20,14 @@ import traceback
 
 import numpy as np
 import math
+import sys
+sys.path.append("..")
 import reader
 import paddle
 import paddle.fluid as fluid
 import paddle.fluid.profiler as profiler
 import paddle.fluid.transpiler.distribute_transpiler as distribute_transpiler
 
-import sys
-sys.path.append("..")
 from utility import add_arguments, print_arguments
 import functools
 from models.fast_imagenet import FastImageNet, lr_decay
@@ -47,6 +47,7 @@ def parse_args():
     add_arg('lr',               float, 1.0,                  "set learning rate.")
     add_arg('lr_strategy',      str,   "piecewise_decay",    "Set the learning rate decay strategy.")
     add_arg('data_dir',         str,   "./data/ILSVRC2012",  "The ImageNet dataset root dir.")
+    add_arg('use_record',       bool,  False,                "Read the records packed by ../tools/pack_records.py instead of image folders.")
     add_arg('model_category',   str,   "models",             "Whether to use models_name or not, valid value:'models','models_name'" )
     add_arg('fp16',             bool,  False,                "Enable half precision training with fp16." )
     add_arg('scale_loss',       float, 1.0,                  "Scale loss for fp16." )
@@ -281,7 +282,8 @@ def prepare_reader(epoch_id, train_py_reader, train_bs, val_bs, trn_dir,
         traindir="%s/%strain" % (args.data_dir, trn_dir),
         sz=img_dim,
         min_scale=min_scale,
-        shuffle_seed=epoch_id + 1)
+        shuffle_seed=epoch_id + 1,
+        use_record=args.use_record)
     train_py_reader.decorate_paddle_reader(
         fluid.io.batch(
             train_reader, batch_size=train_bs))
@@ -290,7 +292,8 @@ def prepare_reader(epoch_id, train_py_reader, train_bs, val_bs, trn_dir,
         valdir="%s/%svalidation" % (args.data_dir, trn_dir),
         bs=val_bs * DEVICE_NUM,
         sz=img_dim,
-        rect_val=rect_val)
+        rect_val=rect_val,
+        use_record=args.use_record)
     test_batched_reader = fluid.io.batch(
         test_reader, batch_size=val_bs * DEVICE_NUM)
 
@@ -13,6 +13,7 @@
 #limitations under the License.
 
 import os
+import io
 import math
 import random
 import functools
@@ -20,13 +21,18 @@ import numpy as np
 import cv2
 import logging
 import imghdr
+from multiprocessing.pool import ThreadPool
 
 import paddle
 from paddle import fluid
 from utils.autoaugment import ImageNetPolicy
+from utils.batch_autoaugment import BatchPolicy
+from utils.shm_reader import shared_memory_batch_reader
+from utils import record_file
 from PIL import Image
 
 policy = None
+batch_policy = None
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -52,19 +58,18 @@ def rotate_image(img):
     return rotated
 
 
-def random_crop(img, size, settings, scale=None, ratio=None,
-                interpolation=None):
-    """random crop image
-        
+def random_crop_box(height, width, settings, scale=None, ratio=None):
+    """draw the region of a random crop
+
     Args:
-        img: image data
-        size: crop size
+        height: image height
+        width: image width
         settings: arguments
         scale: scale parameter
         ratio: ratio parameter
 
     Returns:
-        random cropped image data
+        (i, j, h, w): top, left, height and width of the region
     """
     lower_scale = settings.lower_scale
     lower_ratio = settings.lower_ratio
@@ -76,21 +81,50 @@ def random_crop(img, size, settings, scale=None, ratio=None,
     w = 1. * aspect_ratio
     h = 1. / aspect_ratio
 
-    bound = min((float(img.shape[0]) / img.shape[1]) / (h**2),
-                (float(img.shape[1]) / img.shape[0]) / (w**2))
+    bound = min((float(height) / width) / (h**2),
+                (float(width) / height) / (w**2))
 
     scale_max = min(scale[1], bound)
     scale_min = min(scale[0], bound)
 
-    target_area = img.shape[0] * img.shape[1] * np.random.uniform(scale_min,
-                                                                  scale_max)
+    target_area = height * width * np.random.uniform(scale_min, scale_max)
     target_size = math.sqrt(target_area)
     w = int(target_size * w)
     h = int(target_size * h)
-    i = np.random.randint(0, img.shape[0] - h + 1)
-    j = np.random.randint(0, img.shape[1] - w + 1)
+    i = np.random.randint(0, height - h + 1)
+    j = np.random.randint(0, width - w + 1)
+    return i, j, h, w
 
-    img = img[i:i + h, j:j + w, :]
+
+def random_crop(img, size, settings, scale=None, ratio=None,
+                interpolation=None, box=None, box_shape=None):
+    """random crop image
+        
+    Args:
+        img: image data
+        size: crop size
+        settings: arguments
+        scale: scale parameter
+        ratio: ratio parameter
+        box: region drawn by random_crop_box in advance
+        box_shape: (height, width) the box was drawn for, the box is scaled
+            to img when it was decoded at a reduced size
+
+    Returns:
+        random cropped image data
+    """
+    if box is None:
+        i, j, h, w = random_crop_box(img.shape[0], img.shape[1], settings,
+                                     scale, ratio)
+        img = img[i:i + h, j:j + w, :]
+    else:
+        i, j, h, w = box
+        sy = float(img.shape[0]) / box_shape[0]
+        sx = float(img.shape[1]) / box_shape[1]
+        top, left = int(i * sy), int(j * sx)
+        bottom = max(top + 1, int(round((i + h) * sy)))
+        right = max(left + 1, int(round((j + w) * sx)))
+        img = img[top:bottom, left:right, :]
 
     if interpolation:
         resized = cv2.resize(img, (size, size), interpolation=interpolation)
@@ -112,6 +146,76 @@ def distort_color(img):
     return img
 
 
+REDUCED_DECODE_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+
+# EXIF orientations of images stored rotated by 90 degrees
+TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)
+
+
+def oriented_size(img):
+    """(height, width) of an opened PIL image as cv2 decodes it
+
+    cv2 applies the EXIF orientation when decoding, so the size is swapped
+    for images stored rotated by 90 degrees.
+    """
+    width, height = img.size
+    if img.getexif().get(0x0112) in TRANSPOSED_ORIENTATIONS:
+        return width, height
+    return height, width
+
+
+def image_size(data):
+    """read (height, width) from the header of an encoded image
+
+    Args:
+        data: encoded image bytes
+
+    Returns:
+        (height, width) of the decoded image, nothing is decoded
+    """
+    return oriented_size(Image.open(io.BytesIO(data)))
+
+
+def reduced_decode_factor(short_side, target_size):
+    """largest JPEG DCT scale factor keeping short_side >= target_size
+
+    Args:
+        short_side: the short side in pixels of the full resolution region
+        target_size: the size the region is resized to afterwards
+
+    Returns:
+        one of 1, 2, 4, 8
+    """
+    factor = 1
+    while factor < 8 and short_side // (factor * 2) >= target_size:
+        factor *= 2
+    return factor
+
+
+def decode_image(data, factor=1):
+    """decode image bytes at 1/factor of the resolution
+
+    JPEG is scaled while decoding the DCT blocks, so the decode cost drops
+    with the factor; other formats are decoded and then downsized by cv2.
+
+    Args:
+        data: encoded image bytes
+        factor: one of 1, 2, 4, 8
+
+    Returns:
+        BGR image data
+    """
+    return cv2.imdecode(
+        np.frombuffer(
+            data, dtype='uint8'), REDUCED_DECODE_FLAGS[factor])
+
+
 def resize_short(img, target_size, interpolation=None):
     """resize image
     
@@ -159,57 +263,210 @@ def crop_image(img, target_size, center):
     return img
 
 
-def create_mixup_reader(settings, rd):
+def rect_crop_shape(aspect_ratio, crop_size):
+    """crop shape of a rectangular eval batch
+
+    The short side is crop_size and the long side follows the mean aspect
+    ratio of the batch, rounded down to a multiple of 8.
+
+    Args:
+        aspect_ratio: width / height
+        crop_size: the short side of the crop
+
+    Returns:
+        (height, width) of the crop
     """
+    if aspect_ratio < 1:
+        return int(crop_size / aspect_ratio) // 8 * 8, crop_size
+    return crop_size, int(crop_size * aspect_ratio) // 8 * 8
+
+
+def rect_resize_size(height, width, crop_shape, resize_short_size):
+    """short side size to resize an image to before cropping crop_shape
+
+    Args:
+        height, width: the size of the image
+        crop_shape: (height, width) of the crop
+        resize_short_size: the short side size of the square eval
+
+    Returns:
+        the short side size, at least resize_short_size and large enough to
+        fit crop_shape
     """
+    short = min(height, width)
+    return max(resize_short_size,
+               int(math.ceil(crop_shape[0] * short / float(height))),
+               int(math.ceil(crop_shape[1] * short / float(width))))
 
-    class context:
-        tmp_mix = []
-        tmp_l1 = []
-        tmp_l2 = []
-        tmp_lam = []
 
-    alpha = settings.mixup_alpha
+def center_crop_rect(img, crop_shape):
+    """center crop a (height, width) region from img"""
+    height, width = img.shape[:2]
+    h_start = (height - crop_shape[0]) // 2
+    w_start = (width - crop_shape[1]) // 2
+    return img[h_start:h_start + crop_shape[0], w_start:w_start +
+               crop_shape[1], :]
+
+
+def normalize_batch(imgs, out, scale, shift):
+    """Normalize uint8 HWC images into the float32 NCHW buffer `out`.
+
+    Args:
+        imgs: list of uint8 RGB images with the same shape
+        out: float32 buffer of shape (len(imgs), C, H, W), C can be 4 and
+            the extra channel is left untouched as zero padding
+        scale: float32 array of shape (1, 3, 1, 1), 1 / (255 * std)
+        shift: float32 array of shape (1, 3, 1, 1), mean / std
+
+    Returns:
+        out
+    """
+    rgb = out[:, :3]
+    for i, img in enumerate(imgs):
+        rgb[i] = img.transpose((2, 0, 1))
+    rgb *= scale
+    rgb -= shift
+    return out
+
 
-    def fetch_data():
-        for item in rd():
-            yield item
+class BatchNormalizer(object):
+    """Assemble uint8 HWC images into normalized float32 NCHW batches.
+
+    The batch buffers are reused, a returned batch stays valid until
+    `num_buffers` more batches have been normalized.
+
+    Args:
+        settings: arguments
+        num_buffers: number of batch buffers used in turn
+    """
+
+    def __init__(self, settings, num_buffers=1):
+        mean = np.array(settings.image_mean, dtype='float32')
+        std = np.array(settings.image_std, dtype='float32')
+        self.scale = (1. / (255. * std)).reshape((1, 3, 1, 1))
+        self.shift = (mean / std).reshape((1, 3, 1, 1))
+        self.channel = settings.image_shape[0]
+        self._buffers = [None] * num_buffers
+        self._next = 0
+
+    def _get_buffer(self, shape):
+        buf = self._buffers[self._next]
+        if buf is None or buf.shape[0] < shape[0] or buf.shape[1:] != shape[
+                1:]:
+            buf = np.zeros(shape, dtype='float32')
+            self._buffers[self._next] = buf
+        self._next = (self._next + 1) % len(self._buffers)
+        return buf[:shape[0]]
+
+    def __call__(self, imgs, out=None):
+        """Normalize `imgs` into `out`, or into a reused buffer if not given.
+
+        Images of different sizes, which are not cropped, are normalized one
+        by one into a list of new CHW arrays instead.
+        """
+        h, w = imgs[0].shape[:2]
+        if any(img.shape[:2] != (h, w) for img in imgs):
+            return [
+                normalize_batch([img], np.zeros(
+                    (1, self.channel) + img.shape[:2], dtype='float32'),
+                                self.scale, self.shift)[0] for img in imgs
+            ]
+        if out is None:
+            out = self._get_buffer((len(imgs), self.channel, h, w))
+        return normalize_batch(imgs, out, self.scale, self.shift)
 
-    def mixup_data():
-        for data_list in fetch_data():
+
+def sample_list_reader(rd):
+    """Convert a reader of (images, fields) batches into sample lists."""
+
+    def reader():
+        for imgs, meta in rd():
+            yield [(imgs[i], ) + tuple(m) for i, m in enumerate(meta)]
+
+    return reader
+
+
+def create_mixup_reader(settings, rd):
+    """Mix every batch of `rd` with a shuffled copy of itself.
+
+    Args:
+        settings: arguments
+        rd: reader of (images, fields) batches, images is a float32 NCHW
+            array that may be modified in place
+
+    Returns:
+        reader of sample lists (mixed image, y_a, y_b, lam)
+    """
+    alpha = settings.mixup_alpha
+
+    def mixup_reader():
+        mixed = None
+        for imgs, meta in rd():
             if alpha > 0.:
                 lam = np.random.beta(alpha, alpha)
             else:
                 lam = 1.
-            l1 = np.array(data_list)
-            l2 = np.random.permutation(l1)
-            mixed_l = [
-                l1[i][0] * lam + (1 - lam) * l2[i][0] for i in range(len(l1))
-            ]
-            yield (mixed_l, l1, l2, lam)
-
-    def mixup_reader():
-        for context.tmp_mix, context.tmp_l1, context.tmp_l2, context.tmp_lam in mixup_data(
-        ):
-            for i in range(len(context.tmp_mix)):
-                mixed_l = context.tmp_mix[i]
-                l1 = context.tmp_l1[i]
-                l2 = context.tmp_l2[i]
-                lam = context.tmp_lam
-                yield (mixed_l, int(l1[1]), int(l2[1]), float(lam))
+            n = len(meta)
+            perm = np.random.permutation(n)
+            if mixed is None or mixed.shape[0] < n or mixed.shape[
+                    1:] != imgs.shape[1:]:
+                mixed = np.empty_like(imgs)
+            out = mixed[:n]
+            # mode='clip' lets take write into out without a temporary
+            np.take(imgs, perm, axis=0, out=out, mode='clip')
+            out *= (1. - lam)
+            imgs *= lam
+            out += imgs
+            yield [(out[i], int(meta[i][0]), int(meta[perm[i]][0]),
+                    float(lam)) for i in range(n)]
 
     return mixup_reader
 
 
-def process_image(sample, settings, mode, color_jitter, rotate):
-    """ process_image """
+def process_image(sample, settings, mode, color_jitter, rotate,
+                  dataset=None):
+    """ process_image
+
+    Returns the uint8 RGB HWC image with its fields, normalization is done
+    for the whole batch by BatchNormalizer.
+    """
 
-    mean = settings.image_mean
-    std = settings.image_std
     crop_size = settings.image_shape[1]
+    # the crop region is known before decoding unless the image is rotated
+    reduced_decode = 'reduced_decode' in settings and settings.reduced_decode \
+        and crop_size > 0 and not (mode == 'train' and rotate)
 
     img_path = sample[0]
-    img = cv2.imread(img_path)
+    crop_box = None
+    # set by the rectangular eval reader, shared by the whole batch
+    crop_shape = sample[3] if mode == 'val' and len(sample) > 3 else None
+    if reduced_decode:
+        if dataset is not None:
+            data = dataset.read(sample[2])
+        else:
+            with open(img_path, 'rb') as f:
+                data = f.read()
+        try:
+            height, width = image_size(data)
+        except IOError:
+            img = None
+        else:
+            if mode == 'train':
+                crop_box = random_crop_box(height, width, settings)
+                factor = reduced_decode_factor(
+                    min(crop_box[2], crop_box[3]), crop_size)
+            else:
+                target_size = settings.resize_short_size
+                if crop_shape:
+                    target_size = rect_resize_size(height, width, crop_shape,
+                                                   target_size)
+                factor = reduced_decode_factor(
+                    min(height, width), target_size)
+            img = decode_image(data, factor)
+    elif dataset is not None:
+        img = decode_image(dataset.read(sample[2]))
+    else:
+        img = cv2.imread(img_path)
 
     if img is None:
         logger.warning("img({0}) is None, pass it.".format(img_path))
@@ -220,11 +477,22 @@ def process_image(sample, settings, mode, color_jitter, rotate):
             img = rotate_image(img)
         if crop_size > 0:
             img = random_crop(
-                img, crop_size, settings, interpolation=settings.interpolation)
+                img,
+                crop_size,
+                settings,
+                interpolation=settings.interpolation,
+                box=crop_box,
+                box_shape=(height, width) if crop_box else None)
         if color_jitter:
             img = distort_color(img)
         if np.random.randint(0, 2) == 1:
             img = img[:, ::-1, :]
+    elif crop_shape:
+        target_size = rect_resize_size(img.shape[0], img.shape[1],
+                                       crop_shape, settings.resize_short_size)
+        img = resize_short(
+            img, target_size, interpolation=settings.interpolation)
+        img = center_crop_rect(img, crop_shape)
     else:
         if crop_size > 0:
             target_size = settings.resize_short_size
@@ -234,20 +502,13 @@ def process_image(sample, settings, mode, color_jitter, rotate):
 
     img = img[:, :, ::-1]
 
-    if 'use_aa' in settings and settings.use_aa and mode == 'train':
+    if 'use_aa' in settings and settings.use_aa and mode == 'train' and \
+            _aa_backend(settings) == 'pil':
         img = np.ascontiguousarray(img)
         img = Image.fromarray(img)
         img = policy(img)
         img = np.asarray(img)
 
-    img = img.astype('float32').transpose((2, 0, 1)) / 255
-    img_mean = np.array(mean).reshape((3, 1, 1))
-    img_std = np.array(std).reshape((3, 1, 1))
-    img -= img_mean
-    img /= img_std
-    if settings.image_shape[0] == 4:
-        pad0 = np.zeros((1, img.shape[1], img.shape[2]))
-        img = np.concatenate((img, pad0), axis=0)
     # doing training (train.py)
     if mode == 'train' or (mode == 'val' and
                            not hasattr(settings, 'save_json_path')):
@@ -262,20 +523,55 @@ def process_image(sample, settings, mode, color_jitter, rotate):
         raise Exception("mode not implemented")
 
 
-def process_batch_data(input_data, settings, mode, color_jitter, rotate):
+def _aa_backend(settings):
+    return settings.aa_backend if 'aa_backend' in settings else 'pil'
+
+
+def process_batch_data(input_data,
+                       settings,
+                       mode,
+                       color_jitter,
+                       rotate,
+                       dataset=None):
     batch_data = []
     for sample in input_data:
-        if os.path.isfile(sample[0]):
+        if dataset is not None or os.path.isfile(sample[0]):
             tmp_data = process_image(sample, settings, mode, color_jitter,
-                                     rotate)
+                                     rotate, dataset)
             if tmp_data is None:
                 continue
             batch_data.append(tmp_data)
         else:
             logger.info("File not exist : {0}".format(sample[0]))
+    if 'use_aa' in settings and settings.use_aa and mode == 'train' and \
+            _aa_backend(settings) == 'numpy' and batch_data:
+        # images which drew the same op are augmented together
+        imgs = batch_policy(
+            [np.ascontiguousarray(s[0]) for s in batch_data])
+        batch_data = [(img, ) + s[1:] for img, s in zip(imgs, batch_data)]
     return batch_data
 
 
+def fill_batch_data(input_data,
+                    out,
+                    settings,
+                    mode,
+                    color_jitter,
+                    rotate,
+                    normalizer,
+                    dataset=None):
+    """Process a batch and normalize the images into the preallocated `out`.
+
+    Used by the process reader backend, it returns the remaining fields of
+    every written sample in order.
+    """
+    batch_data = process_batch_data(input_data, settings, mode, color_jitter,
+                                    rotate, dataset)
+    if batch_data:
+        normalizer([s[0] for s in batch_data], out[:len(batch_data)])
+    return [s[1:] for s in batch_data]
+
+
 class ImageNetReader:
     def __init__(self, seed=None):
         self.shuffle_seed = seed
@@ -303,6 +599,96 @@ class ImageNetReader:
                     os.environ.get('CPU_NUM', 1))
         return single_card_bs
 
+    def _get_place_num(self, settings):
+        if settings.use_gpu:
+            return paddle.fluid.core.get_cuda_device_count()
+        return int(os.environ.get('CPU_NUM', 1))
+
+    def _get_record_dataset(self, settings, name):
+        """Open the packed records `data_dir/name` if use_record is set."""
+        if not ('use_record' in settings and settings.use_record):
+            return None
+        prefix = os.path.join(settings.data_dir, name)
+        assert record_file.exists(
+            prefix
+        ), "{} doesn't exist, please pack the dataset by tools/pack_records.py".format(
+            record_file.index_path(prefix))
+        return record_file.RecordDataset(prefix)
+
+    def _get_aspect_ratios(self, settings, file_list, dataset=None):
+        """width / height of every image of file_list or dataset.
+
+        Only the image headers are read, the result is cached next to the
+        list (or the records) and reused by later evaluations.
+        """
+        if dataset is not None:
+            cache_path = dataset.prefix + '_ar.npy'
+            num = len(dataset)
+        else:
+            cache_path = os.path.splitext(file_list)[0] + '_ar.npy'
+            with open(file_list) as flist:
+                lines = [line.strip() for line in flist]
+            num = len(lines)
+        if os.path.isfile(cache_path):
+            ars = np.load(cache_path)
+            if len(ars) == num:
+                return ars
+            logger.warning("{} doesn't match {} images, rebuild it.".format(
+                cache_path, num))
+
+        def get_ar(i):
+            try:
+                if dataset is not None:
+                    height, width = image_size(dataset.read(i))
+                else:
+                    height, width = oriented_size(
+                        Image.open(
+                            os.path.join(settings.data_dir, lines[i].split()[
+                                0])))
+            except IOError:
+                return 1.
+            return float(width) / height
+
+        logger.info("Creating aspect ratio index {} of {} images.".format(
+            cache_path, num))
+        pool = ThreadPool(settings.reader_thread)
+        ars = np.array(pool.map(get_ar, range(num)), dtype='float32')
+        pool.close()
+        np.save(cache_path, ars)
+        return ars
+
+    def _rect_val_reader(self, settings, file_list, batch_size, data_dir,
+                         dataset):
+        """Batch the val images sorted by aspect ratio.
+
+        Each batch is center cropped to one rectangle following the mean
+        aspect ratio of its images, see rect_crop_shape. The last batch is
+        kept even if it is partial, it holds the most extreme aspect ratios.
+        """
+        ars = self._get_aspect_ratios(settings, file_list, dataset)
+        if dataset is None:
+            with open(file_list) as flist:
+                lines = [line.split() for line in flist]
+        order = np.argsort(ars, kind='mergesort')
+
+        def reader():
+            for start in range(0, len(order), batch_size):
+                idxs = order[start:start + batch_size]
+                crop_shape = rect_crop_shape(
+                    float(np.mean(ars[idxs])), settings.image_shape[1])
+                batch_data = []
+                for i in idxs:
+                    if dataset is not None:
+                        img_path = os.path.join(data_dir, dataset.names[i])
+                        label = int(dataset.labels[i])
+                    else:
+                        img_path = os.path.join(data_dir, lines[i][0])
+                        label, i = int(lines[i][1]), None
+                    batch_data.append([img_path, label, i, crop_shape])
+                yield batch_data
+
+        return reader
+
     def _reader_creator(self,
                         settings,
                         file_list,
@@ -310,27 +696,32 @@ class ImageNetReader:
                         shuffle=False,
                         color_jitter=False,
                         rotate=False,
-                        data_dir=None):
+                        data_dir=None,
+                        dataset=None):
         num_trainers = int(os.environ.get('PADDLE_TRAINERS_NUM', 1))
 
         batch_size = self._get_single_card_bs(settings, mode)
 
         def reader():
             def read_file_list():
-                with open(file_list) as flist:
-                    full_lines = [line.strip() for line in flist]
-                    if mode != "test" and len(full_lines) < settings.batch_size:
-                        logger.error(
-                            "Error: The number of the whole data ({}) is smaller than the batch_size ({}), and drop_last is turnning on, so nothing  will feed in program, Terminated now. Please reset batch_size to a smaller number or feed more data!".
-                            format(len(full_lines), settings.batch_size))
-                        os._exit(1)
-                    if num_trainers > 1 and mode == "train":
-                        assert self.shuffle_seed is not None, "multiprocess train, shuffle seed must be set!"
-                        np.random.RandomState(self.shuffle_seed).shuffle(
-                            full_lines)
-                    elif shuffle:
-                        if not settings.enable_ce or not settings.same_feed:
-                            np.random.shuffle(full_lines)
+                if dataset is not None:
+                    # records are shuffled by index, no file is touched
+                    full_lines = list(range(len(dataset)))
+                else:
+                    with open(file_list) as flist:
+                        full_lines = [line.strip() for line in flist]
+                if mode != "test" and len(full_lines) < settings.batch_size:
+                    logger.error(
+                        "Error: The number of the whole data ({}) is smaller than the batch_size ({}), and drop_last is turnning on, so nothing  will feed in program, Terminated now. Please reset batch_size to a smaller number or feed more data!".
+                        format(len(full_lines), settings.batch_size))
+                    os._exit(1)
+                if num_trainers > 1 and mode == "train":
+                    assert self.shuffle_seed is not None, "multiprocess train, shuffle seed must be set!"
+                    np.random.RandomState(self.shuffle_seed).shuffle(
+                        full_lines)
+                elif shuffle:
+                    if not settings.enable_ce or not settings.same_feed:
+                        np.random.shuffle(full_lines)
 
                 batch_data = []
                 if (mode == "train" or mode == "val") and settings.same_feed:
@@ -342,9 +733,14 @@ class ImageNetReader:
                         full_lines.append(temp_file)
 
                 for line in full_lines:
-                    img_path, label = line.split()
-                    img_path = os.path.join(data_dir, img_path)
-                    batch_data.append([img_path, int(label)])
+                    if dataset is not None:
+                        img_path = os.path.join(data_dir, dataset.names[line])
+                        batch_data.append(
+                            [img_path, int(dataset.labels[line]), line])
+                    else:
+                        img_path, label = line.split()
+                        img_path = os.path.join(data_dir, img_path)
+                        batch_data.append([img_path, int(label)])
                     if len(batch_data) == batch_size:
                         if mode == 'train' or mode == 'val' or mode == 'test':
                             yield batch_data
@@ -352,7 +748,11 @@ class ImageNetReader:
 
             return read_file_list
 
-        data_reader = reader()
+        if mode == 'val' and 'rect_val' in settings and settings.rect_val:
+            data_reader = self._rect_val_reader(settings, file_list,
+                                                batch_size, data_dir, dataset)
+        else:
+            data_reader = reader()
 
         if mode == 'train' and num_trainers > 1:
             assert self.shuffle_seed is not None, \
@@ -362,20 +762,68 @@ class ImageNetReader:
             data_reader = paddle.fluid.contrib.reader.distributed_batch_reader(
                 data_reader)
 
+        # eval.py and infer.py hold one batch per place before feeding them
+        keep = 1 if mode == 'train' else self._get_place_num(settings)
+        reader_backend = settings.reader_backend if 'reader_backend' in settings else 'thread'
+        if reader_backend == 'process':
+            assert settings.image_shape[1] > 0, \
+                "process reader backend needs a fixed image_shape"
+            assert not (mode == 'val' and 'rect_val' in settings and
+                        settings.rect_val), \
+                "rect_val batches differ in shape, please use the thread reader backend"
+            fill_fn = functools.partial(
+                fill_batch_data,
+                settings=settings,
+                mode=mode,
+                color_jitter=color_jitter,
+                rotate=rotate,
+                normalizer=BatchNormalizer(settings),
+                dataset=dataset)
+
+            def process_reader():
+                # read shuffle_seed lazily since it is reset every epoch,
+                # each slot holds a whole batch so keep their number small
+                return shared_memory_batch_reader(
+                    data_reader,
+                    fill_fn,
+                    slot_shape=[batch_size] + list(settings.image_shape),
+                    num_workers=settings.reader_thread,
+                    num_slots=max(
+                        min(settings.reader_buf_size,
+                            2 * settings.reader_thread), keep + 1),
+                    keep=keep,
+                    seed=self.shuffle_seed)()
+
+            return process_reader
+
+        assert reader_backend == 'thread', \
+            "reader_backend should be 'thread' or 'process', but got {}".format(reader_backend)
         mapper = functools.partial(
             process_batch_data,
             settings=settings,
             mode=mode,
             color_jitter=color_jitter,
-            rotate=rotate)
+            rotate=rotate,
+            dataset=dataset)
 
-        return fluid.io.xmap_readers(
+        batch_reader = fluid.io.xmap_readers(
             mapper,
             data_reader,
             settings.reader_thread,
             settings.reader_buf_size,
             order=False)
 
+        def normalized_reader():
+            # images stay uint8 until here so the batch is normalized at once
+            normalizer = BatchNormalizer(settings, num_buffers=keep)
+            for batch_data in batch_reader():
+                if not batch_data:
+                    continue
+                imgs = normalizer([s[0] for s in batch_data])
+                yield imgs, [s[1:] for s in batch_data]
+
+        return normalized_reader
+
     def train(self, settings):
         """Create a reader for trainning
 
@@ -386,13 +834,16 @@ class ImageNetReader:
             train reader
         """
         file_list = os.path.join(settings.data_dir, 'train_list.txt')
-        assert os.path.isfile(
+        dataset = self._get_record_dataset(settings, 'train')
+        assert dataset is not None or os.path.isfile(
             file_list), "{} doesn't exist, please check data list path".format(
                 file_list)
 
         if 'use_aa' in settings and settings.use_aa:
-            global policy
+            global policy, batch_policy
             policy = ImageNetPolicy()
+            if _aa_backend(settings) == 'numpy':
+                batch_policy = BatchPolicy(policy)
 
         reader = self._reader_creator(
             settings,
@@ -401,16 +852,14 @@ class ImageNetReader:
             shuffle=True,
             color_jitter=False,
             rotate=False,
-            data_dir=settings.data_dir)
+            data_dir=settings.data_dir,
+            dataset=dataset)
 
         if settings.use_mixup == True:
-            reader = create_mixup_reader(settings, reader)
-            reader = fluid.io.batch(
-                reader,
-                batch_size=int(settings.batch_size /
-                               paddle.fluid.core.get_cuda_device_count()),
-                drop_last=True)
-        return reader
+            assert settings.image_shape[1] > 0, \
+                "mixup needs a fixed image_shape, the images of a batch are mixed as one array"
+            return create_mixup_reader(settings, reader)
+        return sample_list_reader(reader)
 
     def val(self, settings):
         """Create a reader for eval
@@ -423,15 +872,18 @@ class ImageNetReader:
         """
 
         file_list = os.path.join(settings.data_dir, 'val_list.txt')
-        assert os.path.isfile(
+        dataset = self._get_record_dataset(settings, 'val')
+        assert dataset is not None or os.path.isfile(
             file_list), "{} doesn't exist, please check data list path".format(
                 file_list)
-        return self._reader_creator(
-            settings,
-            file_list,
-            'val',
-            shuffle=False,
-            data_dir=settings.data_dir)
+        return sample_list_reader(
+            self._reader_creator(
+                settings,
+                file_list,
+                'val',
+                shuffle=False,
+                data_dir=settings.data_dir,
+                dataset=dataset))
 
     def test(self, settings):
         """Create a reader for testing
@@ -456,9 +908,10 @@ class ImageNetReader:
                     if imghdr.what(file_path) not in imgType_list:
                         continue
                     fout.write(file_name + " 0" + "\n")
-        return self._reader_creator(
-            settings,
-            file_list,
-            'test',
-            shuffle=False,
-            data_dir=settings.data_dir)
+        return sample_list_reader(
+            self._reader_creator(
+                settings,
+                file_list,
+                'test',
+                shuffle=False,
+                data_dir=settings.data_dir))
@@ -0,0 +1,138 @@
+#copyright (c) 2020 PaddlePaddle Authors. All Rights Reserve.
+#
+#Licensed under the Apache License, Version 2.0 (the "License");
+#you may not use this file except in compliance with the License.
+#You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#Unless required by applicable law or agreed to in writing, software
+#distributed under the License is distributed on an "AS IS" BASIS,
+#WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#See the License for the specific language governing permissions and
+#limitations under the License.
+"""Per-op throughput and equivalence of the PIL and NumPy AutoAugment ops.
+
+For every op of utils/autoaugment.py the same batch is processed by the PIL
+lambda (one image at a time) and by utils/batch_autoaugment.py (the whole
+batch at once). The images/sec of both and the mean absolute pixel
+difference of the outputs are printed, then the full ImageNetPolicy and
+BatchPolicy are compared by their output mean/std over random draws.
+
+Usage:
+    python tools/benchmark_autoaugment.py --batch_size=64 --image_size=224
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import sys
+import time
+import random
+import argparse
+import functools
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from utils.utility import add_arguments
+from utils.autoaugment import ImageNetPolicy, SubPolicy
+from utils import batch_autoaugment
+
+parser = argparse.ArgumentParser(description=__doc__)
+add_arg = functools.partial(add_arguments, argparser=parser)
+# yapf: disable
+add_arg('batch_size', int, 64,  "The number of images per batch.")
+add_arg('image_size', int, 224, "The size of the square images.")
+add_arg('magnitude',  int, 5,   "The magnitude index of every op.")
+add_arg('repeat',     int, 5,   "The number of batches to time.")
+add_arg('data_dir',   str, None, "Use the first images of data_dir/val_list.txt instead of random textures.")
+# yapf: enable
+
+
+def load_images(args):
+    if args.data_dir:
+        import cv2
+        imgs = []
+        with open(os.path.join(args.data_dir, 'val_list.txt')) as flist:
+            for line in flist:
+                img = cv2.imread(os.path.join(args.data_dir, line.split()[0]))
+                img = cv2.resize(img, (args.image_size, args.image_size))
+                imgs.append(np.ascontiguousarray(img[:, :, ::-1]))
+                if len(imgs) == args.batch_size:
+                    break
+        return imgs
+    # smooth random textures, flat noise would hide interpolation errors
+    rng = np.random.RandomState(0)
+    imgs = []
+    for _ in range(args.batch_size):
+        small = rng.randint(0, 256, (8, 8, 3)).astype('uint8')
+        img = Image.fromarray(small).resize((args.image_size, args.image_size),
+                                            Image.BICUBIC)
+        imgs.append(np.asarray(img))
+    return imgs
+
+
+def time_it(fn, repeat):
+    fn()
+    start = time.time()
+    for _ in range(repeat):
+        out = fn()
+    return (time.time() - start) / repeat, out
+
+
+def bench_op(name, imgs, args):
+    sub_policy = SubPolicy(1.0, name, args.magnitude, 0.0, name, 0)
+    magnitude = sub_policy.magnitude1
+    pil_imgs = [Image.fromarray(img) for img in imgs]
+
+    # fix the random sign to + for both paths
+    random.choice = lambda seq: seq[-1]
+    pil_cost, pil_out = time_it(
+        lambda: [np.asarray(sub_policy.operation1(img, magnitude)) for img in pil_imgs],
+        args.repeat)
+    op = batch_autoaugment.OPS[name]
+    np_cost, np_out = time_it(
+        lambda: op(np.stack(imgs), magnitude, (128, 128, 128)), args.repeat)
+
+    diff = np.mean([
+        np.abs(a.astype('int32') - b.astype('int32')).mean()
+        for a, b in zip(pil_out, np_out)
+    ])
+    print("{:<13s} PIL {:8.1f} img/s  numpy {:8.1f} img/s  x{:<5.1f} "
+          "mean abs diff {:.3f}".format(name, len(imgs) / pil_cost, len(
+              imgs) / np_cost, pil_cost / np_cost, diff))
+
+
+def compare_policies(imgs, args):
+    random.seed(0)
+    np.random.seed(0)
+    policy = ImageNetPolicy()
+    batch_policy = batch_autoaugment.BatchPolicy(policy)
+    pil_cost, pil_out = time_it(
+        lambda: [np.asarray(policy(Image.fromarray(img))) for img in imgs],
+        args.repeat)
+    np_cost, np_out = time_it(lambda: batch_policy(imgs), args.repeat)
+    pil_out, np_out = np.stack(pil_out), np.stack(np_out)
+    print("ImageNetPolicy PIL {:.1f} img/s, BatchPolicy {:.1f} img/s".format(
+        len(imgs) / pil_cost, len(imgs) / np_cost))
+    print("output mean {:.2f} vs {:.2f}, std {:.2f} vs {:.2f}".format(
+        pil_out.mean(), np_out.mean(), pil_out.std(), np_out.std()))
+
+
+def main():
+    args = parser.parse_args()
+    imgs = load_images(args)
+    choice = random.choice
+    for name in sorted(batch_autoaugment.OPS):
+        bench_op(name, imgs, args)
+    random.choice = choice
+    compare_policies(imgs, args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+#copyright (c) 2020 PaddlePaddle Authors. All Rights Reserve.
+#
+#Licensed under the Apache License, Version 2.0 (the "License");
+#you may not use this file except in compliance with the License.
+#You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#Unless required by applicable law or agreed to in writing, software
+#distributed under the License is distributed on an "AS IS" BASIS,
+#WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#See the License for the specific language governing permissions and
+#limitations under the License.
+"""Microbenchmark of the host side normalization and mixup of one batch.
+
+Compares the per-image path (float64 temporaries per image, mixup over an
+object array) with the batched BatchNormalizer/create_mixup_reader path.
+Reports the time per batch and the peak memory allocated on top of the
+inputs, measured by tracemalloc which numpy reports its buffers to.
+
+Usage:
+    python tools/benchmark_batch_ops.py --batch_size=64 --image_shape 4 224 224
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import sys
+import time
+import argparse
+import functools
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import reader
+from utils.utility import add_arguments
+
+parser = argparse.ArgumentParser(description=__doc__)
+add_arg = functools.partial(add_arguments, argparser=parser)
+# yapf: disable
+add_arg('batch_size',  int,   64,  "Minibatch size.")
+add_arg('repeat',      int,   20,  "The number of batches to time.")
+add_arg('mixup_alpha', float, 0.2, "The value of mixup_alpha")
+parser.add_argument('--image_shape', nargs='+', type=int, default=[3, 224, 224], help="The shape of image")
+parser.add_argument('--image_mean', nargs='+', type=float, default=[0.485, 0.456, 0.406], help="The mean of input image data")
+parser.add_argument('--image_std', nargs='+', type=float, default=[0.229, 0.224, 0.225], help="The std of input image data")
+# yapf: enable
+
+
+def per_image_normalize(img, settings):
+    img = img.astype('float32').transpose((2, 0, 1)) / 255
+    img_mean = np.array(settings.image_mean).reshape((3, 1, 1))
+    img_std = np.array(settings.image_std).reshape((3, 1, 1))
+    img -= img_mean
+    img /= img_std
+    if settings.image_shape[0] == 4:
+        pad0 = np.zeros((1, img.shape[1], img.shape[2]))
+        img = np.concatenate((img, pad0), axis=0)
+    return img
+
+
+def per_image_path(imgs, labels, settings):
+    data_list = [(per_image_normalize(img, settings), label)
+                 for img, label in zip(imgs, labels)]
+    lam = np.random.beta(settings.mixup_alpha, settings.mixup_alpha)
+    l1 = np.array(data_list, dtype=object)
+    l2 = np.random.permutation(l1)
+    return [l1[i][0] * lam + (1 - lam) * l2[i][0] for i in range(len(l1))]
+
+
+def make_batched_path(settings):
+    normalizer = reader.BatchNormalizer(settings)
+    state = {}
+
+    def batch_reader():
+        while True:
+            yield normalizer(state['imgs']), [(l, ) for l in state['labels']]
+
+    mixup_batches = reader.create_mixup_reader(settings, batch_reader)()
+
+    def batched_path(imgs, labels, settings):
+        state['imgs'] = imgs
+        state['labels'] = labels
+        return next(mixup_batches)
+
+    return batched_path
+
+
+def measure(fn, imgs, labels, settings):
+    fn(imgs, labels, settings)  # warm up, the batched buffers are created here
+    tracemalloc.start()
+    start = time.time()
+    for _ in range(settings.repeat):
+        fn(imgs, labels, settings)
+    cost = (time.time() - start) / settings.repeat
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return cost, peak
+
+
+def main():
+    settings = parser.parse_args()
+    h, w = settings.image_shape[1:]
+    imgs = [
+        np.random.randint(
+            0, 256, size=(h, w, 3), dtype='uint8')
+        for _ in range(settings.batch_size)
+    ]
+    labels = list(range(settings.batch_size))
+    batch_mb = 4. * settings.batch_size * np.prod(settings.image_shape) / 2**20
+
+    for name, fn in [('per-image', per_image_path),
+                     ('batched', make_batched_path(settings))]:
+        cost, peak = measure(fn, imgs, labels, settings)
+        print("{:<10s} {:.2f} ms/batch, peak alloc {:.1f} MB ({:.1f} batches)".
+              format(name, cost * 1000, peak / 2**20, peak / 2**20 / batch_mb))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+#copyright (c) 2020 PaddlePaddle Authors. All Rights Reserve.
+#
+#Licensed under the Apache License, Version 2.0 (the "License");
+#you may not use this file except in compliance with the License.
+#You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#Unless required by applicable law or agreed to in writing, software
+#distributed under the License is distributed on an "AS IS" BASIS,
+#WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#See the License for the specific language governing permissions and
+#limitations under the License.
+"""Measure ImageNetReader throughput in samples/sec for each reader backend.
+
+Usage:
+    python tools/benchmark_reader.py --data_dir=./data/ILSVRC2012/ \
+        --reader_thread=8 --batch_size=256 --max_iter=50
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import sys
+import time
+import argparse
+import functools
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import reader
+from utils.utility import add_arguments
+
+parser = argparse.ArgumentParser(description=__doc__)
+add_arg = functools.partial(add_arguments, argparser=parser)
+# yapf: disable
+add_arg('data_dir',          str,   "./data/ILSVRC2012/", "The ImageNet dataset root directory.")
+add_arg('mode',              str,   "train",              "Which reader to benchmark, train or val.")
+add_arg('backends',          str,   "thread,process",     "Comma separated reader backends to compare.")
+add_arg('batch_size',        int,   256,                  "Minibatch size.")
+add_arg('test_batch_size',   int,   256,                  "Minibatch size of val reader.")
+add_arg('max_iter',          int,   50,                   "The number of batches to read per backend.")
+add_arg('warmup_iter',       int,   5,                    "The number of batches skipped before timing.")
+add_arg('reader_thread',     int,   8,                    "The number of reader threads or processes.")
+add_arg('reader_buf_size',   int,   16,                   "The buf size of reader.")
+add_arg('lower_scale',       float, 0.08,                 "The value of lower_scale in ramdom_crop")
+add_arg('lower_ratio',       float, 3. / 4.,              "The value of lower_ratio in ramdom_crop")
+add_arg('upper_ratio',       float, 4. / 3.,              "The value of upper_ratio in ramdom_crop")
+add_arg('resize_short_size', int,   256,                  "The value of resize_short_size")
+add_arg('interpolation',     int,   None,                 "The interpolation mode")
+add_arg('use_aa',            bool,  False,                "Whether to use auto augment")
+parser.add_argument('--image_shape', nargs='+', type=int, default=[3, 224, 224], help="The shape of image")
+parser.add_argument('--image_mean', nargs='+', type=float, default=[0.485, 0.456, 0.406], help="The mean of input image data")
+parser.add_argument('--image_std', nargs='+', type=float, default=[0.229, 0.224, 0.225], help="The std of input image data")
+# yapf: enable
+
+
+def benchmark(args, backend):
+    args.reader_backend = backend
+    imagenet_reader = reader.ImageNetReader(seed=0)
+    batch_reader = getattr(imagenet_reader, args.mode)(settings=args)
+
+    num_samples = 0
+    start = time.time()
+    for batch_id, batch in enumerate(batch_reader()):
+        if batch_id == args.warmup_iter:
+            num_samples = 0
+            start = time.time()
+        num_samples += len(batch)
+        if batch_id + 1 >= args.warmup_iter + args.max_iter:
+            break
+    cost = time.time() - start
+    return num_samples / cost
+
+
+def main():
+    args = parser.parse_args()
+    # the fields below are expected by ImageNetReader but unused here
+    args.use_gpu = False
+    args.use_mixup = False
+    args.enable_ce = False
+    args.same_feed = 0
+    os.environ['CPU_NUM'] = '1'
+
+    for backend in args.backends.split(','):
+        speed = benchmark(args, backend)
+        print("backend: {:<8s} mode: {:<6s} samples/sec: {:.2f}".format(
+            backend, args.mode, speed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+#copyright (c) 2020 PaddlePaddle Authors. All Rights Reserve.
+#
+#Licensed under the Apache License, Version 2.0 (the "License");
+#you may not use this file except in compliance with the License.
+#You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#Unless required by applicable law or agreed to in writing, software
+#distributed under the License is distributed on an "AS IS" BASIS,
+#WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#See the License for the specific language governing permissions and
+#limitations under the License.
+"""Compare full and reduced resolution decoding on a validation subset.
+
+For every image the eval preprocessing (resize_short + center crop) is run
+with and without --reduced_decode, the CPU time per image and the PSNR of
+the reduced crop against the full one are reported. Top-1 parity is checked
+by running eval.py on the same model with --reduced_decode=False/True.
+
+Usage:
+    python tools/check_reduced_decode.py --data_dir=./data/ILSVRC2012/ \
+        --num_images=1000
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import sys
+import time
+import argparse
+import functools
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import reader
+from utils.utility import add_arguments
+
+parser = argparse.ArgumentParser(description=__doc__)
+add_arg = functools.partial(add_arguments, argparser=parser)
+# yapf: disable
+add_arg('data_dir',          str, "./data/ILSVRC2012/", "The ImageNet dataset root directory.")
+add_arg('num_images',        int, 1000,                 "The number of val images to check.")
+add_arg('resize_short_size', int, 256,                  "The value of resize_short_size")
+add_arg('interpolation',     int, None,                 "The interpolation mode")
+parser.add_argument('--image_shape', nargs='+', type=int, default=[3, 224, 224], help="The shape of image")
+# yapf: enable
+
+
+def preprocess(samples, settings):
+    start = time.process_time()
+    imgs = [
+        reader.process_image(sample, settings, 'val', False, False)[0]
+        for sample in samples
+    ]
+    return imgs, (time.process_time() - start) / len(samples)
+
+
+def psnr(a, b):
+    mse = np.mean((a.astype('float32') - b.astype('float32'))**2)
+    return float('inf') if mse == 0 else 10 * np.log10(255.**2 / mse)
+
+
+def main():
+    settings = parser.parse_args()
+    samples = []
+    with open(os.path.join(settings.data_dir, 'val_list.txt')) as flist:
+        for line in flist:
+            img_path, label = line.split()
+            samples.append(
+                [os.path.join(settings.data_dir, img_path), int(label)])
+            if len(samples) == settings.num_images:
+                break
+
+    settings.reduced_decode = False
+    full, full_cost = preprocess(samples, settings)
+    settings.reduced_decode = True
+    reduced, reduced_cost = preprocess(samples, settings)
+
+    psnrs = np.array([psnr(a, b) for a, b in zip(full, reduced)])
+    print("images: {}".format(len(samples)))
+    print("full decode    {:.2f} ms cpu/image".format(full_cost * 1000))
+    print("reduced decode {:.2f} ms cpu/image".format(reduced_cost * 1000))
+    print("PSNR of reduced vs full crops: mean {:.2f} dB, min {:.2f} dB".
+          format(np.mean(psnrs[np.isfinite(psnrs)]) if np.isfinite(
+              psnrs).any() else float('inf'), psnrs.min()))
+
+
+if __name__ == '__main__':
+    main()
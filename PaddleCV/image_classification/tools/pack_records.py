@@ -0,0 +1,120 @@
+#copyright (c) 2020 PaddlePaddle Authors. All Rights Reserve.
+#
+#Licensed under the Apache License, Version 2.0 (the "License");
+#you may not use this file except in compliance with the License.
+#You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#Unless required by applicable law or agreed to in writing, software
+#distributed under the License is distributed on an "AS IS" BASIS,
+#WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#See the License for the specific language governing permissions and
+#limitations under the License.
+"""Pack an image dataset into record shards, see utils/record_file.py.
+
+Pack the lists used by ImageNetReader (then train with --use_record=True),
+shuffling the train records so every shard holds a mix of classes:
+    python tools/pack_records.py --data_dir=./data/ILSVRC2012/ --name=train --shuffle_seed=0
+    python tools/pack_records.py --data_dir=./data/ILSVRC2012/ --name=val
+
+Pack a root/class_x/xxx.jpg folder used by fast_imagenet:
+    python tools/pack_records.py --image_folder=/data/imagenet/train \
+        --output=/data/imagenet/train --shuffle_seed=0
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import sys
+import time
+import argparse
+import functools
+from multiprocessing.pool import ThreadPool
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from utils.utility import add_arguments
+from utils import record_file
+
+IMG_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff')
+
+parser = argparse.ArgumentParser(description=__doc__)
+add_arg = functools.partial(add_arguments, argparser=parser)
+# yapf: disable
+add_arg('data_dir',      str,  "./data/ILSVRC2012/", "The ImageNet dataset root directory.")
+add_arg('name',          str,  "train",              "Pack data_dir/<name>_list.txt into data_dir/<name>-*.rec.")
+add_arg('image_folder',  str,  None,                 "Pack a root/class_x/xxx.jpg folder instead of a list file.")
+add_arg('output',        str,  None,                 "Output prefix, default is data_dir/<name>.")
+add_arg('shard_size_mb', int,  1024,                 "The size of every shard in MB.")
+add_arg('shuffle_seed',  int,  -1,                   "Seed to shuffle the records before packing, e.g. for train, -1 to keep the order.")
+add_arg('num_threads',   int,  16,                   "The number of threads reading images.")
+# yapf: enable
+
+
+def list_file_samples(data_dir, name):
+    file_list = os.path.join(data_dir, '{}_list.txt'.format(name))
+    assert os.path.isfile(file_list), "{} doesn't exist".format(file_list)
+    samples = []
+    with open(file_list) as flist:
+        for line in flist:
+            img_path, label = line.split()
+            samples.append((img_path, int(label)))
+    return data_dir, samples
+
+
+def image_folder_samples(root):
+    classes = sorted(d for d in os.listdir(root)
+                     if os.path.isdir(os.path.join(root, d)))
+    samples = []
+    for label, target in enumerate(classes):
+        for dirpath, _, fnames in sorted(os.walk(os.path.join(root, target))):
+            for fname in sorted(fnames):
+                if fname.lower().endswith(IMG_EXTENSIONS):
+                    path = os.path.join(dirpath, fname)
+                    samples.append((os.path.relpath(path, root), label))
+    return root, samples
+
+
+def read_bytes(root, sample):
+    with open(os.path.join(root, sample[0]), 'rb') as f:
+        return f.read()
+
+
+def main():
+    args = parser.parse_args()
+    if args.image_folder:
+        root, samples = image_folder_samples(args.image_folder)
+        output = args.output or args.image_folder.rstrip('/')
+    else:
+        root, samples = list_file_samples(args.data_dir, args.name)
+        output = args.output or os.path.join(args.data_dir, args.name)
+    assert len(samples) > 0, "no image is found"
+
+    if args.shuffle_seed >= 0:
+        # shuffle once so every shard holds a mix of classes
+        order = np.random.RandomState(args.shuffle_seed).permutation(
+            len(samples))
+        samples = [samples[i] for i in order]
+
+    start = time.time()
+    pool = ThreadPool(args.num_threads)
+    with record_file.RecordWriter(
+            output, shard_size=args.shard_size_mb << 20) as writer:
+        datas = pool.imap(functools.partial(read_bytes, root), samples)
+        for i, (data, sample) in enumerate(zip(datas, samples)):
+            writer.write(data, sample[1], sample[0])
+            if (i + 1) % 10000 == 0:
+                print("packed {}/{} images, {:.1f}s".format(
+                    i + 1, len(samples), time.time() - start))
+    pool.close()
+    print("packed {} images into {}, {:.1f}s".format(
+        len(samples), record_file.index_path(output), time.time() - start))
+
+
+if __name__ == '__main__':
+    main()
@@ -231,9 +231,11 @@ class SubPolicy(object):
         }
 
         self.p1 = p1
+        self.op_name1 = operation1
         self.operation1 = func[operation1]
         self.magnitude1 = ranges[operation1][magnitude_idx1]
         self.p2 = p2
+        self.op_name2 = operation2
         self.operation2 = func[operation2]
         self.magnitude2 = ranges[operation2][magnitude_idx2]
 
@@ -0,0 +1,271 @@
+#copyright (c) 2020 PaddlePaddle Authors. All Rights Reserve.
+#
+#Licensed under the Apache License, Version 2.0 (the "License");
+#you may not use this file except in compliance with the License.
+#You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#Unless required by applicable law or agreed to in writing, software
+#distributed under the License is distributed on an "AS IS" BASIS,
+#WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#See the License for the specific language governing permissions and
+#limitations under the License.
+"""
+AutoAugment sub-policies applied to batches of uint8 RGB arrays.
+
+The ops follow the PIL implementations used by utils/autoaugment.py (same
+luma weights, LUT rounding and blend truncation), images which drew the same
+op, magnitude and sign are stacked and processed together.
+"""
+
+import collections
+
+import cv2
+import numpy as np
+
+from utils.autoaugment import ImageNetPolicy
+
+# ops whose magnitude gets a random sign in utils/autoaugment.py
+SIGNED_OPS = {
+    "shearX", "shearY", "translateX", "translateY", "color", "contrast",
+    "sharpness", "brightness"
+}
+
+
+def _gray(img):
+    """PIL's RGB to L conversion of one (H, W, 3) uint8 image."""
+    img = img.astype('uint32')
+    l = (img[..., 0] * 19595 + img[..., 1] * 38470 + img[..., 2] * 7471 +
+         0x8000) >> 16
+    return l.astype('uint8')
+
+
+def _blend(img, degenerate, factor):
+    """PIL's Image.blend(degenerate, img, factor) of one image.
+
+    degenerate is an image or a scalar, PIL truncates the blended value,
+    which is round(value - 0.5) as done by cv2.addWeighted here.
+    """
+    if np.isscalar(degenerate):
+        return cv2.addWeighted(img, factor, img, 0,
+                               degenerate * (1 - factor) - 0.5)
+    return cv2.addWeighted(img, factor, degenerate, 1 - factor, -0.5)
+
+
+def _lut(imgs, lut):
+    """Apply one (256, ) uint8 LUT to every channel of every image."""
+    n, h, w, c = imgs.shape
+    return cv2.LUT(imgs.reshape((n * h, w, c)), lut).reshape(imgs.shape)
+
+
+def _channel_luts(imgs, luts):
+    """Apply a per image per channel LUT of shape (N, 3, 256)."""
+    luts = np.ascontiguousarray(
+        np.clip(luts, 0, 255).astype('uint8').transpose((0, 2, 1)))
+    out = np.empty_like(imgs)
+    for i in range(imgs.shape[0]):
+        out[i] = cv2.LUT(imgs[i], luts[i].reshape((256, 1, 3)))
+    return out
+
+
+def _histogram(img):
+    """Per channel histogram of one image, shape (3, 256)."""
+    return np.stack([
+        cv2.calcHist([img], [c], None, [256], [0, 256]).reshape(-1)
+        for c in range(3)
+    ]).astype('int64')
+
+
+def _warp(imgs, matrix, interpolation, fillcolor, inverse=True):
+    flags = interpolation | (cv2.WARP_INVERSE_MAP if inverse else 0)
+    h, w = imgs.shape[1:3]
+    out = np.empty_like(imgs)
+    for i in range(imgs.shape[0]):
+        out[i] = cv2.warpAffine(
+            imgs[i],
+            matrix, (w, h),
+            flags=flags,
+            borderMode=cv2.BORDER_CONSTANT,
+            borderValue=fillcolor)
+    return out
+
+
+def _pil_affine(a, b, c, d, e, f):
+    """Convert PIL AFFINE data (pixel centers at +0.5) to a cv2 inverse map."""
+    return np.array(
+        [[a, b, c + 0.5 * (a + b) - 0.5], [d, e, f + 0.5 * (d + e) - 0.5]],
+        dtype='float64')
+
+
+def shear_x(imgs, magnitude, fillcolor):
+    return _warp(imgs,
+                 _pil_affine(1, magnitude, 0, 0, 1, 0), cv2.INTER_CUBIC,
+                 fillcolor)
+
+
+def shear_y(imgs, magnitude, fillcolor):
+    return _warp(imgs,
+                 _pil_affine(1, 0, 0, magnitude, 1, 0), cv2.INTER_CUBIC,
+                 fillcolor)
+
+
+def translate_x(imgs, magnitude, fillcolor):
+    return _warp(imgs,
+                 _pil_affine(1, 0, magnitude * imgs.shape[2], 0, 1, 0),
+                 cv2.INTER_NEAREST, fillcolor)
+
+
+def translate_y(imgs, magnitude, fillcolor):
+    return _warp(imgs,
+                 _pil_affine(1, 0, 0, 0, 1, magnitude * imgs.shape[1]),
+                 cv2.INTER_NEAREST, fillcolor)
+
+
+def rotate(imgs, magnitude, fillcolor):
+    h, w = imgs.shape[1:3]
+    matrix = cv2.getRotationMatrix2D(((w - 1) / 2., (h - 1) / 2.), magnitude,
+                                     1.0)
+    # rotate_with_fill in utils/autoaugment.py always fills with 128
+    return _warp(
+        imgs, matrix, cv2.INTER_NEAREST, (128, 128, 128), inverse=False)
+
+
+def color(imgs, magnitude, fillcolor):
+    out = np.empty_like(imgs)
+    for i, img in enumerate(imgs):
+        gray = cv2.cvtColor(_gray(img), cv2.COLOR_GRAY2RGB)
+        out[i] = _blend(img, gray, 1 + magnitude)
+    return out
+
+
+def contrast(imgs, magnitude, fillcolor):
+    out = np.empty_like(imgs)
+    for i, img in enumerate(imgs):
+        mean = np.floor(_gray(img).mean() + 0.5)
+        out[i] = _blend(img, mean, 1 + magnitude)
+    return out
+
+
+def brightness(imgs, magnitude, fillcolor):
+    n, h, w, c = imgs.shape
+    flat = imgs.reshape((n * h, w, c))
+    return _blend(flat, 0., 1 + magnitude).reshape(imgs.shape)
+
+
+def sharpness(imgs, magnitude, fillcolor):
+    n, h, w = imgs.shape[:3]
+    kernel = np.array(
+        [[1, 1, 1], [1, 5, 1], [1, 1, 1]], dtype='float32') / 13.
+    # filter all images as one tall image, the rows bleeding across images
+    # are borders which PIL's SMOOTH leaves untouched anyway
+    flat = imgs.reshape((n * h, w, 3))
+    smooth = cv2.filter2D(flat, -1, kernel).reshape(imgs.shape)
+    smooth[:, 0] = imgs[:, 0]
+    smooth[:, -1] = imgs[:, -1]
+    smooth[:, :, 0] = imgs[:, :, 0]
+    smooth[:, :, -1] = imgs[:, :, -1]
+    return _blend(flat, smooth.reshape(flat.shape),
+                  1 + magnitude).reshape(imgs.shape)
+
+
+def posterize(imgs, magnitude, fillcolor):
+    mask = ~(2**(8 - int(magnitude)) - 1) & 0xff
+    return imgs & np.uint8(mask)
+
+
+def solarize(imgs, magnitude, fillcolor):
+    ix = np.arange(256)
+    return _lut(imgs, np.where(ix < magnitude, ix, 255 - ix).astype('uint8'))
+
+
+def autocontrast(imgs, magnitude, fillcolor):
+    # cv2.reduce is much faster than a numpy min/max over the strided pixels
+    flat = imgs.reshape((imgs.shape[0], -1, 3))
+    lo = np.stack([cv2.reduce(f, 0, cv2.REDUCE_MIN) for f in flat])
+    hi = np.stack([cv2.reduce(f, 0, cv2.REDUCE_MAX) for f in flat])
+    lo = lo.reshape((-1, 3, 1)).astype('float64')
+    hi = hi.reshape((-1, 3, 1)).astype('float64')
+    ix = np.arange(256, dtype='float64')
+    valid = hi > lo
+    scale = np.where(valid, 255.0 / np.where(valid, hi - lo, 1.), 1.)
+    offset = np.where(valid, -lo * scale, 0.)
+    return _channel_luts(imgs, (ix * scale + offset).astype('int64'))
+
+
+def equalize(imgs, magnitude, fillcolor):
+    hist = np.stack([_histogram(img) for img in imgs])
+    nonzero = hist > 0
+    last = 255 - np.argmax(nonzero[..., ::-1], axis=-1)
+    last_count = np.take_along_axis(hist, last[..., np.newaxis], -1)
+    step = (hist.sum(axis=-1, keepdims=True) - last_count) // 256
+    cum = np.cumsum(hist, axis=-1) - hist
+    lut = (step // 2 + cum) // np.maximum(step, 1)
+    identity = (nonzero.sum(axis=-1, keepdims=True) <= 1) | (step == 0)
+    return _channel_luts(imgs, np.where(identity, np.arange(256), lut))
+
+
+def invert(imgs, magnitude, fillcolor):
+    return 255 - imgs
+
+
+OPS = {
+    "shearX": shear_x,
+    "shearY": shear_y,
+    "translateX": translate_x,
+    "translateY": translate_y,
+    "rotate": rotate,
+    "color": color,
+    "posterize": posterize,
+    "solarize": solarize,
+    "contrast": contrast,
+    "sharpness": sharpness,
+    "brightness": brightness,
+    "autocontrast": autocontrast,
+    "equalize": equalize,
+    "invert": invert,
+}
+
+
+class BatchPolicy(object):
+    """ Apply the sub-policies of an AutoAugment policy to a batch.
+
+        Example:
+        >>> policy = BatchPolicy(ImageNetPolicy())
+        >>> transformed = policy(images)  # list of HxWx3 uint8 RGB arrays
+    """
+
+    def __init__(self, policy=None, fillcolor=(128, 128, 128)):
+        policy = ImageNetPolicy(fillcolor) if policy is None else policy
+        self.fillcolor = fillcolor
+        self.sub_policies = [((sp.p1, sp.op_name1, sp.magnitude1),
+                              (sp.p2, sp.op_name2, sp.magnitude2))
+                             for sp in policy.policies]
+
+    def __call__(self, imgs, policy_idx=None):
+        n = len(imgs)
+        if policy_idx is None:
+            policy_idx = np.random.randint(0, len(self.sub_policies), n)
+        else:
+            policy_idx = np.asarray(policy_idx) % len(self.sub_policies)
+        out = list(imgs)
+        for stage in range(2):
+            groups = collections.defaultdict(list)
+            apply = np.random.random_sample(n)
+            signs = np.random.choice([-1, 1], n)
+            for i in range(n):
+                p, name, magnitude = self.sub_policies[policy_idx[i]][stage]
+                if apply[i] >= p:
+                    continue
+                if name in SIGNED_OPS:
+                    magnitude = magnitude * signs[i]
+                groups[(name, magnitude, out[i].shape)].append(i)
+            for (name, magnitude, _), members in groups.items():
+                batch = np.stack([out[i] for i in members])
+                batch = OPS[name](batch, magnitude, self.fillcolor)
+                for k, i in enumerate(members):
+                    out[i] = batch[k]
+        return out
+
+    def __repr__(self):
+        return "AutoAugment Batch Policy"
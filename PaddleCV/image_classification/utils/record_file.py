@@ -0,0 +1,152 @@
+#copyright (c) 2020 PaddlePaddle Authors. All Rights Reserve.
+#
+#Licensed under the Apache License, Version 2.0 (the "License");
+#you may not use this file except in compliance with the License.
+#You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#Unless required by applicable law or agreed to in writing, software
+#distributed under the License is distributed on an "AS IS" BASIS,
+#WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#See the License for the specific language governing permissions and
+#limitations under the License.
+"""Packed record files for image datasets.
+
+A dataset `prefix` is stored as:
+
+    prefix-00000.rec, prefix-00001.rec, ...   encoded image bytes, back to back
+    prefix.idx.npz                            shard, offset, length, label
+                                              and name of every record
+
+Shards are opened with mmap so reading a record is a slice of the mapping,
+no per-image open/stat is done on the filesystem. Shuffling only permutes
+the in-memory index, i.e. the (shard, offset) pairs.
+"""
+
+import os
+import mmap
+
+import numpy as np
+
+SHARD_SUFFIX = '.rec'
+INDEX_SUFFIX = '.idx.npz'
+
+
+def shard_path(prefix, shard_id):
+    return '{}-{:05d}{}'.format(prefix, shard_id, SHARD_SUFFIX)
+
+
+def index_path(prefix):
+    return prefix + INDEX_SUFFIX
+
+
+def exists(prefix):
+    return os.path.isfile(index_path(prefix))
+
+
+class RecordWriter(object):
+    """Append encoded images to shards of about `shard_size` bytes.
+
+    Args:
+        prefix: output path prefix of the shards and the index.
+        shard_size: a new shard is started once the current one exceeds it.
+    """
+
+    def __init__(self, prefix, shard_size=1 << 30):
+        self.prefix = prefix
+        self.shard_size = shard_size
+        self._shard_id = -1
+        self._fout = None
+        self._offset = 0
+        self._shards = []
+        self._offsets = []
+        self._lengths = []
+        self._labels = []
+        self._names = []
+
+    def _next_shard(self):
+        if self._fout is not None:
+            self._fout.close()
+        self._shard_id += 1
+        self._fout = open(shard_path(self.prefix, self._shard_id), 'wb')
+        self._offset = 0
+
+    def write(self, data, label, name):
+        """Append the encoded bytes `data` of one image."""
+        if self._fout is None or self._offset >= self.shard_size:
+            self._next_shard()
+        self._fout.write(data)
+        self._shards.append(self._shard_id)
+        self._offsets.append(self._offset)
+        self._lengths.append(len(data))
+        self._labels.append(label)
+        self._names.append(name)
+        self._offset += len(data)
+
+    def close(self):
+        if self._fout is not None:
+            self._fout.close()
+            self._fout = None
+        np.savez(
+            index_path(self.prefix),
+            shard=np.array(
+                self._shards, dtype='int32'),
+            offset=np.array(
+                self._offsets, dtype='int64'),
+            length=np.array(
+                self._lengths, dtype='int32'),
+            label=np.array(
+                self._labels, dtype='int64'),
+            name=np.array(self._names))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class RecordDataset(object):
+    """Random access to a packed record dataset.
+
+    The shards are mapped lazily in every process that reads them, so the
+    dataset can be handed to reader threads or pickled to worker processes.
+
+    Args:
+        prefix: path prefix given to RecordWriter.
+    """
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        index = np.load(index_path(prefix))
+        self.shard = index['shard']
+        self.offset = index['offset']
+        self.length = index['length']
+        self.labels = index['label']
+        self.names = index['name']
+        self._maps = {}
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_maps'] = {}
+        return state
+
+    def _map(self, shard_id):
+        mm = self._maps.get(shard_id)
+        if mm is None:
+            with open(shard_path(self.prefix, shard_id), 'rb') as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[shard_id] = mm
+        return mm
+
+    def read(self, idx):
+        """Return the encoded bytes of record `idx` as a zero-copy uint8 array."""
+        return np.frombuffer(
+            self._map(self.shard[idx]),
+            dtype='uint8',
+            count=self.length[idx],
+            offset=self.offset[idx])
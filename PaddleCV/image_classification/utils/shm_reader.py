@@ -0,0 +1,145 @@
+#copyright (c) 2020 PaddlePaddle Authors. All Rights Reserve.
+#
+#Licensed under the Apache License, Version 2.0 (the "License");
+#you may not use this file except in compliance with the License.
+#You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#Unless required by applicable law or agreed to in writing, software
+#distributed under the License is distributed on an "AS IS" BASIS,
+#WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#See the License for the specific language governing permissions and
+#limitations under the License.
+"""Process-pool batch reader backed by preallocated shared-memory slots.
+
+Worker processes decode and augment a whole batch and write the resulting
+float32 tensors directly into one of `num_slots` shared buffers. Only the
+slot index and the small per-sample metadata (labels, paths) travel back
+through the result queue, so the trainer never unpickles image data.
+"""
+
+import collections
+import multiprocessing
+import random
+
+import numpy as np
+from six.moves import queue
+
+_POLL_INTERVAL = 1.0
+
+
+def _as_slots(buf, num_slots, slot_shape):
+    return np.frombuffer(
+        buf, dtype='float32').reshape((num_slots, ) + tuple(slot_shape))
+
+
+def _worker_loop(fill_fn, buf, num_slots, slot_shape, task_queue,
+                 result_queue, seed):
+    slots = _as_slots(buf, num_slots, slot_shape)
+    np.random.seed(seed)
+    random.seed(seed)
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+        slot_id, samples = task
+        meta = fill_fn(samples, slots[slot_id])
+        result_queue.put((slot_id, meta))
+
+
+def shared_memory_batch_reader(batch_reader,
+                               fill_fn,
+                               slot_shape,
+                               num_workers,
+                               num_slots,
+                               keep=1,
+                               seed=None):
+    """Map `fill_fn` over `batch_reader` in worker processes.
+
+    Args:
+        batch_reader: generator creator yielding lists of raw samples.
+        fill_fn: callable(samples, out) that writes processed samples into
+            the float32 array `out` (shape `slot_shape`) in order and
+            returns a list with the remaining fields of every written sample.
+        slot_shape: shape of one batch slot, e.g. (batch_size, C, H, W).
+        num_workers: number of worker processes.
+        num_slots: number of preallocated batch slots, i.e. the number of
+            batches that can be in flight at once, must exceed `keep`.
+        keep: number of most recently yielded batches the consumer may
+            still hold when requesting the next one.
+        seed: base seed for the workers' random generators. Worker i is
+            seeded with `seed + i` so augmentation streams do not repeat
+            across workers.
+
+    Returns:
+        a generator creator yielding (images, fields) where images is a view
+        into a shared slot and fields is the list returned by `fill_fn`.
+        The view stays valid until `keep` more batches are requested.
+    """
+    assert num_workers > 0, "num_workers must be positive"
+    assert num_slots > keep > 0, "num_slots must be larger than keep"
+    slot_size = int(np.prod(slot_shape))
+
+    def reader():
+        base_seed = seed if seed is not None else np.random.randint(2**16)
+        buf = multiprocessing.RawArray('f', num_slots * slot_size)
+        slots = _as_slots(buf, num_slots, slot_shape)
+        task_queue = multiprocessing.Queue()
+        result_queue = multiprocessing.Queue()
+        workers = []
+        for i in range(num_workers):
+            w = multiprocessing.Process(
+                target=_worker_loop,
+                args=(fill_fn, buf, num_slots, slot_shape, task_queue,
+                      result_queue, base_seed + i))
+            w.daemon = True
+            w.start()
+            workers.append(w)
+
+        free_slots = collections.deque(range(num_slots))
+        held_slots = collections.deque()
+        batches = batch_reader()
+        pending = 0
+        exhausted = False
+        try:
+            while True:
+                while free_slots and not exhausted:
+                    try:
+                        samples = next(batches)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    task_queue.put((free_slots.popleft(), samples))
+                    pending += 1
+                if pending == 0:
+                    break
+
+                while True:
+                    try:
+                        slot_id, meta = result_queue.get(
+                            timeout=_POLL_INTERVAL)
+                        break
+                    except queue.Empty:
+                        dead = [w.pid for w in workers if not w.is_alive()]
+                        if dead:
+                            raise RuntimeError(
+                                "reader worker(s) {} exited unexpectedly".
+                                format(dead))
+                pending -= 1
+                if not meta:
+                    free_slots.append(slot_id)
+                    continue
+                yield slots[slot_id][:len(meta)], meta
+                held_slots.append(slot_id)
+                while len(held_slots) >= keep:
+                    free_slots.append(held_slots.popleft())
+        finally:
+            for _ in workers:
+                task_queue.put(None)
+            for w in workers:
+                w.join(timeout=_POLL_INTERVAL)
+                if w.is_alive():
+                    w.terminate()
+
+    return reader
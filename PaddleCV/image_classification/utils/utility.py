@@ -132,8 +132,12 @@ def parse_args():
     add_arg('mixup_alpha',              float,  0.2,                    "The value of mixup_alpha")
     add_arg('reader_thread',            int,    8,                      "The number of multi thread reader")
     add_arg('reader_buf_size',          int,    8,                      "The buf size of multi thread reader")
+    add_arg('reader_backend',           str,    "thread",               "The backend to decode and augment images, thread or process")
+    add_arg('use_record',               bool,   False,                  "Whether to read packed record files instead of train_list.txt/val_list.txt")
     add_arg('interpolation',            int,    None,                   "The interpolation mode")
+    add_arg('reduced_decode',           bool,   False,                  "Whether to decode JPEG at 1/2, 1/4 or 1/8 size chosen by resize_short_size and the crop size")
     add_arg('use_aa',                   bool,   False,                  "Whether to use auto augment")
+    add_arg('aa_backend',               str,    "pil",                  "The backend of auto augment, pil applies the policy per image, numpy applies it to the whole batch")
     parser.add_argument('--image_mean', nargs='+', type=float, default=[0.485, 0.456, 0.406], help="The mean of input image data")
     parser.add_argument('--image_std', nargs='+', type=float, default=[0.229, 0.224, 0.225], help="The std of input image data")
 
@@ -238,6 +242,16 @@ def check_args(args):
             0, 1, 2, 3, 4
         ], "Wrong interpolation, please set:\n0: cv2.INTER_NEAREST\n1: cv2.INTER_LINEAR\n2: cv2.INTER_CUBIC\n3: cv2.INTER_AREA\n4: cv2.INTER_LANCZOS4"
 
+    # check reader backend
+    assert args.reader_backend in [
+        "thread", "process"
+    ], "Wrong reader_backend, please set:\nthread\nprocess"
+
+    # check auto augment backend
+    assert args.aa_backend in [
+        "pil", "numpy"
+    ], "Wrong aa_backend, please set:\npil\nnumpy"
+
     # check padding type
     if args.padding_type:
         assert args.padding_type in [
@@ -0,0 +1,199 @@
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+env_path = os.path.join(os.path.dirname(__file__), '..')
+if env_path not in sys.path:
+    sys.path.append(env_path)
+
+import dataflow as df
+
+import ltr.data.transforms as dltransforms
+from ltr.dataset import Lasot, Got10k
+from ltr.data import processing, sampler
+from ltr.data.image_loader import default_image_loader, roi_image_loader
+
+
+def blank_image_loader(path):
+    """Skips the image decoding, so only the sequence and annotation reading is timed."""
+    return np.zeros((2, 2, 3), dtype=np.uint8)
+
+
+def build_dataset(name, image_loader, anno_index=None, frame_store=None):
+    if name == 'lasot':
+        return Lasot(
+            split='train',
+            image_loader=image_loader,
+            anno_index=anno_index,
+            frame_store=frame_store)
+    return Got10k(
+        split='train',
+        image_loader=image_loader,
+        anno_index=anno_index,
+        frame_store=frame_store)
+
+
+def atom_sampler(dataset, num_pairs):
+    """The training sampler and processing of train_settings/bbreg/atom_res18_vid_lasot_coco.py"""
+    output_sz = 18 * 16
+    data_processing = processing.ATOMProcessing(
+        search_area_factor=5.0,
+        output_sz=output_sz,
+        center_jitter_factor={'train': 0,
+                              'test': 4.5},
+        scale_jitter_factor={'train': 0,
+                             'test': 0.5},
+        mode='sequence',
+        proposal_params={
+            'min_iou': 0.1,
+            'boxes_per_frame': 16,
+            'sigma_factor': [0.01, 0.05, 0.1, 0.2, 0.3]
+        },
+        transform=dltransforms.Compose([
+            dltransforms.ToArrayAndJitter(0.2), dltransforms.Normalize(
+                mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
+        ]),
+        joint_transform=dltransforms.ToGrayscale(probability=0.05))
+    return sampler.ATOMSampler(
+        [dataset], [1],
+        samples_per_epoch=num_pairs,
+        max_gap=50,
+        processing=data_processing)
+
+
+def siamrpn_sampler(dataset, num_pairs):
+    """The training sampler and processing of train_settings/siamrpn/siamrpn_alexnet.py"""
+    data_processing = processing.SiamProcessing(
+        search_area_factor={'train': 1.0,
+                            'test': 2.0},
+        output_sz={'train': 127,
+                   'test': 255},
+        center_jitter_factor={'train': 0.125,
+                              'test': 2.0},
+        scale_jitter_factor={'train': 0.05,
+                             'test': 0.18},
+        scale_type='context',
+        border_type='meanpad',
+        mode='sequence',
+        label_params={
+            'search_size': 255,
+            'output_size': 17,
+            'anchor_stride': 8,
+            'anchor_ratios': [0.33, 0.5, 1, 2, 3],
+            'anchor_scales': [8],
+            'num_pos': 16,
+            'num_neg': 16,
+            'num_total': 64,
+            'thr_high': 0.6,
+            'thr_low': 0.3
+        },
+        train_transform=dltransforms.Transpose(),
+        test_transform=dltransforms.Compose([
+            dltransforms.Color(probability=1.0),
+            dltransforms.Blur(probability=0.18), dltransforms.Transpose()
+        ]),
+        test_mask_transform=dltransforms.Transpose(),
+        joint_transform=dltransforms.ToGrayscale(probability=0.25))
+    return sampler.MaskSampler(
+        [dataset], [1],
+        samples_per_epoch=num_pairs,
+        max_gap=100,
+        processing=data_processing,
+        neg=0.2)
+
+
+def plain_sampler(dataset, num_pairs):
+    return sampler.ATOMSampler(
+        [dataset], [1], samples_per_epoch=num_pairs, max_gap=50)
+
+
+def time_sampler(ds, num_pairs, num_workers):
+    """Training pairs per second of a sampler, in this process or through MultiProcessRunnerZMQ."""
+    # Like LTRLoader, every iteration of the sampler yields a single pair
+    ds = df.RepeatedData(ds, -1)
+    if num_workers > 0:
+        ds = df.MultiProcessRunnerZMQ(ds, num_proc=num_workers, hwm=300)
+    ds.reset_state()
+
+    it = iter(ds)
+    next(it)
+    start = time.time()
+    for _ in range(num_pairs):
+        next(it)
+    return num_pairs / (time.time() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Training pairs per second on LaSOT or GOT-10k. Without --processing the annotations are read '
+        'from the text files and from the annotation index of build_anno_index.py. With --processing the pairs are '
+        'cropped like in ATOM or SiamRPN training, from full decoded image files, with roi_image_loader, and with '
+        'roi_image_loader from the frame store of pack_frames.py.')
+    parser.add_argument(
+        'dataset', type=str, choices=['lasot', 'got10k'], help='Dataset to sample from.')
+    parser.add_argument(
+        '--processing',
+        type=str,
+        default=None,
+        choices=['atom', 'siamrpn'],
+        help='Processing of the training pairs, default none.')
+    parser.add_argument(
+        '--anno_index',
+        type=str,
+        default=None,
+        help='Directory of the annotation index, default root/anno_index.')
+    parser.add_argument(
+        '--frame_store',
+        type=str,
+        default=None,
+        help='Directory of the frame store, default root/frame_store.')
+    parser.add_argument(
+        '--num_pairs', type=int, default=2000, help='Timed training pairs, default 2000.')
+    parser.add_argument(
+        '--num_workers',
+        type=int,
+        default=0,
+        help='Sampler processes of MultiProcessRunnerZMQ, default 0 to sample in this process.')
+    parser.add_argument(
+        '--load_images',
+        action='store_true',
+        help='Decode the frames too without --processing, by default only the annotations are read.')
+
+    args = parser.parse_args()
+
+    if args.processing is None:
+        image_loader = default_image_loader if args.load_images else blank_image_loader
+        runs = [('text files', plain_sampler, image_loader, False, False),
+                ('annotation index', plain_sampler, image_loader,
+                 args.anno_index, False)]
+    else:
+        make_sampler = atom_sampler if args.processing == 'atom' else siamrpn_sampler
+        runs = [('image files, full decode', make_sampler, default_image_loader,
+                 args.anno_index, False),
+                ('image files, roi decode', make_sampler, roi_image_loader,
+                 args.anno_index, False),
+                ('frame store, roi decode', make_sampler, roi_image_loader,
+                 args.anno_index, args.frame_store)]
+
+    for name, make_sampler, image_loader, anno_index, frame_store in runs:
+        dataset = build_dataset(args.dataset, image_loader, anno_index,
+                                frame_store)
+        if name == 'annotation index' and dataset.anno_index is None:
+            print('{}: no annotation index, build it with build_anno_index.py'.
+                  format(name))
+            continue
+        if name.startswith('frame store') and dataset.frame_store is None:
+            print('{}: no frame store, build it with pack_frames.py'.format(
+                name))
+            continue
+        pairs_per_sec = time_sampler(
+            make_sampler(dataset, args.num_pairs), args.num_pairs,
+            args.num_workers)
+        print('{}: {:.1f} pairs/sec'.format(name, pairs_per_sec))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+import os
+import sys
+import time
+import argparse
+
+env_path = os.path.join(os.path.dirname(__file__), '..')
+if env_path not in sys.path:
+    sys.path.append(env_path)
+
+from ltr.dataset import Lasot, Got10k
+from ltr.dataset.anno_index import ANNO_INDEX_DIR, build_anno_index
+from ltr.admin.environment import env_settings
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Build the annotation index of LaSOT or GOT-10k, read by the datasets with mmap.')
+    parser.add_argument(
+        'dataset', type=str, choices=['lasot', 'got10k'], help='Dataset to index.')
+    parser.add_argument(
+        '--root',
+        type=str,
+        default=None,
+        help='Root of the dataset, default the path in "ltr/admin/local.py".')
+    parser.add_argument(
+        '--output',
+        type=str,
+        default=None,
+        help='Directory of the index, default root/{}. Pass the same directory as anno_index to the dataset '
+        'if it is not the default.'.format(ANNO_INDEX_DIR))
+
+    args = parser.parse_args()
+
+    if args.dataset == 'lasot':
+        root = env_settings().lasot_dir if args.root is None else args.root
+        # every LaSOT class has the videos 1 - 20
+        dataset = Lasot(root, vid_ids=list(range(1, 21)), anno_index=False)
+    else:
+        root = env_settings().got10k_dir if args.root is None else args.root
+        dataset = Got10k(root, anno_index=False)
+    output = os.path.join(root, ANNO_INDEX_DIR) if args.output is None else args.output
+
+    start = time.time()
+    build_anno_index(dataset, output)
+    print('{} sequences of {} indexed to {} in {:.1f} s'.format(
+        dataset.get_num_sequences(), args.dataset, output, time.time() - start))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+import os
+import sys
+import shutil
+import resource
+import argparse
+import tempfile
+
+import numpy as np
+
+env_path = os.path.join(os.path.dirname(__file__), '..')
+if env_path not in sys.path:
+    sys.path.append(env_path)
+
+from ltr.dataset.frame_store import FrameStore, pack_sequence
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Reads the frames of more sequences of a frame store than the open file limit allows, in random '
+        'order, and compares them with the packed files. The store is built from small synthetic frames in a '
+        'temporary directory.')
+    parser.add_argument(
+        '--fd_limit',
+        type=int,
+        default=1024,
+        help='Open file limit of the check, lowered from "ulimit -n" if that is larger, default 1024.')
+    parser.add_argument(
+        '--frames', type=int, default=4, help='Frames of every sequence, default 4.')
+
+    args = parser.parse_args()
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    fd_limit = min(soft, args.fd_limit)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (fd_limit, hard))
+    num_seqs = fd_limit + 256
+
+    rng = np.random.RandomState(0)
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        frame_dir = os.path.join(tmp_dir, 'frames')
+        store_dir = os.path.join(tmp_dir, 'store')
+        os.makedirs(frame_dir)
+        os.makedirs(store_dir)
+        frames = []
+        for seq_id in range(num_seqs):
+            name = 'seq{:05d}'.format(seq_id)
+            paths = []
+            for frame_id in range(args.frames):
+                path = os.path.join(frame_dir, '{}_{}.jpg'.format(name, frame_id))
+                rng.randint(0, 256, rng.randint(1, 64)).astype(np.uint8).tofile(path)
+                paths.append(path)
+            pack_sequence(paths, store_dir, name)
+            frames.append(paths)
+
+        store = FrameStore(store_dir)
+        for _ in range(2):
+            for seq_id in rng.permutation(num_seqs):
+                name = 'seq{:05d}'.format(seq_id)
+                assert name in store, name
+                frame_id = rng.randint(args.frames)
+                expected = np.fromfile(frames[seq_id][frame_id], dtype=np.uint8)
+                assert np.array_equal(store.get(name, frame_id), expected), (name, frame_id)
+        assert 'missing' not in store
+        print('read {} sequences twice with an open file limit of {}, {} kept open: ok'.format(
+            num_seqs, fd_limit, len(store._sequences)))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    main()
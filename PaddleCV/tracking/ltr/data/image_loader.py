@@ -6,7 +6,8 @@ import numpy as np
 
 def default_image_loader(path):
     """The default image loader, reads the image from the given path. It first tries to use the jpeg4py_loader,
-    but reverts to the opencv_loader if the former is not available."""
+    but reverts to the opencv_loader if the former is not available. The path can also be a uint8 array holding
+    the encoded image, like the frames of a FrameStore."""
     if default_image_loader.use_jpeg4py is None:
         # Try using jpeg4py
         im = jpeg4py_loader(path)
@@ -24,12 +25,18 @@ def default_image_loader(path):
 default_image_loader.use_jpeg4py = None
 
 
+def _image_name(path):
+    if isinstance(path, np.ndarray):
+        return '<{} bytes buffer>'.format(path.size)
+    return path
+
+
 def jpeg4py_loader(path):
     """ Image reading using jpeg4py (https://github.com/ajkxyz/jpeg4py)"""
     try:
         return jpeg4py.JPEG(path).decode()
     except Exception as e:
-        print('ERROR: Jpeg4py could not read image "{}". Using OpenCV instead.'.format(path))
+        print('ERROR: Jpeg4py could not read image "{}". Using OpenCV instead.'.format(_image_name(path)))
         print(e)
         return opencv_loader(path)
 
@@ -37,11 +44,14 @@ def jpeg4py_loader(path):
 def opencv_loader(path):
     """ Read image using opencv's imread function and returns it in rgb format"""
     try:
-        im = cv.imread(path, cv.IMREAD_COLOR)
+        if isinstance(path, np.ndarray):
+            im = cv.imdecode(path, cv.IMREAD_COLOR)
+        else:
+            im = cv.imread(path, cv.IMREAD_COLOR)
         # convert to rgb and return
         return cv.cvtColor(im, cv.COLOR_BGR2RGB)
     except Exception as e:
-        print('ERROR: OpenCV could not read image "{}"'.format(path))
+        print('ERROR: OpenCV could not read image "{}"'.format(_image_name(path)))
         print(e)
         return None
 
@@ -61,3 +71,103 @@ def lmdb_loader(path, lmdb_path=None):
 
 
 lmdb_loader.txn = None
+
+
+# scale reductions of cv.imdecode, JPEG images are decoded at these scales directly by the DCT
+_REDUCED_FLAGS = [(8, cv.IMREAD_REDUCED_COLOR_8), (4, cv.IMREAD_REDUCED_COLOR_4),
+                  (2, cv.IMREAD_REDUCED_COLOR_2)]
+
+
+def jpeg_size(buffer):
+    """ Reads the (height, width) of a JPEG image from its frame header, without decoding it. Returns None if the
+    buffer is not a JPEG image."""
+    data = memoryview(buffer).cast('B')
+    if len(data) < 4 or data[0] != 0xFF or data[1] != 0xD8:
+        return None
+    pos = 2
+    while pos + 9 < len(data):
+        if data[pos] != 0xFF:
+            return None
+        marker = data[pos + 1]
+        if marker == 0xFF:
+            # fill byte
+            pos += 1
+            continue
+        if marker == 0xD8 or 0xD0 <= marker <= 0xD7:
+            pos += 2
+            continue
+        length = (data[pos + 2] << 8) + data[pos + 3]
+        # start of frame markers, except DHT, JPG and DAC
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height = (data[pos + 5] << 8) + data[pos + 6]
+            width = (data[pos + 7] << 8) + data[pos + 8]
+            return height, width
+        pos += 2 + length
+    return None
+
+
+class LazyImage:
+    """ An image which is only decoded when it is cropped by processing_utils.sample_target. If the crop is resized
+    to a much smaller output size, the image is decoded at 1/2, 1/4 or 1/8 scale, which skips most of the decoding of
+    large JPEG frames. Returned by roi_image_loader."""
+
+    def __init__(self, path):
+        """
+        args:
+            path - path of the image, or a uint8 array holding the encoded image
+        """
+        self.path = path
+        self._buffer = path if isinstance(path, np.ndarray) else None
+        self._shape = None
+        self._decoded = {}
+
+    @property
+    def buffer(self):
+        if self._buffer is None:
+            self._buffer = np.fromfile(self.path, dtype=np.uint8)
+        return self._buffer
+
+    @property
+    def shape(self):
+        """ Shape (height, width, 3) of the full scale image, read from the header for JPEG images """
+        if self._shape is None:
+            size = jpeg_size(self.buffer)
+            if size is None:
+                self._shape = self.decode().shape
+            else:
+                self._shape = size + (3, )
+        return self._shape
+
+    def copy(self):
+        # The decoded images are never modified in place, copies can share them
+        return self
+
+    def reduction(self, crop_sz, output_sz):
+        """ Largest scale reduction at which a crop of crop_sz pixels still has output_sz pixels or more """
+        if output_sz is None:
+            return 1
+        for reduce, _ in _REDUCED_FLAGS:
+            if crop_sz >= reduce * output_sz:
+                return reduce
+        return 1
+
+    def decode(self, reduce=1):
+        """ The image in rgb format, decoded at 1 / reduce scale, reduce is one of 1, 2, 4 and 8 """
+        if reduce not in self._decoded:
+            if reduce == 1:
+                im = default_image_loader(self.buffer)
+            else:
+                im = cv.imdecode(self.buffer, dict(_REDUCED_FLAGS)[reduce])
+                if im is None:
+                    print('ERROR: OpenCV could not read image "{}"'.format(
+                        _image_name(self.path)))
+                    return None
+                im = cv.cvtColor(im, cv.COLOR_BGR2RGB)
+            self._decoded[reduce] = im
+        return self._decoded[reduce]
+
+
+def roi_image_loader(path):
+    """ Image loader which defers the decoding to the cropping of the search region, see LazyImage. Only works with
+    the processing classes of ltr.data.processing, which crop the frames with processing_utils.sample_target."""
+    return LazyImage(path)
@@ -36,6 +36,25 @@ class BaseProcessing:
     def __call__(self, data: TensorDict):
         raise NotImplementedError
 
+    def _joint_transform(self, data: TensorDict):
+        if self.transform['joint'] is not None:
+            num_train_images = len(data['train_images'])
+            all_images = list(data['train_images']) + list(data['test_images'])
+            all_images_trans = self.transform['joint'](*all_images)
+
+            data['train_images'] = all_images_trans[:num_train_images]
+            data['test_images'] = all_images_trans[num_train_images:]
+
+    def _transform_crops(self, data: TensorDict, lazy_images):
+        """ Applies the joint transform on the crops if it was not applied on the frames, then the train and test
+        transforms"""
+        if lazy_images:
+            self._joint_transform(data)
+        for s in ['train', 'test']:
+            data[s + '_images'] = [
+                self.transform[s](x) for x in data[s + '_images']
+            ]
+
 
 class SiamFCProcessing(BaseProcessing):
     def __init__(self,
@@ -69,14 +88,11 @@ class SiamFCProcessing(BaseProcessing):
             (jittered_center - 0.5 * jittered_size, jittered_size), axis=0)
 
     def __call__(self, data: TensorDict, rng=None):
-        # Apply joint transforms
-        if self.transform['joint'] is not None:
-            num_train_images = len(data['train_images'])
-            all_images = data['train_images'] + data['test_images']
-            all_images_trans = self.transform['joint'](*all_images)
-
-            data['train_images'] = all_images_trans[:num_train_images]
-            data['test_images'] = all_images_trans[num_train_images:]
+        # Apply joint transforms. Frames of roi_image_loader are only decoded when cropped, and transformed after it
+        lazy_images = prutils.has_lazy_images(data['train_images'] +
+                                              data['test_images'])
+        if not lazy_images:
+            self._joint_transform(data)
 
         for s in ['train', 'test']:
             assert self.mode == 'sequence' or len(data[s + '_images']) == 1, \
@@ -101,10 +117,12 @@ class SiamFCProcessing(BaseProcessing):
                 print('{}, anno: {}'.format(data['dataset'], data[s + '_anno']))
                 raise e
 
-            # Apply transforms
-            data[s + '_images'] = [self.transform[s](x) for x in crops]
+            data[s + '_images'] = list(crops)
             data[s + '_anno'] = boxes
 
+        # Apply transforms
+        self._transform_crops(data, lazy_images)
+
         # Prepare output
         if self.mode == 'sequence':
             data = data.apply(prutils.stack_tensors)
@@ -180,14 +198,11 @@ class SiamProcessing(BaseProcessing):
     def __call__(self, data: TensorDict, rng=None):
         neg = data['neg']
 
-        # Apply joint transforms
-        if self.transform['joint'] is not None:
-            num_train_images = len(data['train_images'])
-            all_images = data['train_images'] + data['test_images']
-            all_images_trans = self.transform['joint'](*all_images)
-
-            data['train_images'] = all_images_trans[:num_train_images]
-            data['test_images'] = all_images_trans[num_train_images:]
+        # Apply joint transforms. Frames of roi_image_loader are only decoded when cropped, and transformed after it
+        lazy_images = prutils.has_lazy_images(data['train_images'] +
+                                              data['test_images'])
+        if not lazy_images:
+            self._joint_transform(data)
 
         for s in ['train', 'test']:
             assert self.mode == 'sequence' or len(data[s + '_images']) == 1, \
@@ -218,11 +233,13 @@ class SiamProcessing(BaseProcessing):
                 print('{}, anno: {}'.format(data['dataset'], data[s + '_anno']))
                 raise e
 
-            # Apply transforms
-            data[s + '_images'] = [self.transform[s](x) for x in crops]
+            data[s + '_images'] = list(crops)
             data[s + '_anno'] = boxes
             data[s + '_masks'] = [self.transform[s + '_mask'](x) for x in mask_crops]
 
+        # Apply transforms
+        self._transform_crops(data, lazy_images)
+
         # Prepare output
         if self.mode == 'sequence':
             data = data.apply(prutils.stack_tensors)
@@ -359,14 +376,11 @@ class ATOMProcessing(BaseProcessing):
                 'test_proposals'-
                 'proposal_iou'  -
         """
-        # Apply joint transforms
-        if self.transform['joint'] is not None:
-            num_train_images = len(data['train_images'])
-            all_images = data['train_images'] + data['test_images']
-            all_images_trans = self.transform['joint'](*all_images)
-
-            data['train_images'] = all_images_trans[:num_train_images]
-            data['test_images'] = all_images_trans[num_train_images:]
+        # Apply joint transforms. Frames of roi_image_loader are only decoded when cropped, and transformed after it
+        lazy_images = prutils.has_lazy_images(data['train_images'] +
+                                              data['test_images'])
+        if not lazy_images:
+            self._joint_transform(data)
 
         for s in ['train', 'test']:
             assert self.mode == 'sequence' or len(data[s + '_images']) == 1, \
@@ -385,10 +399,12 @@ class ATOMProcessing(BaseProcessing):
             except Exception as e:
                 print('{}, anno: {}'.format(data['dataset'], data[s + '_anno']))
                 raise e
-            # Apply transforms
-            data[s + '_images'] = [self.transform[s](x) for x in crops]
+            data[s + '_images'] = list(crops)
             data[s + '_anno'] = boxes
 
+        # Apply transforms
+        self._transform_crops(data, lazy_images)
+
         # Generate proposals
         frame2_proposals, gt_iou = zip(
             * [self._generate_proposals(a, rng) for a in data['test_anno']])
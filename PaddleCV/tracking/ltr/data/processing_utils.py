@@ -2,6 +2,8 @@ import math
 import numpy as np
 import cv2 as cv
 
+from ltr.data.image_loader import LazyImage
+
 
 def stack_tensors(x):
     if isinstance(x, list) and isinstance(x[0], np.ndarray):
@@ -9,6 +11,10 @@ def stack_tensors(x):
     return x
 
 
+def has_lazy_images(frames):
+    return any(isinstance(f, LazyImage) for f in frames)
+
+
 def sample_target(im,
                   target_bb,
                   search_area_factor,
@@ -18,7 +24,7 @@ def sample_target(im,
     """ Extracts a square crop centered at target_bb box, of area search_area_factor^2 times target_bb area
 
     args:
-        im - cv image
+        im - cv image, or a LazyImage which is decoded at the lowest scale that keeps the crop at output_sz
         target_bb - target box [x, y, w, h]
         search_area_factor - Ratio of crop size to target size
         output_sz - (float) Size to which the extracted crop is resized (always square). If None, no resizing is done.
@@ -48,11 +54,18 @@ def sample_target(im,
     if crop_sz < 1:
         raise Exception('Too small bounding box. w: {}, h: {}'.format(w, h))
 
-    x1 = round(x + 0.5 * w - crop_sz * 0.5)
-    x2 = x1 + crop_sz
+    # Crop window in the pixels of the decoded image
+    reduce = 1
+    if isinstance(im, LazyImage):
+        reduce = im.reduction(crop_sz, output_sz)
+        im = im.decode(reduce)
+    decoded_crop_sz = math.ceil(crop_sz / reduce)
+
+    x1 = round((x + 0.5 * w - crop_sz * 0.5) / reduce)
+    x2 = x1 + decoded_crop_sz
 
-    y1 = round(y + 0.5 * h - crop_sz * 0.5)
-    y2 = y1 + crop_sz
+    y1 = round((y + 0.5 * h - crop_sz * 0.5) / reduce)
+    y2 = y1 + decoded_crop_sz
 
     x1_pad = max(0, -x1)
     x2_pad = max(x2 - im.shape[1] + 1, 0)
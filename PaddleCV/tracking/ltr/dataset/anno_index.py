@@ -0,0 +1,108 @@
+import os
+import numpy as np
+
+# directory of the index inside the dataset root, used if no other path is given
+ANNO_INDEX_DIR = 'anno_index'
+
+
+class AnnoIndex(object):
+    """ Read only annotation index of a video dataset, built once by build_anno_index.py.
+
+    The index is a directory holding
+        boxes.npy   - (num_frames, 4) float32, the groundtruth boxes of all sequences, one after the other
+        visible.npy - (num_frames,) int8, the target visibility of all sequences, before any filter
+        index.npz   - names of the sequences, and offsets (num_sequences + 1) of each sequence in the arrays above
+
+    boxes.npy and visible.npy are read with mmap, so the pages are shared by the data loader processes and only
+    the sampled sequences are touched.
+    """
+
+    def __init__(self, path):
+        """
+        args:
+            path - directory of the index
+        """
+        self.path = path
+        self.boxes = np.load(os.path.join(path, 'boxes.npy'), mmap_mode='r')
+        self.visible = np.load(
+            os.path.join(path, 'visible.npy'), mmap_mode='r')
+        index = np.load(os.path.join(path, 'index.npz'))
+        self.offsets = index['offsets']
+        self.seq_ids = {
+            str(name): i
+            for i, name in enumerate(index['names'].tolist())
+        }
+
+    def __len__(self):
+        return len(self.seq_ids)
+
+    def __contains__(self, name):
+        return name in self.seq_ids
+
+    def get(self, name):
+        """ Annotation and target visibility of a sequence
+
+        args:
+            name - name of the sequence, as used by the dataset to build its sequence path
+        returns:
+            np.array - (num_frames, 4) boxes of the sequence
+            np.array - (num_frames,) int8, whether the target is visible
+        """
+        i = self.seq_ids[name]
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return np.array(self.boxes[start:end]), np.array(
+            self.visible[start:end])
+
+
+def load_anno_index(root, path=None):
+    """ Loads the annotation index of the dataset at root.
+
+    args:
+        root - root of the dataset
+        path - directory of the index. If None, root/anno_index is used if it exists. If False, no index is used.
+    returns:
+        AnnoIndex - the index, None if there is none
+    """
+    if path is False:
+        return None
+    if path is None:
+        path = os.path.join(root, ANNO_INDEX_DIR)
+        if not os.path.isfile(os.path.join(path, 'index.npz')):
+            return None
+    return AnnoIndex(path)
+
+
+def build_anno_index(dataset, path):
+    """ Writes the annotation index of all the sequences of a dataset, parsed from the text files.
+
+    args:
+        dataset - Lasot or Got10k dataset
+        path - directory to write the index to
+    """
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    index_file = os.path.join(path, 'index.npz')
+    if os.path.isfile(index_file):
+        os.remove(index_file)
+
+    annos = []
+    visibles = []
+    for seq_id in range(dataset.get_num_sequences()):
+        anno, target_visible = dataset._parse_sequence_info(seq_id)
+        annos.append(np.asarray(anno, dtype=np.float32).reshape(-1, 4))
+        visibles.append(np.asarray(target_visible, dtype=np.int8))
+        if len(annos[-1]) != len(visibles[-1]):
+            raise ValueError('{} has {} boxes and {} visibility flags'.format(
+                dataset.sequence_list[seq_id],
+                len(annos[-1]), len(visibles[-1])))
+
+    offsets = np.zeros(len(annos) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(a) for a in annos])
+
+    boxes = np.concatenate(annos) if annos else np.zeros((0, 4), np.float32)
+    visible = np.concatenate(visibles) if visibles else np.zeros(0, np.int8)
+    np.save(os.path.join(path, 'boxes.npy'), boxes)
+    np.save(os.path.join(path, 'visible.npy'), visible)
+    # index.npz is written last, an index is only picked up once it exists
+    np.savez(
+        index_file, names=np.array(dataset.sequence_list), offsets=offsets)
@@ -0,0 +1,133 @@
+import os
+from collections import OrderedDict
+
+import numpy as np
+
+# directory of the store inside the dataset root, used if no other path is given
+FRAME_STORE_DIR = 'frame_store'
+
+# sequences kept open by a store, every open sequence holds a file descriptor
+MAX_OPEN_SEQUENCES = 64
+
+
+class FrameStore(object):
+    """ Read only store of the encoded frames of a video dataset, packed once by pack_frames.py.
+
+    Every sequence is packed into two files of the store directory
+        <sequence name>.npy         - uint8, the encoded (JPEG) frames of the sequence, one after the other
+        <sequence name>.offsets.npy - int64 (num_frames + 1), offsets of each frame in <sequence name>.npy
+
+    The frames are read with mmap, which replaces a file open and read per frame of the image directories, and the
+    pages are shared by the data loader processes. The frames are decoded by the image loader of the dataset.
+    Only the max_open most recently read sequences are kept mapped, since every map holds a file descriptor.
+    """
+
+    def __init__(self, path, max_open=MAX_OPEN_SEQUENCES):
+        """
+        args:
+            path - directory of the store
+            max_open - number of sequences kept mapped, the least recently read one is closed to open another
+        """
+        self.path = path
+        self.max_open = max_open
+        self._sequences = OrderedDict()
+        self._packed = {}
+
+    def _open(self, name):
+        if name in self._sequences:
+            self._sequences.move_to_end(name)
+            return self._sequences[name]
+        if len(self._sequences) >= self.max_open:
+            # get() only hands out copies, dropping the map unmaps it and closes its descriptor
+            self._sequences.popitem(last=False)
+        self._sequences[name] = (np.load(
+            os.path.join(self.path, name + '.npy'), mmap_mode='r'), np.load(
+                os.path.join(self.path, name + '.offsets.npy')))
+        return self._sequences[name]
+
+    def __contains__(self, name):
+        if name not in self._packed:
+            self._packed[name] = os.path.isfile(
+                os.path.join(self.path, name + '.offsets.npy'))
+        return self._packed[name]
+
+    def get(self, name, frame_id):
+        """ Encoded frame of a sequence
+
+        args:
+            name - name of the sequence, as used by the dataset to build its sequence path
+            frame_id - index of the frame in the sequence
+        returns:
+            np.array - uint8 array holding the encoded frame, which the image loaders accept as path
+        """
+        frames, offsets = self._open(name)
+        return np.array(frames[offsets[frame_id]:offsets[frame_id + 1]])
+
+
+def load_frame_store(root, path=None):
+    """ Loads the frame store of the dataset at root.
+
+    args:
+        root - root of the dataset
+        path - directory of the store. If None, root/frame_store is used if it exists. If False, no store is used.
+    returns:
+        FrameStore - the store, None if there is none
+    """
+    if path is False:
+        return None
+    if path is None:
+        path = os.path.join(root, FRAME_STORE_DIR)
+        if not os.path.isdir(path):
+            return None
+    return FrameStore(path)
+
+
+def pack_sequence(frame_paths, path, name):
+    """ Packs the frames of a sequence into the store at path. The offsets file is written last, a sequence is only
+    read from the store once it exists.
+
+    args:
+        frame_paths - paths of the encoded frames of the sequence, in order
+        path - directory of the store
+        name - name of the sequence
+    """
+    offsets = np.zeros(len(frame_paths) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([os.path.getsize(p) for p in frame_paths])
+
+    frames = np.lib.format.open_memmap(
+        os.path.join(path, name + '.npy'),
+        mode='w+',
+        dtype=np.uint8,
+        shape=(int(offsets[-1]), ))
+    for i, frame_path in enumerate(frame_paths):
+        frames[offsets[i]:offsets[i + 1]] = np.fromfile(
+            frame_path, dtype=np.uint8)
+    frames.flush()
+    del frames
+    np.save(os.path.join(path, name + '.offsets.npy'), offsets)
+
+
+def build_frame_store(dataset, path, overwrite=False):
+    """ Packs the frames of all the sequences of a dataset. Sequences already in the store are skipped, so an
+    interrupted build can be resumed.
+
+    args:
+        dataset - Lasot or Got10k dataset
+        path - directory of the store
+        overwrite - pack the sequences already in the store again
+    """
+    if not os.path.isdir(path):
+        os.makedirs(path)
+
+    for seq_id in range(dataset.get_num_sequences()):
+        name = dataset.sequence_list[seq_id]
+        offsets_file = os.path.join(path, name + '.offsets.npy')
+        if os.path.isfile(offsets_file):
+            if not overwrite:
+                continue
+            os.remove(offsets_file)
+        num_frames = len(dataset.get_sequence_info(seq_id)[0])
+        seq_path = dataset._get_sequence_path(seq_id)
+        pack_sequence(
+            [dataset._get_frame_path(seq_path, f) for f in range(num_frames)],
+            path, name)
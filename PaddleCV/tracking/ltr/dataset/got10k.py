@@ -5,6 +5,8 @@ import csv
 import pandas
 from collections import OrderedDict
 from .base_dataset import BaseDataset
+from .anno_index import load_anno_index
+from .frame_store import load_frame_store
 from ltr.data.image_loader import default_image_loader
 from ltr.admin.environment import env_settings
 
@@ -26,7 +28,9 @@ class Got10k(BaseDataset):
                  filter=None,
                  image_loader=default_image_loader,
                  split=None,
-                 seq_ids=None):
+                 seq_ids=None,
+                 anno_index=None,
+                 frame_store=None):
         """
         args:
             root - path to the got-10k training data. Note: This should point to the 'train' folder inside GOT-10k
@@ -37,6 +41,11 @@ class Got10k(BaseDataset):
                     the root folder instead.
             seq_ids - List containing the ids of the videos to be used for training. Note: Only one of 'split' or 'seq_ids'
                         options can be used at the same time.
+            anno_index - Directory of the annotation index built with build_anno_index.py. If None, root/anno_index
+                        is used if it exists. If False or there is no index, the annotations are
+                        parsed from the text files of each sequence.
+            frame_store - Directory of the frames packed with pack_frames.py. If None, root/frame_store is used if it
+                        exists. If False or a sequence is not in the store, the frames are read from the image files.
         """
         root = env_settings().got10k_dir if root is None else root
         super().__init__(root, image_loader)
@@ -82,6 +91,8 @@ class Got10k(BaseDataset):
 
         self.sequence_meta_info = self._load_meta_info()
         self.filter = filter
+        self.anno_index = load_anno_index(self.root, anno_index)
+        self.frame_store = load_frame_store(self.root, frame_store)
 
     def get_name(self):
         return 'got10k'
@@ -150,10 +161,22 @@ class Got10k(BaseDataset):
     def _get_sequence_path(self, seq_id):
         return os.path.join(self.root, self.sequence_list[seq_id])
 
-    def get_sequence_info(self, seq_id):
+    def _parse_sequence_info(self, seq_id):
         seq_path = self._get_sequence_path(seq_id)
         anno = self._read_anno(seq_path)
         target_visible = self._read_target_visible(seq_path, anno)
+        return anno, target_visible
+
+    def _indexed(self, seq_id):
+        return self.anno_index is not None and \
+            self.sequence_list[seq_id] in self.anno_index
+
+    def get_sequence_info(self, seq_id):
+        if self._indexed(seq_id):
+            anno, target_visible = self.anno_index.get(
+                self.sequence_list[seq_id])
+        else:
+            anno, target_visible = self._parse_sequence_info(seq_id)
         if self.filter:
             target_large = (anno[:, 2] * anno[:, 3] > 30 * 30)
             ratio = anno[:, 2] / anno[:, 3]
@@ -166,6 +189,9 @@ class Got10k(BaseDataset):
             seq_path, '{:08}.jpg'.format(frame_id + 1))  # frames start from 1
 
     def _get_frame(self, seq_path, frame_id):
+        seq_name = os.path.basename(seq_path)
+        if self.frame_store is not None and seq_name in self.frame_store:
+            return self.image_loader(self.frame_store.get(seq_name, frame_id))
         return self.image_loader(self._get_frame_path(seq_path, frame_id))
 
     def get_frames(self, seq_id, frame_ids, anno=None):
@@ -175,7 +201,10 @@ class Got10k(BaseDataset):
         frame_list = [self._get_frame(seq_path, f_id) for f_id in frame_ids]
 
         if anno is None:
-            anno = self._read_anno(seq_path)
+            if self._indexed(seq_id):
+                anno, _ = self.anno_index.get(self.sequence_list[seq_id])
+            else:
+                anno = self._read_anno(seq_path)
 
         # Return as list of tensors
         anno_frames = [anno[f_id, :] for f_id in frame_ids]
@@ -5,6 +5,8 @@ import pandas
 import csv
 from collections import OrderedDict
 from .base_dataset import BaseDataset
+from .anno_index import ANNO_INDEX_DIR, load_anno_index
+from .frame_store import FRAME_STORE_DIR, load_frame_store
 from ltr.data.image_loader import default_image_loader
 from ltr.admin.environment import env_settings
 
@@ -26,7 +28,9 @@ class Lasot(BaseDataset):
                  filter=None,
                  image_loader=default_image_loader,
                  vid_ids=None,
-                 split=None):
+                 split=None,
+                 anno_index=None,
+                 frame_store=None):
         """
         args:
             root - path to the lasot dataset.
@@ -36,12 +40,19 @@ class Lasot(BaseDataset):
                     videos with subscripts -1, -3, and -5 from each class will be used for training.
             split - If split='train', the official train split (protocol-II) is used for training. Note: Only one of
                     vid_ids or split option can be used at a time.
+            anno_index - Directory of the annotation index built with build_anno_index.py. If None, root/anno_index
+                    is used if it exists. If False or there is no index, the annotations are
+                    parsed from the text files of each sequence.
+            frame_store - Directory of the frames packed with pack_frames.py. If None, root/frame_store is used if it
+                    exists. If False or a sequence is not in the store, the frames are read from the image files.
         """
         root = env_settings().lasot_dir if root is None else root
         super().__init__(root, image_loader)
 
         self.sequence_list = self._build_sequence_list(vid_ids, split)
         self.filter = filter
+        self.anno_index = load_anno_index(self.root, anno_index)
+        self.frame_store = load_frame_store(self.root, frame_store)
 
     def _build_sequence_list(self, vid_ids=None, split=None):
         if split is not None:
@@ -57,6 +68,10 @@ class Lasot(BaseDataset):
             sequence_list = pandas.read_csv(
                 file_path, header=None, squeeze=True).values.tolist()
         elif vid_ids is not None:
+            self.class_list = sorted(
+                f for f in os.listdir(self.root)
+                if f not in (ANNO_INDEX_DIR, FRAME_STORE_DIR) and
+                os.path.isdir(os.path.join(self.root, f)))
             sequence_list = [
                 c + '-' + str(v) for c in self.class_list for v in vid_ids
             ]
@@ -106,10 +121,22 @@ class Lasot(BaseDataset):
 
         return os.path.join(self.root, class_name, class_name + '-' + vid_id)
 
-    def get_sequence_info(self, seq_id):
+    def _parse_sequence_info(self, seq_id):
         seq_path = self._get_sequence_path(seq_id)
         anno = self._read_anno(seq_path)
         target_visible = self._read_target_visible(seq_path, anno)
+        return anno, target_visible
+
+    def _indexed(self, seq_id):
+        return self.anno_index is not None and \
+            self.sequence_list[seq_id] in self.anno_index
+
+    def get_sequence_info(self, seq_id):
+        if self._indexed(seq_id):
+            anno, target_visible = self.anno_index.get(
+                self.sequence_list[seq_id])
+        else:
+            anno, target_visible = self._parse_sequence_info(seq_id)
         if self.filter is not None:
             target_large = (anno[:, 2] * anno[:, 3] > 30 * 30)
             ratio = anno[:, 2] / anno[:, 3]
@@ -123,6 +150,9 @@ class Lasot(BaseDataset):
             '{:08}.jpg'.format(frame_id + 1))  # frames start from 1
 
     def _get_frame(self, seq_path, frame_id):
+        seq_name = os.path.basename(seq_path)
+        if self.frame_store is not None and seq_name in self.frame_store:
+            return self.image_loader(self.frame_store.get(seq_name, frame_id))
         return self.image_loader(self._get_frame_path(seq_path, frame_id))
 
     def _get_class(self, seq_path):
@@ -136,7 +166,10 @@ class Lasot(BaseDataset):
         frame_list = [self._get_frame(seq_path, f_id) for f_id in frame_ids]
 
         if anno is None:
-            anno = self._read_anno(seq_path)
+            if self._indexed(seq_id):
+                anno, _ = self.anno_index.get(self.sequence_list[seq_id])
+            else:
+                anno = self._read_anno(seq_path)
 
         # Return as list of tensors
         anno_frames = [anno[f_id, :] for f_id in frame_ids]
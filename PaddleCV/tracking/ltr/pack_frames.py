@@ -0,0 +1,55 @@
+import os
+import sys
+import time
+import argparse
+
+env_path = os.path.join(os.path.dirname(__file__), '..')
+if env_path not in sys.path:
+    sys.path.append(env_path)
+
+from ltr.dataset import Lasot, Got10k
+from ltr.dataset.frame_store import FRAME_STORE_DIR, build_frame_store
+from ltr.admin.environment import env_settings
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Pack the frames of LaSOT or GOT-10k into one file per sequence, read by the datasets with mmap.')
+    parser.add_argument(
+        'dataset', type=str, choices=['lasot', 'got10k'], help='Dataset to pack.')
+    parser.add_argument(
+        '--root',
+        type=str,
+        default=None,
+        help='Root of the dataset, default the path in "ltr/admin/local.py".')
+    parser.add_argument(
+        '--output',
+        type=str,
+        default=None,
+        help='Directory of the store, default root/{}. Pass the same directory as frame_store to the dataset '
+        'if it is not the default.'.format(FRAME_STORE_DIR))
+    parser.add_argument(
+        '--overwrite',
+        action='store_true',
+        help='Pack the sequences already in the store again, by default they are skipped.')
+
+    args = parser.parse_args()
+
+    if args.dataset == 'lasot':
+        root = env_settings().lasot_dir if args.root is None else args.root
+        # every LaSOT class has the videos 1 - 20
+        dataset = Lasot(
+            root, vid_ids=list(range(1, 21)), frame_store=False)
+    else:
+        root = env_settings().got10k_dir if args.root is None else args.root
+        dataset = Got10k(root, frame_store=False)
+    output = os.path.join(root, FRAME_STORE_DIR) if args.output is None else args.output
+
+    start = time.time()
+    build_frame_store(dataset, output, overwrite=args.overwrite)
+    print('{} sequences of {} packed to {} in {:.1f} s'.format(
+        dataset.get_num_sequences(), args.dataset, output, time.time() - start))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+#  Copyright (c) 2020 PaddlePaddle Authors. All Rights Reserve.
+#
+#Licensed under the Apache License, Version 2.0 (the "License");
+#you may not use this file except in compliance with the License.
+#You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#Unless required by applicable law or agreed to in writing, software
+#distributed under the License is distributed on an "AS IS" BASIS,
+#WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#See the License for the specific language governing permissions and
+#limitations under the License.
+
+import os
+import sys
+import time
+import random
+import argparse
+try:
+    import cPickle as pickle
+except:
+    import pickle
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../..'))
+from reader.frame_store import FrameStore
+from reader.kinetics_reader import video_loader
+
+# example command line:
+#   python benchmark_frame_store.py --pkl_list val.list --frames_list val_frames.list
+#
+# measures the videos/sec of loading and decoding the sampled frames of the
+# pkl path and the frame store path, as decode_pickle and decode_frames do.
+# Drop the page cache before each run to measure cold reads.
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--pkl_list', type=str, default=None)
+parser.add_argument('--frames_list', type=str, default=None)
+parser.add_argument('--seg_num', type=int, default=8)
+parser.add_argument('--seglen', type=int, default=1)
+parser.add_argument('--mode', type=str, default='train')
+parser.add_argument('--num_videos', type=int, default=200)
+
+
+def load_pkl(path, args):
+    with open(path, 'rb') as f:
+        if sys.version_info < (3, 0):
+            vid, label, frames = pickle.load(f)
+        else:
+            vid, label, frames = pickle.load(f, encoding='bytes')
+    return video_loader(frames, args.seg_num, args.seglen, args.mode)
+
+
+def load_frames(path, args):
+    with FrameStore(path) as store:
+        return video_loader(store, args.seg_num, args.seglen, args.mode)
+
+
+def bench(name, list_file, load, args):
+    with open(list_file) as f:
+        paths = [line.strip() for line in f if line.strip()]
+    paths = paths[:args.num_videos]
+    random.seed(0)
+    start = time.time()
+    for path in paths:
+        load(path, args)
+    cost = time.time() - start
+    size = sum(os.path.getsize(p) for p in paths) / float(len(paths)) / 2**20
+    print("{:<7s} {:8.1f} videos/s  {:.2f} MB per file".format(
+        name, len(paths) / cost, size))
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    if args.pkl_list:
+        bench('pkl', args.pkl_list, load_pkl, args)
+    if args.frames_list:
+        bench('frames', args.frames_list, load_frames, args)
@@ -0,0 +1,125 @@
+#  Copyright (c) 2020 PaddlePaddle Authors. All Rights Reserve.
+#
+#Licensed under the Apache License, Version 2.0 (the "License");
+#you may not use this file except in compliance with the License.
+#You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#Unless required by applicable law or agreed to in writing, software
+#distributed under the License is distributed on an "AS IS" BASIS,
+#WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#See the License for the specific language governing permissions and
+#limitations under the License.
+
+import os
+import sys
+import argparse
+try:
+    import cPickle as pickle
+except:
+    import pickle
+from multiprocessing import Pool
+
+import cv2
+
+# import frame_store alone, the reader package needs paddle
+sys.path.insert(0,
+                os.path.join(
+                    os.path.dirname(os.path.abspath(__file__)),
+                    '../../../reader'))
+from frame_store import write_frame_store
+
+# example command lines:
+#   python convert_frame_store.py train.list ./data_k400/train_frames train_frames.list
+#   python convert_frame_store.py train_mp4.list ./data_k400/train_frames train_frames.list --format mp4
+#
+# the input list is the one used by KineticsReader, one pkl path per line
+# for pkl, or "mp4_path label" per line for mp4. Every video is written to
+# target_dir/<name>.frames and the frame store paths are written to the
+# output list, which is used with MODEL.format "frames".
+
+parser = argparse.ArgumentParser()
+parser.add_argument('src_list', type=str, help='pkl or mp4 list file')
+parser.add_argument('target_dir', type=str, help='output directory')
+parser.add_argument('dst_list', type=str, help='output list file')
+parser.add_argument(
+    '--format', type=str, default='pkl', help='pkl or mp4, default: pkl')
+parser.add_argument(
+    '--quality',
+    type=int,
+    default=95,
+    help='JPEG quality of the frames decoded from mp4, default: 95')
+parser.add_argument(
+    '--num_processes', type=int, default=8, help='default: 8')
+
+
+def load_pkl(line):
+    path = line.split(' ')[0]
+    with open(path, 'rb') as f:
+        if sys.version_info < (3, 0):
+            vid, label, frames = pickle.load(f)
+        else:
+            vid, label, frames = pickle.load(f, encoding='bytes')
+    if isinstance(vid, bytes):
+        vid = vid.decode('utf-8')
+    return path, vid, label, frames
+
+
+def load_mp4(line, quality):
+    path, label = line.split(' ')[:2]
+    cap = cv2.VideoCapture(path)
+    frames = []
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(
+            cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])[1]
+            .tobytes())
+    cap.release()
+    vid = os.path.splitext(os.path.basename(path))[0]
+    return path, vid, int(label), frames
+
+
+def convert(line, args):
+    try:
+        if args.format == 'pkl':
+            path, vid, label, frames = load_pkl(line)
+        else:
+            path, vid, label, frames = load_mp4(line, args.quality)
+    except Exception as e:
+        print("Error when loading {}: {}".format(line, e))
+        return None
+    if len(frames) < 1:
+        print("No frame in {}".format(path))
+        return None
+    name = os.path.splitext(os.path.basename(path))[0]
+    dst = os.path.join(args.target_dir, name + '.frames')
+    write_frame_store(dst, vid, label, frames)
+    return os.path.abspath(dst)
+
+
+def convert_line(line):
+    return convert(line, args)
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    assert args.format in ['pkl', 'mp4'], "format should be pkl or mp4"
+    if not os.path.isdir(args.target_dir):
+        os.makedirs(args.target_dir)
+    with open(args.src_list) as f:
+        lines = [line.strip() for line in f if line.strip()]
+
+    pool = Pool(processes=args.num_processes)
+    results = pool.map(convert_line, lines)
+    pool.close()
+    pool.join()
+
+    with open(args.dst_list, 'w') as f:
+        for dst in results:
+            if dst is not None:
+                f.write(dst + '\n')
+    print("converted {} of {} videos".format(
+        sum(r is not None for r in results), len(lines)))
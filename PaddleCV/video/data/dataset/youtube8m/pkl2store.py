@@ -0,0 +1,85 @@
+#  Copyright (c) 2020 PaddlePaddle Authors. All Rights Reserve.
+#
+#Licensed under the Apache License, Version 2.0 (the "License");
+#you may not use this file except in compliance with the License.
+#You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#Unless required by applicable law or agreed to in writing, software
+#distributed under the License is distributed on an "AS IS" BASIS,
+#WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#See the License for the specific language governing permissions and
+#limitations under the License.
+
+import os
+import sys
+import argparse
+try:
+    import cPickle as pickle
+except:
+    import pickle
+from multiprocessing import Pool
+
+# import feature_store alone, the reader package needs paddle
+sys.path.insert(0,
+                os.path.join(
+                    os.path.dirname(os.path.abspath(__file__)),
+                    '../../../reader'))
+from feature_store import FeatureStoreWriter
+
+# example command line:
+#   python pkl2store.py train.list ./store/train train_store.list
+#
+# the input list is the one used by FeatureReader, one pkl path per line.
+# All the records of the pkl files are written to the feature store
+# target_dir, and target_dir is written to the output list, which is used
+# with MODEL.format "store".
+
+parser = argparse.ArgumentParser()
+parser.add_argument('src_list', type=str, help='pkl list file')
+parser.add_argument('target_dir', type=str, help='output feature store')
+parser.add_argument('dst_list', type=str, help='output list file')
+parser.add_argument(
+    '--num_processes',
+    type=int,
+    default=4,
+    help='processes unpickling the pkl files, default: 4')
+
+
+def load_pkl(path):
+    with open(path, 'rb') as f:
+        if sys.version_info < (3, 0):
+            data = pickle.load(f)
+        else:
+            data = pickle.load(f, encoding='bytes')
+    records = []
+    for record in data:
+        # keys are bytes for pkl files written by python2
+        record = dict((k.decode('utf-8') if isinstance(k, bytes) else k, v)
+                      for k, v in record.items())
+        nframes = int(record['nframes'])
+        records.append((record['video'], record['feature'][:nframes],
+                        record['audio'][:nframes], record.get('label', [])))
+    return path, records
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    with open(args.src_list) as f:
+        lines = [line.strip() for line in f if line.strip()]
+
+    pool = Pool(processes=args.num_processes)
+    with FeatureStoreWriter(args.target_dir) as writer:
+        # imap keeps the order of the list
+        for path, records in pool.imap(load_pkl, lines):
+            for video, rgb, audio, labels in records:
+                writer.add(video, rgb, audio, labels)
+            print("{}: {} videos".format(path, len(records)))
+        num_videos = len(writer)
+    pool.close()
+    pool.join()
+
+    with open(args.dst_list, 'w') as f:
+        f.write(os.path.abspath(args.target_dir) + '\n')
+    print("converted {} videos of {} pkl files".format(num_videos, len(lines)))
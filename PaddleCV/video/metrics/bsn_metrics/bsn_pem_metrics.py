@@ -15,8 +15,7 @@ import numpy as np
 import datetime
 import logging
 import json
-import pandas as pd
-from models.bsn.bsn_utils import soft_nms, bsn_post_processing
+from models.bsn.bsn_utils import bsn_post_processing
 import time
 logger = logging.getLogger(__name__)
 import os
@@ -32,8 +31,10 @@ class MetricsCalculator():
         self.file_list = cfg["INFER"]["filelist"]
         self.get_dataset_dict()
         if self.mode == "test" or self.mode == "infer":
-            self.output_path_pem = cfg[self.mode.upper()]["output_path_pem"]
             self.result_path_pem = cfg[self.mode.upper()]["result_path_pem"]
+            # post processing pool size, all cpus if not set
+            self.num_post_workers = cfg[self.mode.upper()].get(
+                "num_post_workers", None)
         self.reset()
 
     def get_dataset_dict(self):
@@ -56,24 +57,18 @@ class MetricsCalculator():
         logger.info('Resetting {} metrics...'.format(self.mode))
         self.aggr_loss = 0.0
         self.aggr_batch_size = 0
-        if self.mode == 'test' or self.mode == 'infer':
-            if not os.path.exists(self.output_path_pem):
-                os.makedirs(self.output_path_pem)
+        # proposals of every video, kept in memory until post processing
+        self.props_dict = {}
 
     def save_results(self, pred_iou, props_info, fid):
         if self.mode == 'infer':
             video_name = self.video_list[fid[0]]
         else:
             video_name = self.video_list[fid[0][0]]
-        df = pd.DataFrame()
-        df["xmin"] = props_info[0, :, 0]
-        df["xmax"] = props_info[0, :, 1]
-        df["xmin_score"] = props_info[0, :, 2]
-        df["xmax_score"] = props_info[0, :, 3]
-        df["iou_score"] = pred_iou.squeeze()
-        df.to_csv(
-            os.path.join(self.output_path_pem, video_name + ".csv"),
-            index=False)
+        props = props_info[0].astype('float64')
+        score = props[:, 2] * props[:, 3] * pred_iou.squeeze().astype('float64')
+        self.props_dict[video_name] = np.stack(
+            [props[:, 0], props[:, 1], score], axis=1)
 
     def accumulate(self, fetch_list):
         cur_batch_size = 1  # iteration counter
@@ -97,12 +92,20 @@ class MetricsCalculator():
     def finalize_metrics(self):
         self.avg_loss = self.aggr_loss / self.aggr_batch_size
         if self.mode == 'test':
-            bsn_post_processing(self.video_dict, self.subset,
-                                self.output_path_pem, self.result_path_pem)
+            bsn_post_processing(
+                self.video_dict,
+                self.subset,
+                self.props_dict,
+                self.result_path_pem,
+                num_workers=self.num_post_workers)
 
     def finalize_infer_metrics(self):
-        bsn_post_processing(self.video_dict, self.subset, self.output_path_pem,
-                            self.result_path_pem)
+        bsn_post_processing(
+            self.video_dict,
+            self.subset,
+            self.props_dict,
+            self.result_path_pem,
+            num_workers=self.num_post_workers)
 
     def get_computed_metrics(self):
         json_stats = {}
@@ -15,8 +15,11 @@
 import datetime
 import numpy
 
-from . import mean_average_precision_calculator as map_calculator
-from . import average_precision_calculator as ap_calculator
+# predictions kept per class, the average precisions are computed at this n
+TOP_N = 10000
+# predictions of the batches collected before they are merged into the kept
+# ones, at least, larger states are merged when the pending ones reach them
+MIN_PENDING = 1 << 20
 
 
 def flatten(l):
@@ -53,20 +56,23 @@ def calculate_precision_at_equal_recall_rate(predictions, actuals):
   Returns:
     float: The average precision at equal recall rate across the entire batch.
   """
-    aggregated_precision = 0.0
-    num_videos = actuals.shape[0]
-    for row in numpy.arange(num_videos):
-        num_labels = int(numpy.sum(actuals[row]))
-        top_indices = numpy.argpartition(predictions[row],
-                                         -num_labels)[-num_labels:]
-        item_precision = 0.0
-        for label_index in top_indices:
-            if predictions[row][label_index] > 0:
-                item_precision += actuals[row][label_index]
-        item_precision /= top_indices.size
-        aggregated_precision += item_precision
-    aggregated_precision /= num_videos
-    return aggregated_precision
+    num_labels = numpy.sum(actuals, axis=1).astype('int64')
+    max_labels = int(numpy.max(num_labels))
+    if max_labels == 0:
+        return 0.0
+    # sort the top max_labels predictions of every video, then keep the
+    # first num_labels of each row
+    top_indices = numpy.argpartition(
+        -predictions, max_labels - 1, axis=1)[:, :max_labels]
+    top_predictions = numpy.take_along_axis(predictions, top_indices, 1)
+    order = numpy.argsort(-top_predictions, axis=1, kind='mergesort')
+    top_indices = numpy.take_along_axis(top_indices, order, 1)
+    top_predictions = numpy.take_along_axis(top_predictions, order, 1)
+    in_top = numpy.arange(max_labels) < num_labels[:, numpy.newaxis]
+    hits = numpy.take_along_axis(actuals, top_indices, 1) * (
+        in_top & (top_predictions > 0))
+    item_precision = numpy.sum(hits, axis=1) / numpy.maximum(num_labels, 1)
+    return numpy.mean(item_precision)
 
 
 def calculate_gap(predictions, actuals, top_k=20):
@@ -84,12 +90,103 @@ def calculate_gap(predictions, actuals, top_k=20):
   Returns:
     float: The global average precision.
   """
-    gap_calculator = ap_calculator.AveragePrecisionCalculator()
-    sparse_predictions, sparse_labels, num_positives = top_k_by_class(
-        predictions, actuals, top_k)
-    gap_calculator.accumulate(
-        flatten(sparse_predictions), flatten(sparse_labels), sum(num_positives))
-    return gap_calculator.peek_ap_at_n()
+    _, top_predictions, top_labels = top_k_by_video(predictions, actuals,
+                                                    top_k)
+    num_positives = numpy.sum(actuals, dtype='float64')
+    return average_precision_by_class(
+        numpy.zeros(top_predictions.size, dtype='int32'),
+        top_predictions.ravel(), top_labels.ravel(), [num_positives])[0]
+
+
+def top_k_by_video(predictions, labels, k=20):
+    """Extracts the top k predictions of every video.
+
+  Args:
+    predictions: A numpy matrix containing the outputs of the model.
+      Dimensions are 'batch' x 'num_classes'.
+    labels: A numpy matrix containing the ground truth labels.
+      Dimensions are 'batch' x 'num_classes'.
+    k: the top k entries to preserve in each prediction.
+
+  Returns:
+    A tuple (classes, predictions, labels) of 'batch' x k matrices, holding
+    the class index, the prediction and whether the class is a ground truth
+    label (bool) for the top k predictions of each video, in no particular
+    order.
+
+  Raises:
+    ValueError: An error occurred when the k is not a positive integer.
+  """
+    if k <= 0:
+        raise ValueError("k must be a positive integer.")
+    k = min(k, predictions.shape[1])
+    classes = numpy.argpartition(predictions, -k, axis=1)[:, -k:]
+    return (classes.astype('int32'),
+            numpy.take_along_axis(predictions, classes, 1),
+            numpy.take_along_axis(labels, classes, 1) > 0)
+
+
+def average_precision_by_class(classes, predictions, actuals, num_positives):
+    """Calculates the non-interpolated average precision of every class.
+
+  This gives the same result as feeding the predictions of each class to an
+  AveragePrecisionCalculator and calling peek_ap_at_n, with all classes sorted
+  at once instead of through per item heaps. Equal predictions are ranked in
+  the order they are given.
+
+  Args:
+    classes: A numpy 1-D integer array, the class of each prediction.
+    predictions: A numpy 1-D array storing the prediction scores.
+    actuals: A numpy 1-D array storing the ground truth labels. Any value
+      larger than 0 will be treated as positives, otherwise as negatives.
+    num_positives: A list or 1-D array with the total number of positives of
+      each class, including the ones missing from predictions.
+
+  Returns:
+    A 1-D float64 array of the average precision of each class (0 for classes
+    without predictions or positives).
+  """
+    num_positives = numpy.asarray(num_positives, dtype='float64')
+    order = numpy.lexsort((-predictions, classes))
+    classes = classes[order]
+    hits = actuals[order] > 0
+    # rank and running positive count of every prediction within its class
+    starts = numpy.searchsorted(classes, classes)
+    ranks = numpy.arange(1, len(classes) + 1) - starts
+    poscount = numpy.cumsum(hits)
+    poscount -= poscount[starts] - hits[starts]
+    delta_recall = numpy.zeros_like(num_positives)
+    numpos = num_positives > 0
+    delta_recall[numpos] = 1.0 / num_positives[numpos]
+    hit_classes = classes[hits]
+    return numpy.bincount(
+        hit_classes,
+        weights=poscount[hits] / ranks[hits] * delta_recall[hit_classes],
+        minlength=len(num_positives))
+
+
+def top_n_by_class(classes, predictions, labels, top_n=None):
+    """Keeps the top_n predictions of every class.
+
+  Args:
+    classes: A numpy 1-D integer array, the class of each prediction.
+    predictions: A numpy 1-D array storing the prediction scores.
+    labels: A numpy 1-D array storing the ground truth labels.
+    top_n: How many predictions to keep per class, None to keep all of them.
+
+  Returns:
+    A tuple (classes, predictions, labels) of the kept predictions, sorted by
+    class and by decreasing prediction within a class. Equal predictions keep
+    the order they are given in.
+  """
+    order = numpy.lexsort((-predictions, classes))
+    classes = classes[order]
+    if top_n is not None:
+        starts = numpy.searchsorted(classes, classes)
+        keep = numpy.arange(len(classes)) - starts < top_n
+        order = order[keep]
+        classes = classes[keep]
+    return classes, predictions[order], labels[order]
 
 
 def top_k_by_class(predictions, labels, k=20):
@@ -140,27 +237,35 @@ def top_k_triplets(predictions, labels, k=20):
 
 
 class EvaluationMetrics(object):
-    """A class to store the evaluation metrics."""
+    """A class to store the evaluation metrics.
 
-    def __init__(self, num_class, top_k):
+  The top_k predictions of every video are collected in numpy arrays and
+  merged every few batches into the top_n predictions of every class, and the
+  top num_class * top_n predictions of all classes for the global average
+  precision, so the kept state does not grow with the number of videos. The
+  average precisions are those of AveragePrecisionCalculator(top_n).
+  """
+
+    def __init__(self, num_class, top_k, top_n=TOP_N):
         """Construct an EvaluationMetrics object to store the evaluation metrics.
 
     Args:
       num_class: A positive integer specifying the number of classes.
       top_k: A positive integer specifying how many predictions are considered per video.
+      top_n: A positive integer specifying how many predictions are kept per
+        class, or None to keep all of them.
 
     Raises:
-      ValueError: An error occurred when MeanAveragePrecisionCalculator cannot
-        not be constructed.
+      ValueError: An error occurred when num_class is not a positive integer.
     """
-        self.sum_hit_at_one = 0.0
-        self.sum_perr = 0.0
-        self.sum_loss = 0.0
-        self.map_calculator = map_calculator.MeanAveragePrecisionCalculator(
-            num_class)
-        self.global_ap_calculator = ap_calculator.AveragePrecisionCalculator()
+        if not isinstance(num_class, int) or num_class <= 1:
+            raise ValueError("num_class must be a positive integer.")
+        if not ((isinstance(top_n, int) and top_n > 0) or top_n is None):
+            raise ValueError("top_n must be a positive integer or None.")
+        self.num_class = num_class
         self.top_k = top_k
-        self.num_examples = 0
+        self.top_n = top_n
+        self.clear()
 
     #def accumulate(self, predictions, labels, loss):
     def accumulate(self, loss, predictions, labels):
@@ -180,6 +285,9 @@ class EvaluationMetrics(object):
       ValueError: An error occurred when the shape of predictions and actuals
         does not match.
     """
+        if predictions.shape != labels.shape:
+            raise ValueError(
+                "the shape of predictions and actuals does not match.")
         batch_size = labels.shape[0]
         mean_hit_at_one = calculate_hit_at_one(predictions, labels)
         mean_perr = calculate_precision_at_equal_recall_rate(predictions,
@@ -187,13 +295,14 @@ class EvaluationMetrics(object):
         mean_loss = numpy.mean(loss)
 
         # Take the top 20 predictions.
-        sparse_predictions, sparse_labels, num_positives = top_k_by_class(
+        top_classes, top_predictions, top_labels = top_k_by_video(
             predictions, labels, self.top_k)
-        self.map_calculator.accumulate(sparse_predictions, sparse_labels,
-                                       num_positives)
-        self.global_ap_calculator.accumulate(
-            flatten(sparse_predictions),
-            flatten(sparse_labels), sum(num_positives))
+        self.pending.append((top_classes.ravel(), top_predictions.ravel(),
+                             top_labels.ravel()))
+        self.num_pending += top_classes.size
+        if self.num_pending >= max(len(self.top_classes), MIN_PENDING):
+            self._merge()
+        self.num_positives += numpy.sum(labels, axis=0, dtype='float64')
 
         self.num_examples += batch_size
         self.sum_hit_at_one += mean_hit_at_one * batch_size
@@ -223,10 +332,21 @@ class EvaluationMetrics(object):
         avg_perr = self.sum_perr / self.num_examples
         avg_loss = self.sum_loss / self.num_examples
 
-        aps = self.map_calculator.peek_map_at_n()
-        gap = self.global_ap_calculator.peek_ap_at_n()
+        self._merge()
+        # the recall at n is counted against at most n positives, as in
+        # AveragePrecisionCalculator.ap_at_n
+        num_positives = self.num_positives
+        gap_positives = numpy.sum(self.num_positives)
+        if self.top_n is not None:
+            num_positives = numpy.minimum(num_positives, self.top_n)
+            gap_positives = min(gap_positives, self.num_class * self.top_n)
+        aps = average_precision_by_class(self.top_classes,
+                                         self.top_predictions, self.top_labels,
+                                         num_positives).tolist()
+        gap = average_precision_by_class(
+            numpy.zeros(len(self.gap_predictions), dtype='int32'),
+            self.gap_predictions, self.gap_labels, [gap_positives])[0]
 
-        epoch_info_dict = {}
         return {
             "avg_hit_at_one": avg_hit_at_one,
             "avg_perr": avg_perr,
@@ -240,6 +360,31 @@ class EvaluationMetrics(object):
         self.sum_hit_at_one = 0.0
         self.sum_perr = 0.0
         self.sum_loss = 0.0
-        self.map_calculator.clear()
-        self.global_ap_calculator.clear()
+        self.top_classes = numpy.zeros(0, dtype='int32')
+        self.top_predictions = numpy.zeros(0, dtype='float32')
+        self.top_labels = numpy.zeros(0, dtype='bool')
+        self.gap_predictions = numpy.zeros(0, dtype='float32')
+        self.gap_labels = numpy.zeros(0, dtype='bool')
+        self.pending = []
+        self.num_pending = 0
+        self.num_positives = numpy.zeros(self.num_class, dtype='float64')
         self.num_examples = 0
+
+    def _merge(self):
+        """Merges the pending predictions into the kept ones."""
+        if not self.pending:
+            return
+        classes, predictions, labels = zip(*self.pending)
+        predictions = numpy.concatenate(predictions)
+        labels = numpy.concatenate(labels)
+        self.top_classes, self.top_predictions, self.top_labels = top_n_by_class(
+            numpy.concatenate((self.top_classes, ) + classes),
+            numpy.concatenate((self.top_predictions, predictions)),
+            numpy.concatenate((self.top_labels, labels)), self.top_n)
+        _, self.gap_predictions, self.gap_labels = top_n_by_class(
+            numpy.zeros(len(self.gap_predictions) + len(predictions), dtype='int32'),
+            numpy.concatenate((self.gap_predictions, predictions)),
+            numpy.concatenate((self.gap_labels, labels)),
+            None if self.top_n is None else self.num_class * self.top_n)
+        self.pending = []
+        self.num_pending = 0
@@ -13,11 +13,14 @@
 
 import numpy as np
 from paddle.fluid.initializer import Uniform
-import pandas as pd
 import multiprocessing as mp
+import logging
 import json
+import time
 import os
 
+logger = logging.getLogger(__name__)
+
 
 def iou_with_anchors(anchors_min, anchors_max, box_min, box_max):
     """Compute jaccard score between a box and the anchors.
@@ -55,106 +58,154 @@ def boundary_choose(score_list):
     return mask
 
 
-def soft_nms(df, alpha, t1, t2):
+def soft_nms(props, alpha, t1, t2):
     '''
-    df: proposals generated by network;
+    props: proposals generated by network, array of [xmin, xmax, score] rows;
     alpha: alpha value of Gaussian decaying function;
     t1, t2: threshold for soft nms.
+    Returns the picked proposals as [xmin, xmax, score] rows, in picked order.
     '''
-    df = df.sort_values(by="score", ascending=False)
-    tstart = list(df.xmin.values[:])
-    tend = list(df.xmax.values[:])
-    tscore = list(df.score.values[:])
-
-    rstart = []
-    rend = []
-    rscore = []
-
-    while len(tscore) > 1 and len(rscore) < 101:
-        max_index = tscore.index(max(tscore))
-        tmp_iou_list = iou_with_anchors(
-            np.array(tstart),
-            np.array(tend), tstart[max_index], tend[max_index])
-        for idx in range(0, len(tscore)):
-            if idx != max_index:
-                tmp_iou = tmp_iou_list[idx]
-                tmp_width = tend[max_index] - tstart[max_index]
-                if tmp_iou > t1 + (t2 - t1) * tmp_width:
-                    tscore[idx] = tscore[idx] * np.exp(-np.square(tmp_iou) /
-                                                       alpha)
-
-        rstart.append(tstart[max_index])
-        rend.append(tend[max_index])
-        rscore.append(tscore[max_index])
-        tstart.pop(max_index)
-        tend.pop(max_index)
-        tscore.pop(max_index)
-
-    newDf = pd.DataFrame()
-    newDf['score'] = rscore
-    newDf['xmin'] = rstart
-    newDf['xmax'] = rend
-    return newDf
-
-
-def video_process(video_list,
-                  video_dict,
-                  output_path,
-                  result_dict,
-                  snms_alpha=0.4,
-                  snms_t1=0.55,
-                  snms_t2=0.9):
-
-    for video_name in video_list:
-        df = pd.read_csv(os.path.join(output_path, video_name + ".csv"))
-        if len(df) > 1:
-            df = soft_nms(df, snms_alpha, snms_t1, snms_t2)
-
-        video_duration = video_dict[video_name]["duration_second"]
-        proposal_list = []
-        for idx in range(min(100, len(df))):
-            tmp_prop={"score":df.score.values[idx],\
-                      "segment":[max(0,df.xmin.values[idx])*video_duration,\
-                                 min(1,df.xmax.values[idx])*video_duration]}
-            proposal_list.append(tmp_prop)
-        result_dict[video_name[2:]] = proposal_list
-
-
-def bmn_post_processing(video_dict, subset, output_path, result_path):
-    video_list = video_dict.keys()
-    video_list = list(video_dict.keys())
-    global result_dict
-    result_dict = mp.Manager().dict()
-    pp_num = 12
-
-    num_videos = len(video_list)
-    num_videos_per_thread = int(num_videos / pp_num)
-    processes = []
-    for tid in range(pp_num - 1):
-        tmp_video_list = video_list[tid * num_videos_per_thread:(tid + 1) *
-                                    num_videos_per_thread]
-        p = mp.Process(
-            target=video_process,
-            args=(tmp_video_list, video_dict, output_path, result_dict))
-        p.start()
-        processes.append(p)
-    tmp_video_list = video_list[(pp_num - 1) * num_videos_per_thread:]
-    p = mp.Process(
-        target=video_process,
-        args=(tmp_video_list, video_dict, output_path, result_dict))
-    p.start()
-    processes.append(p)
-    for p in processes:
-        p.join()
-
-    result_dict = dict(result_dict)
-    output_dict = {
-        "version": "VERSION 1.3",
-        "results": result_dict,
-        "external_data": {}
-    }
-    outfile = open(
-        os.path.join(result_path, "bmn_results_%s.json" % subset), "w")
-
-    json.dump(output_dict, outfile)
-    outfile.close()
+    order = np.argsort(-props[:, 2], kind='mergesort')
+    tstart = props[order, 0].astype('float64')
+    tend = props[order, 1].astype('float64')
+    tscore = props[order, 2].astype('float64')
+
+    # picked proposals are masked out instead of popped from the lists
+    alive = np.ones(len(tscore), dtype='bool')
+    num_alive = len(tscore)
+    keep = []
+    while num_alive > 1 and len(keep) < 101:
+        max_index = np.argmax(np.where(alive, tscore, -np.inf))
+        alive[max_index] = False
+        num_alive -= 1
+        tmp_iou_list = iou_with_anchors(tstart, tend, tstart[max_index],
+                                        tend[max_index])
+        tmp_width = tend[max_index] - tstart[max_index]
+        decay = alive & (tmp_iou_list > t1 + (t2 - t1) * tmp_width)
+        tscore[decay] *= np.exp(-np.square(tmp_iou_list[decay]) / alpha)
+        keep.append(max_index)
+
+    keep = np.array(keep, dtype='int64')
+    return np.stack([tstart[keep], tend[keep], tscore[keep]], axis=1)
+
+
+def gen_props(pred_bm, pred_start, pred_end, snippet_xmins, snippet_xmaxs):
+    """Score every (start, duration) cell of the boundary map whose start and
+    end are boundary candidates.
+
+    Returns [xmin, xmax, score] rows, ordered by duration then start.
+    """
+    dscale, tscale = pred_bm.shape
+    start_mask = boundary_choose(pred_start)
+    start_mask[0] = 1.
+    end_mask = boundary_choose(pred_end)
+    end_mask[-1] = 1.
+    idx, jdx = np.meshgrid(
+        np.arange(dscale), np.arange(tscale), indexing='ij')
+    end_index = idx + jdx
+    valid = (end_index < tscale) & (start_mask[jdx] == 1) & (
+        end_mask[np.minimum(end_index, tscale - 1)] == 1)
+    idx, jdx = np.nonzero(valid)
+    end_index = jdx + idx
+    conf_score = pred_start[jdx] * pred_end[end_index] * pred_bm[idx, jdx]
+    return np.stack(
+        [
+            np.asarray(snippet_xmins)[jdx], np.asarray(snippet_xmaxs)[
+                end_index], conf_score.astype('float64')
+        ],
+        axis=1)
+
+
+def video_process(task):
+    """soft-NMS the proposals of one video and scale them to seconds.
+
+    Runs in the post processing pool, returns the video id, its proposal
+    list and the seconds spent in soft_nms.
+    """
+    video_name, props, video_duration, snms_alpha, snms_t1, snms_t2 = task
+    start = time.time()
+    if len(props) > 1:
+        props = soft_nms(props, snms_alpha, snms_t1, snms_t2)
+    nms_time = time.time() - start
+
+    proposal_list = []
+    for idx in range(min(100, len(props))):
+        tmp_prop={"score":float(props[idx, 2]),\
+                  "segment":[max(0,props[idx, 0])*video_duration,\
+                             min(1,props[idx, 1])*video_duration]}
+        proposal_list.append(tmp_prop)
+    return video_name[2:], proposal_list, nms_time
+
+
+def proposal_post_processing(video_dict,
+                             props_dict,
+                             result_file,
+                             snms_alpha,
+                             snms_t1,
+                             snms_t2,
+                             num_workers=None):
+    """soft-NMS the proposals of every video in a process pool and stream the
+    results into result_file in the ActivityNet proposal json format.
+
+    Args:
+        video_dict: video name to its annotation with "duration_second"
+        props_dict: video name to its [xmin, xmax, score] proposals
+        result_file: the output json file
+        snms_alpha, snms_t1, snms_t2: soft_nms parameters
+        num_workers: size of the pool, the number of cpus by default
+    """
+    num_workers = num_workers or mp.cpu_count()
+    timer = {'load': 0., 'nms': 0., 'write': 0.}
+
+    def tasks():
+        for video_name in video_dict:
+            start = time.time()
+            task = (video_name, props_dict[video_name],
+                    video_dict[video_name]["duration_second"], snms_alpha,
+                    snms_t1, snms_t2)
+            timer['load'] += time.time() - start
+            yield task
+
+    start_time = time.time()
+    pool = mp.Pool(num_workers)
+    num_videos = 0
+    try:
+        with open(result_file, "w") as outfile:
+            outfile.write('{"version": "VERSION 1.3", "results": {')
+            # results are written as they come, no dict of all videos is built
+            for video_id, proposal_list, nms_time in pool.imap(
+                    video_process, tasks(), chunksize=8):
+                timer['nms'] += nms_time
+                start = time.time()
+                if num_videos > 0:
+                    outfile.write(', ')
+                outfile.write(json.dumps(video_id))
+                outfile.write(': ')
+                outfile.write(json.dumps(proposal_list))
+                timer['write'] += time.time() - start
+                num_videos += 1
+            outfile.write('}, "external_data": {}}')
+    finally:
+        pool.close()
+        pool.join()
+    logger.info(
+        "post processed {} videos with {} workers in {:.2f}s: load {:.2f}s, "
+        "nms {:.2f}s (summed over workers), write {:.2f}s".format(
+            num_videos, num_workers,
+            time.time() - start_time, timer['load'], timer['nms'],
+            timer['write']))
+
+
+def bmn_post_processing(video_dict,
+                        subset,
+                        props_dict,
+                        result_path,
+                        num_workers=None):
+    proposal_post_processing(
+        video_dict,
+        props_dict,
+        os.path.join(result_path, "bmn_results_%s.json" % subset),
+        snms_alpha=0.4,
+        snms_t1=0.55,
+        snms_t2=0.9,
+        num_workers=num_workers)
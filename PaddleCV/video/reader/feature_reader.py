@@ -23,6 +23,8 @@ except ImportError:
 import numpy as np
 import random
 
+from .feature_store import FeatureStore
+
 python_ver = sys.version_info
 
 
@@ -34,6 +36,8 @@ class FeatureReader(DataReader):
     dataset cfg: num_classes
                  batch_size
                  list
+                 format: pkl (default) or store, for store every line of the
+                         list is a feature store directory, see feature_store.py
                  NextVlad only: eigen_file
     """
 
@@ -47,10 +51,15 @@ class FeatureReader(DataReader):
         self.filelist = cfg[mode.upper()]['filelist']
         self.eigen_file = cfg.MODEL.get('eigen_file', None)
         self.seg_num = cfg.MODEL.get('seg_num', None)
+        self.format = cfg.MODEL.get('format', 'pkl')
+        assert self.format in ['pkl', 'store'], \
+            "format should be pkl or store, got {}".format(self.format)
 
     def create_reader(self):
         fl = open(self.filelist).readlines()
         fl = [line.strip() for line in fl if line.strip() != '']
+        if self.format == 'store':
+            return self._create_store_reader(fl)
         if self.mode == 'train':
             random.shuffle(fl)
 
@@ -102,6 +111,50 @@ class FeatureReader(DataReader):
 
         return reader
 
+    def _create_store_reader(self, fl):
+        stores = [FeatureStore(path) for path in fl]
+        # (store, video) of every video, shuffled across all stores
+        records = np.concatenate([
+            np.stack(
+                [np.full(len(store), i), np.arange(len(store))], axis=1)
+            for i, store in enumerate(stores)
+        ])
+        # features are dequantized from uint8 with a lookup table, after
+        # frame sampling, straight into float32
+        if self.name != 'NEXTVLAD':
+            table = dequantize(
+                np.arange(256), max_quantized_value=2.,
+                min_quantized_value=-2.).astype('float32')
+        else:
+            table = np.arange(256, dtype='float32')
+
+        def reader():
+            if self.mode == 'train':
+                order = np.random.permutation(len(records))
+            else:
+                order = np.arange(len(records))
+            batch_out = []
+            for k in order:
+                store, i = records[k]
+                video, rgb, audio, label = stores[store][i]
+                if self.name == 'ATTENTIONCLUSTER':
+                    sample_inds = generate_random_idx(rgb.shape[0],
+                                                      self.seg_num)
+                    rgb = rgb[sample_inds]
+                    audio = audio[sample_inds]
+                rgb = table[rgb]
+                audio = table[audio]
+                if self.mode != 'infer':
+                    batch_out.append(
+                        (rgb, audio, make_one_hot(label, self.num_classes)))
+                else:
+                    batch_out.append((rgb, audio, video))
+                if len(batch_out) == self.batch_size:
+                    yield batch_out
+                    batch_out = []
+
+        return reader
+
 
 def dequantize(feat_vector, max_quantized_value=2., min_quantized_value=-2.):
     """
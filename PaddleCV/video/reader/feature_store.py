@@ -0,0 +1,152 @@
+#  Copyright (c) 2020 PaddlePaddle Authors. All Rights Reserve.
+#
+#Licensed under the Apache License, Version 2.0 (the "License");
+#you may not use this file except in compliance with the License.
+#You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#Unless required by applicable law or agreed to in writing, software
+#distributed under the License is distributed on an "AS IS" BASIS,
+#WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#See the License for the specific language governing permissions and
+#limitations under the License.
+"""
+Feature store, the quantized frame features of YouTube-8M videos in columns.
+
+A store is a directory holding:
+
+    rgb.bin      uint8 (total_frames, rgb_dim), rgb features of all videos
+    audio.bin    uint8 (total_frames, audio_dim), audio features
+    index.npz    frame_offsets  (num_videos + 1) int64, the frames of video i
+                                are rows frame_offsets[i]:frame_offsets[i + 1]
+                 label_offsets  (num_videos + 1) int64, the labels of video i
+                                are labels[label_offsets[i]:label_offsets[i + 1]]
+                 labels         int32 class indices
+                 videos         (num_videos, ) bytes, the video ids
+                 rgb_dim, audio_dim
+
+The feature files are opened with np.memmap, so the features of a video are
+views into the mapped files and only the rows actually used are read.
+"""
+
+import os
+
+import numpy as np
+
+RGB_FILE = 'rgb.bin'
+AUDIO_FILE = 'audio.bin'
+INDEX_FILE = 'index.npz'
+
+
+class FeatureStoreWriter(object):
+    """Append videos to a new feature store.
+
+    index.npz is written by close(), a store without it is incomplete.
+
+    Args:
+        path: the store directory, created if missing
+        rgb_dim: size of the rgb feature of a frame
+        audio_dim: size of the audio feature of a frame
+    """
+
+    def __init__(self, path, rgb_dim=1024, audio_dim=128):
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        self.path = path
+        self.rgb_dim = rgb_dim
+        self.audio_dim = audio_dim
+        self._rgb = open(os.path.join(path, RGB_FILE), 'wb')
+        self._audio = open(os.path.join(path, AUDIO_FILE), 'wb')
+        self._frame_offsets = [0]
+        self._label_offsets = [0]
+        self._labels = []
+        self._videos = []
+
+    def add(self, video, rgb, audio, labels):
+        """Append one video.
+
+        Args:
+            video: video id, str or bytes
+            rgb: uint8 array (nframes, rgb_dim)
+            audio: uint8 array (nframes, audio_dim)
+            labels: list of class indices, empty for unlabeled videos
+        """
+        assert rgb.shape[1:] == (self.rgb_dim, ) and \
+            audio.shape[1:] == (self.audio_dim, ), \
+            "feature dims of {} do not match the store".format(video)
+        assert len(rgb) == len(audio), \
+            "rgb and audio of {} have different frames".format(video)
+        self._rgb.write(np.ascontiguousarray(rgb, dtype='uint8').tobytes())
+        self._audio.write(np.ascontiguousarray(audio, dtype='uint8').tobytes())
+        self._frame_offsets.append(self._frame_offsets[-1] + len(rgb))
+        self._labels.extend(int(l) for l in labels)
+        self._label_offsets.append(len(self._labels))
+        if not isinstance(video, bytes):
+            video = video.encode('utf-8')
+        self._videos.append(video)
+
+    def __len__(self):
+        return len(self._videos)
+
+    def close(self):
+        self._rgb.close()
+        self._audio.close()
+        np.savez(
+            os.path.join(self.path, INDEX_FILE),
+            frame_offsets=np.array(self._frame_offsets, dtype='int64'),
+            label_offsets=np.array(self._label_offsets, dtype='int64'),
+            labels=np.array(self._labels, dtype='int32'),
+            videos=np.array(self._videos, dtype='S'),
+            rgb_dim=self.rgb_dim,
+            audio_dim=self.audio_dim)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def _map_features(path, dim):
+    if os.path.getsize(path) == 0:
+        return np.zeros((0, dim), dtype='uint8')
+    return np.memmap(path, dtype='uint8', mode='r').reshape((-1, dim))
+
+
+class FeatureStore(object):
+    """Random access to the videos of a feature store.
+
+    store[i] returns (video, rgb, audio, labels) of video i, rgb and audio
+    are uint8 views into the mapped feature files.
+
+    Args:
+        path: the store directory
+    """
+
+    def __init__(self, path):
+        self.path = path
+        index_path = os.path.join(path, INDEX_FILE)
+        assert os.path.exists(index_path), \
+            "{} is not a complete feature store".format(path)
+        with np.load(index_path) as index:
+            self.frame_offsets = index['frame_offsets']
+            self.label_offsets = index['label_offsets']
+            self.labels = index['labels']
+            self.videos = index['videos']
+            rgb_dim = int(index['rgb_dim'])
+            audio_dim = int(index['audio_dim'])
+        self.rgb = _map_features(os.path.join(path, RGB_FILE), rgb_dim)
+        self.audio = _map_features(os.path.join(path, AUDIO_FILE), audio_dim)
+        assert len(self.rgb) == self.frame_offsets[-1] == len(self.audio), \
+            "feature files of {} do not match its index".format(path)
+
+    def __len__(self):
+        return len(self.videos)
+
+    def __getitem__(self, idx):
+        start, end = self.frame_offsets[idx], self.frame_offsets[idx + 1]
+        labels = self.labels[self.label_offsets[idx]:
+                             self.label_offsets[idx + 1]]
+        return (self.videos[idx], self.rgb[start:end], self.audio[start:end],
+                labels)
@@ -0,0 +1,99 @@
+#  Copyright (c) 2020 PaddlePaddle Authors. All Rights Reserve.
+#
+#Licensed under the Apache License, Version 2.0 (the "License");
+#you may not use this file except in compliance with the License.
+#You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#Unless required by applicable law or agreed to in writing, software
+#distributed under the License is distributed on an "AS IS" BASIS,
+#WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#See the License for the specific language governing permissions and
+#limitations under the License.
+"""
+Frame store, one file holding the encoded frames of a video.
+
+Layout, all integers little endian:
+
+    magic        4 bytes, b'PDFS'
+    num_frames   uint32
+    label        int64
+    vid_len      uint32
+    vid          vid_len bytes, utf-8
+    offsets      (num_frames + 1) uint64, frame i is data[offsets[i]:offsets[i + 1]]
+    data         the encoded frames (JPEG) back to back
+
+The file is opened with mmap, so reading a frame only touches its own
+bytes, unlike a pkl which is read and unpickled as a whole.
+"""
+
+import mmap
+import struct
+
+import numpy as np
+
+MAGIC = b'PDFS'
+_HEADER = struct.Struct('<4sIqI')
+
+
+def write_frame_store(path, vid, label, frames):
+    """write the encoded frames of a video to path
+
+    Args:
+        path: output file
+        vid: video id
+        label: integer label of the video
+        frames: list of encoded frame bytes
+    """
+    vid = vid.encode('utf-8') if not isinstance(vid, bytes) else vid
+    offsets = np.zeros(len(frames) + 1, dtype='<u8')
+    offsets[1:] = np.cumsum([len(f) for f in frames])
+    with open(path, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, len(frames), int(label), len(vid)))
+        f.write(vid)
+        f.write(offsets.tobytes())
+        for frame in frames:
+            f.write(frame)
+
+
+class FrameStore(object):
+    """Random access to the frames of a frame store file.
+
+    Supports len() and indexing, store[i] returns the encoded bytes of frame
+    i, so it can be sampled like the frame list of a pkl.
+
+    Args:
+        path: the frame store file
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, num_frames, self.label, vid_len = _HEADER.unpack_from(self._mm)
+        assert magic == MAGIC, "{} is not a frame store".format(path)
+        pos = _HEADER.size
+        self.vid = self._mm[pos:pos + vid_len].decode('utf-8')
+        pos += vid_len
+        self._offsets = np.frombuffer(
+            self._mm[pos:pos + 8 * (num_frames + 1)], dtype='<u8')
+        self._data = pos + 8 * (num_frames + 1)
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, idx):
+        if idx < 0:
+            idx += len(self)
+        start = self._data + int(self._offsets[idx])
+        return self._mm[start:self._data + int(self._offsets[idx + 1])]
+
+    def close(self):
+        self._mm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
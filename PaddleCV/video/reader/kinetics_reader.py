@@ -17,6 +17,8 @@ import sys
 import cv2
 import math
 import random
+import hashlib
+import threading
 import functools
 try:
     import cPickle as pickle
@@ -41,6 +43,7 @@ from PIL import Image, ImageEnhance
 import logging
 
 from .reader_utils import DataReader
+from .frame_store import FrameStore
 
 logger = logging.getLogger(__name__)
 python_ver = sys.version_info
@@ -48,9 +51,10 @@ python_ver = sys.version_info
 
 class KineticsReader(DataReader):
     """
-    Data reader for kinetics dataset of two format mp4 and pkl.
+    Data reader for kinetics dataset of three format mp4, pkl and frames.
     1. mp4, the original format of kinetics400
     2. pkl, the mp4 was decoded previously and stored as pkl
+    3. frames, the decoded frames stored in a frame store, see frame_store.py
     In both case, load the data, and then get the frame data in the form of numpy and label as an integer.
      dataset cfg: format
                   num_classes
@@ -93,6 +97,11 @@ class KineticsReader(DataReader):
         self.use_dali = self.get_config_from_sec(mode, 'use_dali', False)
         self.dali_mean = cfg.MODEL.image_mean * (self.seg_num * self.seglen)
         self.dali_std = cfg.MODEL.image_std * (self.seg_num * self.seglen)
+        # optional on-disk cache of the resized frames of mp4 videos
+        self.mp4_cache_dir = self.get_config_from_sec(mode, 'mp4_cache_dir',
+                                                      '')
+        self.mp4_cache_size_gb = self.get_config_from_sec(
+            mode, 'mp4_cache_size_gb', 100)
 
         if self.mode == 'infer':
             self.video_path = cfg[mode.upper()]['video_path']
@@ -176,6 +185,12 @@ class KineticsReader(DataReader):
                         num_threads=1,
                         buf_size=1024,
                         format='pkl'):
+        if format == 'mp4' and self.mp4_cache_dir:
+            cache = Mp4FrameCache(self.mp4_cache_dir,
+                                  int(self.mp4_cache_size_gb * (1 << 30)))
+        else:
+            cache = None
+
         def decode_mp4(sample, mode, seg_num, seglen, short_size, target_size,
                        img_mean, img_std):
             sample = sample[0].split(' ')
@@ -183,7 +198,13 @@ class KineticsReader(DataReader):
             # when infer, we store vid as label
             label = int(sample[1])
             try:
-                imgs = mp4_loader(mp4_path, seg_num, seglen, mode)
+                imgs = mp4_loader(
+                    mp4_path,
+                    seg_num,
+                    seglen,
+                    mode,
+                    cache=cache,
+                    short_size=short_size)
                 if len(imgs) < 1:
                     logger.error('{} frame length {} less than 1.'.format(
                         mp4_path, len(imgs)))
@@ -223,6 +244,28 @@ class KineticsReader(DataReader):
             return imgs_transform(imgs, mode, seg_num, seglen, \
                          short_size, target_size, img_mean, img_std, name = self.name), ret_label
 
+        def decode_frames(sample, mode, seg_num, seglen, short_size,
+                          target_size, img_mean, img_std):
+            frames_path = sample[0]
+            try:
+                store = FrameStore(frames_path)
+            except:
+                logger.info('Error when loading {}'.format(frames_path))
+                return None, None
+            with store:
+                if len(store) < 1:
+                    logger.error('{} frame length {} less than 1.'.format(
+                        frames_path, len(store)))
+                    return None, None
+                if mode == 'infer':
+                    ret_label = store.vid
+                else:
+                    ret_label = store.label
+                # only the sampled frames are read from the mapped file
+                imgs = video_loader(store, seg_num, seglen, mode)
+            return imgs_transform(imgs, mode, seg_num, seglen, \
+                         short_size, target_size, img_mean, img_std, name = self.name), ret_label
+
         def reader_():
             with open(pickle_list) as flist:
                 full_lines = [line.strip() for line in flist]
@@ -260,6 +303,8 @@ class KineticsReader(DataReader):
             decode_func = decode_pickle
         elif format == 'mp4':
             decode_func = decode_mp4
+        elif format == 'frames':
+            decode_func = decode_frames
         else:
             raise "Not implemented format {}".format(format)
 
@@ -731,19 +776,10 @@ def video_loader(frames, nsample, seglen, mode):
     return imgs
 
 
-def mp4_loader(filepath, nsample, seglen, mode):
-    cap = cv2.VideoCapture(filepath)
-    videolen = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-    sampledFrames = []
-    for i in range(videolen):
-        ret, frame = cap.read()
-        # maybe first frame is empty
-        if ret == False:
-            continue
-        img = frame[:, :, ::-1]
-        sampledFrames.append(img)
-    average_dur = int(len(sampledFrames) / nsample)
-    imgs = []
+def mp4_frame_indices(videolen, nsample, seglen, mode):
+    """indices of the seglen frames of every one of the nsample segments"""
+    average_dur = int(videolen / nsample)
+    indices = []
     for i in range(nsample):
         idx = 0
         if mode == 'train':
@@ -764,8 +800,172 @@ def mp4_loader(filepath, nsample, seglen, mode):
                 idx = i
 
         for jj in range(idx, idx + seglen):
-            imgbuf = sampledFrames[int(jj % len(sampledFrames))]
-            img = Image.fromarray(imgbuf, mode='RGB')
-            imgs.append(img)
+            indices.append(int(jj % videolen))
+    return indices
 
-    return imgs
+
+def read_mp4_frames(filepath):
+    """decode every frame of the video, as RGB arrays"""
+    cap = cv2.VideoCapture(filepath)
+    videolen = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    frames = []
+    for i in range(videolen):
+        ret, frame = cap.read()
+        # maybe first frame is empty
+        if ret == False:
+            continue
+        frames.append(frame[:, :, ::-1])
+    cap.release()
+    return frames
+
+
+def grab_mp4_frames(filepath, indices):
+    """decode only the frames at indices, as a dict of index to RGB array
+
+    grab() advances the stream without converting or copying the frame,
+    only the wanted ones are retrieved. Seeking by CAP_PROP_POS_FRAMES is
+    not used since it is not frame accurate for many mp4 codecs. Returns
+    None if the video ends early or a frame can't be retrieved, the frame
+    count in the header is then not trustworthy.
+    """
+    cap = cv2.VideoCapture(filepath)
+    wanted = set(indices)
+    frames = {}
+    try:
+        for pos in range(max(wanted) + 1):
+            if not cap.grab():
+                return None
+            if pos in wanted:
+                ret, frame = cap.retrieve()
+                if not ret:
+                    return None
+                frames[pos] = frame[:, :, ::-1]
+    finally:
+        cap.release()
+    return frames
+
+
+class Mp4FrameCache(object):
+    """Bounded on-disk cache of the short side resized frames of videos.
+
+    The frames of a video are stored as one uint8 .npy file named by the
+    md5 of the video path, size and modify time and of the short size the
+    frames are resized to, and loaded with mmap, so only the sampled frames
+    are read. When the cache exceeds max_bytes, the least recently used
+    videos are removed.
+
+    Args:
+        cache_dir: directory of the cached frames
+        max_bytes: the size limit of the cache
+    """
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        if not os.path.isdir(cache_dir):
+            try:
+                os.makedirs(cache_dir)
+            except OSError:
+                # created by another trainer
+                pass
+        self._used = sum(
+            os.path.getsize(os.path.join(cache_dir, f))
+            for f in os.listdir(cache_dir) if f.endswith('.npy'))
+
+    def _path(self, filepath, short_size):
+        # a re-encoded video or another short size gets new frames
+        stat = os.stat(filepath)
+        key = hashlib.md5(
+            repr((os.path.abspath(filepath), stat.st_size, stat.st_mtime,
+                  short_size)).encode('utf-8'))
+        return os.path.join(self.cache_dir, key.hexdigest() + '.npy')
+
+    def get(self, filepath, short_size):
+        path = self._path(filepath, short_size)
+        try:
+            frames = np.load(path, mmap_mode='r')
+        except (IOError, ValueError):
+            return None
+        # the modify time orders the videos for eviction
+        os.utime(path, None)
+        return frames
+
+    def put(self, filepath, short_size, frames):
+        frames = np.stack(frames)
+        path = self._path(filepath, short_size)
+        tmp_path = '{}.{}.{}.tmp'.format(path,
+                                        os.getpid(),
+                                        threading.current_thread().ident)
+        np.save(tmp_path, frames)
+        # np.save appends .npy to names without it
+        os.rename(tmp_path + '.npy', path)
+        with self._lock:
+            self._used += os.path.getsize(path)
+            if self._used > self.max_bytes:
+                self._evict()
+        return frames
+
+    def _evict(self):
+        files = []
+        for f in os.listdir(self.cache_dir):
+            if not f.endswith('.npy'):
+                continue
+            f = os.path.join(self.cache_dir, f)
+            try:
+                files.append((os.path.getmtime(f), os.path.getsize(f), f))
+            except OSError:
+                continue
+        files.sort()
+        self._used = sum(f[1] for f in files)
+        # evict down to 90% so the directory isn't scanned on every put
+        for _, size, f in files:
+            if self._used <= 0.9 * self.max_bytes:
+                break
+            try:
+                os.remove(f)
+            except OSError:
+                continue
+            self._used -= size
+
+
+def mp4_loader(filepath, nsample, seglen, mode, cache=None, short_size=None):
+    """load the sampled frames of a mp4 video as PIL images
+
+    Only the sampled frames are decoded. With a Mp4FrameCache, all the
+    frames of a video are decoded and resized by group_scale on its first
+    visit, later epochs read the sampled frames from the cache.
+    """
+    if cache is not None:
+        frames = cache.get(filepath, short_size)
+        if frames is None:
+            frames = read_mp4_frames(filepath)
+            if len(frames) < 1:
+                return []
+            frames = [np.asarray(img) for img in group_scale(
+                [Image.fromarray(f, mode='RGB') for f in frames], short_size)]
+            frames = cache.put(filepath, short_size, frames)
+        indices = mp4_frame_indices(len(frames), nsample, seglen, mode)
+        return [
+            Image.fromarray(
+                np.ascontiguousarray(frames[i]), mode='RGB') for i in indices
+        ]
+
+    cap = cv2.VideoCapture(filepath)
+    videolen = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    if videolen > 0:
+        indices = mp4_frame_indices(videolen, nsample, seglen, mode)
+        frames = grab_mp4_frames(filepath, indices)
+        if frames is not None:
+            return [Image.fromarray(frames[i], mode='RGB') for i in indices]
+
+    # fall back to decode the whole video and sample the decoded frames
+    sampledFrames = read_mp4_frames(filepath)
+    if len(sampledFrames) < 1:
+        return []
+    return [
+        Image.fromarray(
+            sampledFrames[i], mode='RGB')
+        for i in mp4_frame_indices(len(sampledFrames), nsample, seglen, mode)
+    ]
@@ -15,6 +15,9 @@
 import glob
 import six
 import os
+import array
+import shutil
+import hashlib
 import tarfile
 
 import numpy as np
@@ -150,6 +153,11 @@ def prepare_infer_input(insts, src_pad_idx, bos_idx, n_head, place):
     return data_inputs
 
 
+# the arrays of the token ids of DataProcessor and the .npy files of its cache,
+# the target ones are absent if only_src
+ID_FIELDS = ["src_ids", "src_offsets", "trg_ids", "trg_offsets"]
+
+
 class SortType(object):
     GLOBAL = 'global'
     POOL = 'pool'
@@ -183,60 +191,29 @@ class ComposedConverter(object):
         ]
 
 
-class SentenceBatchCreator(object):
-    def __init__(self, batch_size):
-        self.batch = []
-        self._batch_size = batch_size
-
-    def append(self, info):
-        self.batch.append(info)
-        if len(self.batch) == self._batch_size:
-            tmp = self.batch
-            self.batch = []
-            return tmp
-
-
-class TokenBatchCreator(object):
-    def __init__(self, batch_size):
-        self.batch = []
-        self.max_len = -1
-        self._batch_size = batch_size
-
-    def append(self, info):
-        cur_len = info.max_len
-        max_len = max(self.max_len, cur_len)
-        if max_len * (len(self.batch) + 1) > self._batch_size:
-            result = self.batch
-            self.batch = [info]
-            self.max_len = cur_len
-            return result
-        else:
-            self.max_len = max_len
-            self.batch.append(info)
-
-
-class SampleInfo(object):
-    def __init__(self, i, max_len, min_len):
-        self.i = i
-        self.min_len = min_len
-        self.max_len = max_len
-
+def sentence_batch_ends(max_lens, batch_size):
+    """
+    The end of each full batch of batch_size sentences, for the sentences of
+    max_lens in order.
+    """
+    return list(range(batch_size, len(max_lens) + 1, batch_size))
 
-class MinMaxFilter(object):
-    def __init__(self, max_len, min_len, underlying_creator):
-        self._min_len = min_len
-        self._max_len = max_len
-        self._creator = underlying_creator
 
-    def append(self, info):
-        if info.max_len > self._max_len or info.min_len < self._min_len:
-            return
-        else:
-            return self._creator.append(info)
-
-    @property
-    def batch(self):
-        return self._creator.batch
+def token_batch_ends(max_lens, batch_size):
+    """
+    The end of each full batch of the sentences of max_lens in order, a batch
+    holds at most batch_size tokens, paddings included.
+    """
+    ends = []
+    start = 0
+    batch_max_len = -1
+    for i, max_len in enumerate(max_lens.tolist()):
+        batch_max_len = max(batch_max_len, max_len)
+        if batch_max_len * (i - start + 1) > batch_size:
+            ends.append(i)
+            start = i
+            batch_max_len = max_len
+    return ends
 
 
 class DataProcessor(object):
@@ -321,6 +298,13 @@ class DataProcessor(object):
     :type only_src: bool
     :param seed: The seed for random.
     :type seed: int
+    :param use_cache: Whether to save the token ids to a binary cache the
+        first time and memory map the cache afterwards, the processes reading
+        the same cache share its memory.
+    :type use_cache: bool
+    :param cache_dir: The directory of the cache, the directory of the data
+        files if None.
+    :type cache_dir: basestring
     """
 
     def __init__(self,
@@ -345,13 +329,16 @@ class DataProcessor(object):
                  end_mark="<e>",
                  unk_mark="<unk>",
                  only_src=False,
-                 seed=0):
+                 seed=0,
+                 use_cache=False,
+                 cache_dir=None):
         # convert str to bytes, and use byte data
         field_delimiter = field_delimiter.encode("utf8")
         token_delimiter = token_delimiter.encode("utf8")
         start_mark = start_mark.encode("utf8")
         end_mark = end_mark.encode("utf8")
         unk_mark = unk_mark.encode("utf8")
+        self._vocab_fpaths = [src_vocab_fpath, trg_vocab_fpath]
         self._src_vocab = self.load_dict(src_vocab_fpath)
         self._trg_vocab = self.load_dict(trg_vocab_fpath)
         self._bos_idx = self._src_vocab[start_mark]
@@ -371,11 +358,46 @@ class DataProcessor(object):
         self._max_length = max_length
         self._field_delimiter = field_delimiter
         self._token_delimiter = token_delimiter
+        self._use_cache = use_cache
+        self._cache_dir = cache_dir
         self.load_src_trg_ids(fpattern, tar_fname)
         self._random = np.random
         self._random.seed(seed)
 
     def load_src_trg_ids(self, fpattern, tar_fname):
+        """
+        Loads the token ids of the sentences into flat arrays with offsets, the
+        ids of the i-th source sentence are
+        `self._src_ids[self._src_offsets[i]:self._src_offsets[i + 1]]`, and
+        likewise for the target sentences.
+        """
+        if self._use_cache:
+            cache_path = self.get_cache_path(fpattern, tar_fname)
+            if not os.path.isdir(cache_path):
+                self.save_cache(cache_path,
+                                self.convert_src_trg_ids(fpattern, tar_fname))
+            fields = self.load_cache(cache_path)
+        else:
+            fields = self.convert_src_trg_ids(fpattern, tar_fname)
+
+        self._src_ids = fields["src_ids"]
+        self._src_offsets = fields["src_offsets"]
+        self._trg_ids = fields.get("trg_ids")
+        self._trg_offsets = fields.get("trg_offsets")
+
+        self._max_lens = self._min_lens = np.diff(self._src_offsets)
+        if not self._only_src:
+            trg_lens = np.diff(self._trg_offsets)
+            self._max_lens = np.maximum(self._max_lens, trg_lens)
+            self._min_lens = np.minimum(self._min_lens, trg_lens)
+        # the order of the sentences, shuffled and sorted in place by
+        # batch_generator, so each pass starts from the order of the last one
+        self._sample_order = np.arange(len(self._max_lens))
+
+    def convert_src_trg_ids(self, fpattern, tar_fname):
+        """
+        Converts the sentences of the data files to the arrays of ID_FIELDS.
+        """
         converters = [
             Converter(
                 vocab=self._src_vocab,
@@ -395,20 +417,84 @@ class DataProcessor(object):
                     delimiter=self._token_delimiter,
                     add_beg=True))
 
+        # arrays of C ints take 4 bytes a token instead of a list of int objects
+        seq_ids = [array.array("i") for converter in converters]
+        seq_lens = [array.array("i") for converter in converters]
         converters = ComposedConverter(converters)
 
-        self._src_seq_ids = []
-        self._trg_seq_ids = None if self._only_src else []
-        self._sample_infos = []
+        for line in self._load_lines(fpattern, tar_fname):
+            for ids, lens, sent_ids in zip(seq_ids, seq_lens, converters(line)):
+                ids.extend(sent_ids)
+                lens.append(len(sent_ids))
+
+        fields = {}
+        for name, ids, lens in zip(["src", "trg"], seq_ids, seq_lens):
+            offsets = np.zeros(len(lens) + 1, dtype="int64")
+            offsets[1:] = np.cumsum(np.array(lens, dtype="int64"))
+            fields[name + "_ids"] = np.array(ids, dtype="int32")
+            fields[name + "_offsets"] = offsets
+        return fields
+
+    def get_cache_path(self, fpattern, tar_fname):
+        """
+        The cache directory of the token ids of the data files, keyed by the
+        data files, the vocabs and the conversion args.
+        """
+        fpaths = glob.glob(fpattern)
+        assert len(fpaths) > 0, "no matching file to the provided data path"
+        key = hashlib.md5()
+        # the data files are keyed by their sizes and modification times since
+        # hashing a whole corpus takes long
+        for fpath in fpaths:
+            stat = os.stat(fpath)
+            key.update(
+                repr((os.path.abspath(fpath), stat.st_size, stat.st_mtime))
+                .encode("utf8"))
+        for fpath in self._vocab_fpaths:
+            with open(fpath, "rb") as f:
+                key.update(f.read())
+        key.update(
+            repr((tar_fname, self._field_delimiter, self._token_delimiter,
+                  self._bos_idx, self._eos_idx, self._unk_idx,
+                  self._only_src)).encode("utf8"))
+        cache_dir = self._cache_dir
+        if cache_dir is None:
+            cache_dir = os.path.dirname(os.path.abspath(fpaths[0]))
+        # hidden, so the cache does not match the patterns of the data files
+        return os.path.join(cache_dir, ".%s.ids.%s" %
+                            (os.path.basename(fpaths[0]), key.hexdigest()))
 
-        for i, line in enumerate(self._load_lines(fpattern, tar_fname)):
-            src_trg_ids = converters(line)
-            self._src_seq_ids.append(src_trg_ids[0])
-            lens = [len(src_trg_ids[0])]
-            if not self._only_src:
-                self._trg_seq_ids.append(src_trg_ids[1])
-                lens.append(len(src_trg_ids[1]))
-            self._sample_infos.append(SampleInfo(i, max(lens), min(lens)))
+    @staticmethod
+    def save_cache(cache_path, fields):
+        """
+        Saves the arrays of ID_FIELDS to cache_path, a directory of .npy files.
+        """
+        # written to a temporary directory and renamed, so the cache is never
+        # seen incomplete, also when several processes build it at once
+        tmp_path = "%s.tmp.%d" % (cache_path, os.getpid())
+        if not os.path.isdir(tmp_path):
+            os.makedirs(tmp_path)
+        for name, data in fields.items():
+            np.save(os.path.join(tmp_path, name + ".npy"), data)
+        try:
+            os.rename(tmp_path, cache_path)
+        except OSError:
+            # saved by another process in the meantime
+            shutil.rmtree(tmp_path)
+
+    @staticmethod
+    def load_cache(cache_path):
+        """
+        Memory maps the arrays of ID_FIELDS saved in cache_path read only, the
+        pages are shared with the other processes mapping the same cache.
+        """
+        fields = {}
+        for name in ID_FIELDS:
+            fpath = os.path.join(cache_path, name + ".npy")
+            if os.path.isfile(fpath):
+                # a plain ndarray on the map, slicing np.memmap is slow
+                fields[name] = np.asarray(np.load(fpath, mmap_mode="r"))
+        return fields
 
     def _load_lines(self, fpattern, tar_fname):
         fpaths = glob.glob(fpattern)
@@ -451,51 +537,62 @@ class DataProcessor(object):
         def __impl__():
             # global sort or global shuffle
             if self._sort_type == SortType.GLOBAL:
-                infos = sorted(self._sample_infos, key=lambda x: x.max_len)
+                order = np.argsort(self._max_lens, kind="mergesort")
             else:
+                order = self._sample_order
                 if self._shuffle:
-                    infos = self._sample_infos
-                    self._random.shuffle(infos)
-                else:
-                    infos = self._sample_infos
+                    self._random.shuffle(order)
 
                 if self._sort_type == SortType.POOL:
                     reverse = True
-                    for i in range(0, len(infos), self._pool_size):
+                    for i in range(0, len(order), self._pool_size):
                         # to avoid placing short next to long sentences
                         reverse = not reverse
-                        infos[i:i + self._pool_size] = sorted(
-                            infos[i:i + self._pool_size],
-                            key=lambda x: x.max_len,
-                            reverse=reverse)
-
-            # concat batch
-            batches = []
-            batch_creator = TokenBatchCreator(
-                batch_size) if use_token_batch else SentenceBatchCreator(
-                    batch_size)
-            batch_creator = MinMaxFilter(self._max_length, self._min_length,
-                                         batch_creator)
-
-            for info in infos:
-                batch = batch_creator.append(info)
-                if batch is not None:
-                    batches.append(batch)
-
-            if not self._clip_last_batch and len(batch_creator.batch) != 0:
-                batches.append(batch_creator.batch)
+                        pool = order[i:i + self._pool_size]
+                        pool_lens = self._max_lens[pool]
+                        # stable in both directions, as sorted with reverse
+                        order[i:i + self._pool_size] = pool[np.argsort(
+                            -pool_lens if reverse else pool_lens,
+                            kind="mergesort")]
+
+            # filter by length and concat batch
+            max_lens = self._max_lens[order]
+            keep = (max_lens <= self._max_length) & (
+                self._min_lens[order] >= self._min_length)
+            order = order[keep]
+            batch_ends = (token_batch_ends
+                          if use_token_batch else sentence_batch_ends)(
+                              max_lens[keep], batch_size)
+            batches = np.split(order, batch_ends)
+            # the last batch is uncompleted, and empty if all are completed
+            last_batch = batches.pop()
+            if not self._clip_last_batch and len(last_batch) != 0:
+                batches.append(last_batch)
 
             if self._shuffle_batch:
                 self._random.shuffle(batches)
 
+            src_ids, src_offsets = self._src_ids, self._src_offsets
+            trg_ids, trg_offsets = self._trg_ids, self._trg_offsets
             for batch in batches:
-                batch_ids = [info.i for info in batch]
+                src_starts = src_offsets[batch].tolist()
+                src_ends = src_offsets[batch + 1].tolist()
+                srcs = [
+                    src_ids[start:end].tolist()
+                    for start, end in zip(src_starts, src_ends)
+                ]
 
                 if self._only_src:
-                    yield [[self._src_seq_ids[idx]] for idx in batch_ids]
+                    yield [[src] for src in srcs]
                 else:
-                    yield [(self._src_seq_ids[idx], self._trg_seq_ids[idx][:-1],
-                            self._trg_seq_ids[idx][1:]) for idx in batch_ids]
+                    trg_starts = trg_offsets[batch].tolist()
+                    trg_ends = trg_offsets[batch + 1].tolist()
+                    trgs = [
+                        trg_ids[start:end].tolist()
+                        for start, end in zip(trg_starts, trg_ends)
+                    ]
+                    yield [(src, trg[:-1], trg[1:])
+                           for src, trg in zip(srcs, trgs)]
 
         return __impl__
 
@@ -17,61 +17,74 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import itertools
+
 import numpy as np
 
 
-def mask(batch_tokens, total_token_num, vocab_size, CLS=1, SEP=2, MASK=3):
+def mask(batch_src_ids,
+         seq_lens,
+         total_token_num,
+         vocab_size,
+         CLS=1,
+         SEP=2,
+         MASK=3):
     """
-    Add mask for batch_tokens, return out, mask_label, mask_pos;
-    Note: mask_pos responding the batch_tokens after padded;
+    Add mask for the padded batch_src_ids [shape: batch_size * max_len] in
+    place, return batch_src_ids, mask_label, mask_pos;
+    Note: mask_pos responding the batch_src_ids after padded;
     """
-    max_len = max([len(sent) for sent in batch_tokens])
-    mask_label = []
-    mask_pos = []
-    prob_mask = np.random.rand(total_token_num)
+    batch_size, max_len = batch_src_ids.shape
+    valid = np.arange(max_len) < seq_lens.reshape([-1, 1])
+    num_token = int(seq_lens.sum())
+
+    # the random numbers of the tokens are drawn in the order of the
+    # sentences, the padding gets a prob which never masks
+    prob_mask = np.ones([batch_size, max_len])
+    prob_mask[valid] = np.random.rand(total_token_num)[:num_token]
     # Note: the first token is [CLS], so [low=1]
-    replace_ids = np.random.randint(1, high=vocab_size, size=total_token_num)
-    pre_sent_len = 0
-    prob_index = 0
-    for sent_index, sent in enumerate(batch_tokens):
-        mask_flag = False
-        prob_index += pre_sent_len
-        for token_index, token in enumerate(sent):
-            prob = prob_mask[prob_index + token_index]
-            if prob > 0.15:
-                continue
-            elif 0.03 < prob <= 0.15:
-                # mask
-                if token != SEP and token != CLS:
-                    mask_label.append(sent[token_index])
-                    sent[token_index] = MASK
-                    mask_flag = True
-                    mask_pos.append(sent_index * max_len + token_index)
-            elif 0.015 < prob <= 0.03:
-                # random replace
-                if token != SEP and token != CLS:
-                    mask_label.append(sent[token_index])
-                    sent[token_index] = replace_ids[prob_index + token_index]
-                    mask_flag = True
-                    mask_pos.append(sent_index * max_len + token_index)
-            else:
-                # keep the original token
-                if token != SEP and token != CLS:
-                    mask_label.append(sent[token_index])
-                    mask_pos.append(sent_index * max_len + token_index)
-        pre_sent_len = len(sent)
-
-        # ensure at least mask one word in a sentence
-        while not mask_flag:
-            token_index = int(np.random.randint(1, high=len(sent) - 1, size=1))
+    replace_ids = np.zeros([batch_size, max_len], dtype="int64")
+    replace_ids[valid] = np.random.randint(
+        1, high=vocab_size, size=total_token_num)[:num_token]
+
+    candidate = valid & (batch_src_ids != SEP) & (batch_src_ids != CLS)
+    # prob in (0.03, 0.15]: mask, (0.015, 0.03]: random replace,
+    # [0, 0.015]: keep the original token
+    selected = candidate & (prob_mask <= 0.15)
+    do_mask = selected & (prob_mask > 0.03)
+    do_replace = selected & (prob_mask > 0.015) & (prob_mask <= 0.03)
+
+    mask_label = batch_src_ids[selected]
+    mask_rows, mask_cols = np.nonzero(selected)
+    batch_src_ids[do_mask] = MASK
+    batch_src_ids[do_replace] = replace_ids[do_replace]
+
+    # ensure at least mask one word in a sentence
+    extra_label, extra_rows, extra_cols = [], [], []
+    for sent_index in np.flatnonzero(~(do_mask | do_replace).any(axis=1)):
+        sent = batch_src_ids[sent_index]
+        while True:
+            token_index = np.random.randint(
+                1, high=seq_lens[sent_index] - 1, size=1)[0]
             if sent[token_index] != SEP and sent[token_index] != CLS:
-                mask_label.append(sent[token_index])
-                sent[token_index] = MASK
-                mask_flag = True
-                mask_pos.append(sent_index * max_len + token_index)
-    mask_label = np.array(mask_label).astype("int64").reshape([-1, 1])
-    mask_pos = np.array(mask_pos).astype("int64").reshape([-1, 1])
-    return batch_tokens, mask_label, mask_pos
+                break
+        extra_label.append(sent[token_index])
+        extra_rows.append(sent_index)
+        extra_cols.append(token_index)
+        sent[token_index] = MASK
+
+    if extra_rows:
+        # the extra word goes after the other words of its sentence
+        mask_label = np.concatenate([mask_label, extra_label])
+        mask_rows = np.concatenate([mask_rows, extra_rows])
+        mask_cols = np.concatenate([mask_cols, extra_cols])
+        order = np.argsort(mask_rows, kind="stable")
+        mask_label, mask_rows, mask_cols = (mask_label[order],
+                                            mask_rows[order], mask_cols[order])
+    mask_label = mask_label.astype("int64").reshape([-1, 1])
+    mask_pos = (mask_rows * max_len + mask_cols).astype("int64").reshape(
+        [-1, 1])
+    return batch_src_ids, mask_label, mask_pos
 
 
 def prepare_batch_data(insts,
@@ -102,20 +115,9 @@ def prepare_batch_data(insts,
         labels = np.array(labels).astype("int64").reshape([-1, 1])
         labels_list.append(labels)
 
-    # First step: do mask without padding
-    if mask_id >= 0:
-        out, mask_label, mask_pos = mask(
-            batch_src_ids,
-            total_token_num,
-            vocab_size=voc_size,
-            CLS=cls_id,
-            SEP=sep_id,
-            MASK=mask_id)
-    else:
-        out = batch_src_ids
-    # Second step: padding
+    # First step: padding
     src_id, self_input_mask = pad_batch_data(
-        out, pad_idx=pad_id, return_input_mask=True)
+        batch_src_ids, pad_idx=pad_id, return_input_mask=True)
     pos_id = pad_batch_data(
         batch_pos_ids,
         pad_idx=pad_id,
@@ -127,6 +129,18 @@ def prepare_batch_data(insts,
         return_pos=False,
         return_input_mask=False)
 
+    # Second step: do mask on the padded src ids
+    if mask_id >= 0:
+        seq_lens = np.array([len(inst) for inst in batch_src_ids])
+        src_id, mask_label, mask_pos = mask(
+            src_id,
+            seq_lens,
+            total_token_num,
+            vocab_size=voc_size,
+            CLS=cls_id,
+            SEP=sep_id,
+            MASK=mask_id)
+
     if mask_id >= 0:
         return_list = [
             src_id, pos_id, sent_id, self_input_mask, mask_label, mask_pos
@@ -148,38 +162,32 @@ def pad_batch_data(insts,
     corresponding position data and input mask.
     """
     return_list = []
-    max_len = max(len(inst) for inst in insts)
+    seq_lens = np.array([len(inst) for inst in insts], dtype="int64")
+    max_len = int(seq_lens.max())
+    num_token = int(seq_lens.sum())
+    valid = np.arange(max_len) < seq_lens.reshape([-1, 1])
     # Any token included in dict can be used to pad, since the paddings' loss
     # will be masked out by weights and make no effect on parameter gradients.
 
-    inst_data = np.array([
-        list(inst) + list([pad_idx] * (max_len - len(inst))) for inst in insts
-    ])
-    return_list += [inst_data.astype("int64").reshape([-1, max_len])]
+    inst_data = np.full([len(insts), max_len], pad_idx, dtype="int64")
+    inst_data[valid] = np.fromiter(
+        itertools.chain.from_iterable(insts), dtype="int64", count=num_token)
+    return_list += [inst_data]
 
     # position data
     if return_pos:
-        inst_pos = np.array([
-            list(range(0, len(inst))) + [pad_idx] * (max_len - len(inst))
-            for inst in insts
-        ])
-
-        return_list += [inst_pos.astype("int64").reshape([-1, max_len])]
+        inst_pos = np.where(valid, np.arange(max_len), pad_idx)
+        return_list += [inst_pos.astype("int64")]
 
     if return_input_mask:
         # This is used to avoid attention on paddings.
-        input_mask_data = np.array([[1] * len(inst) + [0] *
-                                    (max_len - len(inst)) for inst in insts])
-        input_mask_data = np.expand_dims(input_mask_data, axis=-1)
+        input_mask_data = np.expand_dims(valid, axis=-1)
         return_list += [input_mask_data.astype("float32")]
 
     if return_max_len:
         return_list += [max_len]
 
     if return_num_token:
-        num_token = 0
-        for inst in insts:
-            num_token += len(inst)
         return_list += [num_token]
 
     return return_list if len(return_list) > 1 else return_list[0]
@@ -0,0 +1,222 @@
+#   Copyright (c) 2019 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Check and time the pretraining batching against the per token loops."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import copy
+import time
+import argparse
+import numpy as np
+
+from utils.args import print_arguments
+from batching import prepare_batch_data
+from reader.pretraining import DataReader
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(__doc__)
+    parser.add_argument(
+        "--data_dir",
+        type=str,
+        default="data/validation",
+        help="The directory of the pretraining data shards.")
+    parser.add_argument(
+        "--vocab_path",
+        type=str,
+        default="data/demo_config/vocab.txt",
+        help="Vocabulary path.")
+    parser.add_argument(
+        "--batch_size",
+        type=int,
+        default=8192,
+        help="Total token number of a batch.")
+    parser.add_argument(
+        "--max_seq_len", type=int, default=512, help="Max sequence length.")
+    parser.add_argument(
+        "--num_batches",
+        type=int,
+        default=100,
+        help="Number of the batches to check and time.")
+    parser.add_argument(
+        "--seed", type=int, default=1, help="Random seed of the masking.")
+    args = parser.parse_args()
+    return args
+
+
+def loop_mask(batch_tokens, total_token_num, vocab_size, CLS=1, SEP=2,
+              MASK=3):
+    """
+    The masking before the padded arrays, token by token on the lists.
+    """
+    max_len = max([len(sent) for sent in batch_tokens])
+    mask_label = []
+    mask_pos = []
+    prob_mask = np.random.rand(total_token_num)
+    replace_ids = np.random.randint(1, high=vocab_size, size=total_token_num)
+    pre_sent_len = 0
+    prob_index = 0
+    for sent_index, sent in enumerate(batch_tokens):
+        mask_flag = False
+        prob_index += pre_sent_len
+        for token_index, token in enumerate(sent):
+            prob = prob_mask[prob_index + token_index]
+            if prob > 0.15:
+                continue
+            elif 0.03 < prob <= 0.15:
+                if token != SEP and token != CLS:
+                    mask_label.append(sent[token_index])
+                    sent[token_index] = MASK
+                    mask_flag = True
+                    mask_pos.append(sent_index * max_len + token_index)
+            elif 0.015 < prob <= 0.03:
+                if token != SEP and token != CLS:
+                    mask_label.append(sent[token_index])
+                    sent[token_index] = replace_ids[prob_index + token_index]
+                    mask_flag = True
+                    mask_pos.append(sent_index * max_len + token_index)
+            else:
+                if token != SEP and token != CLS:
+                    mask_label.append(sent[token_index])
+                    mask_pos.append(sent_index * max_len + token_index)
+        pre_sent_len = len(sent)
+
+        while not mask_flag:
+            token_index = np.random.randint(1, high=len(sent) - 1, size=1)[0]
+            if sent[token_index] != SEP and sent[token_index] != CLS:
+                mask_label.append(sent[token_index])
+                sent[token_index] = MASK
+                mask_flag = True
+                mask_pos.append(sent_index * max_len + token_index)
+    mask_label = np.array(mask_label).astype("int64").reshape([-1, 1])
+    mask_pos = np.array(mask_pos).astype("int64").reshape([-1, 1])
+    return batch_tokens, mask_label, mask_pos
+
+
+def loop_pad_batch_data(insts, pad_idx=0, return_input_mask=False):
+    """
+    The padding of the lists before the padded arrays.
+    """
+    return_list = []
+    max_len = max(len(inst) for inst in insts)
+    inst_data = np.array([
+        list(inst) + list([pad_idx] * (max_len - len(inst))) for inst in insts
+    ])
+    return_list += [inst_data.astype("int64").reshape([-1, max_len])]
+    if return_input_mask:
+        input_mask_data = np.array([[1] * len(inst) + [0] *
+                                    (max_len - len(inst)) for inst in insts])
+        input_mask_data = np.expand_dims(input_mask_data, axis=-1)
+        return_list += [input_mask_data.astype("float32")]
+    return return_list if len(return_list) > 1 else return_list[0]
+
+
+def loop_prepare_batch_data(insts, total_token_num, voc_size, pad_id, cls_id,
+                            sep_id, mask_id):
+    """
+    prepare_batch_data of the pretraining before the padded arrays.
+    """
+    labels = np.array([inst[3] for inst in insts]).astype("int64").reshape(
+        [-1, 1])
+    out, mask_label, mask_pos = loop_mask(
+        [inst[0] for inst in insts],
+        total_token_num,
+        vocab_size=voc_size,
+        CLS=cls_id,
+        SEP=sep_id,
+        MASK=mask_id)
+    src_id, self_input_mask = loop_pad_batch_data(
+        out, pad_idx=pad_id, return_input_mask=True)
+    pos_id = loop_pad_batch_data([inst[2] for inst in insts], pad_idx=pad_id)
+    sent_id = loop_pad_batch_data([inst[1] for inst in insts], pad_idx=pad_id)
+    return [
+        src_id, pos_id, sent_id, self_input_mask, mask_label, mask_pos, labels
+    ]
+
+
+def read_batches(reader, num_batches):
+    """
+    Batches of the samples of the shards like DataReader.data_generator,
+    before prepare_batch_data.
+    """
+    batches = []
+    batch, total_token_num, max_len = [], 0, 0
+    while len(batches) < num_batches:
+        num_read = len(batches)
+        for file in sorted(os.listdir(reader.data_dir)):
+            for sample in reader.read_file(file):
+                max_len = max(max_len, len(sample[0]))
+                if (len(batch) + 1) * max_len <= reader.batch_size:
+                    batch.append(sample)
+                    total_token_num += len(sample[0])
+                else:
+                    batches.append((batch, total_token_num))
+                    batch, total_token_num, max_len = [sample], len(sample[
+                        0]), len(sample[0])
+                if len(batches) == num_batches:
+                    return batches
+        assert len(batches) > num_read, "[Error] no full batch in data_dir"
+    return batches
+
+
+def main(args):
+    reader = DataReader(
+        args.data_dir,
+        args.vocab_path,
+        batch_size=args.batch_size,
+        in_tokens=True,
+        max_seq_len=args.max_seq_len)
+    special_ids = dict(
+        voc_size=len(reader.vocab),
+        pad_id=reader.pad_id,
+        cls_id=reader.cls_id,
+        sep_id=reader.sep_id,
+        mask_id=reader.mask_id)
+    batches = read_batches(reader, args.num_batches)
+
+    # same seed, same batches as the per token loops
+    for batch, total_token_num in batches:
+        outputs = []
+        for prepare in (prepare_batch_data, prepare_batch_data,
+                        loop_prepare_batch_data):
+            np.random.seed(args.seed)
+            outputs.append(
+                prepare(
+                    copy.deepcopy(batch), total_token_num, **special_ids))
+        for output in outputs[1:]:
+            assert len(output) == len(outputs[0])
+            for x, y in zip(outputs[0], output):
+                assert x.dtype == y.dtype and x.shape == y.shape
+                assert np.array_equal(x, y), "[Error] batches differ"
+    print("%d batches are the same as the per token loops under seed %d" %
+          (len(batches), args.seed))
+
+    for name, prepare in (("per token loops", loop_prepare_batch_data),
+                          ("padded arrays", prepare_batch_data)):
+        copies = [copy.deepcopy(batch) for batch, _ in batches]
+        np.random.seed(args.seed)
+        start = time.time()
+        for batch, (_, total_token_num) in zip(copies, batches):
+            prepare(batch, total_token_num, **special_ids)
+        print("%s: %.3f ms per batch" %
+              (name, (time.time() - start) * 1000 / len(batches)))
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    print_arguments(args)
+    main(args)
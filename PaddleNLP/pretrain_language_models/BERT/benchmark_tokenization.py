@@ -0,0 +1,170 @@
+#   Copyright (c) 2019 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Check and time the tokenizers against the char by char tokenization."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import io
+import time
+import argparse
+
+import tokenization
+from utils.args import print_arguments, str2bool
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(__doc__)
+    parser.add_argument(
+        "--vocab_path",
+        type=str,
+        default="data/demo_config/vocab.txt",
+        help="Vocabulary path.")
+    parser.add_argument(
+        "--corpus",
+        type=str,
+        default="data/demo_wiki_tokens.txt",
+        help="Text file to tokenize, one text per line.")
+    parser.add_argument(
+        "--tokenizer",
+        type=str,
+        default="full",
+        choices=["full", "char"],
+        help="FullTokenizer or CharTokenizer.")
+    parser.add_argument(
+        "--do_lower_case",
+        type=str2bool,
+        default=True,
+        help="Whether to lower case the input text.")
+    parser.add_argument(
+        "--batch_size",
+        type=int,
+        default=256,
+        help="Number of the texts of a tokenize_many call.")
+    args = parser.parse_args()
+    return args
+
+
+class LoopBasicTokenizer(tokenization.BasicTokenizer):
+    """BasicTokenizer before the char table and the cache."""
+
+    def tokenize(self, text):
+        text = tokenization.convert_to_unicode(text)
+        text = self._clean_text(text)
+        text = self._tokenize_chinese_chars(text)
+        split_tokens = []
+        for token in tokenization.whitespace_tokenize(text):
+            split_tokens.extend(self._split_token(token))
+        return tokenization.whitespace_tokenize(" ".join(split_tokens))
+
+
+class SlicingWordpieceTokenizer(tokenization.WordpieceTokenizer):
+    """WordpieceTokenizer before the tries and the cache, looking up the
+    substrings in the vocab."""
+
+    def tokenize(self, text):
+        text = tokenization.convert_to_unicode(text)
+        output_tokens = []
+        for token in tokenization.whitespace_tokenize(text):
+            chars = list(token)
+            if len(chars) > self.max_input_chars_per_word:
+                output_tokens.append(self.unk_token)
+                continue
+
+            is_bad = False
+            start = 0
+            sub_tokens = []
+            while start < len(chars):
+                end = len(chars)
+                cur_substr = None
+                while start < end:
+                    substr = "".join(chars[start:end])
+                    if start > 0:
+                        substr = "##" + substr
+                    if substr in self.vocab:
+                        cur_substr = substr
+                        break
+                    end -= 1
+                if cur_substr is None:
+                    is_bad = True
+                    break
+                sub_tokens.append(cur_substr)
+                start = end
+
+            if is_bad:
+                output_tokens.append(self.unk_token)
+            else:
+                output_tokens.extend(sub_tokens)
+        return output_tokens
+
+
+def build_tokenizer(args, reference=False):
+    if args.tokenizer == "full":
+        tokenizer = tokenization.FullTokenizer(
+            vocab_file=args.vocab_path, do_lower_case=args.do_lower_case)
+    else:
+        tokenizer = tokenization.CharTokenizer(
+            vocab_file=args.vocab_path, do_lower_case=args.do_lower_case)
+    if reference:
+        if args.tokenizer == "full":
+            tokenizer.basic_tokenizer = LoopBasicTokenizer(
+                do_lower_case=args.do_lower_case)
+        tokenizer.wordpiece_tokenizer = SlicingWordpieceTokenizer(
+            vocab=tokenizer.vocab)
+    return tokenizer
+
+
+def main(args):
+    with io.open(args.corpus, encoding="utf8") as f:
+        texts = [line.rstrip("\n") for line in f]
+
+    reference = build_tokenizer(args, reference=True)
+    start = time.time()
+    reference_ids = [
+        reference.convert_tokens_to_ids(reference.tokenize(text))
+        for text in texts
+    ]
+    reference_time = time.time() - start
+    num_tokens = sum(len(ids) for ids in reference_ids)
+
+    tokenizer = build_tokenizer(args)
+    start = time.time()
+    ids = [
+        tokenizer.convert_tokens_to_ids(tokenizer.tokenize(text))
+        for text in texts
+    ]
+    cold_time = time.time() - start
+    assert ids == reference_ids, "[Error] the ids differ from the reference"
+
+    start = time.time()
+    many_ids = []
+    for i in range(0, len(texts), args.batch_size):
+        for tokens in tokenizer.tokenize_many(texts[i:i + args.batch_size]):
+            many_ids.append(tokenizer.convert_tokens_to_ids(tokens))
+    warm_time = time.time() - start
+    assert many_ids == reference_ids, "[Error] the ids differ from the reference"
+
+    print("%d texts, %d tokens, the ids are the same as the reference" %
+          (len(texts), num_tokens))
+    for name, seconds in [("char by char reference", reference_time),
+                          ("tokenize, cold cache", cold_time),
+                          ("tokenize_many, warm cache", warm_time)]:
+        print("%s: %.0f tokens/sec" % (name, num_tokens / seconds))
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    print_arguments(args)
+    main(args)
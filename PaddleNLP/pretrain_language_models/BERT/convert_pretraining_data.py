@@ -0,0 +1,66 @@
+#   Copyright (c) 2019 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Convert the .gz pretraining data shards to binary shards read with mmap."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import time
+import argparse
+from utils.args import print_arguments
+from reader.pretraining import BIN_SHARD_SUFFIX, convert_gz_shard
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(__doc__)
+    parser.add_argument(
+        "--input_dir",
+        type=str,
+        required=True,
+        help="The directory of the .gz pretraining data shards.")
+    parser.add_argument(
+        "--output_dir",
+        type=str,
+        required=True,
+        help="The directory to store the binary shards, used as data_dir "
+        "of the training. It should not hold the .gz shards too.")
+    args = parser.parse_args()
+    return args
+
+
+def main(args):
+    files = sorted(f for f in os.listdir(args.input_dir) if f.endswith(".gz"))
+    assert len(files) > 0, "[Error] no .gz shard in %s" % args.input_dir
+    if not os.path.isdir(args.output_dir):
+        os.makedirs(args.output_dir)
+
+    total_samples = 0
+    start = time.time()
+    for file in files:
+        bin_path = os.path.join(args.output_dir,
+                                file[:-len(".gz")] + BIN_SHARD_SUFFIX)
+        num_samples = convert_gz_shard(
+            os.path.join(args.input_dir, file), bin_path)
+        total_samples += num_samples
+        print("%s: %d samples -> %s" % (file, num_samples, bin_path))
+    print("converted %d shards, %d samples in %.1f s" %
+          (len(files), total_samples, time.time() - start))
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    print_arguments(args)
+    main(args)
@@ -31,6 +31,62 @@ import paddle.fluid as fluid
 
 from batching import prepare_batch_data
 
+# a binary shard is a directory <shard name>.bin holding the fields of all the
+# samples of a .gz shard as flat arrays, see convert_gz_shard
+BIN_SHARD_SUFFIX = ".bin"
+BIN_SHARD_FIELDS = ["token_ids", "sent_ids", "pos_ids"]
+
+
+def convert_gz_shard(gz_path, bin_path):
+    """ convert a .gz shard of `token_ids;sent_ids;pos_ids;label` lines to a
+        binary shard directory, holding
+
+            token_ids.npy, sent_ids.npy, pos_ids.npy
+                int32, the fields of all the samples one after the other
+            offsets.npy
+                int64 (num_samples + 1), offset of each sample in the fields
+            labels.npy
+                int64 (num_samples), next sentence labels
+
+        Returns:
+            num_samples: number of samples in the shard
+    """
+    fields = dict((name, []) for name in BIN_SHARD_FIELDS)
+    labels = []
+    with gzip.open(gz_path, "rb") as f:
+        for line in f:
+            line = line.strip().decode().split(";")
+            assert len(line) == 4, "One sample must have 4 fields!"
+            ids = [
+                np.array(
+                    field.split(" "), dtype="int32") for field in line[:3]
+            ]
+            assert len(ids[0]) == len(ids[1]) == len(
+                ids[2]
+            ), "[Must be true]len(token_ids) == len(sent_ids) == len(pos_ids)"
+            for name, field in zip(BIN_SHARD_FIELDS, ids):
+                fields[name].append(field)
+            labels.append(int(line[3]))
+
+    if not os.path.isdir(bin_path):
+        os.makedirs(bin_path)
+    # offsets.npy is written last, the shard is incomplete without it
+    offsets_path = os.path.join(bin_path, "offsets.npy")
+    if os.path.exists(offsets_path):
+        os.remove(offsets_path)
+    lengths = [len(ids) for ids in fields["token_ids"]]
+    offsets = np.zeros(len(lengths) + 1, dtype="int64")
+    offsets[1:] = np.cumsum(lengths)
+    for name in BIN_SHARD_FIELDS:
+        data = np.concatenate(fields[name]) if lengths else np.zeros(
+            0, dtype="int32")
+        np.save(os.path.join(bin_path, name + ".npy"), data)
+    np.save(
+        os.path.join(bin_path, "labels.npy"), np.array(
+            labels, dtype="int64"))
+    np.save(offsets_path, offsets)
+    return len(labels)
+
 
 class DataReader(object):
     def __init__(self,
@@ -94,6 +150,32 @@ class DataReader(object):
         return [token_ids, sent_ids, pos_ids, label]
 
     def read_file(self, file):
+        if file.endswith(BIN_SHARD_SUFFIX):
+            return self.read_bin_file(file)
+        return self.read_gz_file(file)
+
+    def read_bin_file(self, file):
+        """ read a binary shard of convert_gz_shard with mmap, the samples are
+            the same as the ones read from its .gz shard
+        """
+        file_path = self.data_dir + "/" + file
+        offsets = np.load(os.path.join(file_path, "offsets.npy"))
+        labels = np.load(os.path.join(file_path, "labels.npy"))
+        token_ids, sent_ids, pos_ids = [
+            np.load(
+                os.path.join(file_path, name + ".npy"), mmap_mode="r")
+            for name in BIN_SHARD_FIELDS
+        ]
+        lengths = offsets[1:] - offsets[:-1]
+        for index in np.flatnonzero(lengths <= self.max_seq_len):
+            start, end = offsets[index], offsets[index + 1]
+            # batching works on lists and writes the masks into token_ids
+            yield [
+                token_ids[start:end].tolist(), sent_ids[start:end].tolist(),
+                pos_ids[start:end].tolist(), int(labels[index])
+            ]
+
+    def read_gz_file(self, file):
         assert file.endswith('.gz'), "[ERROR] %s is not a gzip file" % file
         file_path = self.data_dir + "/" + file
         with gzip.open(file_path, "rb") as f:
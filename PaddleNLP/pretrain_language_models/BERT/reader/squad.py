@@ -15,11 +15,19 @@
 """Run BERT on SQuAD 1.1 and SQuAD 2.0."""
 
 import io
+import os
+import gc
 import six
+import copy
 import math
 import json
+import time
 import random
+import pickle
+import hashlib
+import functools
 import collections
+import multiprocessing
 import tokenization
 from batching import prepare_batch_data
 
@@ -45,6 +53,9 @@ class SquadExample(object):
         self.start_position = start_position
         self.end_position = end_position
         self.is_impossible = is_impossible
+        # the features without unique_id and example_index, set by
+        # DataProcessor.convert_examples
+        self.features = None
 
     def __str__(self):
         return self.__repr__()
@@ -177,168 +188,120 @@ def read_squad_examples(input_file, is_training, version_2_with_negative=False):
     return examples
 
 
-def convert_examples_to_features(
-        examples,
-        tokenizer,
-        max_seq_length,
-        doc_stride,
-        max_query_length,
-        is_training,
-        #output_fn
-):
-    """Loads a data file into a list of `InputBatch`s."""
-
-    unique_id = 1000000000
-
-    for (example_index, example) in enumerate(examples):
-        query_tokens = tokenizer.tokenize(example.question_text)
-
-        if len(query_tokens) > max_query_length:
-            query_tokens = query_tokens[0:max_query_length]
-
-        tok_to_orig_index = []
-        orig_to_tok_index = []
-        all_doc_tokens = []
-        for (i, token) in enumerate(example.doc_tokens):
-            orig_to_tok_index.append(len(all_doc_tokens))
-            sub_tokens = tokenizer.tokenize(token)
-            for sub_token in sub_tokens:
-                tok_to_orig_index.append(i)
-                all_doc_tokens.append(sub_token)
-
-        tok_start_position = None
-        tok_end_position = None
-        if is_training and example.is_impossible:
-            tok_start_position = -1
-            tok_end_position = -1
-        if is_training and not example.is_impossible:
-            tok_start_position = orig_to_tok_index[example.start_position]
-            if example.end_position < len(example.doc_tokens) - 1:
-                tok_end_position = orig_to_tok_index[example.end_position +
-                                                     1] - 1
-            else:
-                tok_end_position = len(all_doc_tokens) - 1
-            (tok_start_position, tok_end_position) = _improve_answer_span(
-                all_doc_tokens, tok_start_position, tok_end_position, tokenizer,
-                example.orig_answer_text)
-
-        # The -3 accounts for [CLS], [SEP] and [SEP]
-        max_tokens_for_doc = max_seq_length - len(query_tokens) - 3
-
-        # We can have documents that are longer than the maximum sequence length.
-        # To deal with this we do a sliding window approach, where we take chunks
-        # of the up to our max length with a stride of `doc_stride`.
-        _DocSpan = collections.namedtuple(  # pylint: disable=invalid-name
-            "DocSpan", ["start", "length"])
-        doc_spans = []
-        start_offset = 0
-        while start_offset < len(all_doc_tokens):
-            length = len(all_doc_tokens) - start_offset
-            if length > max_tokens_for_doc:
-                length = max_tokens_for_doc
-            doc_spans.append(_DocSpan(start=start_offset, length=length))
-            if start_offset + length == len(all_doc_tokens):
-                break
-            start_offset += min(length, doc_stride)
-
-        for (doc_span_index, doc_span) in enumerate(doc_spans):
-            tokens = []
-            token_to_orig_map = {}
-            token_is_max_context = {}
-            segment_ids = []
-            tokens.append("[CLS]")
-            segment_ids.append(0)
-            for token in query_tokens:
-                tokens.append(token)
-                segment_ids.append(0)
-            tokens.append("[SEP]")
+def convert_example_to_features(example, tokenizer, max_seq_length, doc_stride,
+                                max_query_length, is_training):
+    """Converts a single example into a list of `InputFeatures`, the unique_id
+    and example_index of the features are left to the caller."""
+
+    query_tokens = tokenizer.tokenize(example.question_text)
+
+    if len(query_tokens) > max_query_length:
+        query_tokens = query_tokens[0:max_query_length]
+
+    tok_to_orig_index = []
+    orig_to_tok_index = []
+    all_doc_tokens = []
+    for (i, token) in enumerate(example.doc_tokens):
+        orig_to_tok_index.append(len(all_doc_tokens))
+        sub_tokens = tokenizer.tokenize(token)
+        for sub_token in sub_tokens:
+            tok_to_orig_index.append(i)
+            all_doc_tokens.append(sub_token)
+
+    tok_start_position = None
+    tok_end_position = None
+    if is_training and example.is_impossible:
+        tok_start_position = -1
+        tok_end_position = -1
+    if is_training and not example.is_impossible:
+        tok_start_position = orig_to_tok_index[example.start_position]
+        if example.end_position < len(example.doc_tokens) - 1:
+            tok_end_position = orig_to_tok_index[example.end_position + 1] - 1
+        else:
+            tok_end_position = len(all_doc_tokens) - 1
+        (tok_start_position, tok_end_position) = _improve_answer_span(
+            all_doc_tokens, tok_start_position, tok_end_position, tokenizer,
+            example.orig_answer_text)
+
+    # The -3 accounts for [CLS], [SEP] and [SEP]
+    max_tokens_for_doc = max_seq_length - len(query_tokens) - 3
+
+    # We can have documents that are longer than the maximum sequence length.
+    # To deal with this we do a sliding window approach, where we take chunks
+    # of the up to our max length with a stride of `doc_stride`.
+    _DocSpan = collections.namedtuple(  # pylint: disable=invalid-name
+        "DocSpan", ["start", "length"])
+    doc_spans = []
+    start_offset = 0
+    while start_offset < len(all_doc_tokens):
+        length = len(all_doc_tokens) - start_offset
+        if length > max_tokens_for_doc:
+            length = max_tokens_for_doc
+        doc_spans.append(_DocSpan(start=start_offset, length=length))
+        if start_offset + length == len(all_doc_tokens):
+            break
+        start_offset += min(length, doc_stride)
+
+    features = []
+    for (doc_span_index, doc_span) in enumerate(doc_spans):
+        tokens = []
+        token_to_orig_map = {}
+        token_is_max_context = {}
+        segment_ids = []
+        tokens.append("[CLS]")
+        segment_ids.append(0)
+        for token in query_tokens:
+            tokens.append(token)
             segment_ids.append(0)
-
-            for i in range(doc_span.length):
-                split_token_index = doc_span.start + i
-                token_to_orig_map[len(tokens)] = tok_to_orig_index[
-                    split_token_index]
-
-                is_max_context = _check_is_max_context(
-                    doc_spans, doc_span_index, split_token_index)
-                token_is_max_context[len(tokens)] = is_max_context
-                tokens.append(all_doc_tokens[split_token_index])
-                segment_ids.append(1)
-            tokens.append("[SEP]")
+        tokens.append("[SEP]")
+        segment_ids.append(0)
+
+        for i in range(doc_span.length):
+            split_token_index = doc_span.start + i
+            token_to_orig_map[len(tokens)] = tok_to_orig_index[
+                split_token_index]
+
+            is_max_context = _check_is_max_context(doc_spans, doc_span_index,
+                                                   split_token_index)
+            token_is_max_context[len(tokens)] = is_max_context
+            tokens.append(all_doc_tokens[split_token_index])
             segment_ids.append(1)
+        tokens.append("[SEP]")
+        segment_ids.append(1)
 
-            input_ids = tokenizer.convert_tokens_to_ids(tokens)
-
-            # The mask has 1 for real tokens and 0 for padding tokens. Only real
-            # tokens are attended to.
-            input_mask = [1] * len(input_ids)
-
-            # Zero-pad up to the sequence length.
-            #while len(input_ids) < max_seq_length:
-            #  input_ids.append(0)
-            #  input_mask.append(0)
-            #  segment_ids.append(0)
-
-            #assert len(input_ids) == max_seq_length
-            #assert len(input_mask) == max_seq_length
-            #assert len(segment_ids) == max_seq_length
-
-            start_position = None
-            end_position = None
-            if is_training and not example.is_impossible:
-                # For training, if our document chunk does not contain an annotation
-                # we throw it out, since there is nothing to predict.
-                doc_start = doc_span.start
-                doc_end = doc_span.start + doc_span.length - 1
-                out_of_span = False
-                if not (tok_start_position >= doc_start and
-                        tok_end_position <= doc_end):
-                    out_of_span = True
-                if out_of_span:
-                    start_position = 0
-                    end_position = 0
-                else:
-                    doc_offset = len(query_tokens) + 2
-                    start_position = tok_start_position - doc_start + doc_offset
-                    end_position = tok_end_position - doc_start + doc_offset
+        input_ids = tokenizer.convert_tokens_to_ids(tokens)
 
-            if is_training and example.is_impossible:
+        # The mask has 1 for real tokens and 0 for padding tokens. Only real
+        # tokens are attended to.
+        input_mask = [1] * len(input_ids)
+
+        start_position = None
+        end_position = None
+        if is_training and not example.is_impossible:
+            # For training, if our document chunk does not contain an annotation
+            # we throw it out, since there is nothing to predict.
+            doc_start = doc_span.start
+            doc_end = doc_span.start + doc_span.length - 1
+            out_of_span = False
+            if not (tok_start_position >= doc_start and
+                    tok_end_position <= doc_end):
+                out_of_span = True
+            if out_of_span:
                 start_position = 0
                 end_position = 0
+            else:
+                doc_offset = len(query_tokens) + 2
+                start_position = tok_start_position - doc_start + doc_offset
+                end_position = tok_end_position - doc_start + doc_offset
 
-            if example_index < 3:
-                print(u"*** Example ***")
-                print(u"unique_id: %s" % (unique_id))
-                print(u"example_index: %s" % (example_index))
-                print(u"doc_span_index: %s" % (doc_span_index))
-                print(u"tokens: %s" % " ".join(
-                    [tokenization.printable_text(x) for x in tokens]))
-                print(u"token_to_orig_map: %s" % " ".join([
-                    "%d:%d" % (x, y)
-                    for (x, y) in six.iteritems(token_to_orig_map)
-                ]))
-                print(u"token_is_max_context: %s" % " ".join([
-                    "%d:%s" % (x, y)
-                    for (x, y) in six.iteritems(token_is_max_context)
-                ]))
-                print(u"input_ids: %s" % " ".join([str(x) for x in input_ids]))
-                print(u"input_mask: %s" %
-                      " ".join([str(x) for x in input_mask]))
-                print(u"segment_ids: %s" %
-                      " ".join([str(x) for x in segment_ids]))
-                if is_training and example.is_impossible:
-                    print(u"impossible example")
-                if is_training and not example.is_impossible:
-                    answer_text = " ".join(tokens[start_position:(end_position +
-                                                                  1)])
-                    print(u"start_position: %d" % (start_position))
-                    print(u"end_position: %d" % (end_position))
-                    print(u"answer: %s" %
-                          (tokenization.printable_text(answer_text)))
-
-            feature = InputFeatures(
-                unique_id=unique_id,
-                example_index=example_index,
+        if is_training and example.is_impossible:
+            start_position = 0
+            end_position = 0
+
+        features.append(
+            InputFeatures(
+                unique_id=None,
+                example_index=None,
                 doc_span_index=doc_span_index,
                 tokens=tokens,
                 token_to_orig_map=token_to_orig_map,
@@ -348,13 +311,80 @@ def convert_examples_to_features(
                 segment_ids=segment_ids,
                 start_position=start_position,
                 end_position=end_position,
-                is_impossible=example.is_impossible)
+                is_impossible=example.is_impossible))
+
+    return features
+
+
+def convert_examples_to_features(
+        examples,
+        tokenizer,
+        max_seq_length,
+        doc_stride,
+        max_query_length,
+        is_training,
+        #output_fn
+):
+    """Loads a data file into a list of `InputBatch`s."""
+
+    unique_id = 1000000000
+
+    for (example_index, example) in enumerate(examples):
+        for feature in convert_example_to_features(
+                example, tokenizer, max_seq_length, doc_stride,
+                max_query_length, is_training):
+            feature.unique_id = unique_id
+            feature.example_index = example_index
+
+            if example_index < 3:
+                print_feature(feature, example, is_training)
 
             unique_id += 1
 
             yield feature
 
 
+def print_feature(feature, example, is_training):
+    print(u"*** Example ***")
+    print(u"unique_id: %s" % (feature.unique_id))
+    print(u"example_index: %s" % (feature.example_index))
+    print(u"doc_span_index: %s" % (feature.doc_span_index))
+    print(u"tokens: %s" % " ".join(
+        [tokenization.printable_text(x) for x in feature.tokens]))
+    print(u"token_to_orig_map: %s" % " ".join([
+        "%d:%d" % (x, y) for (x, y) in six.iteritems(feature.token_to_orig_map)
+    ]))
+    print(u"token_is_max_context: %s" % " ".join([
+        "%d:%s" % (x, y)
+        for (x, y) in six.iteritems(feature.token_is_max_context)
+    ]))
+    print(u"input_ids: %s" % " ".join([str(x) for x in feature.input_ids]))
+    print(u"input_mask: %s" % " ".join([str(x) for x in feature.input_mask]))
+    print(u"segment_ids: %s" % " ".join([str(x) for x in feature.segment_ids]))
+    if is_training and example.is_impossible:
+        print(u"impossible example")
+    if is_training and not example.is_impossible:
+        answer_text = " ".join(feature.tokens[feature.start_position:(
+            feature.end_position + 1)])
+        print(u"start_position: %d" % (feature.start_position))
+        print(u"end_position: %d" % (feature.end_position))
+        print(u"answer: %s" % (tokenization.printable_text(answer_text)))
+
+
+# the conversion of the examples in the processes of
+# DataProcessor.convert_examples, set by _init_convert_process
+_process_converter = None
+
+
+def _init_convert_process(converter):
+    global _process_converter
+    _process_converter = converter
+
+
+def _convert_example_shard(examples):
+    return [_process_converter(example) for example in examples]
+
+
 def _improve_answer_span(doc_tokens, input_start, input_end, tokenizer,
                          orig_answer_text):
     """Returns tokenized answer spans that better match the annotated answer."""
@@ -431,14 +461,27 @@ def _check_is_max_context(doc_spans, cur_span_index, position):
 
 
 class DataProcessor(object):
-    def __init__(self, vocab_path, do_lower_case, max_seq_length, in_tokens,
-                 doc_stride, max_query_length):
+    def __init__(self,
+                 vocab_path,
+                 do_lower_case,
+                 max_seq_length,
+                 in_tokens,
+                 doc_stride,
+                 max_query_length,
+                 num_convert_processes=1,
+                 use_feature_cache=True,
+                 feature_cache_dir=None):
         self._tokenizer = tokenization.FullTokenizer(
             vocab_file=vocab_path, do_lower_case=do_lower_case)
+        self._vocab_path = vocab_path
+        self._do_lower_case = do_lower_case
         self._max_seq_length = max_seq_length
         self._doc_stride = doc_stride
         self._max_query_length = max_query_length
         self._in_tokens = in_tokens
+        self._num_convert_processes = num_convert_processes
+        self._use_feature_cache = use_feature_cache
+        self._feature_cache_dir = feature_cache_dir
 
         self.vocab = self._tokenizer.vocab
         self.vocab_size = len(self.vocab)
@@ -467,8 +510,94 @@ class DataProcessor(object):
             input_file=data_path,
             is_training=is_training,
             version_2_with_negative=version_2_with_negative)
+        cache_path = None
+        if self._use_feature_cache:
+            cache_path = self.get_feature_cache_path(
+                data_path, is_training, version_2_with_negative)
+        self.convert_examples(examples, is_training, cache_path)
         return examples
 
+    def get_feature_cache_path(self, data_path, is_training,
+                               version_2_with_negative):
+        """The cache file of the features of data_path, keyed by the data
+        file, the vocab and the conversion args."""
+        key = hashlib.md5()
+        for path in [data_path, self._vocab_path]:
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    key.update(chunk)
+        key.update(
+            repr((self._do_lower_case, self._max_seq_length, self._doc_stride,
+                  self._max_query_length, is_training,
+                  version_2_with_negative)).encode("utf8"))
+        cache_dir = self._feature_cache_dir
+        if cache_dir is None:
+            cache_dir = os.path.dirname(os.path.abspath(data_path))
+        return os.path.join(cache_dir, "%s.features.%s.pkl" %
+                            (os.path.basename(data_path), key.hexdigest()))
+
+    def convert_examples(self, examples, is_training, cache_path=None):
+        """Sets the features of the examples, loaded from cache_path if it
+        exists, else converted in num_convert_processes processes and saved
+        to cache_path."""
+        start = time.time()
+        if cache_path is not None and os.path.isfile(cache_path):
+            # the collections of gc slow down loading the many feature objects
+            gc.disable()
+            try:
+                with open(cache_path, "rb") as f:
+                    all_features = pickle.load(f)
+            finally:
+                gc.enable()
+            print(u"Loaded the features of %d examples from %s in %.1f s" %
+                  (len(examples), cache_path, time.time() - start))
+        else:
+            converter = functools.partial(
+                convert_example_to_features,
+                tokenizer=self._tokenizer,
+                max_seq_length=self._max_seq_length,
+                doc_stride=self._doc_stride,
+                max_query_length=self._max_query_length,
+                is_training=is_training)
+            if self._num_convert_processes > 1:
+                # a few shards per process to even out the example lengths
+                shard_size = int(
+                    math.ceil(
+                        len(examples) / float(self._num_convert_processes *
+                                              4)))
+                shards = [
+                    examples[i:i + shard_size]
+                    for i in range(0, len(examples), shard_size)
+                ]
+                pool = multiprocessing.Pool(
+                    self._num_convert_processes,
+                    initializer=_init_convert_process,
+                    initargs=(converter, ))
+                try:
+                    all_features = [
+                        features
+                        for shard in pool.map(_convert_example_shard, shards)
+                        for features in shard
+                    ]
+                finally:
+                    pool.close()
+                    pool.join()
+            else:
+                all_features = [converter(example) for example in examples]
+            print(u"Converted %d examples to %d features in %.1f s" %
+                  (len(examples), sum(len(f) for f in all_features),
+                   time.time() - start))
+            if cache_path is not None:
+                # written to a temporary file first, a cache file is complete
+                tmp_path = "%s.%d.tmp" % (cache_path, os.getpid())
+                with open(tmp_path, "wb") as f:
+                    pickle.dump(all_features, f, pickle.HIGHEST_PROTOCOL)
+                os.rename(tmp_path, cache_path)
+
+        assert len(all_features) == len(examples)
+        for example, features in zip(examples, all_features):
+            example.features = features
+
     def get_num_examples(self, phase):
         if phase not in ['train', 'predict']:
             raise ValueError(
@@ -476,14 +605,22 @@ class DataProcessor(object):
         return self.num_examples[phase]
 
     def get_features(self, examples, is_training):
-        features = convert_examples_to_features(
-            examples=examples,
-            tokenizer=self._tokenizer,
-            max_seq_length=self._max_seq_length,
-            doc_stride=self._doc_stride,
-            max_query_length=self._max_query_length,
-            is_training=is_training)
-        return features
+        """The features of the examples in their current order, numbered like
+        convert_examples_to_features."""
+        unconverted = [
+            example for example in examples if example.features is None
+        ]
+        if unconverted:
+            self.convert_examples(unconverted, is_training)
+
+        unique_id = 1000000000
+        for (example_index, example) in enumerate(examples):
+            for feature in example.features:
+                feature = copy.copy(feature)
+                feature.unique_id = unique_id
+                feature.example_index = example_index
+                unique_id += 1
+                yield feature
 
     def data_generator(self,
                        data_path,
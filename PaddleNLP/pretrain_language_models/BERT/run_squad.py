@@ -95,6 +95,12 @@ data_g.add_arg("n_best_size",               int,   20,
 data_g.add_arg("null_score_diff_threshold", float, 0.0,
                "If null_score - best_non_null is greater than the threshold predict null.")
 data_g.add_arg("random_seed",               int,   0,      "Random seed.")
+data_g.add_arg("num_convert_processes",     int,   1,
+               "Number of the processes converting the examples to features.")
+data_g.add_arg("use_feature_cache",         bool,  True,
+               "If set, the converted features are saved to a cache file and loaded from it by the next runs.")
+data_g.add_arg("feature_cache_dir",         str,   None,
+               "Directory of the feature cache files, default the directory of the SQuAD json.")
 
 run_type_g = ArgumentGroup(parser, "run_type", "running type options.")
 run_type_g.add_arg("use_cuda",                     bool,   True,  "If set, use GPU for training.")
@@ -247,7 +253,10 @@ def train(args):
         max_seq_length=args.max_seq_len,
         in_tokens=args.in_tokens,
         doc_stride=args.doc_stride,
-        max_query_length=args.max_query_length)
+        max_query_length=args.max_query_length,
+        num_convert_processes=args.num_convert_processes,
+        use_feature_cache=args.use_feature_cache,
+        feature_cache_dir=args.feature_cache_dir)
 
     startup_prog = fluid.Program()
     if args.random_seed is not None:
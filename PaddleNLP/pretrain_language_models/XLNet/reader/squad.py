@@ -1,12 +1,19 @@
 # coding=utf-8
 """This file is adapted from https://github.com/zihangdai/xlnet"""
 import io
+import os
 import six
 import sys
+import copy
 import math
 import json
+import time
 import random
+import pickle
+import hashlib
+import functools
 import collections
+import multiprocessing
 import gc
 import numpy as np
 
@@ -43,6 +50,9 @@ class SquadExample(object):
         self.orig_answer_text = orig_answer_text
         self.start_position = start_position
         self.is_impossible = is_impossible
+        # the features without unique_id and example_index, set by
+        # DataProcessor.convert_examples
+        self.features = None
 
     def __str__(self):
         return self.__repr__()
@@ -175,303 +185,251 @@ def _convert_index(index, pos, M=None, is_start=True):
             return index[front]
 
 
-def convert_examples_to_features(examples, sp_model, max_seq_length, doc_stride,
-                                 max_query_length, is_training, uncased):
-    """Loads a data file into a list of `InputBatch`s."""
-
-    cnt_pos, cnt_neg = 0, 0
-    unique_id = 1000000000
-    max_N, max_M = 1024, 1024
-    f = np.zeros((max_N, max_M), dtype=np.float32)
-
-    for (example_index, example) in enumerate(examples):
-
-        if example_index % 100 == 0:
-            print('Converting {}/{} pos {} neg {}'.format(
-                example_index, len(examples), cnt_pos, cnt_neg))
-
-        query_tokens = encode_ids(
-            sp_model, preprocess_text(
-                example.question_text, lower=uncased))
-
-        if len(query_tokens) > max_query_length:
-            query_tokens = query_tokens[0:max_query_length]
-
-        paragraph_text = example.paragraph_text
-        para_tokens = encode_pieces(
-            sp_model, preprocess_text(
-                example.paragraph_text, lower=uncased))
-
-        chartok_to_tok_index = []
-        tok_start_to_chartok_index = []
-        tok_end_to_chartok_index = []
-        char_cnt = 0
-        for i, token in enumerate(para_tokens):
-            chartok_to_tok_index.extend([i] * len(token))
-            tok_start_to_chartok_index.append(char_cnt)
-            char_cnt += len(token)
-            tok_end_to_chartok_index.append(char_cnt - 1)
-
-        tok_cat_text = ''.join(para_tokens).replace(SPIECE_UNDERLINE, ' ')
-        N, M = len(paragraph_text), len(tok_cat_text)
-
-        if N > max_N or M > max_M:
-            max_N = max(N, max_N)
-            max_M = max(M, max_M)
-            f = np.zeros((max_N, max_M), dtype=np.float32)
-            gc.collect()
-
-        g = {}
-
-        def _lcs_match(max_dist):
-            f.fill(0)
-            g.clear()
-
-            ### longest common sub sequence
-            # f[i, j] = max(f[i - 1, j], f[i, j - 1], f[i - 1, j - 1] + match(i, j))
-            for i in range(N):
-
-                # note(zhiliny):
-                # unlike standard LCS, this is specifically optimized for the setting
-                # because the mismatch between sentence pieces and original text will
-                # be small
-                for j in range(i - max_dist, i + max_dist):
-                    if j >= M or j < 0: continue
-
-                    if i > 0:
-                        g[(i, j)] = 0
-                        f[i, j] = f[i - 1, j]
-
-                    if j > 0 and f[i, j - 1] > f[i, j]:
-                        g[(i, j)] = 1
-                        f[i, j] = f[i, j - 1]
-
-                    f_prev = f[i - 1, j - 1] if i > 0 and j > 0 else 0
-                    if (preprocess_text(
-                            paragraph_text[i], lower=uncased,
-                            remove_space=False) == tok_cat_text[j] and
-                            f_prev + 1 > f[i, j]):
-                        g[(i, j)] = 2
-                        f[i, j] = f_prev + 1
-
-        max_dist = abs(N - M) + 5
-        for _ in range(2):
-            _lcs_match(max_dist)
-            if f[N - 1, M - 1] > 0.8 * N: break
-            max_dist *= 2
-
-        orig_to_chartok_index = [None] * N
-        chartok_to_orig_index = [None] * M
-        i, j = N - 1, M - 1
-        while i >= 0 and j >= 0:
-            if (i, j) not in g: break
-            if g[(i, j)] == 2:
-                orig_to_chartok_index[i] = j
-                chartok_to_orig_index[j] = i
-                i, j = i - 1, j - 1
-            elif g[(i, j)] == 1:
-                j = j - 1
-            else:
-                i = i - 1
-
-        if all(v is None
-               for v in orig_to_chartok_index) or f[N - 1, M - 1] < 0.8 * N:
-            print('MISMATCH DETECTED!')
-            continue
-
-        tok_start_to_orig_index = []
-        tok_end_to_orig_index = []
-        for i in range(len(para_tokens)):
-            start_chartok_pos = tok_start_to_chartok_index[i]
-            end_chartok_pos = tok_end_to_chartok_index[i]
-            start_orig_pos = _convert_index(
-                chartok_to_orig_index, start_chartok_pos, N, is_start=True)
-            end_orig_pos = _convert_index(
-                chartok_to_orig_index, end_chartok_pos, N, is_start=False)
-
-            tok_start_to_orig_index.append(start_orig_pos)
-            tok_end_to_orig_index.append(end_orig_pos)
-
-        if not is_training:
-            tok_start_position = tok_end_position = None
-
-        if is_training and example.is_impossible:
-            tok_start_position = -1
-            tok_end_position = -1
-
-        if is_training and not example.is_impossible:
-            start_position = example.start_position
-            end_position = start_position + len(example.orig_answer_text) - 1
-
-            start_chartok_pos = _convert_index(
-                orig_to_chartok_index, start_position, is_start=True)
-            tok_start_position = chartok_to_tok_index[start_chartok_pos]
-
-            end_chartok_pos = _convert_index(
-                orig_to_chartok_index, end_position, is_start=False)
-            tok_end_position = chartok_to_tok_index[end_chartok_pos]
-            assert tok_start_position <= tok_end_position
-
-        def _piece_to_id(x):
-            if six.PY2 and isinstance(x, unicode):
-                x = x.encode('utf-8')
-            return sp_model.PieceToId(x)
-
-        all_doc_tokens = list(map(_piece_to_id, para_tokens))
-
-        # The -3 accounts for [CLS], [SEP] and [SEP]
-        max_tokens_for_doc = max_seq_length - len(query_tokens) - 3
-
-        # We can have documents that are longer than the maximum sequence length.
-        # To deal with this we do a sliding window approach, where we take chunks
-        # of the up to our max length with a stride of `doc_stride`.
-        _DocSpan = collections.namedtuple(  # pylint: disable=invalid-name
-            "DocSpan", ["start", "length"])
-        doc_spans = []
-        start_offset = 0
-        while start_offset < len(all_doc_tokens):
-            length = len(all_doc_tokens) - start_offset
-            if length > max_tokens_for_doc:
-                length = max_tokens_for_doc
-            doc_spans.append(_DocSpan(start=start_offset, length=length))
-            if start_offset + length == len(all_doc_tokens):
-                break
-            start_offset += min(length, doc_stride)
-
-        for (doc_span_index, doc_span) in enumerate(doc_spans):
-            tokens = []
-            token_is_max_context = {}
-            segment_ids = []
-            p_mask = []
-
-            cur_tok_start_to_orig_index = []
-            cur_tok_end_to_orig_index = []
-
-            for i in range(doc_span.length):
-                split_token_index = doc_span.start + i
+def convert_example_to_features(example, sp_model, max_seq_length, doc_stride,
+                                max_query_length, is_training, uncased):
+    """Converts a single example into a list of `InputFeatures`, the unique_id
+    and example_index of the features are left to the caller."""
+
+    query_tokens = encode_ids(
+        sp_model, preprocess_text(
+            example.question_text, lower=uncased))
+
+    if len(query_tokens) > max_query_length:
+        query_tokens = query_tokens[0:max_query_length]
+
+    paragraph_text = example.paragraph_text
+    para_tokens = encode_pieces(
+        sp_model, preprocess_text(
+            example.paragraph_text, lower=uncased))
+
+    chartok_to_tok_index = []
+    tok_start_to_chartok_index = []
+    tok_end_to_chartok_index = []
+    char_cnt = 0
+    for i, token in enumerate(para_tokens):
+        chartok_to_tok_index.extend([i] * len(token))
+        tok_start_to_chartok_index.append(char_cnt)
+        char_cnt += len(token)
+        tok_end_to_chartok_index.append(char_cnt - 1)
+
+    tok_cat_text = ''.join(para_tokens).replace(SPIECE_UNDERLINE, ' ')
+    N, M = len(paragraph_text), len(tok_cat_text)
+
+    f = np.zeros((max(N, 1), max(M, 1)), dtype=np.float32)
+
+    g = {}
+
+    def _lcs_match(max_dist):
+        f.fill(0)
+        g.clear()
+
+        ### longest common sub sequence
+        # f[i, j] = max(f[i - 1, j], f[i, j - 1], f[i - 1, j - 1] + match(i, j))
+        for i in range(N):
+
+            # note(zhiliny):
+            # unlike standard LCS, this is specifically optimized for the setting
+            # because the mismatch between sentence pieces and original text will
+            # be small
+            for j in range(i - max_dist, i + max_dist):
+                if j >= M or j < 0: continue
+
+                if i > 0:
+                    g[(i, j)] = 0
+                    f[i, j] = f[i - 1, j]
+
+                if j > 0 and f[i, j - 1] > f[i, j]:
+                    g[(i, j)] = 1
+                    f[i, j] = f[i, j - 1]
+
+                f_prev = f[i - 1, j - 1] if i > 0 and j > 0 else 0
+                if (preprocess_text(
+                        paragraph_text[i], lower=uncased,
+                        remove_space=False) == tok_cat_text[j] and
+                        f_prev + 1 > f[i, j]):
+                    g[(i, j)] = 2
+                    f[i, j] = f_prev + 1
+
+    max_dist = abs(N - M) + 5
+    for _ in range(2):
+        _lcs_match(max_dist)
+        if f[N - 1, M - 1] > 0.8 * N: break
+        max_dist *= 2
+
+    orig_to_chartok_index = [None] * N
+    chartok_to_orig_index = [None] * M
+    i, j = N - 1, M - 1
+    while i >= 0 and j >= 0:
+        if (i, j) not in g: break
+        if g[(i, j)] == 2:
+            orig_to_chartok_index[i] = j
+            chartok_to_orig_index[j] = i
+            i, j = i - 1, j - 1
+        elif g[(i, j)] == 1:
+            j = j - 1
+        else:
+            i = i - 1
 
-                cur_tok_start_to_orig_index.append(tok_start_to_orig_index[
-                    split_token_index])
-                cur_tok_end_to_orig_index.append(tok_end_to_orig_index[
-                    split_token_index])
+    if all(v is None
+           for v in orig_to_chartok_index) or f[N - 1, M - 1] < 0.8 * N:
+        print('MISMATCH DETECTED!')
+        return []
 
-                is_max_context = _check_is_max_context(
-                    doc_spans, doc_span_index, split_token_index)
-                token_is_max_context[len(tokens)] = is_max_context
-                tokens.append(all_doc_tokens[split_token_index])
-                segment_ids.append(SEG_ID_P)
-                p_mask.append(0)
+    tok_start_to_orig_index = []
+    tok_end_to_orig_index = []
+    for i in range(len(para_tokens)):
+        start_chartok_pos = tok_start_to_chartok_index[i]
+        end_chartok_pos = tok_end_to_chartok_index[i]
+        start_orig_pos = _convert_index(
+            chartok_to_orig_index, start_chartok_pos, N, is_start=True)
+        end_orig_pos = _convert_index(
+            chartok_to_orig_index, end_chartok_pos, N, is_start=False)
+
+        tok_start_to_orig_index.append(start_orig_pos)
+        tok_end_to_orig_index.append(end_orig_pos)
+
+    if not is_training:
+        tok_start_position = tok_end_position = None
+
+    if is_training and example.is_impossible:
+        tok_start_position = -1
+        tok_end_position = -1
+
+    if is_training and not example.is_impossible:
+        start_position = example.start_position
+        end_position = start_position + len(example.orig_answer_text) - 1
+
+        start_chartok_pos = _convert_index(
+            orig_to_chartok_index, start_position, is_start=True)
+        tok_start_position = chartok_to_tok_index[start_chartok_pos]
+
+        end_chartok_pos = _convert_index(
+            orig_to_chartok_index, end_position, is_start=False)
+        tok_end_position = chartok_to_tok_index[end_chartok_pos]
+        assert tok_start_position <= tok_end_position
+
+    def _piece_to_id(x):
+        if six.PY2 and isinstance(x, unicode):
+            x = x.encode('utf-8')
+        return sp_model.PieceToId(x)
+
+    all_doc_tokens = list(map(_piece_to_id, para_tokens))
+
+    # The -3 accounts for [CLS], [SEP] and [SEP]
+    max_tokens_for_doc = max_seq_length - len(query_tokens) - 3
+
+    # We can have documents that are longer than the maximum sequence length.
+    # To deal with this we do a sliding window approach, where we take chunks
+    # of the up to our max length with a stride of `doc_stride`.
+    _DocSpan = collections.namedtuple(  # pylint: disable=invalid-name
+        "DocSpan", ["start", "length"])
+    doc_spans = []
+    start_offset = 0
+    while start_offset < len(all_doc_tokens):
+        length = len(all_doc_tokens) - start_offset
+        if length > max_tokens_for_doc:
+            length = max_tokens_for_doc
+        doc_spans.append(_DocSpan(start=start_offset, length=length))
+        if start_offset + length == len(all_doc_tokens):
+            break
+        start_offset += min(length, doc_stride)
+
+    features = []
+    for (doc_span_index, doc_span) in enumerate(doc_spans):
+        tokens = []
+        token_is_max_context = {}
+        segment_ids = []
+        p_mask = []
+
+        cur_tok_start_to_orig_index = []
+        cur_tok_end_to_orig_index = []
+
+        for i in range(doc_span.length):
+            split_token_index = doc_span.start + i
+
+            cur_tok_start_to_orig_index.append(tok_start_to_orig_index[
+                split_token_index])
+            cur_tok_end_to_orig_index.append(tok_end_to_orig_index[
+                split_token_index])
+
+            is_max_context = _check_is_max_context(
+                doc_spans, doc_span_index, split_token_index)
+            token_is_max_context[len(tokens)] = is_max_context
+            tokens.append(all_doc_tokens[split_token_index])
+            segment_ids.append(SEG_ID_P)
+            p_mask.append(0)
 
-            paragraph_len = len(tokens)
+        paragraph_len = len(tokens)
 
-            tokens.append(SEP_ID)
-            segment_ids.append(SEG_ID_P)
-            p_mask.append(1)
+        tokens.append(SEP_ID)
+        segment_ids.append(SEG_ID_P)
+        p_mask.append(1)
 
-            # note(zhiliny): we put P before Q
-            # because during pretraining, B is always shorter than A
-            for token in query_tokens:
-                tokens.append(token)
-                segment_ids.append(SEG_ID_Q)
-                p_mask.append(1)
-            tokens.append(SEP_ID)
+        # note(zhiliny): we put P before Q
+        # because during pretraining, B is always shorter than A
+        for token in query_tokens:
+            tokens.append(token)
             segment_ids.append(SEG_ID_Q)
             p_mask.append(1)
+        tokens.append(SEP_ID)
+        segment_ids.append(SEG_ID_Q)
+        p_mask.append(1)
+
+        cls_index = len(segment_ids)
+        tokens.append(CLS_ID)
+        segment_ids.append(SEG_ID_CLS)
+        p_mask.append(0)
+
+        input_ids = tokens
+
+        # The mask has 0 for real tokens and 1 for padding tokens. Only real
+        # tokens are attended to.
+        input_mask = [0] * len(input_ids)
+
+        # Zero-pad up to the sequence length.
+        while len(input_ids) < max_seq_length:
+            input_ids.append(0)
+            input_mask.append(1)
+            segment_ids.append(SEG_ID_PAD)
+            p_mask.append(1)
 
-            cls_index = len(segment_ids)
-            tokens.append(CLS_ID)
-            segment_ids.append(SEG_ID_CLS)
-            p_mask.append(0)
-
-            input_ids = tokens
-
-            # The mask has 0 for real tokens and 1 for padding tokens. Only real
-            # tokens are attended to.
-            input_mask = [0] * len(input_ids)
-
-            # Zero-pad up to the sequence length.
-            while len(input_ids) < max_seq_length:
-                input_ids.append(0)
-                input_mask.append(1)
-                segment_ids.append(SEG_ID_PAD)
-                p_mask.append(1)
-
-            assert len(input_ids) == max_seq_length
-            assert len(input_mask) == max_seq_length
-            assert len(segment_ids) == max_seq_length
-            assert len(p_mask) == max_seq_length
-
-            span_is_impossible = example.is_impossible
-            start_position = None
-            end_position = None
-            if is_training and not span_is_impossible:
-                # For training, if our document chunk does not contain an annotation
-                # we throw it out, since there is nothing to predict.
-                doc_start = doc_span.start
-                doc_end = doc_span.start + doc_span.length - 1
-                out_of_span = False
-                if not (tok_start_position >= doc_start and
-                        tok_end_position <= doc_end):
-                    out_of_span = True
-                if out_of_span:
-                    # continue
-                    start_position = 0
-                    end_position = 0
-                    span_is_impossible = True
-                else:
-                    # note(zhiliny): we put P before Q, so doc_offset should be zero.
-                    # doc_offset = len(query_tokens) + 2
-                    doc_offset = 0
-                    start_position = tok_start_position - doc_start + doc_offset
-                    end_position = tok_end_position - doc_start + doc_offset
-
-            if is_training and span_is_impossible:
-                start_position = cls_index
-                end_position = cls_index
-
-            if example_index < 0:
-                print("*** Example ***")
-                print("unique_id: %s" % (unique_id))
-                print("example_index: %s" % (example_index))
-                print("doc_span_index: %s" % (doc_span_index))
-                print("tok_start_to_orig_index: %s" %
-                      " ".join([str(x) for x in cur_tok_start_to_orig_index]))
-                print("tok_end_to_orig_index: %s" %
-                      " ".join([str(x) for x in cur_tok_end_to_orig_index]))
-                print("token_is_max_context: %s" % " ".join([
-                    "%d:%s" % (x, y)
-                    for (x, y) in six.iteritems(token_is_max_context)
-                ]))
-                print("input_ids: %s" % " ".join([str(x) for x in input_ids]))
-                print("input_mask: %s" % " ".join([str(x) for x in input_mask]))
-                print("segment_ids: %s" %
-                      " ".join([str(x) for x in segment_ids]))
-
-                if is_training and span_is_impossible:
-                    print("impossible example span")
-
-                if is_training and not span_is_impossible:
-                    pieces = [
-                        sp_model.IdToPiece(token)
-                        for token in tokens[start_position:(end_position + 1)]
-                    ]
-                    answer_text = sp_model.DecodePieces(pieces)
-                    print("start_position: %d" % (start_position))
-                    print("end_position: %d" % (end_position))
-                    print("answer: %s" % (printable_text(answer_text)))
-
-                    # note(zhiliny): With multi processing,
-                    # the example_index is actually the index within the current process
-                    # therefore we use example_index=None to avoid being used in the future.
-                    # The current code does not use example_index of training data.
-            if is_training:
-                feat_example_index = None
+        assert len(input_ids) == max_seq_length
+        assert len(input_mask) == max_seq_length
+        assert len(segment_ids) == max_seq_length
+        assert len(p_mask) == max_seq_length
+
+        span_is_impossible = example.is_impossible
+        start_position = None
+        end_position = None
+        if is_training and not span_is_impossible:
+            # For training, if our document chunk does not contain an annotation
+            # we throw it out, since there is nothing to predict.
+            doc_start = doc_span.start
+            doc_end = doc_span.start + doc_span.length - 1
+            out_of_span = False
+            if not (tok_start_position >= doc_start and
+                    tok_end_position <= doc_end):
+                out_of_span = True
+            if out_of_span:
+                # continue
+                start_position = 0
+                end_position = 0
+                span_is_impossible = True
             else:
-                feat_example_index = example_index
-
-            feature = InputFeatures(
-                unique_id=unique_id,
-                example_index=feat_example_index,
+                # note(zhiliny): we put P before Q, so doc_offset should be zero.
+                # doc_offset = len(query_tokens) + 2
+                doc_offset = 0
+                start_position = tok_start_position - doc_start + doc_offset
+                end_position = tok_end_position - doc_start + doc_offset
+
+        if is_training and span_is_impossible:
+            start_position = cls_index
+            end_position = cls_index
+
+        features.append(
+                InputFeatures(
+                unique_id=None,
+                example_index=None,
                 doc_span_index=doc_span_index,
                 tok_start_to_orig_index=cur_tok_start_to_orig_index,
                 tok_end_to_orig_index=cur_tok_end_to_orig_index,
@@ -484,10 +442,35 @@ def convert_examples_to_features(examples, sp_model, max_seq_length, doc_stride,
                 cls_index=cls_index,
                 start_position=start_position,
                 end_position=end_position,
-                is_impossible=span_is_impossible)
+                is_impossible=span_is_impossible))
+
+    return features
+
+
+def convert_examples_to_features(examples, sp_model, max_seq_length, doc_stride,
+                                 max_query_length, is_training, uncased):
+    """Loads a data file into a list of `InputBatch`s."""
+
+    cnt_pos, cnt_neg = 0, 0
+    unique_id = 1000000000
+
+    for (example_index, example) in enumerate(examples):
+
+        if example_index % 100 == 0:
+            print('Converting {}/{} pos {} neg {}'.format(
+                example_index, len(examples), cnt_pos, cnt_neg))
+
+        for feature in convert_example_to_features(
+                example, sp_model, max_seq_length, doc_stride,
+                max_query_length, is_training, uncased):
+            feature.unique_id = unique_id
+            # note(zhiliny): The current code does not use example_index of
+            # training data.
+            if not is_training:
+                feature.example_index = example_index
 
             unique_id += 1
-            if span_is_impossible:
+            if feature.is_impossible:
                 cnt_neg += 1
             else:
                 cnt_pos += 1
@@ -498,6 +481,23 @@ def convert_examples_to_features(examples, sp_model, max_seq_length, doc_stride,
         cnt_pos + cnt_neg, cnt_pos, cnt_neg))
 
 
+# the conversion of the examples in the processes of
+# DataProcessor.convert_examples, set by _init_convert_process
+_process_converter = None
+
+
+def _init_convert_process(spiece_model_file, convert_args):
+    global _process_converter
+    sp_model = spm.SentencePieceProcessor()
+    sp_model.Load(spiece_model_file)
+    _process_converter = functools.partial(
+        convert_example_to_features, sp_model=sp_model, **convert_args)
+
+
+def _convert_example_shard(examples):
+    return [_process_converter(example) for example in examples]
+
+
 def _check_is_max_context(doc_spans, cur_span_index, position):
     """Check if this is the 'max context' doc span for the token."""
 
@@ -537,14 +537,25 @@ def _check_is_max_context(doc_spans, cur_span_index, position):
 
 
 class DataProcessor(object):
-    def __init__(self, spiece_model_file, uncased, max_seq_length, doc_stride,
-                 max_query_length):
+    def __init__(self,
+                 spiece_model_file,
+                 uncased,
+                 max_seq_length,
+                 doc_stride,
+                 max_query_length,
+                 num_convert_processes=1,
+                 use_feature_cache=True,
+                 feature_cache_dir=None):
         self._sp_model = spm.SentencePieceProcessor()
         self._sp_model.Load(spiece_model_file)
+        self._spiece_model_file = spiece_model_file
         self._uncased = uncased
         self._max_seq_length = max_seq_length
         self._doc_stride = doc_stride
         self._max_query_length = max_query_length
+        self._num_convert_processes = num_convert_processes
+        self._use_feature_cache = use_feature_cache
+        self._feature_cache_dir = feature_cache_dir
 
         self.current_train_example = -1
         self.num_train_examples = -1
@@ -561,8 +572,94 @@ class DataProcessor(object):
     def get_examples(self, data_path, is_training):
         examples = read_squad_examples(
             input_file=data_path, is_training=is_training)
+        cache_path = None
+        if self._use_feature_cache:
+            cache_path = self.get_feature_cache_path(data_path, is_training)
+        self.convert_examples(examples, is_training, cache_path)
         return examples
 
+    def get_feature_cache_path(self, data_path, is_training):
+        """The cache file of the features of data_path, keyed by the data
+        file, the sentence piece model and the conversion args."""
+        key = hashlib.md5()
+        for path in [data_path, self._spiece_model_file]:
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    key.update(chunk)
+        key.update(
+            repr((self._uncased, self._max_seq_length, self._doc_stride,
+                  self._max_query_length, is_training)).encode("utf8"))
+        cache_dir = self._feature_cache_dir
+        if cache_dir is None:
+            cache_dir = os.path.dirname(os.path.abspath(data_path))
+        return os.path.join(cache_dir, "%s.features.%s.pkl" %
+                            (os.path.basename(data_path), key.hexdigest()))
+
+    def convert_examples(self, examples, is_training, cache_path=None):
+        """Sets the features of the examples, loaded from cache_path if it
+        exists, else converted in num_convert_processes processes and saved
+        to cache_path."""
+        start = time.time()
+        if cache_path is not None and os.path.isfile(cache_path):
+            # the collections of gc slow down loading the many feature objects
+            gc.disable()
+            try:
+                with open(cache_path, "rb") as f:
+                    all_features = pickle.load(f)
+            finally:
+                gc.enable()
+            print("Loaded the features of {} examples from {} in {:.1f} s".
+                  format(len(examples), cache_path, time.time() - start))
+        else:
+            convert_args = dict(
+                max_seq_length=self._max_seq_length,
+                doc_stride=self._doc_stride,
+                max_query_length=self._max_query_length,
+                is_training=is_training,
+                uncased=self._uncased)
+            if self._num_convert_processes > 1:
+                # a few shards per process to even out the example lengths
+                shard_size = int(
+                    math.ceil(
+                        len(examples) / float(self._num_convert_processes *
+                                              4)))
+                shards = [
+                    examples[i:i + shard_size]
+                    for i in range(0, len(examples), shard_size)
+                ]
+                pool = multiprocessing.Pool(
+                    self._num_convert_processes,
+                    initializer=_init_convert_process,
+                    initargs=(self._spiece_model_file, convert_args))
+                try:
+                    all_features = [
+                        features
+                        for shard in pool.map(_convert_example_shard, shards)
+                        for features in shard
+                    ]
+                finally:
+                    pool.close()
+                    pool.join()
+            else:
+                all_features = [
+                    convert_example_to_features(example, self._sp_model,
+                                                **convert_args)
+                    for example in examples
+                ]
+            print("Converted {} examples to {} features in {:.1f} s".format(
+                len(examples), sum(len(f) for f in all_features),
+                time.time() - start))
+            if cache_path is not None:
+                # written to a temporary file first, a cache file is complete
+                tmp_path = "%s.%d.tmp" % (cache_path, os.getpid())
+                with open(tmp_path, "wb") as f:
+                    pickle.dump(all_features, f, pickle.HIGHEST_PROTOCOL)
+                os.rename(tmp_path, cache_path)
+
+        assert len(all_features) == len(examples)
+        for example, features in zip(examples, all_features):
+            example.features = features
+
     def get_num_examples(self, phase):
         if phase not in ['train', 'predict']:
             raise ValueError(
@@ -570,15 +667,25 @@ class DataProcessor(object):
         return self.num_examples[phase]
 
     def get_features(self, examples, is_training):
-        features = convert_examples_to_features(
-            examples=examples,
-            sp_model=self._sp_model,
-            max_seq_length=self._max_seq_length,
-            doc_stride=self._doc_stride,
-            max_query_length=self._max_query_length,
-            is_training=is_training,
-            uncased=self._uncased)
-        return features
+        """The features of the examples in their current order, numbered like
+        convert_examples_to_features."""
+        unconverted = [
+            example for example in examples if example.features is None
+        ]
+        if unconverted:
+            self.convert_examples(unconverted, is_training)
+
+        unique_id = 1000000000
+        for (example_index, example) in enumerate(examples):
+            for feature in example.features:
+                feature = copy.copy(feature)
+                feature.unique_id = unique_id
+                # note(zhiliny): The current code does not use example_index
+                # of training data.
+                if not is_training:
+                    feature.example_index = example_index
+                unique_id += 1
+                yield feature
 
     def data_generator(self,
                        data_path,
@@ -104,6 +104,12 @@ data_g.add_arg("doc_stride",                int,   128,
 data_g.add_arg("n_best_size",               int,   5,
                "The total number of n-best predictions to generate in the nbest_predictions.json output file.")
 data_g.add_arg("random_seed",               int,   0,      "Random seed.")
+data_g.add_arg("num_convert_processes",     int,   1,
+               "Number of the processes converting the examples to features.")
+data_g.add_arg("use_feature_cache",         bool,  True,
+               "If set, the converted features are saved to a cache file and loaded from it by the next runs.")
+data_g.add_arg("feature_cache_dir",         str,   None,
+               "Directory of the feature cache files, default the directory of the SQuAD json.")
 
 run_type_g = ArgumentGroup(parser, "run_type", "running type options.")
 run_type_g.add_arg("use_cuda",                     bool,   True,  "If set, use GPU for training.")
@@ -443,7 +449,10 @@ def train(args):
         uncased=args.uncased,
         max_seq_length=args.max_seq_length,
         doc_stride=args.doc_stride,
-        max_query_length=args.max_query_length)
+        max_query_length=args.max_query_length,
+        num_convert_processes=args.num_convert_processes,
+        use_feature_cache=args.use_feature_cache,
+        feature_cache_dir=args.feature_cache_dir)
 
 
     startup_prog = fluid.Program()
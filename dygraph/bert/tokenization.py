@@ -107,6 +107,30 @@ def whitespace_tokenize(text):
     return tokens
 
 
+class LRUCache(object):
+    """A bounded mapping which drops the least recently used item when full."""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._items = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key):
+        """Returns the value of `key` and marks it as recently used, None if
+        `key` is not cached."""
+        value = self._items.pop(key, None)
+        if value is not None:
+            self._items[key] = value
+        return value
+
+    def put(self, key, value):
+        self._items[key] = value
+        if len(self._items) > self.capacity:
+            self._items.popitem(last=False)
+
+
 class FullTokenizer(object):
     """Runs end-to-end tokenziation."""
 
@@ -124,6 +148,10 @@ class FullTokenizer(object):
 
         return split_tokens
 
+    def tokenize_many(self, texts):
+        """Tokenizes a batch of texts, the words are cached across the batch."""
+        return [self.tokenize(text) for text in texts]
+
     def convert_tokens_to_ids(self, tokens):
         return convert_by_vocab(self.vocab, tokens)
 
@@ -147,6 +175,10 @@ class CharTokenizer(object):
 
         return split_tokens
 
+    def tokenize_many(self, texts):
+        """Tokenizes a batch of texts, the words are cached across the batch."""
+        return [self.tokenize(text) for text in texts]
+
     def convert_tokens_to_ids(self, tokens):
         return convert_by_vocab(self.vocab, tokens)
 
@@ -157,38 +189,50 @@ class CharTokenizer(object):
 class BasicTokenizer(object):
     """Runs basic tokenization (punctuation splitting, lower casing, etc.)."""
 
-    def __init__(self, do_lower_case=True):
+    def __init__(self, do_lower_case=True, cache_size=50000):
         """Constructs a BasicTokenizer.
 
         Args:
             do_lower_case: Whether to lower case the input.
+            cache_size: Number of the most recently split words to cache.
         """
         self.do_lower_case = do_lower_case
+        self._char_table = _CleanCharTable(self)
+        self._cache = LRUCache(cache_size)
 
     def tokenize(self, text):
         """Tokenizes a piece of text."""
         text = convert_to_unicode(text)
-        text = self._clean_text(text)
-
+        # _clean_text and _tokenize_chinese_chars in a single pass, see
+        # _CleanCharTable
+        #
         # This was added on November 1st, 2018 for the multilingual and Chinese
         # models. This is also applied to the English models now, but it doesn't
         # matter since the English models were not trained on any Chinese data
         # and generally don't have any Chinese data in them (there are Chinese
         # characters in the vocabulary because Wikipedia does have some Chinese
         # words in the English Wikipedia.).
-        text = self._tokenize_chinese_chars(text)
+        text = text.translate(self._char_table)
 
         orig_tokens = whitespace_tokenize(text)
         split_tokens = []
         for token in orig_tokens:
-            if self.do_lower_case:
-                token = token.lower()
-                token = self._run_strip_accents(token)
-            split_tokens.extend(self._run_split_on_punc(token))
+            cached = self._cache.get(token)
+            if cached is None:
+                cached = tuple(self._split_token(token))
+                self._cache.put(token, cached)
+            split_tokens.extend(cached)
 
         output_tokens = whitespace_tokenize(" ".join(split_tokens))
         return output_tokens
 
+    def _split_token(self, token):
+        """Lower cases, strips accents and splits punctuation on a token."""
+        if self.do_lower_case:
+            token = token.lower()
+            token = self._run_strip_accents(token)
+        return self._run_split_on_punc(token)
+
     def _run_strip_accents(self, text):
         """Strips accents from a piece of text."""
         text = unicodedata.normalize("NFD", text)
@@ -272,10 +316,33 @@ class BasicTokenizer(object):
 class WordpieceTokenizer(object):
     """Runs WordPiece tokenziation."""
 
-    def __init__(self, vocab, unk_token="[UNK]", max_input_chars_per_word=100):
+    def __init__(self,
+                 vocab,
+                 unk_token="[UNK]",
+                 max_input_chars_per_word=100,
+                 cache_size=50000):
         self.vocab = vocab
         self.unk_token = unk_token
         self.max_input_chars_per_word = max_input_chars_per_word
+        # prefix tries of the pieces which start a word, and of the pieces
+        # which continue a word without their "##"
+        self._start_trie = {}
+        self._continue_trie = {}
+        for piece in vocab:
+            self._add_to_trie(self._start_trie, piece, piece)
+            if piece.startswith("##"):
+                self._add_to_trie(self._continue_trie, piece[2:], piece)
+        self._cache = LRUCache(cache_size)
+
+    @staticmethod
+    def _add_to_trie(trie, chars, piece):
+        if not chars:
+            return
+        node = trie
+        for char in chars:
+            node = node.setdefault(char, {})
+        # a char is a str of length 1, the empty str marks a piece
+        node[""] = piece
 
     def tokenize(self, text):
         """Tokenizes a piece of text into its word pieces.
@@ -299,36 +366,66 @@ class WordpieceTokenizer(object):
 
         output_tokens = []
         for token in whitespace_tokenize(text):
-            chars = list(token)
-            if len(chars) > self.max_input_chars_per_word:
-                output_tokens.append(self.unk_token)
-                continue
+            sub_tokens = self._cache.get(token)
+            if sub_tokens is None:
+                sub_tokens = self._tokenize_word(token)
+                self._cache.put(token, sub_tokens)
+            output_tokens.extend(sub_tokens)
+        return output_tokens
 
-            is_bad = False
-            start = 0
-            sub_tokens = []
-            while start < len(chars):
-                end = len(chars)
-                cur_substr = None
-                while start < end:
-                    substr = "".join(chars[start:end])
-                    if start > 0:
-                        substr = "##" + substr
-                    if substr in self.vocab:
-                        cur_substr = substr
-                        break
-                    end -= 1
-                if cur_substr is None:
-                    is_bad = True
+    def _tokenize_word(self, token):
+        """Greedy longest-match-first word pieces of a single word, walking the
+        tries instead of looking up every substring in the vocab."""
+        if len(token) > self.max_input_chars_per_word:
+            return (self.unk_token, )
+
+        sub_tokens = []
+        start = 0
+        trie = self._start_trie
+        while start < len(token):
+            node = trie
+            cur_substr = None
+            end = start
+            for i in range(start, len(token)):
+                node = node.get(token[i])
+                if node is None:
                     break
-                sub_tokens.append(cur_substr)
-                start = end
-
-            if is_bad:
-                output_tokens.append(self.unk_token)
-            else:
-                output_tokens.extend(sub_tokens)
-        return output_tokens
+                if "" in node:
+                    cur_substr = node[""]
+                    end = i + 1
+            if cur_substr is None:
+                return (self.unk_token, )
+            sub_tokens.append(cur_substr)
+            start = end
+            trie = self._continue_trie
+        return tuple(sub_tokens)
+
+
+class _CleanCharTable(dict):
+    """The translation table of `BasicTokenizer._clean_text` followed by
+    `BasicTokenizer._tokenize_chinese_chars`, filled in as chars are seen.
+
+    The table maps the code point of a char to None to drop it, to " " for a
+    whitespace, to the char with a space on both sides for a CJK char and to
+    itself otherwise.
+    """
+
+    def __init__(self, basic_tokenizer):
+        super(_CleanCharTable, self).__init__()
+        self._basic_tokenizer = basic_tokenizer
+
+    def __missing__(self, cp):
+        char = six.unichr(cp)
+        if cp == 0 or cp == 0xfffd or _is_control(char):
+            value = None
+        elif _is_whitespace(char):
+            value = u" "
+        elif self._basic_tokenizer._is_chinese_char(cp):
+            value = u" " + char + u" "
+        else:
+            value = cp
+        self[cp] = value
+        return value
 
 
 def _is_whitespace(char):